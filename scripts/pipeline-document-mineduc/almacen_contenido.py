@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Almacén direccionado por contenido para PDFs de documentos_oficiales
+
+El mismo PDF del MINEDUC suele publicarse bajo varias URLs y títulos, y
+terminaba subido, transformado (OCR / IA Vision) y embebido varias veces
+bajo distintos storage_path generados por sanitize_filename.
+
+Este módulo registra SHA-256 → objeto canónico la primera vez que se sube
+un PDF y, en descargas posteriores, detecta el duplicado para apuntar el
+nuevo documento al objeto existente y a sus resultados de transformación
+y embeddings.
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119002_objetos_pdf_contenido.sql
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Dict, Optional
+
+BUCKET = 'documentos-oficiales'
+
+# Etapas en que el documento canónico ya tiene contenido_markdown reutilizable
+ETAPAS_CON_TRANSFORMACION = ('transformado', 'transformado_errores', 'completado')
+
+
+def calcular_hash(pdf_bytes: bytes) -> str:
+    """SHA-256 hexadecimal del contenido del PDF"""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class AlmacenContenido:
+    """Registro SHA-256 → objeto canónico en Storage"""
+
+    def __init__(self, supabase_client, transiciones=None):
+        self.supabase = supabase_client
+        self.transiciones = transiciones
+        self._cache: Dict[str, Dict] = {}
+        self.duplicados_detectados = 0
+
+    # ============================================
+    # CONSULTA / REGISTRO
+    # ============================================
+
+    def buscar(self, pdf_hash: str) -> Optional[Dict]:
+        """Retorna el objeto canónico para un hash, o None"""
+
+        if pdf_hash in self._cache:
+            return self._cache[pdf_hash]
+
+        try:
+            result = self.supabase.table('objetos_pdf')\
+                .select('sha256, storage_path, documento_canonico_id, tamano_bytes')\
+                .eq('sha256', pdf_hash)\
+                .limit(1)\
+                .execute()
+        except Exception as e:
+            print(f"  ⚠️  Error consultando objetos_pdf: {e}")
+            return None
+
+        if result.data:
+            self._cache[pdf_hash] = result.data[0]
+            return result.data[0]
+
+        return None
+
+    def registrar(self, pdf_hash: str, storage_path: str, doc_id: str,
+                  tamano_bytes: int) -> Dict:
+        """
+        Registra el objeto si es la primera vez que se ve el hash.
+        Si otro proceso lo registró antes, retorna el canónico existente.
+        """
+
+        objeto = {
+            'sha256': pdf_hash,
+            'storage_path': storage_path,
+            'documento_canonico_id': doc_id,
+            'tamano_bytes': tamano_bytes
+        }
+
+        try:
+            self.supabase.table('objetos_pdf').upsert({
+                **objeto,
+                'created_at': datetime.now().isoformat()
+            }, on_conflict='sha256', ignore_duplicates=True).execute()
+        except Exception as e:
+            print(f"  ⚠️  No se pudo registrar objeto {pdf_hash[:12]}: {e}")
+            return objeto
+
+        # Releer: el primer registro gana si hubo carrera entre runners
+        self._cache.pop(pdf_hash, None)
+        return self.buscar(pdf_hash) or objeto
+
+    # ============================================
+    # DEDUPLICACIÓN
+    # ============================================
+
+    def resolver(self, doc_id: str, storage_path: str, pdf_bytes: bytes) -> Dict:
+        """
+        Resuelve el objeto canónico para un PDF recién descargado.
+
+        Returns:
+            dict con sha256, storage_path canónico, documento_canonico_id y
+            'duplicado' (True si el PDF ya existía bajo otro documento)
+        """
+
+        pdf_hash = calcular_hash(pdf_bytes)
+        existente = self.buscar(pdf_hash)
+
+        if existente is None:
+            existente = self.registrar(pdf_hash, storage_path, doc_id, len(pdf_bytes))
+
+        duplicado = existente.get('documento_canonico_id') not in (None, doc_id)
+
+        if duplicado:
+            self.duplicados_detectados += 1
+            print(f"  🔗 PDF duplicado (sha256 {pdf_hash[:12]}...) → {existente['storage_path']}")
+
+            if self.transiciones is not None:
+                campos = {}
+                if existente['storage_path'] != storage_path:
+                    campos['storage_path'] = existente['storage_path']
+                self.transiciones.agregar(doc_id, metadata={
+                    'hash_pdf': pdf_hash,
+                    'documento_canonico_id': existente['documento_canonico_id'],
+                    'storage_path_original': storage_path
+                }, **campos)
+
+        return {**existente, 'sha256': pdf_hash, 'duplicado': duplicado}
+
+    def objeto_para_subida(self, pdf_bytes: bytes) -> Optional[Dict]:
+        """Antes de subir un PDF: retorna el objeto existente si ya está en Storage"""
+        return self.buscar(calcular_hash(pdf_bytes))
+
+    def transformacion_existente(self, documento_canonico_id: str) -> Optional[Dict]:
+        """Contenido ya transformado del documento canónico (si existe)"""
+
+        try:
+            result = self.supabase.table('documentos_oficiales')\
+                .select('id, etapa_actual, contenido_markdown, metadata')\
+                .eq('id', documento_canonico_id)\
+                .limit(1)\
+                .execute()
+        except Exception as e:
+            print(f"  ⚠️  Error consultando documento canónico: {e}")
+            return None
+
+        if not result.data:
+            return None
+
+        canonico = result.data[0]
+        if canonico.get('etapa_actual') not in ETAPAS_CON_TRANSFORMACION:
+            return None
+        if not canonico.get('contenido_markdown'):
+            return None
+
+        return canonico
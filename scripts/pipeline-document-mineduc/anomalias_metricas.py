@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Detección de regresiones de rendimiento y costo con líneas base robustas
+
+HistoricalAnalyzer solo comparaba documentos procesados contra una media de
+30 días, y THRESHOLDS['variacion_maxima_costo'] no se usaba. Para cada
+métrica por ejecución (segundos/doc, latencia por documento de cada fase,
+latencia de la llamada de visión, tokens/doc, costo/doc) se calcula:
+
+- Mediana y MAD del historial: una ejecución anómala previa no desplaza la
+  línea base como lo haría la media
+- EWMA: sigue cambios graduales legítimos (p.ej. documentos más largos)
+
+Una ejecución es regresión si su z robusto ((x - mediana) / 1.4826·MAD)
+supera Z_UMBRAL y además está sobre la EWMA y la mediana por más de la
+variación mínima de la métrica. Así ruido chico con MAD ≈ 0 no alerta y
+un proveedor lento o un chunker que duplica tokens sí. Duplicar la
+mediana (o z ≥ 2·Z_UMBRAL) es 'critical' y pasa por registrar_alertas.
+
+Las métricas se extraen de la fila de metricas_pipeline_rag
+(metadata.rendimiento y metadata.kpis), igual para el historial que para
+la ejecución actual. Las de tiempo salen de los spans por documento, no
+de la duración total: el costo fijo de cada ejecución (instalación,
+verificación, validación, índices) dominaría en ejecuciones con pocos
+documentos. Con menos de MIN_DOCUMENTOS documentos no se evalúan.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+Z_UMBRAL = 3.5
+MIN_EJECUCIONES = 5
+MIN_DOCUMENTOS = 5  # muestras mínimas para las métricas de tiempo por documento
+ALFA_EWMA = 0.3
+ESCALA_MAD = 1.4826  # MAD → desviación estándar bajo normalidad
+
+# Variación mínima sobre la línea base para alertar (además del z robusto)
+VARIACION_MINIMA = {
+    'costo_por_doc_usd': 0.30,  # fase6 pasa THRESHOLDS['variacion_maxima_costo']
+}
+VARIACION_MINIMA_DEFECTO = 0.20
+
+DESCRIPCIONES = {
+    's_por_doc': 'Segundos por documento (mediana por fase, sumada)',
+    'latencia_vision_ms': 'Latencia de la llamada de visión',
+    'tokens_por_doc': 'Tokens por documento',
+    'costo_por_doc_usd': 'Costo por documento',
+}
+
+
+def mediana(valores: List[float]) -> float:
+    ordenados = sorted(valores)
+    mitad = len(ordenados) // 2
+    if len(ordenados) % 2:
+        return ordenados[mitad]
+    return (ordenados[mitad - 1] + ordenados[mitad]) / 2.0
+
+
+def mad(valores: List[float], centro: Optional[float] = None) -> float:
+    """Desviación absoluta mediana"""
+    centro = mediana(valores) if centro is None else centro
+    return mediana([abs(v - centro) for v in valores])
+
+
+def ewma(valores: Iterable[float], alfa: float = ALFA_EWMA) -> float:
+    """Media móvil exponencial (valores en orden cronológico)"""
+    actual = None
+    for valor in valores:
+        actual = valor if actual is None else alfa * valor + (1 - alfa) * actual
+    return actual if actual is not None else 0.0
+
+
+@dataclass
+class LineaBase:
+    metrica: str
+    n: int
+    mediana: float
+    mad: float
+    ewma: float
+
+    @property
+    def escala(self) -> float:
+        # Con MAD = 0 (historial casi constante) se usa un 5% de la mediana como piso
+        return max(ESCALA_MAD * self.mad, 0.05 * abs(self.mediana), 1e-9)
+
+    def z(self, valor: float) -> float:
+        return (valor - self.mediana) / self.escala
+
+
+def calcular_linea_base(metrica: str, valores: List[float]) -> Optional[LineaBase]:
+    if len(valores) < MIN_EJECUCIONES:
+        return None
+    centro = mediana(valores)
+    return LineaBase(metrica, len(valores), centro, mad(valores, centro), ewma(valores))
+
+
+def extraer_metricas(fila: Dict) -> Dict[str, float]:
+    """Métricas comparables de una fila de metricas_pipeline_rag (peor = mayor)"""
+    metadata = fila.get('metadata') or {}
+    rendimiento = metadata.get('rendimiento') or {}
+    kpis = metadata.get('kpis') or {}
+    documentos = fila.get('documentos_procesados') or 0
+    metricas: Dict[str, float] = {}
+
+    if not documentos:
+        # Sin documentos cargados el costo/doc y los tokens/doc no significan nada
+        return metricas
+
+    # Tiempo por documento desde los spans 'documento' de cada fase (sin costo fijo)
+    por_fase = {
+        fase: latencia['p50_ms'] for fase, latencia in (rendimiento.get('latencia_documento_ms') or {}).items()
+        if latencia.get('p50_ms') is not None and (latencia.get('n') or 0) >= MIN_DOCUMENTOS
+    }
+    for fase, p50 in por_fase.items():
+        metricas[f'latencia_doc_{fase}_ms'] = p50
+    if por_fase and documentos >= MIN_DOCUMENTOS:
+        metricas['s_por_doc'] = sum(por_fase.values()) / 1000.0
+    vision = (rendimiento.get('latencia_etapa_ms') or {}).get('vision') or {}
+    if vision.get('p50_ms') is not None and (vision.get('n') or 0) >= MIN_DOCUMENTOS:
+        metricas['latencia_vision_ms'] = vision['p50_ms']
+
+    tokens = kpis.get('tokens_por_doc')
+    if tokens is None and metadata.get('total_tokens') is not None:
+        tokens = metadata['total_tokens'] / documentos
+    if tokens:
+        metricas['tokens_por_doc'] = tokens
+    costo = kpis.get('costo_por_doc')
+    if costo:
+        metricas['costo_por_doc_usd'] = costo
+    return metricas
+
+
+def describir(metrica: str) -> str:
+    if metrica.startswith('latencia_doc_'):
+        return f"Latencia por documento en {metrica[len('latencia_doc_'):-len('_ms')]}"
+    return DESCRIPCIONES.get(metrica, metrica)
+
+
+def detectar_regresiones(actuales: Dict[str, float], historial: List[Dict[str, float]],
+                         z_umbral: float = Z_UMBRAL,
+                         variaciones: Optional[Dict[str, float]] = None) -> List[Dict]:
+    """
+    Alertas (formato de fase6) para las métricas actuales que empeoran de
+    forma significativa. `historial` son dicts de extraer_metricas en orden
+    cronológico (más antiguo primero); `variaciones` reemplaza la variación
+    mínima de algunas métricas.
+    """
+    bases = {}
+    for metrica in actuales:
+        base = calcular_linea_base(metrica, [h[metrica] for h in historial if h.get(metrica) is not None])
+        if base is not None:
+            bases[metrica] = base
+    return evaluar_regresiones(actuales, bases, z_umbral, variaciones)
+
+
+def evaluar_regresiones(actuales: Dict[str, float], bases: Dict[str, LineaBase],
+                        z_umbral: float = Z_UMBRAL,
+                        variaciones: Optional[Dict[str, float]] = None) -> List[Dict]:
+    """Como detectar_regresiones, con líneas base ya calculadas (p.ej. desde rollups)"""
+    variaciones = {**VARIACION_MINIMA, **(variaciones or {})}
+    alertas = []
+    for metrica, valor in sorted(actuales.items()):
+        base = bases.get(metrica)
+        if base is None or base.n < MIN_EJECUCIONES:
+            continue
+
+        z = base.z(valor)
+        margen = variaciones.get(metrica, VARIACION_MINIMA_DEFECTO)
+        referencia = max(base.mediana, base.ewma)
+        if z < z_umbral or valor <= referencia * (1 + margen):
+            continue
+
+        razon = valor / base.mediana if base.mediana > 0 else float('inf')
+        severidad = 'critical' if razon >= 2.0 or z >= 2 * z_umbral else 'warning'
+        alertas.append({
+            'tipo': f'regresion_{metrica}',
+            'severidad': severidad,
+            'mensaje': (f"{describir(metrica)}: {valor:,.4g} vs mediana {base.mediana:,.4g} "
+                        f"(x{razon:.2f}, z={z:.1f}, EWMA {base.ewma:,.4g}, {base.n} ejecuciones)"),
+            'metrica': metrica,
+            'actual': valor,
+            'mediana': base.mediana,
+            'mad': base.mad,
+            'ewma': base.ewma,
+            'z': round(z, 2)
+        })
+    return alertas
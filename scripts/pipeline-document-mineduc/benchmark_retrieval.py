@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Benchmark de recuperación: recall y latencia del índice vs búsqueda exacta
+
+fase5 recrea el índice HNSW de chunks_documentos pero nunca mide si
+devuelve los vecinos correctos ni cuánto tarda. Este módulo:
+
+1. Carga los embeddings del corpus buscable (documentos es_version_actual)
+   a una matriz float32 normalizada
+2. Toma una muestra de esos embeddings como consultas y calcula el top-k
+   exacto con fuerza bruta NumPy
+3. Lanza las mismas consultas contra la base con concurrencia configurable:
+   - 'rpc': buscar_chunks_similares vía Supabase
+   - 'postgres': SQL directo (ORDER BY embedding <=> q LIMIT k) sobre un DSN,
+     útil contra un Postgres + pgvector local
+   - 'local': snapshot_ann.py (IVF NumPy sobre un snapshot exportado, sin red)
+4. Reporta recall@k y latencias p50/p95/p99, y escribe
+   retrieval_benchmark.json junto a optimize_metrics.json
+
+Uso:
+    python scripts/pipeline-document-mineduc/benchmark_retrieval.py \\
+        [--backend rpc|postgres|local] [--dsn postgresql://...] [--snapshot dir] \\
+        [--consultas 100] [--k 10] [--concurrencia 4] [--ef-search 40]
+
+Variables de entorno:
+- SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY (backend rpc)
+- DATABASE_URL (backend postgres, si no se pasa --dsn)
+- EMBEDDING_DIMENSIONS=1536
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from dotenv import load_dotenv
+except ImportError:
+    print("❌ Instalar: pip install python-dotenv numpy")
+    sys.exit(1)
+
+from vectores import decodificar_vector, normalizar_filas
+
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))
+TAMANO_PAGINA = 500
+LOTE_EXACTO = 256
+
+SQL_CORPUS = """
+    select c.id::text, c.embedding::text
+    from chunks_documentos c
+    join documentos_oficiales d on d.id = c.documento_id
+    where d.es_version_actual = true and c.embedding is not null
+"""
+
+SQL_VECINOS = """
+    select c.id::text
+    from chunks_documentos c
+    join documentos_oficiales d on d.id = c.documento_id
+    where d.es_version_actual = true
+    order by c.embedding <=> %s::vector
+    limit %s
+"""
+
+
+# ============================================
+# CORPUS
+# ============================================
+
+def _apilar(filas, dimensiones: int) -> Tuple[List[str], np.ndarray]:
+    ids, vectores = [], []
+    for chunk_id, embedding in filas:
+        vector = decodificar_vector(embedding)
+        if vector is not None and vector.shape[0] == dimensiones:
+            ids.append(chunk_id)
+            vectores.append(vector)
+    if not vectores:
+        return [], np.zeros((0, dimensiones), dtype=np.float32)
+    return ids, normalizar_filas(np.vstack(vectores))
+
+
+def cargar_corpus_supabase(supabase, dimensiones: int = EMBEDDING_DIMENSIONS) -> Tuple[List[str], np.ndarray]:
+    """Embeddings buscables vía PostgREST (keyset sobre id)"""
+    filas = []
+    ultimo = None
+    while True:
+        query = supabase.table('chunks_documentos')\
+            .select('id, embedding, documentos_oficiales!inner(es_version_actual)')\
+            .eq('documentos_oficiales.es_version_actual', True)\
+            .not_.is_('embedding', 'null')
+        if ultimo is not None:
+            query = query.gt('id', ultimo)
+        pagina = query.order('id').limit(TAMANO_PAGINA).execute().data or []
+        filas.extend((f['id'], f['embedding']) for f in pagina)
+        if len(pagina) < TAMANO_PAGINA:
+            break
+        ultimo = pagina[-1]['id']
+    return _apilar(filas, dimensiones)
+
+
+def cargar_corpus_postgres(conexion, dimensiones: int = EMBEDDING_DIMENSIONS) -> Tuple[List[str], np.ndarray]:
+    """Embeddings buscables leídos directamente con psycopg"""
+    with conexion.cursor() as cursor:
+        cursor.execute(SQL_CORPUS)
+        filas = []
+        while True:
+            lote = cursor.fetchmany(TAMANO_PAGINA)
+            if not lote:
+                break
+            filas.extend(lote)
+    return _apilar(filas, dimensiones)
+
+
+# ============================================
+# BÚSQUEDA EXACTA
+# ============================================
+
+def top_k_exacto(matriz: np.ndarray, consultas: np.ndarray, k: int) -> np.ndarray:
+    """Índices del top-k por coseno (filas normalizadas), por lotes de consultas"""
+    k = min(k, matriz.shape[0])
+    resultado = np.empty((len(consultas), k), dtype=np.int64)
+    for inicio in range(0, len(consultas), LOTE_EXACTO):
+        similitudes = consultas[inicio:inicio + LOTE_EXACTO] @ matriz.T
+        candidatos = np.argpartition(-similitudes, k - 1, axis=1)[:, :k]
+        orden = np.take_along_axis(similitudes, candidatos, axis=1).argsort(axis=1)[:, ::-1]
+        resultado[inicio:inicio + LOTE_EXACTO] = np.take_along_axis(candidatos, orden, axis=1)
+    return resultado
+
+
+def percentiles_ms(latencias: List[float]) -> Dict:
+    if not latencias:
+        return {'p50': None, 'p95': None, 'p99': None, 'media': None}
+    valores = np.asarray(latencias) * 1000
+    p50, p95, p99 = np.percentile(valores, [50, 95, 99])
+    return {
+        'p50': round(float(p50), 2),
+        'p95': round(float(p95), 2),
+        'p99': round(float(p99), 2),
+        'media': round(float(valores.mean()), 2)
+    }
+
+
+# ============================================
+# BACKENDS
+# ============================================
+
+class BackendRPC:
+    """buscar_chunks_similares vía Supabase (el camino real de la app)"""
+
+    nombre = 'rpc'
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def buscar(self, vector: np.ndarray, k: int) -> List[str]:
+        result = self.supabase.rpc('buscar_chunks_similares', {
+            'query_embedding': vector.tolist(),
+            'match_threshold': -1.0,
+            'match_count': k
+        }).execute()
+        return [fila['chunk_id'] for fila in (result.data or [])]
+
+
+class BackendPostgres:
+    """SQL directo sobre un DSN (Supabase o un Postgres + pgvector local)"""
+
+    nombre = 'postgres'
+
+    def __init__(self, dsn: str, ef_search: Optional[int] = None, probes: Optional[int] = None):
+        self.dsn = dsn
+        self.ef_search = ef_search
+        self.probes = probes
+        self._local = threading.local()
+
+    def conexion(self):
+        """Una conexión por hilo (psycopg no comparte cursores entre hilos)"""
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = conectar_postgres(self.dsn)
+            with conexion.cursor() as cursor:
+                if self.ef_search:
+                    cursor.execute(f"set hnsw.ef_search = {int(self.ef_search)}")
+                if self.probes:
+                    cursor.execute(f"set ivfflat.probes = {int(self.probes)}")
+            self._local.conexion = conexion
+        return conexion
+
+    def buscar(self, vector: np.ndarray, k: int) -> List[str]:
+        texto = '[' + ','.join(f'{x:.7g}' for x in vector) + ']'
+        with self.conexion().cursor() as cursor:
+            cursor.execute(SQL_VECINOS, (texto, k))
+            return [fila[0] for fila in cursor.fetchall()]
+
+
+def conectar_postgres(dsn: str):
+    """Conexión autocommit con psycopg 3 o psycopg2 (dependencia opcional)"""
+    try:
+        import psycopg
+        return psycopg.connect(dsn, autocommit=True)
+    except ImportError:
+        pass
+    try:
+        import psycopg2
+        conexion = psycopg2.connect(dsn)
+        conexion.autocommit = True
+        return conexion
+    except ImportError:
+        print("❌ Instalar: pip install 'psycopg[binary]'")
+        sys.exit(1)
+
+
+# ============================================
+# BENCHMARK
+# ============================================
+
+def ejecutar_benchmark(backend, ids: List[str], matriz: np.ndarray, consultas: int = 100,
+                       k: int = 10, concurrencia: int = 4, semilla: int = 42) -> Dict:
+    """
+    Compara el backend contra el top-k exacto sobre una muestra del corpus.
+
+    Returns:
+        dict con recall@k, latencias (ms), throughput y parámetros
+    """
+    if len(ids) == 0:
+        return {'backend': backend.nombre, 'consultas': 0, 'recall_at_k': None, 'latencia_ms': percentiles_ms([])}
+
+    rng = np.random.default_rng(semilla)
+    muestra = rng.choice(len(ids), size=min(consultas, len(ids)), replace=False)
+    exactos = top_k_exacto(matriz, matriz[muestra], k)
+
+    def consultar(i: int):
+        inicio = time.perf_counter()
+        vecinos = backend.buscar(matriz[muestra[i]], k)
+        return vecinos, time.perf_counter() - inicio
+
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        respuestas = list(executor.map(consultar, range(len(muestra))))
+    duracion = time.perf_counter() - inicio_total
+
+    recalls = []
+    for (vecinos, _), fila_exacta in zip(respuestas, exactos):
+        esperados = {ids[j] for j in fila_exacta}
+        recalls.append(len(esperados & set(vecinos[:k])) / len(esperados))
+
+    return {
+        'backend': backend.nombre,
+        'corpus': len(ids),
+        'consultas': len(muestra),
+        'k': k,
+        'concurrencia': concurrencia,
+        'recall_at_k': round(float(np.mean(recalls)), 4),
+        'recall_min': round(float(np.min(recalls)), 4),
+        'latencia_ms': percentiles_ms([latencia for _, latencia in respuestas]),
+        'consultas_por_segundo': round(len(muestra) / duracion, 2)
+    }
+
+
+def export_metrics_json(metrics: dict, filepath: str):
+    """Exporta métricas en formato JSON para GitHub Actions"""
+    try:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2, ensure_ascii=False)
+        print(f"\n📄 Métricas exportadas: {filepath}")
+    except Exception as e:
+        print(f"\n⚠️ Error exportando métricas: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de recuperación vectorial')
+    parser.add_argument('--backend', choices=['rpc', 'postgres', 'local'], default='rpc')
+    parser.add_argument('--snapshot', default='snapshot_chunks', help='Directorio de snapshot_ann.py (backend local)')
+    parser.add_argument('--nprobe', type=int, default=None, help='Listas IVF a recorrer (backend local)')
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--consultas', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--concurrencia', type=int, default=4)
+    parser.add_argument('--ef-search', type=int, default=None)
+    parser.add_argument('--probes', type=int, default=None)
+    parser.add_argument('--output', default='retrieval_benchmark.json')
+    args = parser.parse_args()
+
+    load_dotenv('.env.local')
+
+    print("\n" + "=" * 60)
+    print("🎯 BENCHMARK DE RECUPERACIÓN (índice vs exacto)")
+    print("=" * 60)
+
+    if args.backend == 'postgres':
+        if not args.dsn:
+            print("❌ Backend postgres requiere --dsn o DATABASE_URL")
+            sys.exit(1)
+        backend = BackendPostgres(args.dsn, ef_search=args.ef_search, probes=args.probes)
+        ids, matriz = cargar_corpus_postgres(backend.conexion())
+    elif args.backend == 'local':
+        from snapshot_ann import NPROBE_DEFECTO, BackendLocal, SnapshotANN
+        snapshot = SnapshotANN.abrir(args.snapshot)
+        backend = BackendLocal(snapshot, nprobe=args.nprobe or NPROBE_DEFECTO)
+        ids, matriz = snapshot.ids, snapshot.matriz()
+    else:
+        from supabase import create_client
+        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+        backend = BackendRPC(supabase)
+        ids, matriz = cargar_corpus_supabase(supabase)
+
+    print(f"   Corpus: {len(ids):,} chunks ({matriz.nbytes / 1e6:.1f} MB)")
+    print(f"   Consultas: {args.consultas} | k={args.k} | concurrencia={args.concurrencia}")
+
+    resultado = ejecutar_benchmark(backend, ids, matriz, args.consultas, args.k, args.concurrencia)
+    resultado['timestamp'] = datetime.now().isoformat()
+    resultado['ef_search'] = args.ef_search
+    resultado['probes'] = args.probes
+
+    if resultado['consultas']:
+        latencia = resultado['latencia_ms']
+        print(f"\n   🎯 Recall@{args.k}: {resultado['recall_at_k']:.2%} (mín {resultado['recall_min']:.2%})")
+        print(f"   ⏱️  Latencia: p50 {latencia['p50']}ms | p95 {latencia['p95']}ms | p99 {latencia['p99']}ms")
+        print(f"   ⚡ Throughput: {resultado['consultas_por_segundo']} consultas/s")
+    else:
+        print("   ⚠️ Sin embeddings en el corpus - nada que medir")
+
+    export_metrics_json(resultado, args.output)
+
+
+if __name__ == '__main__':
+    main()
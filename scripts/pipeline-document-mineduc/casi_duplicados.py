@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Detección de documentos casi duplicados (MinHash + LSH)
+
+El MINEDUC re-publica documentos que solo difieren en la portada o en el
+año de vigencia. almacen_contenido detecta PDFs byte-idénticos; este
+módulo detecta los casi idénticos comparando el Markdown extraído:
+
+1. Shingles de k palabras sobre el Markdown normalizado
+2. Firma MinHash (num_perm permutaciones, vectorizada con NumPy)
+3. Índice LSH por bandas sobre todo el corpus (firmas persistidas en BD)
+4. Pares con similitud Jaccard estimada >= umbral → el documento nuevo
+   se marca como candidato delta (metadata.candidato_delta) para que las
+   fases siguientes solo procesen las secciones que cambiaron
+
+Variables de entorno:
+- CASI_DUPLICADO_UMBRAL=0.85 (similitud Jaccard mínima)
+- MINHASH_NUM_PERM=128
+- MINHASH_SHINGLE_PALABRAS=5
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119003_firmas_minhash_documentos.sql
+"""
+
+import os
+import re
+import threading
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+UMBRAL_SIMILITUD = float(os.getenv('CASI_DUPLICADO_UMBRAL', '0.85'))
+NUM_PERM = int(os.getenv('MINHASH_NUM_PERM', '128'))
+SHINGLE_PALABRAS = int(os.getenv('MINHASH_SHINGLE_PALABRAS', '5'))
+NUM_BANDAS = 16
+
+_PRIMO_MERSENNE = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_BLOQUE_SHINGLES = 20_000
+
+
+# ============================================
+# SHINGLES Y FIRMAS
+# ============================================
+
+def normalizar_markdown(texto: str) -> List[str]:
+    """Palabras en minúscula sin sintaxis Markdown ni puntuación"""
+    texto = texto.lower()
+    texto = re.sub(r'[#*_>`|\-\[\]()!]+', ' ', texto)
+    return re.findall(r'\w+', texto)
+
+
+def shingles(texto: str, k: int = SHINGLE_PALABRAS) -> np.ndarray:
+    """Hashes CRC32 (estables entre procesos) de los shingles de k palabras"""
+    palabras = normalizar_markdown(texto)
+    if not palabras:
+        return np.empty(0, dtype=np.uint64)
+    k = min(k, len(palabras))
+
+    hashes = {
+        zlib.crc32(' '.join(palabras[i:i + k]).encode('utf-8'))
+        for i in range(len(palabras) - k + 1)
+    }
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def _permutaciones(num_perm: int, semilla: int = 1):
+    rng = np.random.RandomState(semilla)
+    a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def firma_minhash(texto: str, num_perm: int = NUM_PERM) -> np.ndarray:
+    """
+    Firma MinHash de un texto: mínimo de (a·x + b) mod p por permutación.
+    Procesa los shingles en bloques para acotar memoria (bloque × num_perm).
+    """
+    valores = shingles(texto)
+    firma = np.full(num_perm, _MAX_HASH, dtype=np.uint64)
+    if valores.size == 0:
+        return firma
+
+    a, b = _permutaciones(num_perm)
+    for inicio in range(0, valores.size, _BLOQUE_SHINGLES):
+        bloque = valores[inicio:inicio + _BLOQUE_SHINGLES, None]
+        # a, x < 2^32 → a·x + b < 2^64: sin overflow en uint64
+        hashes = ((bloque * a + b) % _PRIMO_MERSENNE) & _MAX_HASH
+        np.minimum(firma, hashes.min(axis=0), out=firma)
+
+    return firma
+
+
+def similitud_estimada(firma_a: np.ndarray, firma_b: np.ndarray) -> float:
+    """Similitud Jaccard estimada: fracción de componentes iguales"""
+    return float(np.mean(firma_a == firma_b))
+
+
+# ============================================
+# ÍNDICE LSH
+# ============================================
+
+class IndiceLSH:
+    """Índice LSH por bandas (num_perm = bandas × filas)"""
+
+    def __init__(self, num_perm: int = NUM_PERM, bandas: int = NUM_BANDAS):
+        if num_perm % bandas != 0:
+            raise ValueError(f"num_perm ({num_perm}) debe ser múltiplo de bandas ({bandas})")
+        self.num_perm = num_perm
+        self.bandas = bandas
+        self.filas = num_perm // bandas
+        self._buckets: List[Dict[bytes, Set[str]]] = [defaultdict(set) for _ in range(bandas)]
+        self.firmas: Dict[str, np.ndarray] = {}
+
+    def _claves(self, firma: np.ndarray):
+        for banda in range(self.bandas):
+            yield banda, firma[banda * self.filas:(banda + 1) * self.filas].tobytes()
+
+    def agregar(self, clave: str, firma: np.ndarray):
+        self.firmas[clave] = firma
+        for banda, bucket in self._claves(firma):
+            self._buckets[banda][bucket].add(clave)
+
+    def candidatos(self, firma: np.ndarray) -> Set[str]:
+        encontrados = set()
+        for banda, bucket in self._claves(firma):
+            encontrados |= self._buckets[banda].get(bucket, set())
+        return encontrados
+
+    def mas_similar(self, firma: np.ndarray, excluir: Optional[Set[str]] = None):
+        """(clave, similitud) del candidato más parecido, o (None, 0.0)"""
+        mejor, mejor_sim = None, 0.0
+        for clave in self.candidatos(firma) - (excluir or set()):
+            sim = similitud_estimada(firma, self.firmas[clave])
+            if sim > mejor_sim:
+                mejor, mejor_sim = clave, sim
+        return mejor, mejor_sim
+
+    def __len__(self):
+        return len(self.firmas)
+
+
+# ============================================
+# DETECTOR SOBRE EL CORPUS
+# ============================================
+
+class DetectorCasiDuplicados:
+    """Mantiene el índice LSH del corpus y marca candidatos delta"""
+
+    def __init__(self, supabase_client, transiciones=None,
+                 umbral: float = UMBRAL_SIMILITUD, num_perm: int = NUM_PERM):
+        self.supabase = supabase_client
+        self.transiciones = transiciones
+        self.umbral = umbral
+        self.num_perm = num_perm
+        self.indice = IndiceLSH(num_perm)
+        self._cargado = False
+        self._lock = threading.Lock()
+        self.candidatos_delta = 0
+
+    def _cargar_corpus(self):
+        """Carga todas las firmas persistidas (paginado)"""
+        pagina = 1000
+        desde = 0
+        while True:
+            try:
+                result = self.supabase.table('firmas_minhash_documentos')\
+                    .select('documento_id, firma')\
+                    .eq('num_perm', self.num_perm)\
+                    .order('documento_id')\
+                    .range(desde, desde + pagina - 1)\
+                    .execute()
+            except Exception as e:
+                print(f"  ⚠️  No se pudieron cargar firmas MinHash: {e}")
+                break
+
+            filas = result.data or []
+            for fila in filas:
+                self.indice.agregar(fila['documento_id'], np.asarray(fila['firma'], dtype=np.uint64))
+            if len(filas) < pagina:
+                break
+            desde += pagina
+
+        self._cargado = True
+        print(f"  🧬 Índice LSH: {len(self.indice)} documentos")
+
+    def evaluar(self, doc_id: str, markdown: str, tipo_documento: Optional[str] = None,
+                excluir: Optional[Set[str]] = None) -> Optional[Dict]:
+        """
+        Calcula la firma del documento, busca su par más parecido y la persiste.
+
+        Returns:
+            dict candidato_delta ({documento_base_id, similitud}) o None
+        """
+
+        firma = firma_minhash(markdown, self.num_perm)
+
+        with self._lock:
+            if not self._cargado:
+                self._cargar_corpus()
+            base_id, similitud = self.indice.mas_similar(firma, excluir=(excluir or set()) | {doc_id})
+            self.indice.agregar(doc_id, firma)
+
+        self._persistir(doc_id, firma, tipo_documento)
+
+        if base_id is None or similitud < self.umbral:
+            return None
+
+        self.candidatos_delta += 1
+        candidato = {
+            'documento_base_id': base_id,
+            'similitud': round(similitud, 4),
+            'metodo': f'minhash_{self.num_perm}'
+        }
+        print(f"  🧬 Casi duplicado de {base_id} (similitud {similitud:.1%}) → candidato delta")
+
+        if self.transiciones is not None:
+            self.transiciones.agregar(doc_id, metadata={'candidato_delta': candidato})
+
+        return candidato
+
+    def _persistir(self, doc_id: str, firma: np.ndarray, tipo_documento: Optional[str]):
+        try:
+            self.supabase.table('firmas_minhash_documentos').upsert({
+                'documento_id': doc_id,
+                'num_perm': self.num_perm,
+                'firma': firma.astype(np.int64).tolist(),
+                'tipo_documento': tipo_documento,
+                'created_at': datetime.now().isoformat()
+            }, on_conflict='documento_id').execute()
+        except Exception as e:
+            print(f"  ⚠️  No se pudo guardar firma MinHash: {e}")
@@ -8,6 +8,8 @@ import os
 from supabase import create_client
 from dotenv import load_dotenv
 
+from transiciones_estado import BufferTransiciones
+
 load_dotenv('.env.local')
 
 supabase = create_client(
@@ -46,15 +48,13 @@ def marcar_documentos_sin_storage():
     if sin_archivo:
         print(f"\n🔧 Marcando {len(sin_archivo)} documentos para re-descarga...")
         
-        for doc in sin_archivo:
-            supabase.table('documentos_oficiales').update({
-                'etapa_actual': 'pendiente',
-                'metadata': {
+        with BufferTransiciones(supabase) as transiciones:
+            for doc in sin_archivo:
+                transiciones.agregar(doc['id'], 'pendiente', {
                     'requiere_redownload': True,
                     'storage_path_invalido': doc['storage_path'],
                     'marcado_para_redownload': True
-                }
-            }).eq('id', doc['id']).execute()
+                })
         
         print(f"  ✅ Marcados exitosamente")
         print(f"\n📢 SIGUIENTE PASO:")
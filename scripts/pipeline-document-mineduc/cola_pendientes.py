@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Iterador de trabajo pendiente con paginación keyset
+
+Las fases tomaban .limit(50) documentos pendientes y terminaban, así que un
+backlog de miles de documentos requería decenas de ejecuciones del workflow.
+
+ColaPendientes recorre documentos_oficiales con paginación keyset sobre
+(created_at, id): cada página se pide solo cuando el pool de workers la
+necesita, hasta vaciar el backlog o agotar el presupuesto de tiempo.
+Como el cursor avanza monótonamente, los documentos que fallan y siguen
+en la misma etapa no se vuelven a tomar en la misma ejecución.
+
+Variables de entorno:
+- PENDIENTES_TAMANO_PAGINA=50
+- PIPELINE_PRESUPUESTO_SEGUNDOS (opcional; sin límite si no se define)
+- PIPELINE_MAX_DOCUMENTOS (opcional; sin límite si no se define)
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+TAMANO_PAGINA = int(os.getenv('PENDIENTES_TAMANO_PAGINA', '50'))
+PRESUPUESTO_SEGUNDOS = float(os.getenv('PIPELINE_PRESUPUESTO_SEGUNDOS', '0')) or None
+MAX_DOCUMENTOS = int(os.getenv('PIPELINE_MAX_DOCUMENTOS', '0')) or None
+
+
+class ColaPendientes:
+    """
+    Recorre documentos pendientes página a página (keyset sobre created_at, id).
+
+    Uso:
+        cola = ColaPendientes(
+            supabase,
+            'id, storage_path, titulo',
+            lambda q: q.eq('etapa_actual', 'descargado')
+        )
+        for doc in cola:
+            ...
+    """
+
+    def __init__(self, supabase_client, columnas: str,
+                 filtros: Callable, tabla: str = 'documentos_oficiales',
+                 tamano_pagina: Optional[int] = None,
+                 presupuesto_segundos: Optional[float] = None,
+                 max_documentos: Optional[int] = None):
+        self.supabase = supabase_client
+        self.tabla = tabla
+        self.filtros = filtros
+        self.tamano_pagina = tamano_pagina or TAMANO_PAGINA
+        self.presupuesto_segundos = presupuesto_segundos if presupuesto_segundos is not None else PRESUPUESTO_SEGUNDOS
+        self.max_documentos = max_documentos if max_documentos is not None else MAX_DOCUMENTOS
+
+        # Las claves del cursor deben venir siempre en la selección
+        campos = [c.strip() for c in columnas.split(',') if c.strip()]
+        for clave in ('id', 'created_at'):
+            if clave not in campos:
+                campos.append(clave)
+        self.columnas = ', '.join(campos)
+
+        self.inicio = time.monotonic()
+        self.paginas = 0
+        self.entregados = 0
+        self.agotado_por_presupuesto = False
+        self._cursor: Optional[Tuple[str, str]] = None
+
+    def presupuesto_agotado(self) -> bool:
+        if self.presupuesto_segundos is None:
+            return False
+        return (time.monotonic() - self.inicio) >= self.presupuesto_segundos
+
+    def segundos_restantes(self) -> Optional[float]:
+        if self.presupuesto_segundos is None:
+            return None
+        return max(0.0, self.presupuesto_segundos - (time.monotonic() - self.inicio))
+
+    def _pagina(self):
+        query = self.filtros(self.supabase.table(self.tabla).select(self.columnas))
+
+        if self._cursor is not None:
+            creado, doc_id = self._cursor
+            query = query.or_(
+                f'created_at.gt."{creado}",and(created_at.eq."{creado}",id.gt.{doc_id})'
+            )
+
+        limite = self.tamano_pagina
+        if self.max_documentos is not None:
+            limite = min(limite, self.max_documentos - self.entregados)
+
+        return query.order('created_at').order('id').limit(limite).execute().data or []
+
+    def agotar_si_corresponde(self, destino: str = 'la siguiente ejecución') -> bool:
+        """True (y lo registra una vez) si el presupuesto de tiempo se agotó"""
+        if not self.presupuesto_agotado():
+            return False
+        if not self.agotado_por_presupuesto:
+            self.agotado_por_presupuesto = True
+            print(f"\n⏱️  Presupuesto de {self.presupuesto_segundos:.0f}s agotado - "
+                  f"se deja el resto del backlog para {destino}")
+        return True
+
+    def __iter__(self) -> Iterator[Dict]:
+        while True:
+            if self.max_documentos is not None and self.entregados >= self.max_documentos:
+                return
+            if self.agotar_si_corresponde():
+                return
+
+            filas = self._pagina()
+            if not filas:
+                return
+
+            self.paginas += 1
+            ultimo = filas[-1]
+            self._cursor = (ultimo['created_at'], ultimo['id'])
+
+            # También entre documentos: una página completa puede exceder el presupuesto
+            for fila in filas:
+                if self.agotar_si_corresponde():
+                    return
+                self.entregados += 1
+                yield fila
+
+            if len(filas) < self.tamano_pagina:
+                return
+
+    def resumen(self) -> Dict:
+        return {
+            'paginas': self.paginas,
+            'documentos_entregados': self.entregados,
+            'presupuesto_segundos': self.presupuesto_segundos,
+            'agotado_por_presupuesto': self.agotado_por_presupuesto
+        }
+
+
+def procesar_en_pool(items: Iterable, funcion: Callable, max_workers: int,
+                     max_en_vuelo: Optional[int] = None) -> Iterator[Tuple[Dict, Future]]:
+    """
+    Alimenta un ThreadPoolExecutor desde un iterable perezoso.
+
+    Mantiene a lo sumo max_en_vuelo tareas enviadas (por defecto 2 × workers)
+    para que la siguiente página solo se pida cuando hay capacidad libre.
+    Entrega (item, future) a medida que terminan; el llamador usa future.result().
+    """
+
+    max_en_vuelo = max_en_vuelo or max_workers * 2
+    iterador = iter(items)
+    en_vuelo: Dict[Future, Dict] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def llenar():
+            while len(en_vuelo) < max_en_vuelo:
+                try:
+                    item = next(iterador)
+                except StopIteration:
+                    return
+                en_vuelo[executor.submit(funcion, item)] = item
+
+        llenar()
+        while en_vuelo:
+            hechos, _ = wait(list(en_vuelo), return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                yield en_vuelo.pop(futuro), futuro
+            llenar()
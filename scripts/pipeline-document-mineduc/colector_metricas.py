@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Colector de métricas de una ejecución a partir de sus artefactos
+
+fase6 recibía --downloaded/--transformed/--loaded/--tokens/--cost que el
+workflow extraía con jq de cada *_metrics.json, y latencia_procesamiento_ms
+quedaba siempre en 0. El colector lee directamente los artefactos de las
+fases (JSON + trazas de trazas.py) y calcula:
+
+- Contadores de la ejecución (los mismos que antes llegaban por flags)
+- Throughput: documentos/min de la ejecución y de transformación,
+  chunks/s y tokens/s de la carga
+- Latencia por documento (p50/p90/p99) en cada fase, desde los spans
+- Costo por documento cargado
+
+Un valor que no se puede calcular (sin duración o sin documentos) queda en
+None, no en 0, para que una regresión no se confunda con "sin datos".
+
+Uso:
+    python scripts/pipeline-document-mineduc/fase6_metrics.py \\
+        --artefactos artefactos --workflow-id "$GITHUB_RUN_ID" --export-json
+"""
+
+import glob
+import json
+import os
+from argparse import Namespace
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from rollups_metricas import sketches_desde_eventos
+from trazas import cargar_eventos, resumen_ejecucion
+
+# Archivo → fase (nombres que exportan los scripts)
+ARTEFACTOS = {
+    'monitor_response.json': 'extraccion',
+    'verify_storage_metrics.json': 'verificacion',
+    'transform_metrics.json': 'transformacion',
+    'load_metrics.json': 'carga',
+    'validation_metrics.json': 'validacion',
+    'optimize_metrics.json': 'optimizacion',
+    'pipeline_runner_metrics.json': 'runner',
+}
+
+# Servicio de las trazas (nombre del script) → fase
+SERVICIOS = {
+    'fase1.5_verify_storage': 'verificacion',
+    'fase2_transform_multiproveedor': 'transformacion',
+    'fase3_load': 'carga',
+    'fase4_validacion_calidad': 'validacion',
+    'fase5_optimize': 'optimizacion',
+    'pipeline_runner': 'runner',
+}
+
+
+def buscar_artefactos(directorio: str) -> Dict[str, Dict]:
+    """{fase: json} con el archivo más reciente de cada fase bajo `directorio`"""
+    encontrados: Dict[str, tuple] = {}
+    for ruta in glob.glob(os.path.join(directorio, '**', '*.json'), recursive=True):
+        fase = ARTEFACTOS.get(os.path.basename(ruta))
+        if fase is None:
+            continue
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                contenido = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"   ⚠️ Artefacto ilegible {ruta}: {e}")
+            continue
+        modificado = os.path.getmtime(ruta)
+        if fase not in encontrados or modificado > encontrados[fase][0]:
+            encontrados[fase] = (modificado, contenido)
+    return {fase: contenido for fase, (_, contenido) in encontrados.items()}
+
+
+def _numero(valor, defecto=0):
+    try:
+        return type(defecto)(valor) if valor is not None else defecto
+    except (TypeError, ValueError):
+        return defecto
+
+
+def _tasa(cantidad: float, segundos: Optional[float], por: float = 1.0) -> Optional[float]:
+    if not segundos or segundos <= 0:
+        return None
+    return round(cantidad / segundos * por, 3)
+
+
+@dataclass
+class MetricasEjecucion:
+    """Contadores, rendimiento y trazas de una ejecución del pipeline"""
+    downloaded: int = 0
+    transformed: int = 0
+    loaded: int = 0
+    validated: int = 0
+    quality: float = 0.0
+    tokens: int = 0
+    cost: float = 0.0
+    chunks: int = 0
+    duraciones_fase_s: Dict[str, float] = field(default_factory=dict)
+    trazas: Dict = field(default_factory=dict)
+    rendimiento: Dict = field(default_factory=dict)
+    latencias: Dict = field(default_factory=dict)
+    fuentes: List[str] = field(default_factory=list)
+
+    def aplicar(self, args: Namespace) -> Namespace:
+        """Completa el Namespace de fase6 con lo recolectado"""
+        for nombre in ('downloaded', 'transformed', 'loaded', 'validated', 'quality', 'tokens', 'cost'):
+            setattr(args, nombre, getattr(self, nombre))
+        args.trazas = self.trazas
+        args.rendimiento = self.rendimiento
+        args.latencias = self.latencias
+        return args
+
+
+def contadores_desde_artefactos(artefactos: Dict[str, Dict]) -> MetricasEjecucion:
+    """Contadores de la ejecución; el runner en un proceso reemplaza a transform/load"""
+    m = MetricasEjecucion(fuentes=sorted(artefactos))
+    transformacion = artefactos.get('transformacion', {})
+    carga = artefactos.get('carga', {})
+    validacion = artefactos.get('validacion', {})
+    runner = artefactos.get('runner', {})
+
+    nuevos = _numero((artefactos.get('extraccion', {}).get('reporte') or {}).get('documentos_nuevos'))
+    if runner:
+        tomados = max(_numero(runner.get('descargados')), _numero(runner.get('tomados')))
+        m.transformed = _numero(runner.get('transformados')) + _numero(runner.get('transformados_previos'))
+        m.loaded = _numero(runner.get('cargados'))
+        m.chunks = _numero(runner.get('chunks'))
+        m.tokens = _numero(runner.get('tokens'))
+        m.cost = _numero(runner.get('cost_usd'), 0.0)
+    else:
+        tomados = _numero(transformacion.get('total'))
+        m.transformed = _numero(transformacion.get('transformed'))
+        m.loaded = _numero(carga.get('loaded'))
+        m.chunks = _numero((carga.get('chunks') or {}).get('total_generados'))
+        m.tokens = _numero(carga.get('tokens'))
+        m.cost = _numero(transformacion.get('cost_usd'), 0.0) + _numero(carga.get('cost_usd'), 0.0)
+
+    # Documentos que entraron a la ejecución: nuevos del monitor o backlog tomado por fase2
+    m.downloaded = max(nuevos, tomados)
+    m.validated = _numero(validacion.get('total_chunks'), m.chunks)
+    m.quality = _numero(validacion.get('calidad_promedio'), 0.0)
+    m.cost = round(m.cost, 4)
+
+    # Duraciones declaradas por los scripts (respaldo si no hay trazas)
+    for fase, contenido in artefactos.items():
+        segundos = contenido.get('tiempo_total_segundos')
+        if segundos:
+            m.duraciones_fase_s[fase] = float(segundos)
+    return m
+
+
+def _percentiles(resumen: Dict) -> Dict:
+    return {k: v for k, v in resumen.items() if k in ('n', 'p50_ms', 'p90_ms', 'p99_ms')}
+
+
+def calcular_rendimiento(contadores, trazas: Optional[Dict] = None,
+                         duraciones_fase_s: Optional[Dict[str, float]] = None) -> Dict:
+    """
+    Throughput, latencias y costo por documento. `contadores` es cualquier
+    objeto con loaded/transformed/tokens/cost (Namespace de fase6 o
+    MetricasEjecucion); `chunks` es opcional (por defecto validated).
+    """
+    trazas = trazas or {}
+    duraciones = dict(duraciones_fase_s or {})
+    for servicio, ms in (trazas.get('fases') or {}).items():
+        duraciones[SERVICIOS.get(servicio, servicio)] = ms / 1000.0
+
+    total_s = (trazas.get('tiempo_total_ms') or 0) / 1000.0 or sum(duraciones.values()) or None
+    # En el runner transformación y carga están solapadas: se usa la duración del proceso
+    segundos_transformacion = duraciones.get('transformacion') or duraciones.get('runner')
+    segundos_carga = duraciones.get('carga') or duraciones.get('runner')
+
+    loaded = contadores.loaded
+    chunks = getattr(contadores, 'chunks', None) or contadores.validated
+
+    return {
+        'duracion_total_s': round(total_s, 1) if total_s else None,
+        'duracion_por_fase_s': {fase: round(s, 1) for fase, s in sorted(duraciones.items())},
+        'documentos_por_minuto': _tasa(loaded, total_s, 60.0),
+        'transformacion_documentos_por_minuto': _tasa(contadores.transformed, segundos_transformacion, 60.0),
+        'carga_chunks_por_segundo': _tasa(chunks, segundos_carga),
+        'carga_tokens_por_segundo': _tasa(contadores.tokens, segundos_carga),
+        'costo_por_documento_usd': round(contadores.cost / loaded, 4) if loaded else None,
+        'latencia_documento_ms': {
+            SERVICIOS.get(servicio, servicio): _percentiles(resumen)
+            for servicio, resumen in (trazas.get('documentos_por_fase') or {}).items()
+        },
+        # Por etapa (descarga, ocr, vision, embedding, escritura, ...) entre todas las fases
+        'latencia_etapa_ms': {
+            etapa: _percentiles(resumen) for etapa, resumen in (trazas.get('etapas') or {}).items()
+            if etapa != 'documento' and not etapa.startswith('etapa_')
+        }
+    }
+
+
+def recolectar(directorio: str, run_id: Optional[str] = None) -> MetricasEjecucion:
+    """Lee artefactos y trazas de `directorio` y calcula el rendimiento"""
+    metricas = contadores_desde_artefactos(buscar_artefactos(directorio))
+    eventos = cargar_eventos(directorio, run_id)
+    metricas.trazas = resumen_ejecucion(eventos)
+    # Sketches fusionables de las duraciones para los rollups (rollups_metricas.py)
+    metricas.latencias = sketches_desde_eventos(eventos, SERVICIOS)
+    metricas.rendimiento = calcular_rendimiento(metricas, metricas.trazas, metricas.duraciones_fase_s)
+    return metricas
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Columnas tipadas de chunks_documentos para búsqueda vectorial pre-filtrada
+
+extraer_metadata_documento y los chunkers de fase3 dejan dominios MBE,
+nivel educativo, módulo, categoría y nivel de desempeño solo en el JSONB
+metadata, mientras que buscar_chunks_similares filtra por las columnas
+dominio_mbe / tipo_contenido (nunca pobladas). Este módulo:
+
+1. columnas_tipadas(): mapeo único metadata -> columnas, usado por fase3 al
+   insertar cada chunk
+2. BackfillColumnasChunks: recorre (keyset sobre id) los chunks existentes
+   con tipo_contenido nulo y los actualiza en bloque vía la RPC
+   actualizar_columnas_chunks (fila a fila si no está desplegada)
+
+Uso (backfill):
+    python scripts/pipeline-document-mineduc/columnas_chunks.py [--lote 500] [--max-chunks N]
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119007_columnas_tipadas_chunks.sql
+"""
+
+import argparse
+import os
+import re
+import sys
+import unicodedata
+from datetime import datetime
+from typing import Dict, List, Optional
+
+DOMINIO_RE = re.compile(r'dominio\s+([a-d])\b', re.IGNORECASE)
+NIVELES_DESEMPENO = ('insatisfactorio', 'basico', 'competente', 'destacado')
+TIPO_CONTENIDO_DEFECTO = 'desconocido'
+
+# Largo de las columnas varchar (recortar antes de insertar)
+LARGO_SECCION = 200
+LARGO_TIPO_CONTENIDO = 50
+LARGO_NIVEL_EDUCATIVO = 50
+
+COLUMNAS = ('seccion', 'dominio_mbe', 'dominios_mbe', 'tipo_contenido',
+            'nivel_educativo', 'modulo', 'nivel_desempeno', 'pagina_numero')
+
+
+# ============================================
+# MAPEO METADATA -> COLUMNAS
+# ============================================
+
+def _sin_tildes(texto: str) -> str:
+    normalizado = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in normalizado if not unicodedata.combining(c))
+
+
+def _entero(valor) -> Optional[int]:
+    try:
+        return int(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _recortar(valor, largo: int) -> Optional[str]:
+    if valor is None:
+        return None
+    texto = str(valor).strip()
+    return texto[:largo] if texto else None
+
+
+def columnas_tipadas(contenido: str, metadata: Dict) -> Dict:
+    """
+    Columnas filtrables de un chunk a partir de su texto y metadata.
+
+    Los dominios MBE se detectan en el texto del chunk; si no menciona
+    ninguno se heredan los del documento. dominio_mbe solo se fija cuando
+    hay exactamente un dominio (dominios_mbe guarda la lista completa).
+    """
+    metadata = metadata or {}
+
+    dominios = sorted({d.lower() for d in DOMINIO_RE.findall(contenido or '')})
+    if not dominios:
+        dominios = sorted({str(d).lower() for d in metadata.get('dominios_mbe') or []})
+
+    nivel_desempeno = metadata.get('nivel_desempeno')
+    if nivel_desempeno is not None:
+        nivel_desempeno = _sin_tildes(str(nivel_desempeno)).lower()
+        if nivel_desempeno not in NIVELES_DESEMPENO:
+            nivel_desempeno = None
+
+    tipo_contenido = metadata.get('categoria') or metadata.get('tipo_documento') or TIPO_CONTENIDO_DEFECTO
+
+    return {
+        'seccion': _recortar(metadata.get('seccion') or metadata.get('indicador_nombre'), LARGO_SECCION),
+        'dominio_mbe': dominios[0] if len(dominios) == 1 else None,
+        'dominios_mbe': dominios,
+        'tipo_contenido': _recortar(tipo_contenido, LARGO_TIPO_CONTENIDO),
+        'nivel_educativo': _recortar(metadata.get('nivel_educativo'), LARGO_NIVEL_EDUCATIVO),
+        'modulo': _entero(metadata.get('modulo')),
+        'nivel_desempeno': nivel_desempeno,
+        'pagina_numero': _entero(metadata.get('pagina'))
+    }
+
+
+# ============================================
+# BACKFILL DE CHUNKS EXISTENTES
+# ============================================
+
+def _rpc_no_desplegada(error: Exception) -> bool:
+    mensaje = str(error)
+    return 'PGRST202' in mensaje or 'Could not find the function' in mensaje
+
+
+class BackfillColumnasChunks:
+    """Puebla las columnas tipadas de los chunks cargados antes del cambio"""
+
+    def __init__(self, supabase_client, lote: int = 500, max_chunks: Optional[int] = None):
+        self.supabase = supabase_client
+        self.lote = lote
+        self.max_chunks = max_chunks
+        self._rpc_disponible = True
+        self.leidos = 0
+        self.actualizados = 0
+
+    def _pagina(self, ultimo: Optional[str]) -> List[Dict]:
+        query = self.supabase.table('chunks_documentos')\
+            .select('id, contenido, metadata')\
+            .is_('tipo_contenido', 'null')
+        if ultimo is not None:
+            query = query.gt('id', ultimo)
+        return query.order('id').limit(self.lote).execute().data or []
+
+    def _actualizar(self, filas: List[Dict]) -> int:
+        if self._rpc_disponible:
+            try:
+                result = self.supabase.rpc('actualizar_columnas_chunks', {'p_filas': filas}).execute()
+                return result.data if isinstance(result.data, int) else len(filas)
+            except Exception as e:
+                if not _rpc_no_desplegada(e):
+                    raise
+                print("   ⚠️ RPC actualizar_columnas_chunks no desplegada - actualizando fila a fila")
+                self._rpc_disponible = False
+
+        for fila in filas:
+            columnas = {clave: valor for clave, valor in fila.items() if clave != 'id'}
+            self.supabase.table('chunks_documentos').update(columnas).eq('id', fila['id']).execute()
+        return len(filas)
+
+    def ejecutar(self) -> Dict:
+        """Keyset sobre id: las filas que quedan sin tipo no se releen en la misma corrida"""
+        ultimo = None
+        while self.max_chunks is None or self.leidos < self.max_chunks:
+            pagina = self._pagina(ultimo)
+            if not pagina:
+                break
+            if self.max_chunks is not None:
+                pagina = pagina[:self.max_chunks - self.leidos]
+
+            filas = [{'id': chunk['id'], **columnas_tipadas(chunk.get('contenido'), chunk.get('metadata'))}
+                     for chunk in pagina]
+            self.actualizados += self._actualizar(filas)
+            self.leidos += len(pagina)
+            ultimo = pagina[-1]['id']
+            print(f"   📝 {self.leidos:,} chunks procesados")
+
+            if len(pagina) < self.lote:
+                break
+
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'chunks_leidos': self.leidos,
+            'chunks_actualizados': self.actualizados,
+            'via_rpc': self._rpc_disponible
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill de columnas tipadas en chunks_documentos')
+    parser.add_argument('--lote', type=int, default=500)
+    parser.add_argument('--max-chunks', type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        from dotenv import load_dotenv
+        from supabase import create_client
+    except ImportError:
+        print("❌ Instalar: pip install supabase python-dotenv")
+        sys.exit(1)
+
+    load_dotenv('.env.local')
+    supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+
+    print("\n" + "=" * 60)
+    print("🏷️  BACKFILL DE COLUMNAS TIPADAS (chunks_documentos)")
+    print("=" * 60)
+
+    resumen = BackfillColumnasChunks(supabase, lote=args.lote, max_chunks=args.max_chunks).ejecutar()
+    print(f"\n✅ {resumen['chunks_actualizados']:,} chunks actualizados")
+
+
+if __name__ == '__main__':
+    main()
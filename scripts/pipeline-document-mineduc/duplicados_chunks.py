@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Detección vectorizada de chunks semánticamente duplicados
+
+Chunks casi idénticos (similitud coseno >= umbral) inflan el índice
+vectorial y devuelven resultados repetidos en la búsqueda. Comparar todos
+los pares es O(n²) sobre decenas de miles de vectores de 1536 dimensiones,
+así que:
+
+1. Los embeddings se leen de un export de snapshot_ann.py (sin red) o, si
+   no hay snapshot, por páginas de PostgREST (keyset sobre id), a matrices
+   float32 normalizadas agrupadas en bloques candidatos:
+   - 'lsh' (defecto): proyecciones aleatorias (varias tablas de hiperplanos)
+   - 'tipo': un bloque por metadata.tipo_documento (O(n²) dentro de cada
+     tipo grande)
+2. Dentro de cada bloque la similitud se calcula con productos matriciales
+   por lotes de filas (memoria acotada a lote × bloque)
+3. Los pares sobre el umbral se unen con union-find en clusters
+
+Leer todo el corpus es costoso: fase4 solo ejecuta la detección con
+VALIDAR_CHUNKS_DUPLICADOS=true (opt-in).
+
+Variables de entorno:
+- CHUNKS_DUPLICADO_UMBRAL=0.95
+- CHUNKS_DUPLICADO_BLOQUEO=lsh (lsh | tipo)
+- CHUNKS_DUPLICADO_SNAPSHOT (directorio de snapshot_ann.py; vacío = PostgREST)
+- EMBEDDING_DIMENSIONS=1536
+"""
+
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vectores import decodificar_vector, normalizar_filas
+
+UMBRAL_DUPLICADO = float(os.getenv('CHUNKS_DUPLICADO_UMBRAL', '0.95'))
+BLOQUEO = os.getenv('CHUNKS_DUPLICADO_BLOQUEO', 'lsh')
+SNAPSHOT_DIR = os.getenv('CHUNKS_DUPLICADO_SNAPSHOT') or None
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))
+
+LSH_TABLAS = 4
+LSH_BITS = 8
+TAMANO_PAGINA = 500
+LOTE_FILAS = 1024
+
+
+# ============================================
+# UNION-FIND
+# ============================================
+
+class UnionFind:
+    def __init__(self):
+        self.padre: Dict[str, str] = {}
+
+    def encontrar(self, x: str) -> str:
+        self.padre.setdefault(x, x)
+        raiz = x
+        while self.padre[raiz] != raiz:
+            raiz = self.padre[raiz]
+        while self.padre[x] != raiz:
+            self.padre[x], x = raiz, self.padre[x]
+        return raiz
+
+    def unir(self, a: str, b: str):
+        ra, rb = self.encontrar(a), self.encontrar(b)
+        if ra != rb:
+            self.padre[max(ra, rb)] = min(ra, rb)
+
+    def grupos(self) -> List[List[str]]:
+        grupos = defaultdict(list)
+        for x in self.padre:
+            grupos[self.encontrar(x)].append(x)
+        return [sorted(g) for g in grupos.values() if len(g) > 1]
+
+
+# ============================================
+# SIMILITUD POR BLOQUES
+# ============================================
+
+def pares_similares(matriz: np.ndarray, umbral: float,
+                    lote: int = LOTE_FILAS) -> List[Tuple[int, int, float]]:
+    """
+    Pares (i, j, similitud) con i < j y coseno >= umbral.
+    `matriz` debe venir normalizada por filas.
+    """
+    pares = []
+    n = matriz.shape[0]
+    for inicio in range(0, n, lote):
+        fin = min(inicio + lote, n)
+        # Solo la parte triangular superior: columnas desde `inicio`
+        similitudes = matriz[inicio:fin] @ matriz[inicio:].T
+        filas, columnas = np.nonzero(similitudes >= umbral)
+        globales = columnas + inicio
+        mascara = globales > filas + inicio
+        for f, c, g in zip(filas[mascara], columnas[mascara], globales[mascara]):
+            pares.append((inicio + int(f), int(g), float(similitudes[f, c])))
+    return pares
+
+
+def claves_lsh(matriz: np.ndarray, tablas: int = LSH_TABLAS, bits: int = LSH_BITS,
+               semilla: int = 7) -> np.ndarray:
+    """Firma de hiperplanos aleatorios por tabla: (n, tablas) enteros"""
+    rng = np.random.default_rng(semilla)
+    planos = rng.standard_normal((matriz.shape[1], tablas * bits)).astype(np.float32)
+    signos = (matriz @ planos) > 0
+    pesos = 1 << np.arange(bits)
+    return signos.reshape(len(matriz), tablas, bits).astype(np.int64) @ pesos
+
+
+def clusters_duplicados(ids: List[str], matriz: np.ndarray, bloques: Dict[str, np.ndarray],
+                        umbral: float = UMBRAL_DUPLICADO) -> Tuple[List[List[str]], int]:
+    """
+    Agrupa chunks duplicados evaluando solo pares dentro de cada bloque.
+
+    Returns:
+        (clusters de ids, pares evaluados)
+    """
+    uf = UnionFind()
+    evaluados = 0
+    for indices in bloques.values():
+        if len(indices) < 2:
+            continue
+        evaluados += len(indices) * (len(indices) - 1) // 2
+        for i, j, _ in pares_similares(matriz[indices], umbral):
+            uf.unir(ids[indices[i]], ids[indices[j]])
+    return uf.grupos(), evaluados
+
+
+# ============================================
+# DETECTOR SOBRE chunks_documentos
+# ============================================
+
+class DetectorChunksDuplicados:
+    """Lee embeddings de chunks_documentos y reporta clusters duplicados"""
+
+    def __init__(self, supabase_client, umbral: float = UMBRAL_DUPLICADO,
+                 bloqueo: str = BLOQUEO, dimensiones: int = EMBEDDING_DIMENSIONS,
+                 snapshot: Optional[str] = SNAPSHOT_DIR):
+        if bloqueo not in ('tipo', 'lsh'):
+            raise ValueError(f"Bloqueo desconocido: {bloqueo} (usar 'tipo' o 'lsh')")
+        self.supabase = supabase_client
+        self.umbral = umbral
+        self.bloqueo = bloqueo
+        self.dimensiones = dimensiones
+        self.snapshot = snapshot
+
+    def _leer_embeddings(self):
+        """Páginas keyset de (id, documento_id, tipo_documento, embedding)"""
+        ultimo: Optional[str] = None
+        while True:
+            query = self.supabase.table('chunks_documentos')\
+                .select('id, documento_id, tipo_documento:metadata->>tipo_documento, embedding')\
+                .not_.is_('embedding', 'null')
+            if ultimo is not None:
+                query = query.gt('id', ultimo)
+            filas = query.order('id').limit(TAMANO_PAGINA).execute().data or []
+            if not filas:
+                return
+            yield filas
+            ultimo = filas[-1]['id']
+            if len(filas) < TAMANO_PAGINA:
+                return
+
+    def _cargar_snapshot(self) -> Tuple[List[str], List[str], List[str], np.ndarray]:
+        """Export de snapshot_ann.py (vectores memory-mapped, sin PostgREST)"""
+        from snapshot_ann import SnapshotANN
+
+        snapshot = SnapshotANN.abrir(self.snapshot)
+        filas = snapshot.filas
+        return (
+            [f['chunk_id'] for f in filas],
+            [f['documento_id'] for f in filas],
+            [(f.get('metadata') or {}).get('tipo_documento') or 'desconocido' for f in filas],
+            normalizar_filas(snapshot.matriz())
+        )
+
+    def cargar(self) -> Tuple[List[str], List[str], List[str], np.ndarray]:
+        """Matriz normalizada (n, dimensiones) float32 más ids, documentos y tipos"""
+        if self.snapshot:
+            return self._cargar_snapshot()
+
+        ids, documentos, tipos, paginas = [], [], [], []
+
+        for filas in self._leer_embeddings():
+            pagina = np.zeros((len(filas), self.dimensiones), dtype=np.float32)
+            usadas = 0
+            for fila in filas:
+                vector = decodificar_vector(fila['embedding'])
+                if vector is None or vector.shape[0] != self.dimensiones:
+                    continue
+                pagina[usadas] = vector
+                usadas += 1
+                ids.append(fila['id'])
+                documentos.append(fila['documento_id'])
+                tipos.append(fila.get('tipo_documento') or 'desconocido')
+            paginas.append(pagina[:usadas])
+
+        if not paginas:
+            return [], [], [], np.zeros((0, self.dimensiones), dtype=np.float32)
+
+        return ids, documentos, tipos, normalizar_filas(np.concatenate(paginas))
+
+    def _bloques(self, tipos: List[str], matriz: np.ndarray) -> Dict[str, np.ndarray]:
+        bloques = defaultdict(list)
+        if self.bloqueo == 'tipo':
+            for i, tipo in enumerate(tipos):
+                bloques[tipo].append(i)
+        else:
+            for i, fila in enumerate(claves_lsh(matriz)):
+                for tabla, clave in enumerate(fila):
+                    bloques[f'{tabla}:{clave}'].append(i)
+        return {k: np.asarray(v) for k, v in bloques.items()}
+
+    def detectar(self) -> Dict:
+        """Ejecuta la detección completa y devuelve el reporte"""
+        print(f"\n🧬 DETECCIÓN DE CHUNKS DUPLICADOS (coseno >= {self.umbral}, bloqueo {self.bloqueo})")
+
+        ids, documentos, tipos, matriz = self.cargar()
+        print(f"   Embeddings cargados: {len(ids)} ({matriz.nbytes / 1e6:.1f} MB)")
+
+        bloques = self._bloques(tipos, matriz)
+        clusters, evaluados = clusters_duplicados(ids, matriz, bloques, self.umbral)
+
+        documento_de = dict(zip(ids, documentos))
+        reporte_clusters = sorted(
+            (
+                {
+                    'chunk_ids': cluster,
+                    'documento_ids': sorted({documento_de[c] for c in cluster}),
+                    'tamano': len(cluster)
+                }
+                for cluster in clusters
+            ),
+            key=lambda c: c['tamano'], reverse=True
+        )
+        redundantes = sum(c['tamano'] - 1 for c in reporte_clusters)
+
+        total_pares = len(ids) * (len(ids) - 1) // 2
+        print(f"   Pares evaluados: {evaluados:,} de {total_pares:,} posibles")
+        print(f"   Clusters duplicados: {len(reporte_clusters)} ({redundantes} chunks redundantes)")
+        for cluster in reporte_clusters[:5]:
+            print(f"   - {cluster['tamano']} chunks en {len(cluster['documento_ids'])} documento(s)")
+
+        return {
+            'umbral': self.umbral,
+            'bloqueo': self.bloqueo,
+            'chunks_analizados': len(ids),
+            'pares_evaluados': evaluados,
+            'clusters': len(reporte_clusters),
+            'chunks_redundantes': redundantes,
+            'detalle_clusters': reporte_clusters[:50]
+        }
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Embeddings en precisión reducida: halfvec (chunks) e int8 (caché)
+
+Cada embedding de 1536 dimensiones se guarda como float32 y viaja por
+PostgREST como una lista JSON de ~1536 decimales. Con la migración
+20260119008:
+
+- chunks_documentos.embedding_half (halfvec, 2 bytes/dim) se mantiene por
+  trigger. Por sí sola es almacenamiento adicional: la memoria del índice
+  se reduce a la mitad recién con activar-halfvec, que construye el HNSW
+  de embedding_half con CONCURRENTLY, cambia buscar_chunks_similares a
+  halfvec y elimina el índice ANN float32 de embedding
+- embeddings_cache guarda int8 + escala por vector (1 byte/dim), enviado
+  como bytea hex: ~3 KB por vector en vez de ~20 KB de JSON
+
+Este módulo tiene los codificadores usados por fase3, el backfill de filas
+existentes y un benchmark de pérdida de recall vs tamaño/latencia.
+
+Uso:
+    python scripts/pipeline-document-mineduc/embeddings_reducidos.py backfill \\
+        [--solo chunks|cache] [--liberar-float32]
+    python scripts/pipeline-document-mineduc/embeddings_reducidos.py activar-halfvec \\
+        [--dsn postgresql://...]
+    python scripts/pipeline-document-mineduc/embeddings_reducidos.py benchmark \\
+        [--consultas 200] [--dsn postgresql://...]
+
+Variables de entorno:
+- EMBEDDING_CACHE_FORMATO=float32|int8 (formato en que fase3 escribe el caché; la
+  lectura acepta ambos)
+- EMBEDDING_ALMACENAMIENTO=float32|halfvec (halfvec: fase3 envía el vector con
+  EMBEDDING_DIGITOS_HALFVEC dígitos significativos, suficientes para float16;
+  achica el insert, no la columna float32 embedding)
+- EMBEDDING_MODEL=text-embedding-3-large
+- DATABASE_URL (activar-halfvec; benchmark de índices, opcional)
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119008_embeddings_precision_reducida.sql
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    print("❌ Instalar: pip install numpy")
+    sys.exit(1)
+
+from vectores import cuantizar_int8, decodificar_vector, decuantizar_int8
+
+FORMATOS_CACHE = ('float32', 'int8')
+FORMATO_CACHE = os.getenv('EMBEDDING_CACHE_FORMATO', 'float32')
+ALMACENAMIENTO = os.getenv('EMBEDDING_ALMACENAMIENTO', 'float32')
+DIGITOS_HALFVEC = int(os.getenv('EMBEDDING_DIGITOS_HALFVEC', '5'))
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-large')
+TAMANO_PAGINA = 500
+LOTE_HALFVEC = 5000
+
+SQL_VECINOS_HALF = """
+    select c.id::text
+    from chunks_documentos c
+    join documentos_oficiales d on d.id = c.documento_id
+    where d.es_version_actual = true
+    order by c.embedding_half <=> %s::halfvec
+    limit %s
+"""
+
+INDICE_HALF = 'idx_chunks_embedding_half'
+
+# Índices ANN sobre la columna float32 (no los de embedding_half)
+SQL_INDICES_FLOAT32 = """
+    select indexname from pg_indexes
+    where schemaname = 'public' and tablename = 'chunks_documentos'
+      and indexdef ~* 'using (hnsw|ivfflat) \\(embedding '
+    order by indexname
+"""
+
+SQL_PENDIENTES_HALF = """
+    select count(*) from chunks_documentos
+    where embedding is not null and embedding_half is null
+"""
+
+FIRMA_BUSQUEDA = ('buscar_chunks_similares(vector, double precision, integer, integer, '
+                  'character varying, character varying, character varying, integer, character varying)')
+
+SQL_TAMANO_INDICES = """
+    select i.indexname, pg_relation_size(format('public.%I', i.indexname)::regclass)
+    from pg_indexes i
+    where i.schemaname = 'public' and i.tablename = 'chunks_documentos'
+      and i.indexdef ilike '%using hnsw%'
+"""
+
+
+# ============================================
+# CODIFICACIÓN
+# ============================================
+
+def codificar_int8(embedding) -> Dict:
+    """Columnas int8 del caché: bytea en hex ('\\x...') + escala"""
+    codigos, escalas = cuantizar_int8(np.asarray(embedding, dtype=np.float32)[None, :])
+    return {
+        'embedding_int8': '\\x' + codigos[0].tobytes().hex(),
+        'embedding_escala': float(escalas[0])
+    }
+
+
+def decodificar_int8(valor: str, escala: float) -> np.ndarray:
+    """Inversa de codificar_int8 (PostgREST devuelve bytea como '\\x...')"""
+    texto = valor[2:] if valor.startswith('\\x') else valor
+    codigos = np.frombuffer(bytes.fromhex(texto), dtype=np.int8)
+    return decuantizar_int8(codigos[None, :], np.asarray([escala], dtype=np.float32))[0]
+
+
+def columnas_cache(embedding: List[float], formato: str = FORMATO_CACHE) -> Dict:
+    """Columnas de embeddings_cache a insertar según el formato configurado"""
+    if formato not in FORMATOS_CACHE:
+        raise ValueError(f"Formato de caché desconocido: {formato} (usar {', '.join(FORMATOS_CACHE)})")
+    if formato == 'int8':
+        return codificar_int8(embedding)
+    return {'embedding': embedding}
+
+
+def embedding_de_cache(fila: Dict) -> Optional[List[float]]:
+    """Embedding de una fila del caché: float32 si existe, si no int8 decodificado"""
+    if fila.get('embedding') is not None:
+        vector = decodificar_vector(fila['embedding'])
+        return vector.tolist() if vector is not None else None
+    if fila.get('embedding_int8') and fila.get('embedding_escala') is not None:
+        return decodificar_int8(fila['embedding_int8'], fila['embedding_escala']).tolist()
+    return None
+
+
+def serializar_embedding(embedding, almacenamiento: str = ALMACENAMIENTO):
+    """
+    Valor a enviar a chunks_documentos.embedding (lista, arreglo o texto
+    pgvector, p.ej. el embedding reutilizado de otro chunk). Con halfvec se
+    envía texto pgvector con los dígitos que float16 conserva: solo reduce
+    el payload del insert, la columna embedding sigue siendo float32. El
+    ahorro de almacenamiento está en embedding_half, que mantiene el trigger.
+    """
+    if almacenamiento != 'halfvec':
+        return embedding
+    valores = decodificar_vector(embedding) if isinstance(embedding, str) else embedding
+    return '[' + ','.join(f'{float(x):.{DIGITOS_HALFVEC}g}' for x in valores) + ']'
+
+
+# ============================================
+# BACKFILL
+# ============================================
+
+def _rpc_no_desplegada(error: Exception) -> bool:
+    mensaje = str(error)
+    return 'PGRST202' in mensaje or 'Could not find the function' in mensaje
+
+
+class MigradorEmbeddings:
+    """Backfill de embedding_half (chunks) y del int8 del caché"""
+
+    def __init__(self, supabase_client, lote: int = TAMANO_PAGINA):
+        self.supabase = supabase_client
+        self.lote = lote
+
+    def backfill_chunks_half(self, limite: int = LOTE_HALFVEC) -> int:
+        """El cast vector -> halfvec ocurre en la BD: solo se itera la RPC"""
+        total = 0
+        while True:
+            actualizados = self.supabase.rpc('backfill_embedding_half', {'p_limite': limite}).execute().data or 0
+            total += actualizados
+            if actualizados:
+                print(f"   📝 {total:,} chunks con embedding_half")
+            if actualizados < limite:
+                return total
+
+    def _paginas_cache(self):
+        ultimo = None
+        while True:
+            query = self.supabase.table('embeddings_cache')\
+                .select('content_hash, model, embedding')\
+                .eq('model', EMBEDDING_MODEL)\
+                .is_('embedding_int8', 'null')\
+                .not_.is_('embedding', 'null')
+            if ultimo is not None:
+                query = query.gt('content_hash', ultimo)
+            filas = query.order('content_hash').limit(self.lote).execute().data or []
+            if not filas:
+                return
+            yield filas
+            ultimo = filas[-1]['content_hash']
+            if len(filas) < self.lote:
+                return
+
+    def backfill_cache_int8(self, liberar_float32: bool = False) -> int:
+        total = 0
+        for filas in self._paginas_cache():
+            lote = []
+            for fila in filas:
+                vector = decodificar_vector(fila['embedding'])
+                if vector is None or vector.size == 0:
+                    continue
+                lote.append({'content_hash': fila['content_hash'], 'model': fila['model'], **codificar_int8(vector)})
+            if not lote:
+                continue
+
+            try:
+                self.supabase.rpc('actualizar_cache_int8', {
+                    'p_filas': lote,
+                    'p_liberar_float32': liberar_float32
+                }).execute()
+            except Exception as e:
+                if not _rpc_no_desplegada(e):
+                    raise
+                print("   ❌ RPC actualizar_cache_int8 no desplegada (aplicar migración 20260119008)")
+                return total
+
+            total += len(lote)
+            print(f"   📝 {total:,} entradas de caché en int8")
+        return total
+
+
+# ============================================
+# CAMBIO DE ÍNDICE (float32 → halfvec)
+# ============================================
+
+def sentencias_activacion_halfvec(indices_float32: List[str]) -> List[str]:
+    """
+    Cambio a halfvec en orden seguro: el índice nuevo existe antes de que la
+    búsqueda lo use, y el float32 se elimina al final. Todas con
+    CONCURRENTLY (requieren autocommit, fuera de una transacción).
+    """
+    return [
+        f"create index concurrently if not exists {INDICE_HALF} "
+        "on chunks_documentos using hnsw (embedding_half halfvec_cosine_ops)",
+        f"alter function {FIRMA_BUSQUEDA} set app.embedding_busqueda = 'halfvec'",
+    ] + [f'drop index concurrently if exists public."{nombre}"' for nombre in indices_float32]
+
+
+def activar_halfvec(dsn: str) -> Dict:
+    """Ejecuta sentencias_activacion_halfvec tras verificar backfill e índice"""
+    from benchmark_retrieval import conectar_postgres
+
+    conexion = conectar_postgres(dsn)
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute(SQL_PENDIENTES_HALF)
+            pendientes = cursor.fetchone()[0]
+            if pendientes:
+                print(f"   ❌ {pendientes:,} chunks sin embedding_half: ejecutar antes 'backfill --solo chunks'")
+                return {'success': False, 'pendientes': int(pendientes)}
+
+            cursor.execute(SQL_INDICES_FLOAT32)
+            indices_float32 = [fila[0] for fila in cursor.fetchall()]
+            crear, ajustar, *eliminar = sentencias_activacion_halfvec(indices_float32)
+
+            print(f"   🔧 Construyendo {INDICE_HALF} (CONCURRENTLY)...")
+            cursor.execute(crear)
+            # Un CREATE INDEX CONCURRENTLY interrumpido deja el índice inválido
+            cursor.execute("select indisvalid from pg_index where indexrelid = %s::regclass",
+                           (f'public.{INDICE_HALF}',))
+            if not cursor.fetchone()[0]:
+                cursor.execute(f"drop index concurrently if exists public.{INDICE_HALF}")
+                print(f"   ❌ {INDICE_HALF} quedó inválido: se eliminó, reintentar")
+                return {'success': False, 'indice_invalido': INDICE_HALF}
+
+            cursor.execute(ajustar)
+            print("   ✅ buscar_chunks_similares usa embedding_half")
+            for sentencia, nombre in zip(eliminar, indices_float32):
+                cursor.execute(sentencia)
+                print(f"   🗑️  {nombre} eliminado")
+    finally:
+        conexion.close()
+
+    return {'success': True, 'indice': INDICE_HALF, 'eliminados': indices_float32}
+
+
+# ============================================
+# BENCHMARK
+# ============================================
+
+def _recall(aproximado: np.ndarray, exacto: np.ndarray) -> float:
+    return float(np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(aproximado.tolist(), exacto.tolist())]))
+
+
+def comparar_precision(matriz: np.ndarray, consultas: int = 200, k: int = 10, semilla: int = 42) -> Dict:
+    """
+    Pérdida de recall@k por cuantizar el corpus (búsqueda exacta en ambos
+    lados, aísla el efecto de la precisión) y bytes por vector.
+    """
+    from benchmark_retrieval import top_k_exacto
+
+    rng = np.random.default_rng(semilla)
+    muestra = matriz[rng.choice(len(matriz), size=min(consultas, len(matriz)), replace=False)]
+    exacto = top_k_exacto(matriz, muestra, k)
+    ejemplo = matriz[0].tolist()
+
+    codigos, escalas = cuantizar_int8(matriz)
+    variantes = {
+        'float32': (matriz, matriz.shape[1] * 4, len(json.dumps(ejemplo))),
+        'halfvec': (matriz.astype(np.float16).astype(np.float32), matriz.shape[1] * 2,
+                    len(serializar_embedding(ejemplo, 'halfvec'))),
+        'int8': (decuantizar_int8(codigos, escalas), matriz.shape[1] + 4,
+                 len(codificar_int8(ejemplo)['embedding_int8']))
+    }
+
+    resultado = {}
+    for nombre, (corpus, bytes_vector, bytes_transferencia) in variantes.items():
+        resultado[nombre] = {
+            'recall_at_k': round(_recall(top_k_exacto(corpus, muestra, k), exacto), 4),
+            'bytes_por_vector': bytes_vector,
+            'bytes_transferencia': bytes_transferencia
+        }
+    return {'consultas': len(muestra), 'k': k, 'variantes': resultado}
+
+
+def medir_indices(dsn: str, ids: List[str], matriz: np.ndarray, consultas: int, k: int) -> Dict:
+    """Tamaño de los índices HNSW y recall/latencia de embedding vs embedding_half"""
+    from benchmark_retrieval import BackendPostgres, conectar_postgres, ejecutar_benchmark
+
+    class BackendHalfvec(BackendPostgres):
+        nombre = 'postgres_halfvec'
+
+        def buscar(self, vector: np.ndarray, k: int) -> List[str]:
+            texto = serializar_embedding(vector.tolist(), 'halfvec')
+            with self.conexion().cursor() as cursor:
+                cursor.execute(SQL_VECINOS_HALF, (texto, k))
+                return [fila[0] for fila in cursor.fetchall()]
+
+    conexion = conectar_postgres(dsn)
+    with conexion.cursor() as cursor:
+        cursor.execute(SQL_TAMANO_INDICES)
+        tamanos = {nombre: int(tamano) for nombre, tamano in cursor.fetchall()}
+    conexion.close()
+
+    return {
+        'tamano_indices_bytes': tamanos,
+        'float32': ejecutar_benchmark(BackendPostgres(dsn), ids, matriz, consultas, k),
+        'halfvec': ejecutar_benchmark(BackendHalfvec(dsn), ids, matriz, consultas, k)
+    }
+
+
+def export_metrics_json(metrics: dict, filepath: str):
+    """Exporta métricas en formato JSON para GitHub Actions"""
+    try:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2, ensure_ascii=False)
+        print(f"\n📄 Métricas exportadas: {filepath}")
+    except Exception as e:
+        print(f"\n⚠️ Error exportando métricas: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embeddings en precisión reducida (halfvec / int8)')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    backfill = sub.add_parser('backfill', help='Poblar halfvec e int8 en filas existentes')
+    backfill.add_argument('--solo', choices=['chunks', 'cache'], default=None)
+    backfill.add_argument('--liberar-float32', action='store_true',
+                          help='Borrar el float32 del caché tras codificarlo en int8')
+
+    activar = sub.add_parser('activar-halfvec', help='Índice HNSW halfvec en lugar del float32 (tras backfill)')
+    activar.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+
+    bench = sub.add_parser('benchmark', help='Recall vs tamaño/latencia por formato')
+    bench.add_argument('--consultas', type=int, default=200)
+    bench.add_argument('--k', type=int, default=10)
+    bench.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    bench.add_argument('--output', default='embeddings_reducidos_benchmark.json')
+    args = parser.parse_args()
+
+    try:
+        from dotenv import load_dotenv
+        from supabase import create_client
+    except ImportError:
+        print("❌ Instalar: pip install supabase python-dotenv")
+        sys.exit(1)
+
+    load_dotenv('.env.local')
+    supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+
+    print("\n" + "=" * 60)
+    print("🗜️  EMBEDDINGS EN PRECISIÓN REDUCIDA")
+    print("=" * 60)
+
+    if args.comando == 'backfill':
+        migrador = MigradorEmbeddings(supabase)
+        inicio = time.perf_counter()
+        if args.solo in (None, 'chunks'):
+            print("\n📐 chunks_documentos.embedding_half")
+            print(f"   ✅ {migrador.backfill_chunks_half():,} chunks actualizados")
+        if args.solo in (None, 'cache'):
+            print(f"\n📦 embeddings_cache int8 ({EMBEDDING_MODEL})")
+            print(f"   ✅ {migrador.backfill_cache_int8(args.liberar_float32):,} entradas actualizadas")
+        print(f"\n⏱️  {time.perf_counter() - inicio:.1f}s")
+        return
+
+    if args.comando == 'activar-halfvec':
+        if not args.dsn:
+            print("❌ Requiere --dsn o DATABASE_URL (CREATE INDEX CONCURRENTLY no es posible vía RPC)")
+            sys.exit(1)
+        print("\n🔁 Cambio de índice a halfvec")
+        if not activar_halfvec(args.dsn)['success']:
+            sys.exit(1)
+        return
+
+    from benchmark_retrieval import cargar_corpus_supabase
+
+    ids, matriz = cargar_corpus_supabase(supabase)
+    if len(ids) <= args.k:
+        print("   ⚠️ Sin suficientes embeddings para medir")
+        sys.exit(1)
+    print(f"   Corpus: {len(ids):,} chunks")
+
+    resultado = {'timestamp': datetime.now().isoformat(), 'corpus': len(ids)}
+    resultado['precision'] = comparar_precision(matriz, args.consultas, args.k)
+    for nombre, variante in resultado['precision']['variantes'].items():
+        print(f"   {nombre:<8} recall@{args.k} {variante['recall_at_k']:.2%} | "
+              f"{variante['bytes_por_vector']:,} B/vector | {variante['bytes_transferencia']:,} B transferidos")
+
+    if args.dsn:
+        resultado['indices'] = medir_indices(args.dsn, ids, matriz, min(args.consultas, 100), args.k)
+        for nombre, tamano in resultado['indices']['tamano_indices_bytes'].items():
+            print(f"   📦 {nombre}: {tamano / 1e6:.1f} MB")
+        for nombre in ('float32', 'halfvec'):
+            medicion = resultado['indices'][nombre]
+            print(f"   ⚡ {nombre:<8} recall@{args.k} {medicion['recall_at_k']:.2%} | "
+                  f"p95 {medicion['latencia_ms']['p95']}ms")
+    else:
+        print("   💡 Sin DATABASE_URL: se omite la medición de índices")
+
+    export_metrics_json(resultado, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Etapas productor/consumidor unidas por colas acotadas
+
+El ETL de mlops_pipeline hacía descarga → extracción → embedding → escritura
+en serie por documento: mientras se esperaba la red no se extraía texto y
+mientras se extraía no se pedían embeddings. Con etapas concurrentes el
+documento N+1 se descarga mientras el N se embebe.
+
+- Cada etapa tiene sus propios workers (hilos) y lee de una cola acotada:
+  si una etapa se atrasa, las anteriores se bloquean en vez de acumular
+  PDFs en memoria (backpressure)
+- Un trabajo que falla en una etapa no pasa por las siguientes; llega al
+  final con 'error' para que el llamador lo contabilice
+- Por etapa se mide tiempo ocupado, tiempo esperando entrada (etapa
+  hambrienta) y tiempo bloqueado en la salida (etapa siguiente saturada)
+"""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List
+
+_FIN = object()
+
+
+@dataclass
+class EtapaCola:
+    """Etapa del pipeline: funcion(trabajo) modifica el dict del trabajo"""
+    nombre: str
+    funcion: Callable[[Dict], None]
+    workers: int = 1
+
+
+@dataclass
+class EstadisticasEtapa:
+    """Tiempos acumulados entre todos los workers de una etapa"""
+    trabajos: int = 0
+    errores: int = 0
+    ocupado_s: float = 0.0
+    espera_entrada_s: float = 0.0
+    espera_salida_s: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def sumar(self, ocupado: float, espera_entrada: float, espera_salida: float, error: bool):
+        with self._lock:
+            self.trabajos += 1
+            self.errores += int(error)
+            self.ocupado_s += ocupado
+            self.espera_entrada_s += espera_entrada
+            self.espera_salida_s += espera_salida
+
+    def resumen(self) -> Dict:
+        return {
+            'trabajos': self.trabajos,
+            'errores': self.errores,
+            'ocupado_ms': int(self.ocupado_s * 1000),
+            'espera_entrada_ms': int(self.espera_entrada_s * 1000),
+            'espera_salida_ms': int(self.espera_salida_s * 1000)
+        }
+
+
+class PipelineEtapas:
+    """
+    Ejecuta trabajos a través de etapas concurrentes.
+
+    Uso:
+        pipeline = PipelineEtapas([
+            EtapaCola('descargar', descargar, workers=4),
+            EtapaCola('extraer', extraer),
+        ])
+        for trabajo in pipeline.ejecutar(documentos):
+            ...  # trabajo.get('error') indica si falló
+
+    Los trabajos salen en orden de término, no de entrada.
+    """
+
+    def __init__(self, etapas: List[EtapaCola], capacidad_cola: int = 4):
+        if not etapas:
+            raise ValueError("Se requiere al menos una etapa")
+        self.etapas = etapas
+        self.capacidad_cola = capacidad_cola
+        self.estadisticas = {etapa.nombre: EstadisticasEtapa() for etapa in etapas}
+
+    def _alimentar(self, items: Iterable[Dict], salida: queue.Queue, errores: List[BaseException]):
+        try:
+            for item in items:
+                salida.put(item)
+        except BaseException as e:
+            errores.append(e)
+        finally:
+            salida.put(_FIN)
+
+    def _trabajar(self, etapa: EtapaCola, entrada: queue.Queue, salida: queue.Queue,
+                  restantes: List[int], lock: threading.Lock):
+        estadisticas = self.estadisticas[etapa.nombre]
+        while True:
+            inicio_espera = time.monotonic()
+            trabajo = entrada.get()
+            espera_entrada = time.monotonic() - inicio_espera
+
+            if trabajo is _FIN:
+                # Reenviar a los demás workers de la etapa; el último cierra la siguiente
+                with lock:
+                    restantes[0] -= 1
+                    ultimo = restantes[0] == 0
+                if ultimo:
+                    salida.put(_FIN)
+                else:
+                    entrada.put(_FIN)
+                return
+
+            ocupado = 0.0
+            if not trabajo.get('error'):
+                inicio = time.monotonic()
+                try:
+                    etapa.funcion(trabajo)
+                except Exception as e:
+                    trabajo['error'] = str(e) or type(e).__name__
+                    trabajo['etapa_error'] = etapa.nombre
+                ocupado = time.monotonic() - inicio
+
+            inicio_salida = time.monotonic()
+            salida.put(trabajo)
+            estadisticas.sumar(ocupado, espera_entrada, time.monotonic() - inicio_salida,
+                               trabajo.get('etapa_error') == etapa.nombre)
+
+    def ejecutar(self, items: Iterable[Dict]) -> Iterator[Dict]:
+        """Entrega cada trabajo al salir de la última etapa"""
+        colas = [queue.Queue(maxsize=self.capacidad_cola) for _ in range(len(self.etapas) + 1)]
+        errores_alimentacion: List[BaseException] = []
+
+        hilos = [threading.Thread(target=self._alimentar, args=(items, colas[0], errores_alimentacion),
+                                  name='etapa-alimentar', daemon=True)]
+        for i, etapa in enumerate(self.etapas):
+            restantes, lock = [max(1, etapa.workers)], threading.Lock()
+            for n in range(restantes[0]):
+                hilos.append(threading.Thread(
+                    target=self._trabajar, args=(etapa, colas[i], colas[i + 1], restantes, lock),
+                    name=f'etapa-{etapa.nombre}-{n}', daemon=True
+                ))
+        for hilo in hilos:
+            hilo.start()
+
+        while True:
+            trabajo = colas[-1].get()
+            if trabajo is _FIN:
+                break
+            yield trabajo
+
+        for hilo in hilos:
+            hilo.join()
+        if errores_alimentacion:
+            raise errores_alimentacion[0]
+
+    def resumen(self) -> Dict[str, Dict]:
+        return {nombre: est.resumen() for nombre, est in self.estadisticas.items()}
+
+    def workers_totales(self) -> int:
+        return sum(max(1, etapa.workers) for etapa in self.etapas)
@@ -23,6 +23,11 @@ from dotenv import load_dotenv
 from supabase import create_client
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from transiciones_estado import BufferTransiciones
+from almacen_contenido import AlmacenContenido
+from trazas import obtener_trazador, span
+from perfilado import perfilar
+
 load_dotenv('.env.local')
 
 supabase = create_client(
@@ -30,6 +35,12 @@ supabase = create_client(
     os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 )
 
+# Transiciones de etapa aplicadas en bloque (flush automático al salir)
+transiciones = BufferTransiciones(supabase)
+
+# Registro SHA-256 → objeto canónico (evita subir PDFs duplicados)
+almacen = AlmacenContenido(supabase, transiciones)
+
 # Configuración
 BATCH_SIZE = int(os.getenv('VERIFY_BATCH_SIZE', '5'))  # Documentos en paralelo
 MAX_RETRIES = 3
@@ -158,6 +169,15 @@ def redownload_y_upload(doc_id, url_original, storage_path, titulo):
             if len(pdf_bytes) > 100_000_000:
                 return False, f"Archivo muy grande ({size_mb:.2f} MB)", 0
             
+            # Deduplicación por contenido: mismo PDF ya almacenado bajo otro path
+            objeto = almacen.objeto_para_subida(pdf_bytes)
+            if objeto and objeto['storage_path'] != storage_path:
+                existe, _, _ = verificar_archivo_existe(objeto['storage_path'])
+                if existe:
+                    print(f"      🔗 Contenido idéntico ya almacenado: {objeto['storage_path']}")
+                    almacen.resolver(doc_id, storage_path, pdf_bytes)
+                    return True, "Duplicado de objeto existente", len(pdf_bytes)
+            
             # Subir a Storage
             print(f"      💾 Subiendo a Storage...")
             
@@ -189,6 +209,7 @@ def redownload_y_upload(doc_id, url_original, storage_path, titulo):
                     existe, msg, _ = verificar_archivo_existe(storage_path)
                     if existe:
                         print(f"      ✅ Archivo ya existe y es válido")
+                        almacen.resolver(doc_id, storage_path, pdf_bytes)
                         return True, "Archivo validado (ya existía)", len(pdf_bytes)
                 
                 return False, f"Error upload: {error_msg[:100]}", 0
@@ -199,6 +220,7 @@ def redownload_y_upload(doc_id, url_original, storage_path, titulo):
             
             if existe:
                 print(f"      ✅ Upload exitoso y verificado")
+                almacen.resolver(doc_id, storage_path, pdf_bytes)
                 return True, "Upload exitoso", len(pdf_bytes)
             else:
                 return False, f"Upload aparentemente exitoso pero no se encuentra: {msg}", 0
@@ -247,6 +269,13 @@ def verificar_y_sincronizar_documento(doc):
     Returns:
         dict con resultado del procesamiento
     """
+    with span('documento', documento_id=doc['id'], tipo_documento=doc.get('tipo_documento')) as atributos:
+        resultado = _verificar_y_sincronizar_documento(doc)
+        atributos['status'] = resultado['status']
+        return resultado
+
+
+def _verificar_y_sincronizar_documento(doc):
     doc_id = doc['id']
     titulo = doc['titulo']
     tipo = doc.get('tipo_documento', 'desconocido')
@@ -271,7 +300,8 @@ def verificar_y_sincronizar_documento(doc):
     print(f"   Path esperado: {expected_storage_path}")
     
     # 1. Verificar si existe en Storage
-    existe, mensaje, status_code = verificar_archivo_existe(expected_storage_path)
+    with span('verificar_storage'):
+        existe, mensaje, status_code = verificar_archivo_existe(expected_storage_path)
     
     if existe:
         print(f"   ✅ {mensaje}")
@@ -291,12 +321,13 @@ def verificar_y_sincronizar_documento(doc):
     print(f"   🔄 Iniciando re-sincronización...")
     
     # 3. Re-descargar y subir con el path esperado (sanitizado)
-    exito, msg, bytes_subidos = redownload_y_upload(
-        doc_id, 
-        url_original, 
-        expected_storage_path,
-        titulo
-    )
+    with span('descarga'):
+        exito, msg, bytes_subidos = redownload_y_upload(
+            doc_id, 
+            url_original, 
+            expected_storage_path,
+            titulo
+        )
     
     if exito:
         print(f"   ✅ Re-sincronizado exitosamente")
@@ -317,59 +348,35 @@ def verificar_y_sincronizar_documento(doc):
 # ============================================
 
 def actualizar_estado_bd(resultado):
-    """Actualiza estado del documento en BD según resultado"""
+    """Encola la transición del documento según resultado (se aplica en bloque)"""
     
     doc_id = resultado['doc_id']
+    ahora = datetime.now().isoformat()
     
     try:
-        # Obtener metadata actual
-        result = supabase.table('documentos_oficiales').select('metadata').eq('id', doc_id).execute()
-        current_metadata = result.data[0].get('metadata', {}) if result.data else {}
-        
         if resultado['status'] == 'ok':
             # Archivo OK - marcar como storage_validado
-            updated_metadata = {
-                **current_metadata,
+            transiciones.agregar(doc_id, 'storage_validado', {
                 'storage_verificado': True,
-                'fecha_verificacion': datetime.now().isoformat()
-            }
-            
-            supabase.table('documentos_oficiales').update({
-                'etapa_actual': 'storage_validado',
-                'fecha_actualizacion': datetime.now().isoformat(),
-                'metadata': updated_metadata
-            }).eq('id', doc_id).execute()
+                'fecha_verificacion': ahora
+            }, fecha_actualizacion=ahora)
         
         elif resultado['status'] == 'resincronizado':
             # Re-descargado exitosamente
-            updated_metadata = {
-                **current_metadata,
+            transiciones.agregar(doc_id, 'storage_validado', {
                 'storage_verificado': True,
                 'requirio_redownload': True,
                 'bytes_redownload': resultado['bytes'],
-                'fecha_redownload': datetime.now().isoformat()
-            }
-            
-            supabase.table('documentos_oficiales').update({
-                'etapa_actual': 'storage_validado',
-                'fecha_actualizacion': datetime.now().isoformat(),
-                'metadata': updated_metadata
-            }).eq('id', doc_id).execute()
+                'fecha_redownload': ahora
+            }, fecha_actualizacion=ahora)
         
         else:
             # Error - marcar para atención manual
-            updated_metadata = {
-                **current_metadata,
+            transiciones.agregar(doc_id, 'error_validacion_storage', {
                 'storage_error': resultado['mensaje'],
-                'fecha_error': datetime.now().isoformat(),
+                'fecha_error': ahora,
                 'requiere_atencion_manual': True
-            }
-            
-            supabase.table('documentos_oficiales').update({
-                'etapa_actual': 'error_validacion_storage',
-                'fecha_actualizacion': datetime.now().isoformat(),
-                'metadata': updated_metadata
-            }).eq('id', doc_id).execute()
+            }, fecha_actualizacion=ahora)
     
     except Exception as e:
         print(f"   ⚠️  Error actualizando BD: {e}")
@@ -400,7 +407,7 @@ def procesar_batch(documentos_batch, batch_num, total_batches):
             resultado = futuro.result()
             resultados.append(resultado)
             
-            # Actualizar BD inmediatamente
+            # Encolar transición (flush en bloque)
             actualizar_estado_bd(resultado)
     
     tiempo_batch = time.time() - inicio_batch
@@ -477,6 +484,10 @@ def main():
             print(f"\n⏸️  Pausa de 3s antes del siguiente batch...")
             time.sleep(3)
     
+    # Aplicar transiciones pendientes antes del resumen
+    with span('escritura_transiciones'):
+        transiciones.flush()
+    
     # 3. Resumen final
     tiempo_total = time.time() - inicio_total
     
@@ -496,6 +507,7 @@ def main():
     print(f"   🔄 Re-sincronizados: {resincronizados}")
     print(f"   ❌ Errores: {errores}")
     print(f"   📦 Datos descargados: {mb_totales:.2f} MB")
+    print(f"   🔗 PDFs duplicados por contenido: {almacen.duplicados_detectados}")
     print(f"\n⏱️  Tiempo total: {tiempo_total:.1f}s")
     print(f"⚡ Velocidad: {tiempo_total/len(documentos):.1f}s/doc")
     
@@ -524,7 +536,10 @@ def main():
         'errores': errores,
         'bytes_descargados': bytes_totales,
         'mb_descargados': round(mb_totales, 2),
+        'duplicados_contenido': almacen.duplicados_detectados,
         'tiempo_total_segundos': round(tiempo_total, 2),
+        'run_id': obtener_trazador().run_id,
+        'trazas': obtener_trazador().resumen(),
         'documentos_con_error': [
             {
                 'id': r['doc_id'],
@@ -534,6 +549,7 @@ def main():
             for r in todos_resultados if r['status'] == 'error'
         ]
     }, 'verify_storage_metrics.json')
+    obtener_trazador().exportar()
     
     print("\n" + "="*70)
     
@@ -563,7 +579,8 @@ def export_metrics_json(metrics: dict, filepath: str):
 
 if __name__ == '__main__':
     try:
-        main()
+        with perfilar():
+            main()
     except KeyboardInterrupt:
         print("\n\n⚠️  Interrupción manual")
         sys.exit(1)
@@ -26,6 +26,7 @@ Variables de entorno:
 - OPENAI_API_KEY: Prioridad 2 (OpenAI)
 - ANTHROPIC_API_KEY: Prioridad 3 (Anthropic)
 - BATCH_SIZE=5 (opcional, default 5 documentos en paralelo)
+- PIPELINE_PRESUPUESTO_SEGUNDOS (opcional, corta el drenaje del backlog)
 
 ESQUEMA BD REQUERIDO:
 ```sql
@@ -57,11 +58,18 @@ FIXES CRÍTICOS APLICADOS:
 
 import os, sys, fitz, re, json, base64, time, hashlib, asyncio, requests
 from io import BytesIO
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from dotenv import load_dotenv
 from supabase import create_client
 
+from transiciones_estado import BufferTransiciones
+from almacen_contenido import AlmacenContenido
+from casi_duplicados import DetectorCasiDuplicados
+from cola_pendientes import procesar_en_pool
+from leases import ColaConLeases
+from trazas import obtener_trazador, span
+from perfilado import perfilar
+
 # OCR opcional
 try:
     from PIL import Image
@@ -100,6 +108,15 @@ supabase = create_client(
     os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 )
 
+# Transiciones de etapa aplicadas en bloque (flush automático al salir)
+transiciones = BufferTransiciones(supabase)
+
+# Registro SHA-256 → objeto canónico (reutiliza transformaciones de PDFs duplicados)
+almacen = AlmacenContenido(supabase, transiciones)
+
+# Índice MinHash/LSH del corpus (marca re-ediciones casi idénticas como candidato delta)
+detector_casi_duplicados = DetectorCasiDuplicados(supabase, transiciones)
+
 # Configuración
 AI_EXTRACTION_ENABLED = os.getenv('AI_EXTRACTION_ENABLED', 'false').lower() == 'true'
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
@@ -188,6 +205,14 @@ def intentar_resubir_desde_url(doc_id, url_original, storage_path):
             
             print(f"  ✅ Descargado: {len(pdf_bytes):,} bytes")
             
+            # Si el mismo contenido ya está en Storage bajo otro path, no re-subir
+            objeto = almacen.objeto_para_subida(pdf_bytes)
+            if objeto and objeto['storage_path'] != storage_path:
+                existe, _ = verificar_archivo_storage(objeto['storage_path'])
+                if existe:
+                    print(f"  🔗 Contenido idéntico ya almacenado: {objeto['storage_path']}")
+                    return True, pdf_bytes
+            
             # 🔧 FIX CRÍTICO: Usar file_options correctamente
             print(f"  💾 Re-subiendo a Storage...")
             
@@ -214,27 +239,15 @@ def intentar_resubir_desde_url(doc_id, url_original, storage_path):
             
             print(f"  ✅ Re-subido exitosamente")
             
-            # Actualizar metadata en BD
+            # Actualizar metadata en BD (merge en servidor, sin SELECT previo)
             try:
-                # Obtener metadata actual
-                result = supabase.table('documentos_oficiales').select('metadata').eq('id', doc_id).execute()
-                current_metadata = result.data[0].get('metadata', {}) if result.data else {}
-                
-                # Merge con nueva info de re-subida
-                updated_metadata = {
-                    **current_metadata,
+                transiciones.agregar(doc_id, metadata={
                     'resubido': {
                         'fecha': datetime.now().isoformat(),
                         'razon': 'archivo_faltante_storage',
                         'intentos': intento + 1
                     }
-                }
-                
-                # Actualizar en BD
-                supabase.table('documentos_oficiales').update({
-                    'fecha_actualizacion': datetime.now().isoformat(),
-                    'metadata': updated_metadata
-                }).eq('id', doc_id).execute()
+                }, fecha_actualizacion=datetime.now().isoformat())
             except Exception as e:
                 print(f"  ⚠️  No se pudo actualizar metadata: {e}")
             
@@ -446,8 +459,30 @@ def _extraer_con_gemini(prompt, imagenes_base64):
 # PROCESAMIENTO INDIVIDUAL (MEJORADO)
 # ============================================
 
-def procesar_documento_individual(doc_data):
-    """Procesa documento con manejo robusto de errores"""
+def marcar_sin_archivo(doc_id):
+    """Marca como error en BD un documento cuyo PDF no se pudo recuperar"""
+    transiciones.agregar(doc_id, 'error_validacion_storage', {
+        'error': 'archivo_no_disponible_en_storage',
+        'timestamp_error': datetime.now().isoformat()
+    })
+
+
+def procesar_documento_individual(doc_data, pdf_bytes=None):
+    """
+    Procesa documento con manejo robusto de errores
+
+    pdf_bytes permite recibir el PDF ya descargado (pipeline_runner.py); el
+    resultado incluye 'metadata_documento' con lo que fase3 necesita sin
+    releer la BD (documento canónico, candidato delta).
+    """
+    
+    with span('documento', documento_id=doc_data['id'], tipo_documento=doc_data.get('tipo_documento')) as atributos:
+        resultado = _procesar_documento_individual(doc_data, pdf_bytes)
+        atributos['metodo'] = resultado['metodo'] if resultado else 'fallido'
+        return resultado
+
+
+def _procesar_documento_individual(doc_data, pdf_bytes=None):
     
     try:
         doc_id = doc_data['id']
@@ -457,22 +492,38 @@ def procesar_documento_individual(doc_data):
         print(f"\n📄 [{doc_id}] {titulo}")
         
         # 1. Descargar con verificación y re-sincronización
-        exito, pdf_bytes = descargar_pdf_con_verificacion(doc_data)
+        if pdf_bytes is None:
+            with span('descarga'):
+                exito, pdf_bytes = descargar_pdf_con_verificacion(doc_data)
+        else:
+            exito = True
         
         if not exito or pdf_bytes is None:
-            # Marcar como error en BD
-            supabase.table('documentos_oficiales').update({
-                'etapa_actual': 'error_validacion_storage',
-                'metadata': {
-                    'error': 'archivo_no_disponible_en_storage',
-                    'timestamp_error': datetime.now().isoformat()
-                }
-            }).eq('id', doc_id).execute()
-            
+            marcar_sin_archivo(doc_id)
             return None
         
+        # 1b. Deduplicación por contenido (SHA-256)
+        objeto = almacen.resolver(doc_id, doc_data['storage_path'], pdf_bytes)
+        if objeto['duplicado']:
+            canonico = almacen.transformacion_existente(objeto['documento_canonico_id'])
+            if canonico:
+                print(f"  ♻️  Reutilizando transformación de {canonico['id']}")
+                meta_canonico = canonico.get('metadata') or {}
+                return {
+                    'doc_id': doc_id,
+                    'contenido_final': canonico['contenido_markdown'],
+                    'metodo': 'duplicado_contenido',
+                    'tipo_pdf': meta_canonico.get('tipo_pdf', 'desconocido'),
+                    'costo': 0,
+                    'proveedor': 'duplicado_contenido',
+                    'es_valido': (meta_canonico.get('validacion') or {}).get('es_valido', True),
+                    'mensaje_validacion': f"Reutilizado de documento {canonico['id']}",
+                    'metadata_documento': {'documento_canonico_id': objeto['documento_canonico_id']}
+                }
+        
         # 2. Clasificar tipo de PDF
-        tipo_pdf = clasificar_tipo_pdf(pdf_bytes)
+        with span('clasificar'):
+            tipo_pdf = clasificar_tipo_pdf(pdf_bytes)
         print(f"  📋 Tipo: {tipo_pdf}")
         
         # 3. Decidir método de extracción
@@ -483,7 +534,9 @@ def procesar_documento_individual(doc_data):
         
         # 4. Extraer contenido
         if usar_ia:
-            contenido, costo, proveedor = extraer_con_cache(pdf_bytes, tipo_documento)
+            with span('vision') as atributos_vision:
+                contenido, costo, proveedor = extraer_con_cache(pdf_bytes, tipo_documento)
+                atributos_vision['proveedor'] = proveedor
             
             if proveedor == 'cache':
                 metodo = 'ia_cache'
@@ -491,7 +544,8 @@ def procesar_documento_individual(doc_data):
                 metodo = f'ia_{proveedor}'
         else:
             print(f"  📚 Extrayendo con PyMuPDF + OCR...")
-            contenido, es_escaneado = extraer_con_pymupdf(pdf_bytes)
+            with span('ocr'):
+                contenido, es_escaneado = extraer_con_pymupdf(pdf_bytes)
             costo = 0
             metodo = 'tesseract_ocr' if es_escaneado else 'pymupdf'
             proveedor = 'pymupdf'
@@ -504,7 +558,8 @@ def procesar_documento_individual(doc_data):
             
             if usar_ia:
                 print(f"  🔄 Reintentando con PyMuPDF...")
-                contenido_fallback, es_escaneado = extraer_con_pymupdf(pdf_bytes)
+                with span('ocr', fallback=True):
+                    contenido_fallback, es_escaneado = extraer_con_pymupdf(pdf_bytes)
                 
                 es_valido_fallback, _ = validar_extraccion_rubrica(
                     contenido_fallback, tipo_documento
@@ -520,7 +575,18 @@ def procesar_documento_individual(doc_data):
             print(f"  ✅ {mensaje_validacion}")
         
         # 6. Estructurar para RAG
-        contenido_final = estructurar_para_rag(contenido, tipo_documento, doc_titulo=titulo)
+        with span('estructurar'):
+            contenido_final = estructurar_para_rag(contenido, tipo_documento, doc_titulo=titulo)
+        
+        # 7. Detección de casi duplicados (portada / año distintos)
+        metadata_documento = {}
+        try:
+            with span('casi_duplicados'):
+                candidato = detector_casi_duplicados.evaluar(doc_id, contenido_final, tipo_documento)
+            if candidato:
+                metadata_documento['candidato_delta'] = candidato
+        except Exception as e:
+            print(f"  ⚠️  Error en detección de casi duplicados: {e}")
         
         print(f"  ✅ {len(contenido_final):,} chars ({metodo}) ${costo:.4f}")
         
@@ -532,7 +598,8 @@ def procesar_documento_individual(doc_data):
             'costo': costo,
             'proveedor': proveedor,
             'es_valido': es_valido,
-            'mensaje_validacion': mensaje_validacion
+            'mensaje_validacion': mensaje_validacion,
+            'metadata_documento': metadata_documento
         }
     
     except Exception as e:
@@ -540,13 +607,10 @@ def procesar_documento_individual(doc_data):
         
         # Marcar como error en BD
         try:
-            supabase.table('documentos_oficiales').update({
-                'etapa_actual': 'error_transform',
-                'metadata': {
-                    'error': str(e)[:500],
-                    'timestamp_error': datetime.now().isoformat()
-                }
-            }).eq('id', doc_data['id']).execute()
+            transiciones.agregar(doc_data['id'], 'error_transform', {
+                'error': str(e)[:500],
+                'timestamp_error': datetime.now().isoformat()
+            })
         except:
             pass
         
@@ -808,91 +872,62 @@ def _extraer_con_anthropic(prompt, imagenes_base64):
 # MAIN: BUSCAR Y PROCESAR DOCUMENTOS
 # ============================================
 
+def registrar_transformacion(resultado):
+    """Encola la transición a 'transformado' con el Markdown (se aplica en bloque)"""
+    transiciones.agregar(resultado['doc_id'], 'transformado', {
+        'metodo_extraccion': resultado['metodo'],
+        'tipo_pdf': resultado['tipo_pdf'],
+        'costo_extraccion_usd': round(resultado['costo'], 4),
+        'longitud_chars': len(resultado['contenido_final']),
+        'validacion': {
+            'es_valido': resultado['es_valido'],
+            'mensaje': resultado['mensaje_validacion']
+        }
+    }, contenido_markdown=resultado['contenido_final'])
+
+
 def main():
-    # Buscar documentos pendientes
-    docs = supabase.table('documentos_oficiales')\
-        .select('id, storage_path, url_original, titulo, tipo_documento')\
-        .eq('etapa_actual', 'descargado')\
-        .limit(50)\
-        .execute().data or []
-    
-    print(f"📄 Procesando {len(docs)} PDFs...")
+    # Backlog de documentos pendientes, reclamados con lease para no chocar
+    # con otros runners (cae a paginación keyset si la RPC no existe)
+    cola = ColaConLeases(
+        supabase,
+        'descargado',
+        'id, storage_path, url_original, titulo, tipo_documento',
+        lambda q: q.eq('etapa_actual', 'descargado')
+    )
+    
+    print(f"📄 Procesando backlog de PDFs (páginas de {cola.tamano_pagina})...")
     print(f"🤖 IA: {'✅ Habilitada' if AI_EXTRACTION_ENABLED else '❌ Deshabilitada'}")
     
     if AI_EXTRACTION_ENABLED:
         print(f"   Proveedores: {' → '.join([p.upper() for p in AI_PROVIDERS])}")
     
-    if len(docs) == 0:
-        print("\nTransformados: 0")
-        
-        # Exportar JSON vacío
-        export_metrics_json({
-            'timestamp': datetime.now().isoformat(),
-            'transformados': 0,
-            'total': 0,
-            'cost_usd': 0
-        }, 'transform_metrics.json')
-        
-        sys.exit(0)
+    if cola.presupuesto_segundos:
+        print(f"⏱️  Presupuesto: {cola.presupuesto_segundos:.0f}s")
     
-    # Procesamiento en batches
+    # Procesamiento con pool acotado: BATCH_SIZE workers, 2×BATCH_SIZE en vuelo
     transformed = 0
     total_costo_ia = 0.0
     stats_proveedores = {}
     inicio_total = time.time()
     
-    total_batches = (len(docs) + BATCH_SIZE - 1) // BATCH_SIZE
-    print(f"\n🚀 Modo batch: {len(docs)} docs en {total_batches} batches de {BATCH_SIZE}")
+    print(f"\n🚀 Pool de {BATCH_SIZE} workers")
     
-    for batch_num in range(total_batches):
-        inicio_idx = batch_num * BATCH_SIZE
-        fin_idx = min((batch_num + 1) * BATCH_SIZE, len(docs))
-        batch = docs[inicio_idx:fin_idx]
-        
-        print(f"\n{'='*60}")
-        print(f"🚀 BATCH {batch_num + 1}/{total_batches}")
-        print(f"{'='*60}")
-        
-        inicio_batch = time.time()
-        resultados_exitosos = []
-        
-        # Procesar batch en paralelo
-        with ThreadPoolExecutor(max_workers=BATCH_SIZE) as executor:
-            futuros = {
-                executor.submit(procesar_documento_individual, doc): doc 
-                for doc in batch
-            }
-            
-            for futuro in as_completed(futuros):
-                resultado = futuro.result()
-                if resultado:
-                    resultados_exitosos.append(resultado)
-        
-        tiempo_batch = time.time() - inicio_batch
+    for doc, futuro in procesar_en_pool(cola, procesar_documento_individual, BATCH_SIZE):
+        try:
+            resultado = futuro.result()
+        except Exception as e:
+            print(f"  ❌ Error procesando {doc.get('titulo', doc['id'])}: {e}")
+            resultado = None
         
-        print(f"\n📊 BATCH {batch_num + 1} completado en {tiempo_batch:.1f}s")
-        print(f"   ✅ Exitosos: {len(resultados_exitosos)}/{len(batch)}")
-        if len(batch) - len(resultados_exitosos) > 0:
-            print(f"   ❌ Fallidos: {len(batch) - len(resultados_exitosos)}")
-        print(f"   ⚡ Velocidad: {tiempo_batch/len(batch):.1f}s/doc")
+        # Fallido: liberar con backoff para que ningún runner lo reintente en caliente
+        if not resultado:
+            cola.liberar(doc['id'])
         
-        # Guardar resultados
-        for resultado in resultados_exitosos:
+        # Guardar resultado (encolado, se aplica en bloque)
+        if resultado:
             try:
-                supabase.table('documentos_oficiales').update({
-                    'contenido_markdown': resultado['contenido_final'],
-                    'etapa_actual': 'transformado',
-                    'metadata': {
-                        'metodo_extraccion': resultado['metodo'],
-                        'tipo_pdf': resultado['tipo_pdf'],
-                        'costo_extraccion_usd': round(resultado['costo'], 4),
-                        'longitud_chars': len(resultado['contenido_final']),
-                        'validacion': {
-                            'es_valido': resultado['es_valido'],
-                            'mensaje': resultado['mensaje_validacion']
-                        }
-                    }
-                }).eq('id', resultado['doc_id']).execute()
+                registrar_transformacion(resultado)
                 
                 total_costo_ia += resultado['costo']
                 stats_proveedores[resultado['proveedor']] = stats_proveedores.get(resultado['proveedor'], 0) + 1
@@ -901,10 +936,33 @@ def main():
             except Exception as e:
                 print(f"  ⚠️  Error guardando: {e}")
         
-        # Pausa entre batches
-        if batch_num < total_batches - 1:
-            print(f"\n⏸️  Pausa de 2s...")
-            time.sleep(2)
+        if cola.entregados % 10 == 0:
+            transcurrido = time.time() - inicio_total
+            print(f"\n📊 Progreso: {transformed} transformados de {cola.entregados} tomados "
+                  f"({transcurrido/cola.entregados:.1f}s/doc)")
+    
+    # Aplicar transiciones pendientes antes del resumen
+    with span('escritura_transiciones'):
+        transiciones.flush()
+    
+    # Liberar leases restantes solo después de aplicar las nuevas etapas
+    cola.cerrar()
+    
+    total = cola.entregados
+    
+    if total == 0:
+        print("\nTransformados: 0")
+        
+        # Exportar JSON vacío
+        export_metrics_json({
+            'timestamp': datetime.now().isoformat(),
+            'transformados': 0,
+            'total': 0,
+            'cost_usd': 0,
+            'run_id': obtener_trazador().run_id
+        }, 'transform_metrics.json')
+        
+        sys.exit(0)
     
     # Resumen final
     tiempo_total = time.time() - inicio_total
@@ -912,9 +970,12 @@ def main():
     print("\n" + "="*60)
     print(f"✅ PROCESAMIENTO COMPLETADO")
     print(f"="*60)
-    print(f"📊 Documentos transformados: {transformed}/{len(docs)}")
+    print(f"📊 Documentos transformados: {transformed}/{total}")
+    print(f"📑 Páginas leídas: {cola.paginas}")
+    if cola.agotado_por_presupuesto:
+        print(f"⏱️  Backlog restante queda para la siguiente ejecución")
     print(f"⏱️  Tiempo total: {tiempo_total:.1f}s")
-    print(f"⚡ Velocidad: {tiempo_total/len(docs):.1f}s/doc")
+    print(f"⚡ Velocidad: {tiempo_total/total:.1f}s/doc")
     
     if total_costo_ia > 0:
         print(f"\n💰 Costos IA:")
@@ -930,14 +991,20 @@ def main():
     export_metrics_json({
         'timestamp': datetime.now().isoformat(),
         'fase': 'transform',
-        'total': len(docs),
+        'total': total,
         'transformed': transformed,
-        'fallidos': len(docs) - transformed,
-        'tasa_exito': (transformed / len(docs) * 100) if len(docs) > 0 else 0,
+        'fallidos': total - transformed,
+        'tasa_exito': (transformed / total * 100) if total > 0 else 0,
         'tiempo_total_segundos': round(tiempo_total, 2),
         'cost_usd': round(total_costo_ia, 4),
-        'proveedores': stats_proveedores
+        'duplicados_contenido': almacen.duplicados_detectados,
+        'candidatos_delta': detector_casi_duplicados.candidatos_delta,
+        'backlog': cola.resumen(),
+        'proveedores': stats_proveedores,
+        'run_id': obtener_trazador().run_id,
+        'trazas': obtener_trazador().resumen()
     }, 'transform_metrics.json')
+    obtener_trazador().exportar()
     
     print("\n" + "="*60)
 
@@ -961,7 +1028,8 @@ def export_metrics_json(metrics: dict, filepath: str):
 
 if __name__ == '__main__':
     try:
-        main()
+        with perfilar():
+            main()
     except KeyboardInterrupt:
         print("\n\n⚠️  Interrupción manual")
         sys.exit(1)
@@ -4,33 +4,67 @@ FASE 3: Load - Chunking Inteligente + Embeddings Optimizados
 
 MEJORAS IMPLEMENTADAS:
 1. Chunking semántico respetando estructura Markdown
-2. Metadata rica para filtrado preciso
-3. Embeddings con text-embedding-3-large (mejor calidad)
-4. Caché de embeddings para re-ejecuciones
-5. Procesamiento por lotes (batch)
+2. Metadata rica para filtrado preciso (columnas tipadas e indexadas)
+3. Embeddings con text-embedding-3-large (mejor calidad) o modelo local ONNX
+   (EMBEDDING_PROVEEDOR=onnx, ver proveedores_embedding.py)
+4. Caché de embeddings para re-ejecuciones (clave: hash + proveedor + modelo)
+5. Procesamiento por lotes (batch), reanudable a nivel de chunk (journal_carga.py)
 6. Validación de calidad
+7. Ritmo de requests por TPM/RPM sin fallar documentos por 429 (planificador_embeddings.py)
 """
 
 import os, sys, re, hashlib, json
 from datetime import datetime
 from dotenv import load_dotenv
 from supabase import create_client
-from openai import OpenAI
 from typing import List, Dict, Tuple
 import tiktoken  # Para contar tokens
 
+from transiciones_estado import BufferTransiciones
+from cola_pendientes import procesar_en_pool
+from leases import ColaConLeases
+from columnas_chunks import columnas_tipadas
+from embeddings_reducidos import serializar_embedding
+from vectores import decodificar_vector
+from matryoshka import CacheMatryoshka, derivar, error_dimensiones
+from proveedores_embedding import obtener_proveedor
+from planificador_embeddings import PlanificadorEmbeddings
+from journal_carga import JournalCarga, grupos, huella_chunks
+from trazas import obtener_trazador, span
+from perfilado import perfilar
+
 load_dotenv('.env.local')
 supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
-openai = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+# Proveedor de embeddings (openai por defecto; onnx para ejecuciones sin red)
+proveedor = obtener_proveedor(modelo=os.getenv('EMBEDDING_MODEL') or None)
+
+# Transiciones de etapa aplicadas en bloque (flush automático al salir)
+transiciones = BufferTransiciones(supabase)
+
+# Progreso por documento para reanudar a nivel de chunk
+journal = JournalCarga(supabase)
 
 # Configuración optimizada
-EMBEDDING_MODEL = 'text-embedding-3-large'  # 3072 dimensiones, mejor calidad, costo moderado, Para reducción a 1536 dimensiones escoger el modelo text-embedding-3-small
-EMBEDDING_DIMENSIONS = 1536  # Reducción dimensional para eficiencia
+EMBEDDING_MODEL = proveedor.modelo  # openai: text-embedding-3-large (3072D nativas); onnx: nombre del modelo local
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))  # Dimensión de la columna destino (truncado Matryoshka del vector completo)
+EMBEDDING_COLUMNA = os.getenv('EMBEDDING_COLUMNA', 'embedding')  # embedding_<sufijo> para modelos locales de otra dimensión
 MAX_CHUNK_SIZE = 6000  # Chars por chunk (balance calidad/costo)
 MIN_CHUNK_SIZE = 500   # Evita chunks muy pequeños
 OVERLAP_SIZE = 200     # Overlap mínimo para contexto
+LOAD_WORKERS = int(os.getenv('LOAD_WORKERS', '2'))  # Documentos embebidos en paralelo
 MAX_TOKENS_PER_CHUNK = 7500  # 🔧 HARD LIMIT: OpenAI text-embedding-3-large límite 8192 tokens (dejamos margen)
 
+# Caché de embeddings a tamaño completo; cada destino deriva su dimensión
+cache_embeddings = CacheMatryoshka(supabase, proveedor.modelo, proveedor.nombre)
+
+# Truncado Matryoshka solo para modelos entrenados así; el resto debe coincidir con la columna
+motivo_dimensiones = error_dimensiones(proveedor.modelo, proveedor.dimensiones, EMBEDDING_DIMENSIONS)
+if motivo_dimensiones:
+    print(f"❌ {proveedor.nombre}: {motivo_dimensiones} (EMBEDDING_DIMENSIONS={EMBEDDING_DIMENSIONS}, "
+          f"EMBEDDING_COLUMNA=embedding_<sufijo>)")
+    sys.exit(1)
+
 # Tokenizer para validación
 try:
     tokenizer = tiktoken.encoding_for_model("text-embedding-3-large")
@@ -38,6 +72,12 @@ except:
     # Fallback si el modelo específico no está disponible
     tokenizer = tiktoken.get_encoding("cl100k_base")
 
+# Ritmo de requests según EMBEDDING_TPM / EMBEDDING_RPM (compartido por los workers):
+# los tokens se cuentan antes de enviar y los 429 pausan en vez de fallar el documento
+planificador = PlanificadorEmbeddings(contar_tokens=lambda texto: len(tokenizer.encode(texto, disallowed_special=())))
+if proveedor.nombre == 'openai':
+    proveedor.planificador = planificador
+
 # ============================================
 # CHUNKING SEMÁNTICO INTELIGENTE
 # ============================================
@@ -303,148 +343,276 @@ def chunking_generico(contenido: str, doc_metadata: dict) -> List[Dict]:
 # GENERACIÓN DE EMBEDDINGS CON CACHÉ
 # ============================================
 
-def generar_embedding_con_cache(texto: str, chunk_hash: str) -> Tuple[List[float], int, float]:
+def generar_embeddings_con_cache(textos: List[str], chunk_hashes: List[str]) -> List[Tuple[List[float], int, float]]:
     """
-    Genera embedding con sistema de caché
+    Genera embeddings con sistema de caché
     Evita re-calcular embeddings idénticos
+
+    El caché guarda el vector completo del modelo (Matryoshka); el chunk
+    recibe EMBEDDING_DIMENSIONS por truncado local, sin re-embeber si la
+    dimensión destino cambia. Los textos sin caché se embeben en lotes con
+    el proveedor configurado. Devuelve (embedding, tokens, costo) por texto.
     """
     
-    # Buscar en caché
-    # 🔧 FIX: Usar .limit(1).execute() en lugar de .maybeSingle() 
-    # (maybeSingle no existe en supabase-py, fue renombrado a maybe_single)
-    cache_result = supabase.table('embeddings_cache')\
-        .select('embedding, tokens_usados')\
-        .eq('content_hash', chunk_hash)\
-        .eq('model', EMBEDDING_MODEL)\
-        .limit(1)\
-        .execute()
-    
-    if cache_result.data and len(cache_result.data) > 0:
-        cached = cache_result.data[0]  # Obtener primer resultado
-        return cached['embedding'], cached['tokens_usados'], 0.0
-    
-    # Generar embedding nuevo
+    # Buscar en caché (cualquier entrada con dimensión >= destino), una consulta
+    cached = cache_embeddings.buscar_lote(chunk_hashes, EMBEDDING_DIMENSIONS)
+    resultados = [None] * len(textos)
+    pendientes: Dict[str, List[int]] = {}
+    for i, chunk_hash in enumerate(chunk_hashes):
+        if chunk_hash in cached:
+            embedding, tokens = cached[chunk_hash]
+            resultados[i] = (embedding, tokens, 0.0)
+        else:
+            pendientes.setdefault(chunk_hash, []).append(i)
+    
+    if not pendientes:
+        return resultados
+    
+    # Generar embeddings nuevos a tamaño completo (el costo es por token, no por dimensión)
     try:
-        resp = openai.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=texto,
-            dimensions=EMBEDDING_DIMENSIONS  # Reducción dimensional
-        )
+        hashes = list(pendientes)
+        generados = proveedor.embeber([textos[pendientes[h][0]] for h in hashes])
         
-        embedding = resp.data[0].embedding
-        tokens = resp.usage.total_tokens
+        # Guardar en caché los vectores completos
+        cache_embeddings.guardar_lote(list(zip(hashes, generados.vectores, generados.tokens)))
         
-        # text-embedding-3-large: $0.13 por 1M tokens
-        cost = (tokens / 1_000_000) * 0.13
-        
-        # Guardar en caché
-        supabase.table('embeddings_cache').insert({
-            'content_hash': chunk_hash,
-            'model': EMBEDDING_MODEL,
-            'embedding': embedding,
-            'tokens_usados': tokens,
-            'dimensions': EMBEDDING_DIMENSIONS,
-            'created_at': datetime.now().isoformat()
-        }).execute()
-        
-        return embedding, tokens, cost
+        total_tokens = sum(generados.tokens) or 1
+        for chunk_hash, embedding_completo, tokens in zip(hashes, generados.vectores, generados.tokens):
+            embedding = derivar(embedding_completo, EMBEDDING_DIMENSIONS)
+            cost = generados.costo_usd * tokens / total_tokens
+            for posicion, i in enumerate(pendientes[chunk_hash]):
+                # Textos repetidos en el documento: se cobran una vez
+                resultados[i] = (embedding, tokens, cost) if posicion == 0 else (embedding, 0, 0.0)
+        return resultados
         
     except Exception as e:
-        print(f"  ⚠️  Error generando embedding: {e}")
+        print(f"  ⚠️  Error generando embeddings: {e}")
         raise
 
 
-def procesar_documento_batch(doc: dict) -> Tuple[int, int, float]:
+def chunks_documento_canonico(doc: dict) -> int:
+    """Chunks ya cargados del documento canónico si doc es un PDF duplicado"""
+    
+    canonico_id = (doc.get('metadata') or {}).get('documento_canonico_id')
+    if not canonico_id or canonico_id == doc['id']:
+        return 0
+    
+    try:
+        result = supabase.table('chunks_documentos')\
+            .select('id', count='exact')\
+            .eq('documento_id', canonico_id)\
+            .limit(1)\
+            .execute()
+        return result.count or 0
+    except Exception as e:
+        print(f"  ⚠️  Error consultando chunks del canónico: {e}")
+        return 0
+
+
+def embeddings_documento_base(doc: dict) -> Dict[str, List[float]]:
+    """
+    Para candidatos delta (casi duplicados detectados en fase2): embeddings
+    del documento base indexados por chunk_hash, en una sola consulta.
+    Los chunks idénticos reutilizan ese embedding; solo se procesan las
+    secciones que cambiaron.
+    """
+    
+    candidato = (doc.get('metadata') or {}).get('candidato_delta')
+    if not candidato or not candidato.get('documento_base_id'):
+        return {}
+    
+    try:
+        result = supabase.table('chunks_documentos')\
+            .select(f'chunk_hash, {EMBEDDING_COLUMNA}')\
+            .eq('documento_id', candidato['documento_base_id'])\
+            .execute()
+    except Exception as e:
+        print(f"  ⚠️  Error cargando chunks del documento base: {e}")
+        return {}
+    
+    # PostgREST devuelve los vectores como texto pgvector ('[0.1,...]')
+    return {
+        c['chunk_hash']: decodificar_vector(c[EMBEDDING_COLUMNA]).tolist()
+        for c in (result.data or [])
+        if c.get('chunk_hash') and c.get(EMBEDDING_COLUMNA) is not None
+    }
+
+
+def fragmentar_documento(doc: dict) -> List[Dict]:
+    """Metadata del documento + chunking semántico de su Markdown"""
+    
+    contenido = doc.get('contenido_markdown') or doc.get('contenido_texto', '')
+    
+    if not contenido:
+        raise ValueError("Documento sin contenido")
+    
+    # 1. Extraer metadata del documento
+    doc_metadata = extraer_metadata_documento(contenido, doc)
+    
+    # 2. Chunking semántico
+    return chunking_semantico_markdown(contenido, doc_metadata)
+
+
+def procesar_documento_batch(doc: dict, chunks: List[Dict] = None) -> Tuple[int, int, float]:
     """
     Procesa un documento completo:
     1. Extrae metadata
-    2. Chunking semántico
+    2. Chunking semántico (o chunks ya calculados en memoria por pipeline_runner.py)
     3. Genera embeddings
     4. Guarda en BD
     """
     
+    with span('documento', documento_id=doc['id'], tipo_documento=doc.get('tipo_documento')) as atributos:
+        chunks_guardados, total_tokens, total_cost = _procesar_documento_batch(doc, chunks)
+        atributos.update(chunks=chunks_guardados, tokens=total_tokens)
+        return chunks_guardados, total_tokens, total_cost
+
+
+def _procesar_documento_batch(doc: dict, chunks: List[Dict] = None) -> Tuple[int, int, float]:
+    
     try:
-        # Marcar como procesando
-        supabase.table('documentos_oficiales')\
-            .update({'estado_procesamiento': 'procesando'})\
-            .eq('id', doc['id'])\
-            .execute()
+        # PDF duplicado por contenido: reutilizar chunks del documento canónico
+        compartidos = chunks_documento_canonico(doc)
+        if compartidos:
+            canonico_id = doc['metadata']['documento_canonico_id']
+            transiciones.agregar(doc['id'], 'completado', {
+                'chunks_compartidos_con': canonico_id,
+                'chunks_generados': 0,
+                'tokens_embeddings': 0,
+                'costo_embeddings_usd': 0
+            },
+                procesado=True,
+                fecha_procesamiento=datetime.now().isoformat(),
+                embedding_model=EMBEDDING_MODEL,
+                progreso_procesamiento=100,
+                estado_procesamiento='exitoso'
+            )
+            print(f"  🔗 Duplicado de {canonico_id}: reutiliza {compartidos} chunks existentes")
+            return 0, 0, 0.0
         
-        contenido = doc.get('contenido_markdown') or doc.get('contenido_texto', '')
+        # Marcar como procesando
+        transiciones.agregar(doc['id'], estado_procesamiento='procesando')
         
-        if not contenido:
-            raise ValueError("Documento sin contenido")
+        if chunks is None:
+            with span('chunking'):
+                chunks = fragmentar_documento(doc)
         
-        # 1. Extraer metadata del documento
-        doc_metadata = extraer_metadata_documento(contenido, doc)
+        print(f"  📑 {len(chunks)} chunks semánticos generados")
         
-        # 2. Chunking semántico
-        chunks = chunking_semantico_markdown(contenido, doc_metadata)
+        # Hash del contenido para caché
+        chunk_hashes = [hashlib.sha256(c['contenido'].encode()).hexdigest() for c in chunks]
         
-        print(f"  📑 {len(chunks)} chunks semánticos generados")
+        # Reanudar desde el último checkpoint si el chunking no cambió
+        progreso = journal.cargar(
+            doc['id'],
+            huella_chunks(chunk_hashes, proveedor.nombre, EMBEDDING_MODEL, EMBEDDING_COLUMNA, str(EMBEDDING_DIMENSIONS)),
+            len(chunks)
+        )
+        if progreso.reanudado:
+            print(f"  ⏯️  Reanudando desde chunk {progreso.chunks_escritos}/{len(chunks)}")
         
-        # 3. Generar embeddings para cada chunk
-        total_tokens = 0
-        total_cost = 0.0
-        chunks_guardados = 0
+        # Candidato delta: reutilizar embeddings de secciones idénticas al documento base
+        embeddings_base = embeddings_documento_base(doc)
         
-        for idx, chunk_data in enumerate(chunks):
-            chunk_texto = chunk_data['contenido']
-            chunk_metadata = chunk_data['metadata']
-            
-            # Hash del contenido para caché
-            chunk_hash = hashlib.sha256(chunk_texto.encode()).hexdigest()
+        # 3. Generar embeddings y guardar por grupos, con checkpoint tras cada grupo
+        for grupo in grupos(len(chunks), progreso.chunks_escritos):
+            # Generar embeddings con caché, en lote, para las secciones nuevas
+            nuevos = [i for i in grupo if chunk_hashes[i] not in embeddings_base]
+            with span('embedding', textos=len(nuevos)):
+                generados = dict(zip(nuevos, generar_embeddings_con_cache(
+                    [chunks[i]['contenido'] for i in nuevos], [chunk_hashes[i] for i in nuevos]
+                )))
             
-            # Generar embedding con caché
-            embedding, tokens, cost = generar_embedding_con_cache(chunk_texto, chunk_hash)
+            filas = []
+            for idx in grupo:
+                chunk_texto = chunks[idx]['contenido']
+                chunk_metadata = chunks[idx]['metadata']
+                
+                if idx in generados:
+                    embedding, tokens, cost = generados[idx]
+                else:
+                    # Sección sin cambios respecto al documento base
+                    embedding, tokens, cost = embeddings_base[chunk_hashes[idx]], 0, 0.0
+                    progreso.chunks_reutilizados += 1
+                
+                filas.append({
+                    'documento_id': doc['id'],
+                    'contenido': chunk_texto,
+                    'chunk_index': idx,
+                    'chunk_hash': chunk_hashes[idx],
+                    EMBEDDING_COLUMNA: serializar_embedding(embedding),
+                    # Columnas filtrables por buscar_chunks_similares (pre-filtrado)
+                    **columnas_tipadas(chunk_texto, chunk_metadata),
+                    'metadata': {
+                        **chunk_metadata,
+                        'tokens': tokens,
+                        'length': len(chunk_texto),
+                        'embedding_model': EMBEDDING_MODEL,
+                        'embedding_provider': proveedor.nombre,
+                        'embedding_dimensions': EMBEDDING_DIMENSIONS
+                    }
+                })
+                progreso.tokens += tokens
+                progreso.costo_usd += cost
             
-            # 4. Guardar chunk en BD
-            supabase.table('chunks_documentos').insert({
-                'documento_id': doc['id'],
-                'contenido': chunk_texto,
-                'chunk_index': idx,
-                'chunk_hash': chunk_hash,
-                'embedding': embedding,
-                'metadata': {
-                    **chunk_metadata,
-                    'tokens': tokens,
-                    'length': len(chunk_texto),
-                    'embedding_model': EMBEDDING_MODEL,
-                    'embedding_dimensions': EMBEDDING_DIMENSIONS
-                }
-            }).execute()
+            # 4. Guardar chunks en BD (upsert: un intento anterior pudo dejar filas)
+            with span('escritura', filas=len(filas)):
+                supabase.table('chunks_documentos')\
+                    .upsert(filas, on_conflict='documento_id,chunk_index')\
+                    .execute()
             
-            total_tokens += tokens
-            total_cost += cost
-            chunks_guardados += 1
+            progreso.chunks_escritos = grupo.stop
+            with span('checkpoint'):
+                journal.registrar(progreso)
+            transiciones.agregar(doc['id'], progreso_procesamiento=int(99 * grupo.stop / len(chunks)))
         
-        # 5. Marcar documento como completado
-        supabase.table('documentos_oficiales').update({
-            'procesado': True,
-            'fecha_procesamiento': datetime.now().isoformat(),
-            'embedding_model': EMBEDDING_MODEL,
-            'etapa_actual': 'completado',
-            'progreso_procesamiento': 100,
-            'estado_procesamiento': 'exitoso',
-            'metadata': {
-                'chunks_generados': chunks_guardados,
-                'tokens_embeddings': total_tokens,
-                'costo_embeddings_usd': round(total_cost, 4)
-            }
-        }).eq('id', doc['id']).execute()
+        chunks_guardados = len(chunks)
+        chunks_reutilizados = progreso.chunks_reutilizados
+        total_tokens = progreso.tokens
+        total_cost = progreso.costo_usd
+        
+        # 5. Marcar documento como completado (atómico con el recorte y la verificación de chunks)
+        metadata_final = {
+            'chunks_generados': chunks_guardados,
+            'chunks_reutilizados_delta': chunks_reutilizados,
+            'tokens_embeddings': total_tokens,
+            'costo_embeddings_usd': round(total_cost, 4)
+        }
+        # Las transiciones pendientes del documento ('procesando') no deben pisar el cierre;
+        # las de los demás documentos siguen en el buffer compartido
+        with span('finalizar'):
+            transiciones.flush(doc['id'])
+            finalizado = journal.finalizar(progreso, metadata_final, EMBEDDING_MODEL)
+        if not finalizado:
+            transiciones.agregar(doc['id'], 'completado', metadata_final,
+                procesado=True,
+                fecha_procesamiento=datetime.now().isoformat(),
+                embedding_model=EMBEDDING_MODEL,
+                progreso_procesamiento=100,
+                estado_procesamiento='exitoso'
+            )
         
+        if chunks_reutilizados:
+            print(f"  ♻️  {chunks_reutilizados}/{chunks_guardados} chunks sin cambios respecto al documento base")
         print(f"  ✅ {chunks_guardados} chunks guardados | {total_tokens:,} tokens | ${total_cost:.4f}")
         
         return chunks_guardados, total_tokens, total_cost
         
     except Exception as e:
         # Marcar como fallido
-        supabase.table('documentos_oficiales').update({
-            'estado_procesamiento': 'fallido',
-            'error_procesamiento': str(e),
-            'etapa_fallida': 'embeddings'
-        }).eq('id', doc['id']).execute()
-        
+        transiciones.agregar(
+            doc['id'],
+            estado_procesamiento='fallido',
+            error_procesamiento=str(e),
+            etapa_fallida='embeddings'
+        )
+        # Igual que al finalizar: el fallo se aplica ya, no con el próximo flush del buffer
+        # (el documento vuelve a la cola y otro worker puede tomarlo antes)
+        try:
+            transiciones.flush(doc['id'])
+        except Exception as error_flush:
+            print(f"  ⚠️ No se pudo registrar el fallo: {error_flush}")
+
         print(f"  ❌ Error: {e}")
         raise
 
@@ -453,59 +621,6 @@ def procesar_documento_batch(doc: dict) -> Tuple[int, int, float]:
 # PROCESAMIENTO PRINCIPAL
 # ============================================
 
-# Buscar documentos listos para embeddings
-# IMPORTANTE: Buscar en 'transformado' no en 'texto_extraido'
-docs = supabase.table('documentos_oficiales')\
-    .select('id, contenido_markdown, contenido_texto, titulo, tipo_documento')\
-    .eq('etapa_actual', 'transformado')\
-    .eq('procesado', False)\
-    .limit(50)\
-    .execute().data or []
-
-print(f"🔢 Generando embeddings para {len(docs)} documentos...")
-print(f"🤖 Modelo: {EMBEDDING_MODEL} ({EMBEDDING_DIMENSIONS}D)")
-print(f"📏 Chunking: semántico adaptativo")
-
-if len(docs) == 0:
-    print("\nℹ️  No hay documentos pendientes de carga")
-    print("\nCargados: 0")
-    print("Chunks: 0")
-    print("Tokens: 0")
-    print("Costo: $0.0000")
-    sys.exit(0)
-
-# Procesar documentos
-loaded = 0
-total_chunks = 0
-total_tokens = 0
-total_cost = 0.0
-
-for doc in docs:
-    try:
-        print(f"\n📄 {doc['titulo']}")
-        chunks, tokens, cost = procesar_documento_batch(doc)
-        
-        loaded += 1
-        total_chunks += chunks
-        total_tokens += tokens
-        total_cost += cost
-        
-    except Exception as e:
-        print(f"  ❌ Error procesando documento: {e}")
-        continue
-
-# Reporte final
-print("\n" + "="*60)
-print(f"✅ Documentos cargados: {loaded}/{len(docs)}")
-print(f"📦 Chunks generados: {total_chunks:,}")
-print(f"🎯 Tokens totales: {total_tokens:,}")
-print(f"💰 Costo total: ${total_cost:.4f} USD")
-print(f"📊 Promedio: {total_chunks//max(loaded,1)} chunks/doc, ${total_cost/max(loaded,1):.4f}/doc")
-
-# ============================================
-# EXPORTAR MÉTRICAS JSON
-# ============================================
-
 def export_metrics_json(metrics: dict, filepath: str):
     """Exporta métricas en formato JSON para GitHub Actions"""
     try:
@@ -515,43 +630,130 @@ def export_metrics_json(metrics: dict, filepath: str):
     except Exception as e:
         print(f"\n⚠️ Error exportando métricas: {e}")
 
-# Preparar métricas para exportación
-metrics = {
-    'timestamp': datetime.now().isoformat(),
-    'fase': 'load',
-    
-    # Aliases para GitHub Actions (compatibilidad)
-    'loaded': loaded,
-    'tokens': total_tokens,
-    'cost_usd': round(total_cost, 4),
-    
-    # Métricas detalladas
-    'documentos_procesados': len(docs),
-    'documentos_cargados': loaded,
-    'documentos_fallidos': len(docs) - loaded,
-    'tasa_exito': round(loaded / max(len(docs), 1) * 100, 2),
-    'chunks': {
-        'total_generados': total_chunks,
-        'promedio_por_documento': total_chunks // max(loaded, 1)
-    },
-    'embeddings': {
-        'modelo': EMBEDDING_MODEL,
-        'dimensiones': EMBEDDING_DIMENSIONS,
-        'tokens_totales': total_tokens,
-        'tokens_promedio_por_doc': total_tokens // max(loaded, 1)
-    },
-    'costos': {
-        'total_usd': round(total_cost, 4),
-        'promedio_por_documento_usd': round(total_cost / max(loaded, 1), 4),
-        'costo_por_1k_tokens_usd': 0.00013  # text-embedding-3-large
-    },
-    'configuracion': {
-        'max_chunk_size': MAX_CHUNK_SIZE,
-        'min_chunk_size': MIN_CHUNK_SIZE,
-        'overlap_size': OVERLAP_SIZE
+
+def procesar_documento(doc: dict) -> Tuple[int, int, float]:
+    print(f"\n📄 {doc['titulo']}")
+    return procesar_documento_batch(doc)
+
+
+def main():
+    # Backlog de documentos listos para embeddings, reclamados con lease
+    # IMPORTANTE: Buscar en 'transformado' no en 'texto_extraido'
+    cola = ColaConLeases(
+        supabase,
+        'transformado',
+        'id, contenido_markdown, contenido_texto, titulo, tipo_documento, metadata',
+        lambda q: q.eq('etapa_actual', 'transformado').eq('procesado', False),
+        solo_no_procesados=True
+    )
+    
+    print(f"🔢 Generando embeddings para el backlog (páginas de {cola.tamano_pagina}, {LOAD_WORKERS} workers)...")
+    print(f"🤖 Modelo: {proveedor.nombre}/{EMBEDDING_MODEL} ({EMBEDDING_DIMENSIONS}D → {EMBEDDING_COLUMNA})")
+    print(f"📏 Chunking: semántico adaptativo")
+    
+    # Procesar documentos
+    loaded = 0
+    total_chunks = 0
+    total_tokens = 0
+    total_cost = 0.0
+    
+    for doc, futuro in procesar_en_pool(cola, procesar_documento, LOAD_WORKERS):
+        try:
+            chunks, tokens, cost = futuro.result()
+            
+            loaded += 1
+            total_chunks += chunks
+            total_tokens += tokens
+            total_cost += cost
+            
+        except Exception as e:
+            print(f"  ❌ Error procesando documento {doc['titulo']}: {e}")
+            cola.liberar(doc['id'])
+            continue
+    
+    # Aplicar transiciones pendientes antes del reporte
+    transiciones.flush()
+    
+    # Liberar leases restantes solo después de aplicar las nuevas etapas
+    cola.cerrar()
+    
+    total = cola.entregados
+    
+    if total == 0:
+        print("\nℹ️  No hay documentos pendientes de carga")
+        print("\nCargados: 0")
+        print("Chunks: 0")
+        print("Tokens: 0")
+        print("Costo: $0.0000")
+        sys.exit(0)
+    
+    # Reporte final
+    print("\n" + "="*60)
+    print(f"✅ Documentos cargados: {loaded}/{total}")
+    print(f"📑 Páginas leídas: {cola.paginas}")
+    if cola.agotado_por_presupuesto:
+        print(f"⏱️  Backlog restante queda para la siguiente ejecución")
+    print(f"📦 Chunks generados: {total_chunks:,}")
+    print(f"🎯 Tokens totales: {total_tokens:,}")
+    print(f"💰 Costo total: ${total_cost:.4f} USD")
+    ritmo = planificador.resumen()
+    if ritmo['requests']:
+        print(f"🚦 Requests: {ritmo['requests']:,} | 429 absorbidos: {ritmo['throttles']} | espera: {ritmo['espera_segundos']}s")
+    print(f"📊 Promedio: {total_chunks//max(loaded,1)} chunks/doc, ${total_cost/max(loaded,1):.4f}/doc")
+    
+    # ============================================
+    # EXPORTAR MÉTRICAS JSON
+    # ============================================
+    
+    # Preparar métricas para exportación
+    metrics = {
+        'timestamp': datetime.now().isoformat(),
+        'fase': 'load',
+        
+        # Aliases para GitHub Actions (compatibilidad)
+        'loaded': loaded,
+        'tokens': total_tokens,
+        'cost_usd': round(total_cost, 4),
+        
+        # Métricas detalladas
+        'documentos_procesados': total,
+        'documentos_cargados': loaded,
+        'documentos_fallidos': total - loaded,
+        'tasa_exito': round(loaded / max(total, 1) * 100, 2),
+        'chunks': {
+            'total_generados': total_chunks,
+            'promedio_por_documento': total_chunks // max(loaded, 1)
+        },
+        'embeddings': {
+            'proveedor': proveedor.nombre,
+            'ritmo': planificador.resumen(),
+            'modelo': EMBEDDING_MODEL,
+            'dimensiones': EMBEDDING_DIMENSIONS,
+            'tokens_totales': total_tokens,
+            'tokens_promedio_por_doc': total_tokens // max(loaded, 1)
+        },
+        'costos': {
+            'total_usd': round(total_cost, 4),
+            'promedio_por_documento_usd': round(total_cost / max(loaded, 1), 4),
+            'costo_por_1k_tokens_usd': 0.00013  # text-embedding-3-large
+        },
+        'backlog': cola.resumen(),
+        'run_id': obtener_trazador().run_id,
+        'trazas': obtener_trazador().resumen(),
+        'configuracion': {
+            'max_chunk_size': MAX_CHUNK_SIZE,
+            'min_chunk_size': MIN_CHUNK_SIZE,
+            'overlap_size': OVERLAP_SIZE,
+            'workers': LOAD_WORKERS
+        }
     }
-}
+    
+    export_metrics_json(metrics, 'load_metrics.json')
+    obtener_trazador().exportar()
+    
+    sys.exit(0 if loaded > 0 else 1)
 
-export_metrics_json(metrics, 'load_metrics.json')
 
-sys.exit(0 if loaded > 0 else 1)
\ No newline at end of file
+if __name__ == '__main__':
+    with perfilar():
+        main()
@@ -4,7 +4,8 @@ VALIDADOR DE CALIDAD AVANZADO v2.0 - Sistema RAG ProfeFlow
 
 MEJORAS IMPLEMENTADAS:
 - ✅ Validación de embeddings text-embedding-3-large (valores numéricos)
-- ✅ Detección de chunks duplicados semánticamente (similitud > 0.95)
+- ✅ Detección de chunks duplicados semánticamente (similitud > 0.95, opt-in con
+  VALIDAR_CHUNKS_DUPLICADOS=true)
 - ✅ Validación de metadata rica JSONB (12+ campos Fase 3)
 - ✅ Validación de integridad de caché (chunk_hash, model, dimensions)
 - ✅ Detección de chunks huérfanos (sin documento padre)
@@ -20,7 +21,7 @@ import sys
 import re
 import json
 import hashlib
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
 from datetime import datetime
 from dotenv import load_dotenv
 from collections import defaultdict
@@ -32,6 +33,49 @@ except ImportError:
     print("❌ Instalar: pip install supabase python-dotenv numpy")
     sys.exit(1)
 
+from duplicados_chunks import DetectorChunksDuplicados
+from perfilado import perfilar
+
+
+TAMANO_PAGINA = 1000
+METADATA_KEYWORDS = ('endobj', 'endstream', 'flatedecode')
+
+
+def estadisticas_texto(texto: str) -> Dict:
+    """Contadores de texto equivalentes a los calculados por la RPC"""
+    
+    return {
+        'longitud_texto': len(texto),
+        'palabras_legibles': len(re.findall(r'\b[a-zA-ZÀ-ſ]{3,}\b', texto)),
+        'tiene_metadata_pdf': any(kw in texto.lower() for kw in METADATA_KEYWORDS)
+    }
+
+
+def puntuar_calidad(longitud_texto: np.ndarray, palabras_legibles: np.ndarray,
+                    tiene_metadata_pdf: np.ndarray, total_chunks: np.ndarray,
+                    sin_embedding: np.ndarray, chunks_validos: np.ndarray) -> np.ndarray:
+    """
+    Score de calidad vectorizado (un elemento por documento):
+        - Longitud mínima (15%)
+        - Palabras legibles (25%)
+        - Sin metadata PDF cruda (15%)
+        - Chunks con embedding (25%) y con contenido válido (20%)
+    """
+    
+    score = np.select([longitud_texto >= 500, longitud_texto >= 200], [0.15, 0.08], 0.0)
+    score += np.select([palabras_legibles >= 100, palabras_legibles >= 50], [0.25, 0.12], 0.0)
+    score += np.where(tiene_metadata_pdf.astype(bool), 0.0, 0.15)
+    
+    con_chunks = total_chunks > 0
+    divisor = np.maximum(total_chunks, 1)
+    score += np.where(con_chunks, 0.25 * (1 - sin_embedding / divisor), 0.0)
+    score += np.where(con_chunks, 0.20 * (chunks_validos / divisor), 0.0)
+    
+    # Sin texto extraído el documento no aprueba
+    score = np.where(longitud_texto > 0, score, 0.0)
+    
+    return np.minimum(score, 1.0)
+
 
 class ValidadorCalidad:
     """
@@ -68,111 +112,129 @@ class ValidadorCalidad:
         print("✅ Validador de calidad inicializado")
     
     def validar_todos(self) -> Dict:
-        """Valida todos los documentos procesados"""
+        """Valida todos los documentos procesados (modo agregado, sin N+1)"""
         
         print("\n🔍 VALIDACIÓN DE CALIDAD")
         print("=" * 60)
         
-        # Obtener documentos procesados
-        response = self.supabase.table('documentos_oficiales')\
-            .select('id, titulo, contenido_texto, embedding')\
-            .eq('procesado', True)\
-            .execute()
-        
-        documentos = response.data or []
+        # Contadores por documento: una RPC agregada o lectura paginada sin vectores
+        documentos = self._estadisticas_documentos()
         print(f"   Documentos a validar: {len(documentos)}")
         
-        resultados = {
-            'total': len(documentos),
-            'aprobados': 0,
-            'rechazados': 0,
-            'calidad_promedio': 0.0,
-            'total_chunks': 0,
-            'chunks_sin_embedding': 0,
-            'detalles': []
+        columnas = {
+            campo: np.array([d[campo] for d in documentos], dtype=np.int64)
+            for campo in ('longitud_texto', 'palabras_legibles', 'tiene_metadata_pdf',
+                          'total_chunks', 'sin_embedding', 'chunks_validos')
         }
         
-        for doc in documentos:
-            calidad, chunks_info = self._calcular_calidad(doc)
-            
-            resultado = {
-                'id': doc['id'],
-                'titulo': doc['titulo'],
-                'calidad': calidad,
-                'aprobado': calidad >= 0.7,
-                'chunks': chunks_info
-            }
-            
-            if resultado['aprobado']:
-                resultados['aprobados'] += 1
-            else:
-                resultados['rechazados'] += 1
-            
-            resultados['calidad_promedio'] += calidad
-            resultados['total_chunks'] += chunks_info['total']
-            resultados['chunks_sin_embedding'] += chunks_info['sin_embedding']
-            resultados['detalles'].append(resultado)
+        # Sin texto: calidad 0 y chunks no contabilizados (criterio histórico)
+        con_texto = columnas['longitud_texto'] > 0
+        columnas['total_chunks'] = np.where(con_texto, columnas['total_chunks'], 0)
+        columnas['sin_embedding'] = np.where(con_texto, columnas['sin_embedding'], 0)
         
-        if resultados['total'] > 0:
-            resultados['calidad_promedio'] /= resultados['total']
+        calidades = puntuar_calidad(**columnas) if documentos else np.zeros(0)
+        aprobados = calidades >= 0.7
+        
+        resultados = {
+            'total': len(documentos),
+            'aprobados': int(aprobados.sum()),
+            'rechazados': int((~aprobados).sum()),
+            'calidad_promedio': float(calidades.mean()) if documentos else 0.0,
+            'total_chunks': int(columnas['total_chunks'].sum()),
+            'chunks_sin_embedding': int(columnas['sin_embedding'].sum()),
+            'detalles': [
+                {
+                    'id': doc['id'],
+                    'titulo': doc['titulo'],
+                    'calidad': float(calidad),
+                    'aprobado': bool(aprobado),
+                    'chunks': {'total': int(total), 'sin_embedding': int(sin_emb)}
+                }
+                for doc, calidad, aprobado, total, sin_emb in zip(
+                    documentos, calidades, aprobados,
+                    columnas['total_chunks'], columnas['sin_embedding']
+                )
+            ]
+        }
         
         self._mostrar_reporte(resultados)
         
         return resultados
     
-    def _calcular_calidad(self, doc: Dict) -> tuple:
-        """Calcula score de calidad del documento y valida chunks"""
-        
-        texto = doc.get('contenido_texto', '')
-        
-        if not texto:
-            return 0.0, {'total': 0, 'sin_embedding': 0}
-        
-        score = 0.0
-        
-        # Criterio 1: Longitud mínima (15%)
-        if len(texto) >= 500:
-            score += 0.15
-        elif len(texto) >= 200:
-            score += 0.08
-        
-        # Criterio 2: Palabras legibles (25%)
-        palabras = re.findall(r'\b[a-zA-ZÀ-ſ]{3,}\b', texto)
-        if len(palabras) >= 100:
-            score += 0.25
-        elif len(palabras) >= 50:
-            score += 0.12
-        
-        # Criterio 3: Sin metadata excesiva (15%)
-        metadata_keywords = ['endobj', 'endstream', 'flatedecode']
-        metadata_count = sum(1 for kw in metadata_keywords if kw in texto.lower())
-        if metadata_count == 0:
-            score += 0.15
-        
-        # Criterio 4: Validar chunks (45%)
-        chunks_response = self.supabase.table('chunks_documentos')\
-            .select('id, embedding, contenido')\
-            .eq('documento_id', doc['id'])\
-            .execute()
-        
-        chunks = chunks_response.data or []
-        chunks_info = {
-            'total': len(chunks),
-            'sin_embedding': sum(1 for c in chunks if not c.get('embedding'))
-        }
+    def _estadisticas_documentos(self) -> List[Dict]:
+        """Contadores por documento vía RPC validacion_calidad_documentos (keyset sobre id)"""
         
-        if len(chunks) > 0:
-            # Todos los chunks tienen embedding (25%)
-            if chunks_info['sin_embedding'] == 0:
-                score += 0.25
-            else:
-                score += 0.25 * (1 - chunks_info['sin_embedding'] / len(chunks))
-            
-            # Chunks tienen contenido válido (20%)
-            chunks_validos = sum(1 for c in chunks if len(c.get('contenido', '')) > 100)
-            score += 0.20 * (chunks_validos / len(chunks))
+        try:
+            filas = list(self._paginar_rpc('validacion_calidad_documentos'))
+            print("   ⚡ Estadísticas agregadas en BD")
+            return filas
+        except Exception as e:
+            mensaje = str(e)
+            if 'PGRST202' not in mensaje and 'Could not find the function' not in mensaje:
+                raise
+            print("   ⚠️  RPC validacion_calidad_documentos no desplegada - lectura paginada sin embeddings")
         
-        return min(score, 1.0), chunks_info
+        return self._estadisticas_paginadas()
+    
+    def _estadisticas_paginadas(self) -> List[Dict]:
+        """Fallback: lecturas paginadas de solo las columnas necesarias (nunca embedding)"""
+        
+        # Los textos se reducen a contadores página a página. Los duplicados por
+        # contenido no tienen chunks propios (se evalúan con el canónico)
+        documentos = []
+        for doc in self._paginar(lambda: self.supabase.table('documentos_oficiales')
+                                 .select('id, titulo, contenido_texto')
+                                 .eq('procesado', True)
+                                 .is_('metadata->>chunks_compartidos_con', 'null')
+                                 .order('id')):
+            texto = doc.pop('contenido_texto', None) or ''
+            doc.update(estadisticas_texto(texto))
+            documentos.append(doc)
+        
+        chunks = defaultdict(lambda: {'total_chunks': 0, 'chunks_validos': 0, 'sin_embedding': 0})
+        for fila in self._paginar(lambda: self.supabase.table('chunks_documentos')
+                                  .select('documento_id, contenido')
+                                  .order('id')):
+            info = chunks[fila['documento_id']]
+            info['total_chunks'] += 1
+            info['chunks_validos'] += len(fila.get('contenido') or '') > 100
+        
+        for fila in self._paginar(lambda: self.supabase.table('chunks_documentos')
+                                  .select('documento_id')
+                                  .is_('embedding', 'null')
+                                  .order('id')):
+            chunks[fila['documento_id']]['sin_embedding'] += 1
+        
+        for doc in documentos:
+            doc.update(chunks.get(doc['id'], {'total_chunks': 0, 'chunks_validos': 0, 'sin_embedding': 0}))
+        
+        return documentos
+    
+    def _paginar_rpc(self, funcion: str, tamano: int = TAMANO_PAGINA) -> Iterator[Dict]:
+        """
+        RPC paginada por cursor (p_despues_de = último id): cada página
+        agrega solo sus documentos, sin repetir el GROUP BY por offset
+        """
+        
+        ultimo = None
+        while True:
+            pagina = self.supabase.rpc(funcion, {'p_despues_de': ultimo, 'p_limite': tamano}).execute().data or []
+            yield from pagina
+            if len(pagina) < tamano:
+                return
+            ultimo = pagina[-1]['id']
+    
+    @staticmethod
+    def _paginar(construir_query, tamano: int = TAMANO_PAGINA) -> Iterator[Dict]:
+        """Ejecuta la query por rangos hasta agotar resultados (una página en memoria)"""
+        
+        desde = 0
+        while True:
+            pagina = construir_query().range(desde, desde + tamano - 1).execute().data or []
+            yield from pagina
+            if len(pagina) < tamano:
+                return
+            desde += tamano
     
     def _mostrar_reporte(self, resultados: Dict):
         """Muestra reporte de validación"""
@@ -199,8 +261,18 @@ class ValidadorCalidad:
 
 if __name__ == '__main__':
     try:
-        validador = ValidadorCalidad()
-        resultados = validador.validar_todos()
+        with perfilar():
+            validador = ValidadorCalidad()
+            resultados = validador.validar_todos()
+            
+            # Chunks semánticamente duplicados (similitud > 0.95): opt-in, lee todo el
+            # corpus de embeddings (o el export de snapshot_ann.py, ver duplicados_chunks)
+            duplicados = None
+            if os.getenv('VALIDAR_CHUNKS_DUPLICADOS', 'false').lower() == 'true':
+                try:
+                    duplicados = DetectorChunksDuplicados(validador.supabase).detectar()
+                except Exception as e:
+                    print(f"\n⚠️ Error detectando chunks duplicados: {e}")
         
         # ============================================
         # EXPORTAR MÉTRICAS JSON
@@ -226,6 +298,7 @@ if __name__ == '__main__':
             'total_chunks': resultados['total_chunks'],
             'chunks_sin_embedding': resultados['chunks_sin_embedding'],
             'tasa_aprobacion': round(resultados['aprobados'] / max(resultados['total'], 1) * 100, 2),
+            'chunks_duplicados': duplicados,
             'detalles_rechazados': [
                 {
                     'id': d['id'],
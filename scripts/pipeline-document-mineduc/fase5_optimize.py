@@ -6,7 +6,7 @@ FUNCIONES PRINCIPALES:
 1. Crear/actualizar índice HNSW para búsqueda vectorial rápida
 2. Actualizar estadísticas de tablas (ANALYZE)
 3. Verificar salud de índices
-4. Reindexar si es necesario
+4. Reindexar solo si hay deriva (politica_reindexado.py)
 
 IMPORTANTE:
 - Este script requiere funciones RPC en Supabase (ver SQL al final)
@@ -26,6 +26,9 @@ except ImportError:
     print("❌ Instalar: pip install supabase python-dotenv")
     sys.exit(1)
 
+from perfilado import perfilar
+from politica_reindexado import ACCION_RECONSTRUIR, UMBRAL_CAMBIOS, UMBRAL_RECALL, PoliticaReindexado
+
 load_dotenv('.env.local')
 
 # ============================================
@@ -290,10 +293,18 @@ def main():
         # 2. Verificar estado de índices
         resultados['verificacion_indices'] = verificar_indices()
         
-        # 3. Optimizar índice HNSW
-        resultados['optimizacion_hnsw'] = optimizar_indice_hnsw()
+        # 3. Reconstruir índice HNSW solo si la política lo indica
+        politica = PoliticaReindexado(supabase)
+        decision = politica.evaluar(forzar=os.getenv('FORCE_REINDEX', 'false').lower() == 'true')
+        resultados['politica_reindexado'] = decision.como_dict()
+        
+        if decision.accion == ACCION_RECONSTRUIR:
+            resultados['optimizacion_hnsw'] = politica.reconstruir(optimizar_indice_hnsw)
+        else:
+            print("\n⏭️  Índice HNSW vigente - solo ANALYZE")
+            resultados['optimizacion_hnsw'] = {'success': True, 'skipped': True}
         
-        # 4. Actualizar estadísticas de tablas
+        # 4. Actualizar estadísticas de tablas (ANALYZE)
         resultados['estadisticas'] = actualizar_estadisticas_tablas()
         
         # 5. Obtener métricas finales
@@ -311,7 +322,7 @@ def main():
         print("\n💡 Recomendaciones:")
         print("   - Ejecutar este script después de cada carga masiva")
         print("   - Monitorear performance de búsquedas")
-        print("   - Considerar reindexar si hay >10% nuevos chunks")
+        print(f"   - Reindexado automático si cambia >{UMBRAL_CAMBIOS:.0%} de chunks o recall < {UMBRAL_RECALL:.0%}")
         
         # ============================================
         # EXPORTAR MÉTRICAS JSON
@@ -335,8 +346,10 @@ def main():
             'indices_verificados': resultados['verificacion_indices'] is not None,
             'optimizacion_exitosa': resultados['optimizacion_hnsw'] is not None and resultados['optimizacion_hnsw'].get('success', False),
             'estadisticas_actualizadas': resultados['estadisticas'] is not None,
+            'reindexado': resultados.get('politica_reindexado'),
+            'resultado_hnsw': resultados['optimizacion_hnsw'],
             'metricas': resultados['metricas'] or {},
-            'recomendacion_reindexar': resultados['metricas'].get('chunks_con_embedding', 0) > 1000 if resultados['metricas'] else False
+            'recomendacion_reindexar': decision.accion == ACCION_RECONSTRUIR
         }
         
         export_metrics_json(metrics, 'optimize_metrics.json')
@@ -354,5 +367,6 @@ def main():
 
 
 if __name__ == '__main__':
-    exit_code = main()
+    with perfilar():
+        exit_code = main()
     sys.exit(exit_code)
\ No newline at end of file
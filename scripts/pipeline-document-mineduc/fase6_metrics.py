@@ -15,7 +15,9 @@ MÉTRICAS CLAVE:
 - Tokens por documento
 - Calidad promedio de chunks
 - Velocidad de procesamiento
-- Comparación con promedio histórico (últimos 30 días)
+- Comparación con promedio histórico (últimos 30 días, desde los rollups
+  diarios de rollups_metricas.py; filas crudas si los rollups no cubren
+  la ventana)
 """
 
 import os
@@ -26,6 +28,12 @@ from datetime import date, datetime, timedelta
 from typing import Dict, Optional
 from dotenv import load_dotenv
 
+from anomalias_metricas import detectar_regresiones, evaluar_regresiones, extraer_metricas
+from colector_metricas import SERVICIOS, calcular_rendimiento, recolectar
+from perfilado import perfilar
+from rollups_metricas import RollupsMetricas, lineas_base, promedio_historico, sketches_desde_eventos
+from trazas import cargar_eventos, resumen_ejecucion
+
 try:
     from supabase import create_client
 except ImportError:
@@ -151,14 +159,17 @@ class MetricsValidator:
             })
         
         # Determinar estado general
-        if len(metricas['alertas']) == 0:
-            metricas['estado'] = 'excelente'
-        elif any(a['severidad'] == 'critical' for a in metricas['alertas']):
-            metricas['estado'] = 'critico'
-        else:
-            metricas['estado'] = 'aceptable'
+        metricas['estado'] = MetricsValidator.estado_por_alertas(metricas['alertas'])
         
         return metricas
+    
+    @staticmethod
+    def estado_por_alertas(alertas: list) -> str:
+        if len(alertas) == 0:
+            return 'excelente'
+        if any(a['severidad'] == 'critical' for a in alertas):
+            return 'critico'
+        return 'aceptable'
 
 
 class HistoricalAnalyzer:
@@ -166,22 +177,47 @@ class HistoricalAnalyzer:
     
     def __init__(self, supabase_client):
         self.supabase = supabase_client
+        self.rollups = RollupsMetricas(supabase_client)
+        self._historial: Dict[int, list] = {}
+        self._rollups: Dict[int, list] = {}
+    
+    def obtener_rollups(self, dias: int = 30) -> list:
+        """
+        Rollups diarios de los últimos N días (a lo más una fila por día);
+        [] si no cubren todas las ejecuciones de la ventana
+        """
+        
+        if dias not in self._rollups:
+            self._rollups[dias] = self.rollups.consultar_ventana(dias)
+        return self._rollups[dias]
     
-    def obtener_promedio_historico(self, dias: int = 30) -> Optional[Dict]:
-        """Obtiene promedios de los últimos N días"""
+    def obtener_historial(self, dias: int = 30) -> list:
+        """Ejecuciones de los últimos N días en orden cronológico (solo columnas usadas)"""
         
-        try:
+        if dias not in self._historial:
             fecha_inicio = (datetime.now() - timedelta(days=dias)).date().isoformat()
             
             response = self.supabase.table('metricas_pipeline_rag')\
-                .select('*')\
+                .select('fecha, created_at, documentos_procesados, chunks_validados, errores_criticos, metadata')\
                 .gte('fecha', fecha_inicio)\
+                .order('created_at')\
                 .execute()
+            self._historial[dias] = response.data or []
+        
+        return self._historial[dias]
+    
+    def obtener_promedio_historico(self, dias: int = 30) -> Optional[Dict]:
+        """Obtiene promedios de los últimos N días"""
+        
+        try:
+            rollups = self.obtener_rollups(dias)
+            if rollups:
+                return promedio_historico(rollups)
             
-            if not response.data or len(response.data) == 0:
-                return None
+            runs = self.obtener_historial(dias)
             
-            runs = response.data
+            if not runs:
+                return None
             
             promedio = {
                 'runs_totales': len(runs),
@@ -196,6 +232,25 @@ class HistoricalAnalyzer:
             print(f"   ⚠️ No se pudo obtener histórico: {e}")
             return None
     
+    def detectar_regresiones(self, fila_actual: Dict, dias: int = 30) -> list:
+        """
+        Regresiones de s/doc, latencias por fase, latencia de visión, tokens/doc
+        y costo/doc contra la mediana/MAD y EWMA del historial (anomalias_metricas.py)
+        """
+        
+        variaciones = {'costo_por_doc_usd': THRESHOLDS['variacion_maxima_costo']}
+        rollups = self.obtener_rollups(dias)
+        if rollups:
+            return evaluar_regresiones(extraer_metricas(fila_actual), lineas_base(rollups), variaciones=variaciones)
+        
+        try:
+            historial = [extraer_metricas(r) for r in self.obtener_historial(dias)]
+        except Exception as e:
+            print(f"   ⚠️ No se pudo obtener historial para regresiones: {e}")
+            return []
+        
+        return detectar_regresiones(extraer_metricas(fila_actual), historial, variaciones=variaciones)
+    
     def comparar_con_historico(self, metricas_actuales: Dict, historico: Optional[Dict]) -> Dict:
         """Compara métricas actuales con promedio histórico"""
         
@@ -233,21 +288,58 @@ class HistoricalAnalyzer:
 # REGISTRO DE MÉTRICAS
 # ============================================
 
+def kpis_pipeline(metricas_derivadas: Dict) -> Dict:
+    """KPIs guardados en metricas_pipeline_rag.metadata (base de las regresiones)"""
+    return {
+        'tasa_exito': metricas_derivadas['tasa_exito_total'],
+        'costo_por_doc': metricas_derivadas['costo_por_documento'],
+        'tokens_por_doc': metricas_derivadas['tokens_por_documento'],
+        'chunks_por_doc': metricas_derivadas['chunks_por_documento']
+    }
+
+
+def fila_pipeline_rag(args, metricas_derivadas: Dict, trazas: Optional[Dict] = None,
+                      rendimiento: Optional[Dict] = None) -> Dict:
+    """Fila de metricas_pipeline_rag (también la ejecución actual en regresiones y rollups)"""
+    trazas = trazas or {}
+    return {
+        'fecha': date.today().isoformat(),
+        'documentos_monitoreados': args.downloaded,
+        'documentos_procesados': args.loaded,
+        'chunks_validados': args.validated,
+        'errores_criticos': max(0, args.downloaded - args.loaded),
+        'latencia_procesamiento_ms': trazas.get('tiempo_total_ms', 0),
+        'workflow_run_id': args.workflow_id,
+        'metadata': {
+            'quality_score': args.quality,
+            'total_cost_usd': args.cost,
+            'total_tokens': args.tokens,
+            'estado': metricas_derivadas['estado'],
+            'kpis': kpis_pipeline(metricas_derivadas),
+            # Throughput, latencia por fase y costo por documento (colector_metricas.py)
+            'rendimiento': rendimiento or {}
+        }
+    }
+
+
 class MetricsRecorder:
     """Registra métricas en Supabase"""
     
     def __init__(self, supabase_client):
         self.supabase = supabase_client
+        self.fila_pipeline_rag: Optional[Dict] = None
     
-    def registrar_metricas_procesamiento(self, args, metricas_derivadas: Dict) -> bool:
+    def registrar_metricas_procesamiento(self, args, metricas_derivadas: Dict, trazas: Optional[Dict] = None) -> bool:
         """Registra en tabla metricas_procesamiento"""
         
+        trazas = trazas or {}
         try:
             self.supabase.table('metricas_procesamiento').insert({
                 'tipo': 'etl_documentos',
                 'documentos_procesados': args.loaded,
                 'documentos_fallidos': args.downloaded - args.loaded,
-                'tiempo_total_ms': 0,  # Se actualizará con tiempo real en GitHub Actions
+                # Tiempo de pared de la ejecución según las trazas de las fases (0 si no hay)
+                'tiempo_total_ms': trazas.get('tiempo_total_ms', 0),
                 'metadata': {
                     # Datos raw
                     'downloaded': args.downloaded,
@@ -266,7 +358,11 @@ class MetricsRecorder:
                     
                     # Estado
                     'estado': metricas_derivadas['estado'],
-                    'alertas': metricas_derivadas['alertas']
+                    'alertas': metricas_derivadas['alertas'],
+                    
+                    # Tiempo por fase y percentiles por etapa (trazas.py)
+                    'tiempo_por_fase_ms': trazas.get('fases', {}),
+                    'etapas': trazas.get('etapas', {})
                 }
             }).execute()
             
@@ -277,30 +373,16 @@ class MetricsRecorder:
             print(f"   ❌ Error registrando metricas_procesamiento: {e}")
             return False
     
-    def registrar_metricas_pipeline_rag(self, args, metricas_derivadas: Dict) -> bool:
+    def registrar_metricas_pipeline_rag(self, args, metricas_derivadas: Dict, trazas: Optional[Dict] = None,
+                                        rendimiento: Optional[Dict] = None) -> bool:
         """Registra en tabla metricas_pipeline_rag"""
         
         try:
-            self.supabase.table('metricas_pipeline_rag').insert({
-                'fecha': date.today().isoformat(),
-                'documentos_monitoreados': args.downloaded,
-                'documentos_procesados': args.loaded,
-                'chunks_validados': args.validated,
-                'errores_criticos': max(0, args.downloaded - args.loaded),
-                'latencia_procesamiento_ms': 0,
-                'workflow_run_id': args.workflow_id,
-                'metadata': {
-                    'quality_score': args.quality,
-                    'total_cost_usd': args.cost,
-                    'total_tokens': args.tokens,
-                    'estado': metricas_derivadas['estado'],
-                    'kpis': {
-                        'tasa_exito': metricas_derivadas['tasa_exito_total'],
-                        'costo_por_doc': metricas_derivadas['costo_por_documento'],
-                        'chunks_por_doc': metricas_derivadas['chunks_por_documento']
-                    }
-                }
-            }).execute()
+            response = self.supabase.table('metricas_pipeline_rag')\
+                .insert(fila_pipeline_rag(args, metricas_derivadas, trazas, rendimiento))\
+                .execute()
+            # Con id y created_at para acumular en los rollups
+            self.fila_pipeline_rag = (response.data or [None])[0]
             
             print("   ✅ metricas_pipeline_rag registradas")
             return True
@@ -398,8 +480,24 @@ def generar_reporte_consola(args, metricas: Dict, historico: Optional[Dict], com
     print("\n" + "=" * 60)
 
 
+def mostrar_rendimiento(rendimiento: Dict):
+    """Throughput y latencias (— si no hay datos para calcularlos)"""
+    
+    def valor(v, unidad=''):
+        return '—' if v is None else f"{v:,}{unidad}"
+    
+    print(f"⚡ Throughput: {valor(rendimiento['documentos_por_minuto'])} docs/min | "
+          f"{valor(rendimiento['carga_chunks_por_segundo'])} chunks/s | "
+          f"{valor(rendimiento['carga_tokens_por_segundo'])} tokens/s | "
+          f"costo/doc {valor(rendimiento['costo_por_documento_usd'], ' USD')}")
+    for fase, latencia in rendimiento['latencia_documento_ms'].items():
+        print(f"   ⏱️  {fase}: p50 {latencia['p50_ms']:,.0f}ms · p90 {latencia['p90_ms']:,.0f}ms · "
+              f"p99 {latencia['p99_ms']:,.0f}ms ({latencia['n']} docs)")
+
+
 def generar_reporte_json(args, metricas: Dict, historico: Optional[Dict], 
-                        comparacion: Dict, filepath: str = 'metrics_report.json'):
+                        comparacion: Dict, filepath: str = 'metrics_report.json',
+                        trazas: Optional[Dict] = None, rendimiento: Optional[Dict] = None):
     """Genera reporte en formato JSON"""
     
     reporte = {
@@ -416,7 +514,9 @@ def generar_reporte_json(args, metricas: Dict, historico: Optional[Dict],
         },
         'derived_metrics': metricas,
         'historical_context': historico,
-        'comparison': comparacion
+        'comparison': comparacion,
+        'traces': trazas,
+        'performance': rendimiento
     }
     
     try:
@@ -456,12 +556,30 @@ def main():
                        help='GitHub workflow run ID')
     parser.add_argument('--export-json', action='store_true',
                        help='Exportar reporte JSON')
+    parser.add_argument('--trazas-dir', type=str, default=None,
+                       help='Directorio con las trazas (*.trace.json) de las fases de esta ejecución')
+    parser.add_argument('--artefactos', type=str, default=None,
+                       help='Directorio con los *_metrics.json y trazas de las fases: '
+                            'reemplaza a los contadores por flags')
     
-    args = parser.parse_args()
+    return registrar_metricas(parser.parse_args())
+
+
+def registrar_metricas(args) -> int:
+    """
+    Registro completo a partir de los contadores del pipeline. `args` es el
+    Namespace del CLI o uno armado en memoria por pipeline_runner.py.
+    """
     
     print("📊 REGISTRANDO MÉTRICAS DEL PIPELINE")
     print("=" * 60)
     
+    # 0. Contadores y trazas desde los artefactos de las fases
+    if getattr(args, 'artefactos', None):
+        recolectar(args.artefactos).aplicar(args)
+        print(f"📥 Artefactos leídos de {args.artefactos}: descargados {args.downloaded}, "
+              f"transformados {args.transformed}, cargados {args.loaded}")
+    
     # 1. Validar argumentos
     if not MetricsValidator.validar_argumentos(args):
         print("\n❌ Validación de argumentos falló")
@@ -480,21 +598,48 @@ def main():
         historico
     )
     
-    # 4. Registrar en BD
+    # 4. Tiempos reales desde las trazas (en memoria si viene de pipeline_runner.py)
+    trazas = getattr(args, 'trazas', None)
+    latencias = getattr(args, 'latencias', None) or {}
+    if trazas is None and getattr(args, 'trazas_dir', None):
+        eventos = cargar_eventos(args.trazas_dir)
+        trazas = resumen_ejecucion(eventos)
+        latencias = sketches_desde_eventos(eventos, SERVICIOS)
+    if trazas and trazas['spans']:
+        print(f"🧭 Trazas: {trazas['spans']:,} spans, {trazas['tiempo_total_ms'] / 1000:.1f}s de pared")
+    rendimiento = getattr(args, 'rendimiento', None) or calcular_rendimiento(args, trazas)
+    mostrar_rendimiento(rendimiento)
+    
+    # 5. Regresiones de rendimiento y costo contra la línea base robusta
+    regresiones = analyzer.detectar_regresiones(fila_pipeline_rag(args, metricas, trazas, rendimiento))
+    if regresiones:
+        print(f"🚨 {len(regresiones)} regresiones vs línea base (mediana/MAD, EWMA)")
+        metricas['alertas'].extend(regresiones)
+        metricas['estado'] = MetricsValidator.estado_por_alertas(metricas['alertas'])
+    
+    # 6. Registrar en BD
     print("\n💾 Registrando en Supabase...")
     recorder = MetricsRecorder(supabase)
     
-    success_1 = recorder.registrar_metricas_procesamiento(args, metricas)
-    success_2 = recorder.registrar_metricas_pipeline_rag(args, metricas)
+    success_1 = recorder.registrar_metricas_procesamiento(args, metricas, trazas)
+    success_2 = recorder.registrar_metricas_pipeline_rag(args, metricas, trazas, rendimiento)
     recorder.registrar_alertas(metricas['alertas'])
     
-    # 5. Generar reportes
+    # Rollups por hora/día: la próxima comparación histórica no relee filas crudas
+    if recorder.fila_pipeline_rag:
+        try:
+            if analyzer.rollups.acumular(recorder.fila_pipeline_rag, latencias):
+                print("   ✅ Rollups hora/día actualizados")
+        except Exception as e:
+            print(f"   ⚠️ Error actualizando rollups: {e}")
+    
+    # 7. Generar reportes
     generar_reporte_consola(args, metricas, historico, comparacion)
     
     if args.export_json:
-        generar_reporte_json(args, metricas, historico, comparacion)
+        generar_reporte_json(args, metricas, historico, comparacion, trazas=trazas, rendimiento=rendimiento)
     
-    # 6. Exit code según estado
+    # 8. Exit code según estado
     if not (success_1 and success_2):
         print("\n⚠️ Algunas métricas no se registraron")
         return 1
@@ -509,7 +654,8 @@ def main():
 
 if __name__ == '__main__':
     try:
-        exit_code = main()
+        with perfilar():
+            exit_code = main()
         sys.exit(exit_code)
     except Exception as e:
         print(f"\n❌ ERROR CRÍTICO: {e}")
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Escáner de integridad de embeddings (streaming)
+
+fase4 solo comprueba que el embedding no sea nulo. Este escáner recorre
+chunks_documentos y embeddings_cache página a página (keyset), decodifica
+cada página a una matriz float32 contigua y verifica en bloque:
+
+- Dimensión == EMBEDDING_DIMENSIONS
+- Valores NaN / Inf
+- Norma nula o casi nula
+- Deriva de norma (text-embedding-3 devuelve vectores unitarios)
+- chunk_hash distinto de sha256(contenido) en chunks_documentos
+
+La memoria queda acotada a una página; al final informa filas/s por tabla
+para poder correrlo sobre el corpus completo cada noche.
+
+Uso:
+    python scripts/pipeline-document-mineduc/integridad_embeddings.py [--tabla chunks|cache|todas]
+
+Variables de entorno:
+- EMBEDDING_DIMENSIONS=1536
+- EMBEDDING_MODEL=text-embedding-3-large (filtro de embeddings_cache)
+- INTEGRIDAD_TOLERANCIA_NORMA=0.01
+- INTEGRIDAD_TAMANO_PAGINA=500
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+    from dotenv import load_dotenv
+    from supabase import create_client
+except ImportError:
+    print("❌ Instalar: pip install supabase python-dotenv numpy")
+    sys.exit(1)
+
+from embeddings_reducidos import embedding_de_cache
+from vectores import decodificar_vector
+
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-large')
+TOLERANCIA_NORMA = float(os.getenv('INTEGRIDAD_TOLERANCIA_NORMA', '0.01'))
+TAMANO_PAGINA = int(os.getenv('INTEGRIDAD_TAMANO_PAGINA', '500'))
+NORMA_MINIMA = 1e-6
+MAX_EJEMPLOS = 20
+
+CHEQUEOS = ('sin_embedding', 'dimension_incorrecta', 'no_finito', 'norma_nula', 'deriva_norma')
+
+
+# ============================================
+# CHEQUEOS VECTORIZADOS
+# ============================================
+
+def analizar_vectores(valores: List, dimensiones: int = EMBEDDING_DIMENSIONS,
+                      tolerancia: float = TOLERANCIA_NORMA,
+                      esperadas: Optional[List[int]] = None) -> Dict[str, np.ndarray]:
+    """
+    Aplica los chequeos a una página de embeddings.
+
+    esperadas: dimensión declarada por fila (caché Matryoshka, donde conviven
+    vectores completos y truncados); por defecto `dimensiones` para todas.
+
+    Returns:
+        dict chequeo → máscara booleana (n,), más 'normas' (NaN si no aplica)
+    """
+    n = len(valores)
+    esperadas = np.full(n, dimensiones) if esperadas is None else np.asarray(
+        [e or dimensiones for e in esperadas], dtype=np.int64)
+    matriz = np.zeros((n, int(esperadas.max()) if n else dimensiones), dtype=np.float32)
+    sin_embedding = np.zeros(n, dtype=bool)
+    dimension_incorrecta = np.zeros(n, dtype=bool)
+
+    for i, valor in enumerate(valores):
+        vector = decodificar_vector(valor)
+        if vector is None or vector.size == 0:
+            sin_embedding[i] = True
+        elif vector.shape[0] != esperadas[i]:
+            dimension_incorrecta[i] = True
+        else:
+            matriz[i, :vector.shape[0]] = vector
+
+    comparables = ~(sin_embedding | dimension_incorrecta)
+    no_finito = comparables & ~np.isfinite(matriz).all(axis=1)
+
+    with np.errstate(invalid='ignore', over='ignore'):
+        normas = np.linalg.norm(matriz, axis=1)
+    normas[~comparables | no_finito] = np.nan
+
+    validas = comparables & ~no_finito
+    norma_nula = validas & (normas < NORMA_MINIMA)
+    deriva_norma = validas & ~norma_nula & (np.abs(normas - 1.0) > tolerancia)
+
+    return {
+        'sin_embedding': sin_embedding,
+        'dimension_incorrecta': dimension_incorrecta,
+        'no_finito': no_finito,
+        'norma_nula': norma_nula,
+        'deriva_norma': deriva_norma,
+        'normas': normas
+    }
+
+
+def hashes_invalidos(contenidos: List[Optional[str]], hashes: List[Optional[str]]) -> np.ndarray:
+    """Máscara de filas cuyo chunk_hash no coincide con sha256(contenido)"""
+    return np.array([
+        h is None or hashlib.sha256((c or '').encode()).hexdigest() != h
+        for c, h in zip(contenidos, hashes)
+    ], dtype=bool)
+
+
+# ============================================
+# ESCÁNER
+# ============================================
+
+class EscanerIntegridad:
+    """Recorre las tablas de embeddings y acumula contadores de problemas"""
+
+    def __init__(self, supabase_client, dimensiones: int = EMBEDDING_DIMENSIONS,
+                 tolerancia: float = TOLERANCIA_NORMA, tamano_pagina: int = TAMANO_PAGINA):
+        self.supabase = supabase_client
+        self.dimensiones = dimensiones
+        self.tolerancia = tolerancia
+        self.tamano_pagina = tamano_pagina
+
+    def _paginas(self, tabla: str, columnas: str, clave: str, filtros=None):
+        ultimo = None
+        while True:
+            query = self.supabase.table(tabla).select(columnas)
+            if filtros is not None:
+                query = filtros(query)
+            if ultimo is not None:
+                query = query.gt(clave, ultimo)
+            filas = query.order(clave).limit(self.tamano_pagina).execute().data or []
+            if not filas:
+                return
+            yield filas
+            ultimo = filas[-1][clave]
+            if len(filas) < self.tamano_pagina:
+                return
+
+    def _escanear(self, nombre: str, paginas, clave: str, con_hash: bool,
+                  columna_dimensiones: Optional[str] = None) -> Dict:
+        print(f"\n🔬 {nombre}")
+        contadores = {chequeo: 0 for chequeo in CHEQUEOS}
+        if con_hash:
+            contadores['hash_invalido'] = 0
+        ejemplos = {chequeo: [] for chequeo in contadores}
+        suma_normas = 0.0
+        normas_validas = 0
+        filas_total = 0
+        inicio = time.monotonic()
+
+        for filas in paginas:
+            esperadas = [f.get(columna_dimensiones) for f in filas] if columna_dimensiones else None
+            mascaras = analizar_vectores([f.get('embedding') for f in filas], self.dimensiones,
+                                         self.tolerancia, esperadas)
+            if con_hash:
+                mascaras['hash_invalido'] = hashes_invalidos(
+                    [f.get('contenido') for f in filas], [f.get('chunk_hash') for f in filas]
+                )
+
+            for chequeo in contadores:
+                indices = np.flatnonzero(mascaras[chequeo])
+                contadores[chequeo] += len(indices)
+                faltan = MAX_EJEMPLOS - len(ejemplos[chequeo])
+                ejemplos[chequeo].extend(filas[i][clave] for i in indices[:max(faltan, 0)])
+
+            normas = mascaras['normas'][np.isfinite(mascaras['normas'])]
+            suma_normas += float(normas.sum())
+            normas_validas += len(normas)
+            filas_total += len(filas)
+
+            segundos = time.monotonic() - inicio
+            print(f"   {filas_total:,} filas ({filas_total / max(segundos, 1e-9):,.0f} filas/s)", end='\r')
+
+        segundos = time.monotonic() - inicio
+        problemas = sum(contadores.values())
+        print(f"   {filas_total:,} filas en {segundos:.1f}s ({filas_total / max(segundos, 1e-9):,.0f} filas/s)")
+        for chequeo, cantidad in contadores.items():
+            if cantidad:
+                print(f"   ⚠️  {chequeo}: {cantidad}")
+        if problemas == 0:
+            print("   ✅ Sin problemas")
+
+        return {
+            'filas': filas_total,
+            'segundos': round(segundos, 2),
+            'filas_por_segundo': round(filas_total / max(segundos, 1e-9), 1),
+            'norma_promedio': round(suma_normas / normas_validas, 6) if normas_validas else None,
+            'problemas': problemas,
+            'contadores': contadores,
+            'ejemplos': {k: v for k, v in ejemplos.items() if v}
+        }
+
+    def escanear_chunks(self) -> Dict:
+        paginas = self._paginas('chunks_documentos', 'id, contenido, chunk_hash, embedding', 'id')
+        return self._escanear('chunks_documentos', paginas, 'id', con_hash=True)
+
+    def escanear_cache(self) -> Dict:
+        paginas = self._paginas(
+            'embeddings_cache', 'content_hash, embedding, embedding_int8, embedding_escala, dimensions',
+            'content_hash',
+            filtros=lambda q: q.eq('model', EMBEDDING_MODEL)
+        )
+        # Entradas en int8 sin float32: se valida el vector decodificado
+        paginas = ([f if f.get('embedding') is not None else {**f, 'embedding': embedding_de_cache(f)}
+                    for f in filas] for filas in paginas)
+        return self._escanear(f'embeddings_cache ({EMBEDDING_MODEL})', paginas, 'content_hash',
+                              con_hash=False, columna_dimensiones='dimensions')
+
+
+def export_metrics_json(metrics: dict, filepath: str):
+    """Exporta métricas en formato JSON para GitHub Actions"""
+    try:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2, ensure_ascii=False)
+        print(f"\n📄 Reporte exportado: {filepath}")
+    except Exception as e:
+        print(f"\n⚠️ Error exportando reporte: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Escáner de integridad de embeddings')
+    parser.add_argument('--tabla', choices=['chunks', 'cache', 'todas'], default='todas')
+    parser.add_argument('--output', default='integridad_embeddings_report.json')
+    args = parser.parse_args()
+
+    load_dotenv('.env.local')
+    supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+
+    print("🔎 INTEGRIDAD DE EMBEDDINGS")
+    print("=" * 60)
+    print(f"   Dimensiones esperadas: {EMBEDDING_DIMENSIONS}")
+    print(f"   Tolerancia de norma: ±{TOLERANCIA_NORMA}")
+
+    escaner = EscanerIntegridad(supabase)
+    reporte = {'timestamp': datetime.now().isoformat(), 'dimensiones': EMBEDDING_DIMENSIONS}
+
+    if args.tabla in ('chunks', 'todas'):
+        reporte['chunks_documentos'] = escaner.escanear_chunks()
+    if args.tabla in ('cache', 'todas'):
+        reporte['embeddings_cache'] = escaner.escanear_cache()
+
+    problemas = sum(v['problemas'] for v in reporte.values() if isinstance(v, dict))
+    reporte['problemas_totales'] = problemas
+
+    print("\n" + "=" * 60)
+    print(f"{'✅' if problemas == 0 else '❌'} Problemas de integridad: {problemas}")
+
+    export_metrics_json(reporte, args.output)
+    sys.exit(0 if problemas == 0 else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Journal de carga por documento: checkpoint y reanudación a nivel de chunk
+
+Si fase3 moría a mitad de un documento de 200 chunks, el documento quedaba
+'fallido', los chunks insertados quedaban huérfanos y la siguiente
+ejecución chocaba con UNIQUE(documento_id, chunk_index). Ahora:
+
+- Los chunks se escriben por grupos con upsert (documento_id, chunk_index)
+- Tras cada grupo se registra el progreso (chunks escritos, tokens, costo)
+  en un archivo local y en progreso_carga_documentos
+- Al reanudar, si la huella del chunking coincide, se retoma desde el
+  último grupo confirmado; los embeddings de chunks no escritos ya están
+  en embeddings_cache, así que no se vuelve a pagar por ellos
+- finalizar_carga_documento cierra el documento en una transacción
+  (recorta chunks sobrantes, verifica el total, marca completado)
+
+El journal local sirve para reinicios en la misma máquina y si la tabla no
+está desplegada; el de la BD sobrevive a la pérdida del runner.
+
+Variables de entorno:
+- FASE3_JOURNAL_DIR=.fase3_journal
+- FASE3_CHUNKS_POR_CHECKPOINT=25
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119011_progreso_carga_documentos.sql
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from leases import identificador_worker
+
+JOURNAL_DIR = os.getenv('FASE3_JOURNAL_DIR', '.fase3_journal')
+CHUNKS_POR_CHECKPOINT = int(os.getenv('FASE3_CHUNKS_POR_CHECKPOINT', '25'))
+
+
+def _rpc_no_desplegada(error: Exception) -> bool:
+    mensaje = str(error)
+    return 'PGRST202' in mensaje or 'Could not find the function' in mensaje
+
+
+def _tabla_no_desplegada(error: Exception) -> bool:
+    mensaje = str(error)
+    return 'PGRST205' in mensaje or '42P01' in mensaje or 'does not exist' in mensaje
+
+
+@dataclass
+class ProgresoDocumento:
+    """Estado confirmado de la carga de un documento"""
+    documento_id: str
+    huella: str
+    total_chunks: int
+    chunks_escritos: int = 0
+    chunks_reutilizados: int = 0
+    tokens: int = 0
+    costo_usd: float = 0.0
+
+    @property
+    def reanudado(self) -> bool:
+        return self.chunks_escritos > 0
+
+
+def huella_chunks(chunk_hashes: Iterable[str], *contexto: str) -> str:
+    """Identifica el chunking + destino: si cambia, el progreso previo no sirve"""
+    h = hashlib.sha256()
+    for parte in list(contexto) + list(chunk_hashes):
+        h.update(parte.encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def grupos(total: int, inicio: int, tamano: int = CHUNKS_POR_CHECKPOINT) -> List[range]:
+    """Rangos de índices pendientes, uno por checkpoint"""
+    return [range(i, min(i + tamano, total)) for i in range(inicio, total, tamano)]
+
+
+class JournalCarga:
+    """Progreso por documento en disco local y en progreso_carga_documentos"""
+
+    def __init__(self, supabase_client, directorio: str = JOURNAL_DIR):
+        self.supabase = supabase_client
+        self.directorio = directorio
+        self.worker = identificador_worker()
+        self._tabla_disponible = True
+        self._rpc_disponible = True
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, documento_id: str) -> str:
+        return os.path.join(self.directorio, f"{documento_id}.json")
+
+    # ============================================
+    # LECTURA
+    # ============================================
+
+    def _local(self, documento_id: str) -> Optional[Dict]:
+        try:
+            with open(self._ruta(documento_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remoto(self, documento_id: str) -> Optional[Dict]:
+        if not self._tabla_disponible:
+            return None
+        try:
+            result = self.supabase.table('progreso_carga_documentos')\
+                .select('huella, total_chunks, chunks_escritos, chunks_reutilizados, tokens, costo_usd')\
+                .eq('documento_id', documento_id)\
+                .limit(1)\
+                .execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            self._marcar_tabla(e)
+            return None
+
+    def cargar(self, documento_id: str, huella: str, total_chunks: int) -> ProgresoDocumento:
+        """Progreso más avanzado con la misma huella, o uno nuevo desde cero"""
+        mejor = ProgresoDocumento(documento_id, huella, total_chunks)
+        for fila in (self._local(documento_id), self._remoto(documento_id)):
+            if not fila or fila.get('huella') != huella or fila.get('total_chunks') != total_chunks:
+                continue
+            escritos = min(int(fila.get('chunks_escritos') or 0), total_chunks)
+            if escritos > mejor.chunks_escritos:
+                mejor = ProgresoDocumento(
+                    documento_id, huella, total_chunks, escritos,
+                    int(fila.get('chunks_reutilizados') or 0),
+                    int(fila.get('tokens') or 0),
+                    float(fila.get('costo_usd') or 0.0)
+                )
+        return mejor
+
+    # ============================================
+    # ESCRITURA
+    # ============================================
+
+    def registrar(self, progreso: ProgresoDocumento):
+        """Checkpoint: llamar solo después de que el grupo de chunks quedó escrito"""
+        fila = asdict(progreso)
+        temporal = self._ruta(progreso.documento_id) + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(fila, f)
+        os.replace(temporal, self._ruta(progreso.documento_id))
+
+        if not self._tabla_disponible:
+            return
+        try:
+            self.supabase.table('progreso_carga_documentos').upsert({
+                **fila,
+                'costo_usd': round(progreso.costo_usd, 6),
+                'worker': self.worker,
+                'actualizado_en': datetime.now().isoformat()
+            }, on_conflict='documento_id').execute()
+        except Exception as e:
+            self._marcar_tabla(e)
+
+    def finalizar(self, progreso: ProgresoDocumento, metadata: Dict, embedding_model: str) -> bool:
+        """
+        Cierra el documento con finalizar_carga_documento (atómico). Retorna
+        False si la RPC no está desplegada: el llamador aplica la transición.
+        """
+        finalizado = False
+        if self._rpc_disponible:
+            try:
+                self.supabase.rpc('finalizar_carga_documento', {
+                    'p_documento_id': progreso.documento_id,
+                    'p_total_chunks': progreso.total_chunks,
+                    'p_metadata': metadata,
+                    'p_embedding_model': embedding_model
+                }).execute()
+                finalizado = True
+            except Exception as e:
+                if not _rpc_no_desplegada(e):
+                    raise
+                print("  ⚠️  RPC finalizar_carga_documento no desplegada - finalizando sin transacción")
+                self._rpc_disponible = False
+
+        if not finalizado:
+            self._recortar(progreso)
+        self.descartar(progreso.documento_id, remoto=not finalizado)
+        return finalizado
+
+    def _recortar(self, progreso: ProgresoDocumento):
+        """Fallback: borra chunks de un intento anterior más largo"""
+        self.supabase.table('chunks_documentos')\
+            .delete()\
+            .eq('documento_id', progreso.documento_id)\
+            .gte('chunk_index', progreso.total_chunks)\
+            .execute()
+
+    def descartar(self, documento_id: str, remoto: bool = True):
+        try:
+            os.remove(self._ruta(documento_id))
+        except OSError:
+            pass
+        if remoto and self._tabla_disponible:
+            try:
+                self.supabase.table('progreso_carga_documentos').delete().eq('documento_id', documento_id).execute()
+            except Exception as e:
+                self._marcar_tabla(e)
+
+    def _marcar_tabla(self, error: Exception):
+        if _tabla_no_desplegada(error):
+            print("  ⚠️  Tabla progreso_carga_documentos no desplegada - journal solo local")
+            self._tabla_disponible = False
+        else:
+            print(f"  ⚠️  Error en journal remoto: {str(error)[:100]}")
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Reclamo de trabajo con leases para repartir una fase entre varios runners
+
+Seleccionar pendientes por etapa_actual hace que dos ejecuciones concurrentes
+(un workflow_dispatch encima del cron, o varios jobs de una matrix) procesen
+las mismas filas y paguen dos veces las llamadas de IA.
+
+ColaConLeases reclama lotes pequeños con la RPC reclamar_documentos
+(FOR UPDATE SKIP LOCKED + lease_expira), renueva los leases con un hilo
+heartbeat y libera cada documento fallido con un backoff para que ni este
+runner ni otro lo reintenten de inmediato. Los documentos exitosos se
+liberan en cerrar(), después de aplicar las transiciones de etapa.
+
+Si la RPC no está desplegada, cae a ColaPendientes (paginación keyset sin
+exclusión entre runners).
+
+Variables de entorno:
+- PIPELINE_WORKER_ID (por defecto host:pid[:GITHUB_RUN_ID-GITHUB_JOB])
+- LEASE_SEGUNDOS=900
+- LEASE_LOTE=5 (documentos reclamados por llamada)
+- LEASE_REINTENTO_SEGUNDOS=3600 (backoff de un documento fallido)
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119004_leases_documentos.sql
+"""
+
+import os
+import socket
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+from cola_pendientes import ColaPendientes
+
+LEASE_SEGUNDOS = int(os.getenv('LEASE_SEGUNDOS', '900'))
+LEASE_LOTE = int(os.getenv('LEASE_LOTE', '5'))
+LEASE_REINTENTO_SEGUNDOS = int(os.getenv('LEASE_REINTENTO_SEGUNDOS', '3600'))
+
+
+def identificador_worker() -> str:
+    """Identificador estable del runner actual (dueño de los leases)"""
+    if os.getenv('PIPELINE_WORKER_ID'):
+        return os.getenv('PIPELINE_WORKER_ID')
+
+    partes = [socket.gethostname(), str(os.getpid())]
+    if os.getenv('GITHUB_RUN_ID'):
+        partes.append(f"{os.getenv('GITHUB_RUN_ID')}-{os.getenv('GITHUB_JOB', 'job')}")
+    return ':'.join(partes)
+
+
+def _rpc_no_desplegada(error: Exception) -> bool:
+    mensaje = str(error)
+    return 'PGRST202' in mensaje or 'Could not find the function' in mensaje
+
+
+class ColaConLeases:
+    """
+    Iterable de documentos reclamados en exclusiva para este runner.
+
+    Uso:
+        cola = ColaConLeases(supabase, 'descargado', 'id, titulo, storage_path',
+                             lambda q: q.eq('etapa_actual', 'descargado'))
+        for doc in cola:
+            if not procesar(doc):
+                cola.liberar(doc['id'])
+        transiciones.flush()
+        cola.cerrar()
+    """
+
+    def __init__(self, supabase_client, etapa: str, columnas: str, filtros: Callable,
+                 solo_no_procesados: bool = False, owner: Optional[str] = None,
+                 lote: Optional[int] = None, lease_segundos: Optional[int] = None,
+                 presupuesto_segundos: Optional[float] = None,
+                 max_documentos: Optional[int] = None):
+        self.supabase = supabase_client
+        self.etapa = etapa
+        self.solo_no_procesados = solo_no_procesados
+        self.owner = owner or identificador_worker()
+        self.lote = lote or LEASE_LOTE
+        self.lease_segundos = lease_segundos or LEASE_SEGUNDOS
+
+        # Misma selección, presupuesto y tope que la cola keyset (también es el fallback)
+        self._respaldo = ColaPendientes(
+            supabase_client, columnas, filtros,
+            presupuesto_segundos=presupuesto_segundos,
+            max_documentos=max_documentos
+        )
+        self.campos = [c.strip() for c in self._respaldo.columnas.split(',')]
+
+        self.usa_leases = True
+        self.reclamos = 0
+        self.reclamados = 0
+        self.entregados_con_lease = 0
+        self.liberados_por_fallo = 0
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    # ============================================
+    # API PÚBLICA
+    # ============================================
+
+    @property
+    def tamano_pagina(self) -> int:
+        return self.lote if self.usa_leases else self._respaldo.tamano_pagina
+
+    @property
+    def presupuesto_segundos(self) -> Optional[float]:
+        return self._respaldo.presupuesto_segundos
+
+    @property
+    def entregados(self) -> int:
+        return self.entregados_con_lease if self.usa_leases else self._respaldo.entregados
+
+    @property
+    def paginas(self) -> int:
+        return self.reclamos if self.usa_leases else self._respaldo.paginas
+
+    @property
+    def agotado_por_presupuesto(self) -> bool:
+        return self._respaldo.agotado_por_presupuesto
+
+    def segundos_restantes(self) -> Optional[float]:
+        return self._respaldo.segundos_restantes()
+
+    def __iter__(self) -> Iterator[Dict]:
+        cola = self._respaldo
+        while True:
+            if cola.max_documentos is not None and self.reclamados >= cola.max_documentos:
+                return
+            if cola.agotar_si_corresponde('otros runners'):
+                return
+
+            cantidad = self.lote
+            if cola.max_documentos is not None:
+                cantidad = min(cantidad, cola.max_documentos - self.reclamados)
+
+            try:
+                filas = self.reclamar(cantidad)
+            except Exception as e:
+                if self.reclamos == 0 and _rpc_no_desplegada(e):
+                    print("  ⚠️  RPC reclamar_documentos no desplegada - usando paginación keyset sin leases")
+                    self.usa_leases = False
+                    yield from cola
+                    return
+                raise
+
+            if not filas:
+                return
+
+            for posicion, fila in enumerate(filas):
+                # Lo reclamado y no entregado vuelve a la cola en cuanto se agota el tiempo
+                if cola.agotar_si_corresponde('otros runners'):
+                    self._devolver([f['id'] for f in filas[posicion:]])
+                    return
+                with self._lock:
+                    self.entregados_con_lease += 1
+                yield {campo: fila.get(campo) for campo in self.campos}
+
+    def reclamar(self, cantidad: int) -> List[Dict]:
+        """Reclama hasta `cantidad` documentos libres de la etapa"""
+        filas = self.supabase.rpc('reclamar_documentos', {
+            'p_etapa': self.etapa,
+            'p_owner': self.owner,
+            'p_cantidad': cantidad,
+            'p_lease_segundos': self.lease_segundos,
+            'p_solo_no_procesados': self.solo_no_procesados
+        }).execute().data or []
+
+        with self._lock:
+            self.reclamos += 1
+            self.reclamados += len(filas)
+
+        if filas and self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._renovar_periodicamente, daemon=True)
+            self._heartbeat.start()
+
+        return filas
+
+    def renovar(self) -> int:
+        result = self.supabase.rpc('renovar_leases_documentos', {
+            'p_owner': self.owner,
+            'p_lease_segundos': self.lease_segundos
+        }).execute()
+        return result.data if isinstance(result.data, int) else 0
+
+    def liberar(self, doc_id: str, reintentar_en: Optional[int] = None):
+        """
+        Libera un documento fallido. Queda bloqueado `reintentar_en` segundos
+        (LEASE_REINTENTO_SEGUNDOS por defecto) para no reintentarlo en caliente.
+        """
+        if not self.usa_leases:
+            return
+        reintentar_en = LEASE_REINTENTO_SEGUNDOS if reintentar_en is None else reintentar_en
+        try:
+            self.supabase.rpc('liberar_documentos', {
+                'p_owner': self.owner,
+                'p_ids': [doc_id],
+                'p_reintentar_en_segundos': reintentar_en
+            }).execute()
+            with self._lock:
+                self.liberados_por_fallo += 1
+        except Exception as e:
+            print(f"  ⚠️  No se pudo liberar lease de {doc_id}: {str(e)[:100]}")
+
+    def _devolver(self, ids: List[str]):
+        """Libera sin espera leases reclamados que no se llegaron a entregar"""
+        try:
+            self.supabase.rpc('liberar_documentos', {
+                'p_owner': self.owner,
+                'p_ids': ids,
+                'p_reintentar_en_segundos': 0
+            }).execute()
+        except Exception as e:
+            print(f"  ⚠️  No se pudieron devolver {len(ids)} leases (expiran en {self.lease_segundos}s): "
+                  f"{str(e)[:100]}")
+
+    def cerrar(self):
+        """
+        Detiene el heartbeat y libera los leases restantes.
+        Llamar después de transiciones.flush() para que otro runner no vea
+        la etapa anterior de un documento ya procesado.
+        """
+        self._detener.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout=5)
+        if not self.usa_leases or self.reclamos == 0:
+            return
+        try:
+            self.supabase.rpc('liberar_documentos', {
+                'p_owner': self.owner,
+                'p_ids': None,
+                'p_reintentar_en_segundos': 0
+            }).execute()
+        except Exception as e:
+            print(f"  ⚠️  No se pudieron liberar leases (expiran en {self.lease_segundos}s): {str(e)[:100]}")
+
+    def resumen(self) -> Dict:
+        resumen = self._respaldo.resumen()
+        resumen.update({
+            'paginas': self.paginas,
+            'documentos_entregados': self.entregados,
+            'leases': self.usa_leases,
+            'worker_id': self.owner,
+            'liberados_por_fallo': self.liberados_por_fallo
+        })
+        return resumen
+
+    # ============================================
+    # INTERNOS
+    # ============================================
+
+    def _renovar_periodicamente(self):
+        """Hilo de fondo: renueva los leases a un tercio de su duración"""
+        while not self._detener.wait(self.lease_segundos / 3):
+            try:
+                self.renovar()
+            except Exception as e:
+                print(f"  ⚠️  Error renovando leases: {str(e)[:100]}")
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Dimensiones Matryoshka: embeber una vez a tamaño completo, derivar localmente
+
+Los modelos text-embedding-3 están entrenados con Matryoshka: los primeros
+d componentes, renormalizados, equivalen a pedir dimensions=d a la API. Por
+eso embeddings_cache guarda el vector completo (3072 para -large, 1536 para
+-small) y cada columna destino recibe su dimensión por truncado local:
+
+    chunks_documentos.embedding (1536)  ← truncar(completo, 1536)
+    chunks_documentos.embedding_768     ← truncar(completo, 768)  (experimento)
+
+Cambiar de dimensión ya no requiere re-embeber: basta poblar la columna
+nueva desde el caché (`poblar`). Las entradas antiguas del caché (1536)
+siguen sirviendo para cualquier dimensión ≤ 1536.
+
+Uso (columna experimental):
+    alter table chunks_documentos add column embedding_768 vector(768);
+    python scripts/pipeline-document-mineduc/matryoshka.py poblar \\
+        --columna embedding_768 --dimensiones 768
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119009_embeddings_matryoshka.sql
+    supabase/migrations/20260119010_cache_embeddings_proveedor.sql
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    print("❌ Instalar: pip install numpy")
+    sys.exit(1)
+
+from embeddings_reducidos import columnas_cache, embedding_de_cache
+
+# Tamaño nativo de cada modelo (lo que devuelve la API sin 'dimensions')
+DIMENSIONES_MODELO = {
+    'text-embedding-3-large': 3072,
+    'text-embedding-3-small': 1536
+}
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-large')
+TAMANO_PAGINA = 500
+
+
+# ============================================
+# TRUNCADO
+# ============================================
+
+def truncar(embeddings, dimensiones: int) -> np.ndarray:
+    """
+    Primeros `dimensiones` componentes renormalizados (L2). Acepta un vector
+    (d,) o una matriz (n, d); las filas nulas quedan en cero.
+    """
+    matriz = np.asarray(embeddings, dtype=np.float32)
+    if matriz.shape[-1] < dimensiones:
+        raise ValueError(f"No se puede derivar {dimensiones}D desde {matriz.shape[-1]}D")
+
+    recortada = np.array(matriz[..., :dimensiones], dtype=np.float32)
+    normas = np.linalg.norm(recortada, axis=-1, keepdims=True)
+    np.divide(recortada, normas, out=recortada, where=normas > 0)
+    return recortada
+
+
+def derivar(embedding, dimensiones: int) -> List[float]:
+    """truncar() para un solo vector, como lista (formato de inserción)"""
+    return truncar(embedding, dimensiones).tolist()
+
+
+def dimensiones_completas(modelo: str) -> Optional[int]:
+    return DIMENSIONES_MODELO.get(modelo)
+
+
+def error_dimensiones(modelo: str, nativas: int, destino: int) -> Optional[str]:
+    """
+    None si `modelo` (que produce `nativas` dimensiones) puede llenar una
+    columna de `destino`; si no, el motivo. Solo los modelos de
+    DIMENSIONES_MODELO están entrenados con Matryoshka: truncar otro modelo
+    produce vectores sin sentido, así que debe coincidir exactamente.
+    """
+    if nativas == destino:
+        return None
+    if modelo not in DIMENSIONES_MODELO:
+        return (f"{modelo} produce {nativas}D y no admite truncado Matryoshka; "
+                f"usar una columna vector({nativas}) con EMBEDDING_DIMENSIONS={nativas}")
+    if nativas < destino:
+        return f"{modelo} produce {nativas}D, no se pueden derivar {destino}D"
+    return None
+
+
+# ============================================
+# CACHÉ A TAMAÑO COMPLETO
+# ============================================
+
+class CacheMatryoshka:
+    """
+    embeddings_cache con vectores completos y lectura a cualquier dimensión
+    menor. La clave es (content_hash, provider, model).
+    """
+
+    def __init__(self, supabase_client, modelo: str = EMBEDDING_MODEL, proveedor: str = 'openai'):
+        self.supabase = supabase_client
+        self.modelo = modelo
+        self.proveedor = proveedor
+
+    def buscar(self, content_hash: str, dimensiones: int) -> Optional[Tuple[List[float], int]]:
+        """(embedding derivado a `dimensiones`, tokens) o None si no hay entrada útil"""
+        result = self.supabase.table('embeddings_cache')\
+            .select('embedding, embedding_int8, embedding_escala, dimensions, tokens_usados')\
+            .eq('content_hash', content_hash)\
+            .eq('provider', self.proveedor)\
+            .eq('model', self.modelo)\
+            .gte('dimensions', dimensiones)\
+            .order('dimensions', desc=True)\
+            .limit(1)\
+            .execute()
+
+        if not result.data:
+            return None
+        fila = result.data[0]
+        embedding = embedding_de_cache(fila)
+        if embedding is None or len(embedding) < dimensiones:
+            return None
+        return derivar(embedding, dimensiones), fila.get('tokens_usados') or 0
+
+    def buscar_lote(self, hashes: List[str], dimensiones: int) -> Dict[str, Tuple[List[float], int]]:
+        """buscar() para varios hashes en una consulta (solo los encontrados)"""
+        if not hashes:
+            return {}
+        result = self.supabase.table('embeddings_cache')\
+            .select('content_hash, embedding, embedding_int8, embedding_escala, dimensions, tokens_usados')\
+            .eq('provider', self.proveedor)\
+            .eq('model', self.modelo)\
+            .gte('dimensions', dimensiones)\
+            .in_('content_hash', sorted(set(hashes)))\
+            .execute()
+
+        encontrados = {}
+        for fila in _mayor_dimension(result.data or []).values():
+            embedding = embedding_de_cache(fila)
+            if embedding is not None and len(embedding) >= dimensiones:
+                encontrados[fila['content_hash']] = (derivar(embedding, dimensiones), fila.get('tokens_usados') or 0)
+        return encontrados
+
+    def _fila(self, content_hash: str, embedding_completo: List[float], tokens: int) -> Dict:
+        return {
+            'content_hash': content_hash,
+            'provider': self.proveedor,
+            'model': self.modelo,
+            **columnas_cache(embedding_completo),
+            'tokens_usados': tokens,
+            'dimensions': len(embedding_completo),
+            'created_at': datetime.now().isoformat()
+        }
+
+    def guardar(self, content_hash: str, embedding_completo: List[float], tokens: int):
+        self.supabase.table('embeddings_cache').insert(self._fila(content_hash, embedding_completo, tokens)).execute()
+
+    def guardar_lote(self, entradas: List[Tuple[str, List[float], int]]):
+        """Un solo insert para (content_hash, embedding_completo, tokens) de varios textos"""
+        filas = {h: self._fila(h, e, t) for h, e, t in entradas}
+        if filas:
+            self.supabase.table('embeddings_cache').insert(list(filas.values())).execute()
+
+    def completos(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Vector de mayor dimensión disponible por content_hash (una consulta)"""
+        if not hashes:
+            return {}
+        result = self.supabase.table('embeddings_cache')\
+            .select('content_hash, embedding, embedding_int8, embedding_escala, dimensions')\
+            .eq('provider', self.proveedor)\
+            .eq('model', self.modelo)\
+            .in_('content_hash', hashes)\
+            .execute()
+
+        mejores = _mayor_dimension(result.data or [])
+        return {h: v for h, v in ((h, embedding_de_cache(f)) for h, f in mejores.items()) if v is not None}
+
+
+def _mayor_dimension(filas: List[Dict]) -> Dict[str, Dict]:
+    """Por content_hash, la fila con más dimensiones"""
+    mejores: Dict[str, Dict] = {}
+    for fila in filas:
+        actual = mejores.get(fila['content_hash'])
+        if actual is None or (fila.get('dimensions') or 0) > (actual.get('dimensions') or 0):
+            mejores[fila['content_hash']] = fila
+    return mejores
+
+
+# ============================================
+# POBLAR UNA COLUMNA DERIVADA
+# ============================================
+
+class PobladorColumnaDerivada:
+    """Llena chunks_documentos.<columna> truncando los vectores del caché"""
+
+    def __init__(self, supabase_client, columna: str, dimensiones: int,
+                 modelo: str = EMBEDDING_MODEL, lote: int = TAMANO_PAGINA, proveedor: str = 'openai'):
+        if not columna.startswith('embedding_'):
+            raise ValueError("La columna destino debe llamarse embedding_<sufijo>")
+        if modelo not in DIMENSIONES_MODELO:
+            raise ValueError(f"{modelo} no admite truncado Matryoshka")
+        self.supabase = supabase_client
+        self.columna = columna
+        self.dimensiones = dimensiones
+        self.cache = CacheMatryoshka(supabase_client, modelo, proveedor)
+        self.lote = lote
+
+    def _paginas(self):
+        ultimo = None
+        while True:
+            query = self.supabase.table('chunks_documentos')\
+                .select('id, chunk_hash')\
+                .is_(self.columna, 'null')
+            if ultimo is not None:
+                query = query.gt('id', ultimo)
+            filas = query.order('id').limit(self.lote).execute().data or []
+            if not filas:
+                return
+            yield filas
+            ultimo = filas[-1]['id']
+            if len(filas) < self.lote:
+                return
+
+    def ejecutar(self) -> Dict:
+        actualizados = sin_cache = 0
+        for filas in self._paginas():
+            completos = self.cache.completos(sorted({f['chunk_hash'] for f in filas if f.get('chunk_hash')}))
+            con_vector = [f for f in filas if f.get('chunk_hash') in completos
+                          and len(completos[f['chunk_hash']]) >= self.dimensiones]
+            sin_cache += len(filas) - len(con_vector)
+            if not con_vector:
+                continue
+
+            # Truncado vectorizado de toda la página
+            derivados = truncar(np.vstack([completos[f['chunk_hash']] for f in con_vector]), self.dimensiones)
+            self.supabase.rpc('actualizar_embedding_derivado', {
+                'p_columna': self.columna,
+                'p_filas': [{'id': f['id'], 'embedding': v.tolist()} for f, v in zip(con_vector, derivados)]
+            }).execute()
+            actualizados += len(con_vector)
+            print(f"   📝 {actualizados:,} chunks con {self.columna}")
+
+        return {'columna': self.columna, 'dimensiones': self.dimensiones,
+                'actualizados': actualizados, 'sin_cache': sin_cache}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dimensiones Matryoshka derivadas del caché')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    poblar = sub.add_parser('poblar', help='Poblar una columna embedding_<sufijo> de chunks_documentos')
+    poblar.add_argument('--columna', required=True)
+    poblar.add_argument('--dimensiones', type=int, required=True)
+    poblar.add_argument('--modelo', default=EMBEDDING_MODEL)
+    poblar.add_argument('--proveedor', default='openai')
+    args = parser.parse_args()
+
+    try:
+        from dotenv import load_dotenv
+        from supabase import create_client
+    except ImportError:
+        print("❌ Instalar: pip install supabase python-dotenv")
+        sys.exit(1)
+
+    load_dotenv('.env.local')
+    supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+
+    print("\n" + "=" * 60)
+    print(f"🪆 MATRYOSHKA: {args.columna} ({args.dimensiones}D desde {args.modelo})")
+    print("=" * 60)
+
+    resumen = PobladorColumnaDerivada(supabase, args.columna, args.dimensiones, args.modelo,
+                                      proveedor=args.proveedor).ejecutar()
+    print(f"\n✅ {resumen['actualizados']:,} chunks actualizados")
+    if resumen['sin_cache']:
+        print(f"   ⚠️ {resumen['sin_cache']:,} chunks sin vector completo en caché (requieren re-embeber)")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,23 +4,44 @@ MLOps Pipeline - Procesamiento de Documentos con Métricas
 Implementa mejores prácticas MLOps: ETL, validación, optimización y métricas
 """
 
+import hashlib
 import os
+import re
 import sys
+import threading
 import time
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime, date
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
 try:
     import fitz
     from supabase import create_client
-    from openai import OpenAI
     import requests
 except ImportError as e:
     print(f"❌ Dependencia faltante: {e}")
     sys.exit(1)
 
+from cola_pendientes import ColaPendientes
+from etapas_concurrentes import EtapaCola, PipelineEtapas
+from trazas import obtener_trazador, span
+from perfilado import perfilar
+from matryoshka import CacheMatryoshka, derivar, error_dimensiones
+from proveedores_embedding import obtener_proveedor
+
+EMBEDDING_PROVEEDOR = os.getenv('MLOPS_EMBEDDING_PROVEEDOR', 'openai')
+# openai: text-embedding-3-small; onnx: el modelo local de ONNX_MODELO_DIR
+EMBEDDING_MODEL = 'text-embedding-3-small' if EMBEDDING_PROVEEDOR == 'openai' else None
+# Dimensión de documentos_oficiales.embedding (derivada del vector completo en caché)
+EMBEDDING_DIMENSIONS = int(os.getenv('MLOPS_EMBEDDING_DIMENSIONS', '1536'))
+
+# Workers por etapa del ETL (fitz no es thread-safe: la extracción va en un solo hilo)
+WORKERS_DESCARGA = int(os.getenv('MLOPS_WORKERS_DESCARGA', '4'))
+WORKERS_EMBEDDING = int(os.getenv('MLOPS_WORKERS_EMBEDDING', '2'))
+WORKERS_ESCRITURA = int(os.getenv('MLOPS_WORKERS_ESCRITURA', '2'))
+CAPACIDAD_COLA = int(os.getenv('MLOPS_CAPACIDAD_COLA', '4'))
+
 
 @dataclass
 class MetricasETL:
@@ -36,6 +57,9 @@ class MetricasETL:
     tokens_usados: int = 0
     costo_estimado_usd: float = 0.0
     calidad_promedio: float = 0.0
+    # Tiempo ocupado / esperando entrada / bloqueado en salida por etapa del ETL
+    etapas: Dict[str, Dict] = field(default_factory=dict)
+    concurrencia: int = 1
 
 
 class MLOpsPipeline:
@@ -48,8 +72,13 @@ class MLOpsPipeline:
             os.getenv('SUPABASE_URL'),
             os.getenv('SUPABASE_SERVICE_ROLE_KEY')
         )
-        self.openai = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.proveedor = obtener_proveedor(EMBEDDING_PROVEEDOR, EMBEDDING_MODEL)
+        motivo = error_dimensiones(self.proveedor.modelo, self.proveedor.dimensiones, EMBEDDING_DIMENSIONS)
+        if motivo:
+            raise ValueError(f"{motivo} (MLOPS_EMBEDDING_DIMENSIONS={EMBEDDING_DIMENSIONS})")
+        self.cache_embeddings = CacheMatryoshka(self.supabase, self.proveedor.modelo, self.proveedor.nombre)
         self.metricas = MetricasETL()
+        self._lock_metricas = threading.Lock()
         
         print("✅ MLOps Pipeline inicializado")
     
@@ -64,16 +93,16 @@ class MLOpsPipeline:
         print("=" * 60)
         
         try:
-            # FASE 1: OBTENCIÓN
+            # FASE 1: OBTENCIÓN (páginas pedidas a demanda durante el ETL)
             documentos = self._fase_obtencion()
             
-            if not documentos:
-                self._registrar_metricas_pipeline(workflow_id, 0, 0)
-                return {'status': 'success', 'procesados': 0}
-            
             # FASE 2: PREPARACIÓN Y ETL
             resultados = self._fase_etl(documentos)
             
+            if not resultados:
+                self._registrar_metricas_pipeline(workflow_id, 0, 0)
+                return {'status': 'success', 'procesados': 0}
+            
             # FASE 3: VALIDACIÓN
             self._fase_validacion(resultados)
             
@@ -85,11 +114,12 @@ class MLOpsPipeline:
             self._registrar_metricas_procesamiento()
             self._registrar_metricas_pipeline(
                 workflow_id,
-                len(documentos),
+                len(resultados),
                 self.metricas.documentos_procesados
             )
             
             self._mostrar_resumen()
+            obtener_trazador().exportar()
             
             return {
                 'status': 'success',
@@ -104,95 +134,127 @@ class MLOpsPipeline:
             self._registrar_metricas_pipeline(workflow_id, 0, 0, error=str(e))
             raise
     
-    def _fase_obtencion(self) -> List[Dict]:
-        """FASE 1: Obtención de documentos pendientes"""
+    def _fase_obtencion(self) -> ColaPendientes:
+        """FASE 1: Obtención de documentos pendientes (backlog completo, paginado)"""
         
         print("\n📋 FASE 1: OBTENCIÓN DE DATOS")
         print("-" * 60)
         
-        response = self.supabase.table('documentos_oficiales')\
-            .select('id, titulo, url_original, tipo_documento, año_vigencia')\
-            .eq('procesado', False)\
-            .limit(50)\
-            .execute()
-        
-        documentos = response.data or []
-        print(f"   ✅ Documentos pendientes: {len(documentos)}")
+        cola = ColaPendientes(
+            self.supabase,
+            'id, titulo, url_original, tipo_documento, año_vigencia',
+            lambda q: q.eq('procesado', False)
+        )
+        print(f"   ✅ Backlog paginado (páginas de {cola.tamano_pagina})")
         
-        return documentos
+        return cola
     
-    def _fase_etl(self, documentos: List[Dict]) -> List[Dict]:
-        """FASE 2: ETL (Extract, Transform, Load)"""
+    def _fase_etl(self, documentos: Iterable[Dict]) -> List[Dict]:
+        """
+        FASE 2: ETL (Extract, Transform, Load) en etapas concurrentes
+        
+        descargar → extraer → embeber → escribir, unidas por colas acotadas:
+        el documento N+1 se descarga mientras el N se embebe. La calidad se
+        puntúa sobre el texto en memoria al salir de la última etapa.
+        """
         
         print(f"\n📥 FASE 2: ETL - PROCESAMIENTO")
         print("-" * 60)
         
+        pipeline = PipelineEtapas([
+            EtapaCola('descargar', self._etapa_descargar, WORKERS_DESCARGA),
+            EtapaCola('extraer', self._etapa_extraer, 1),
+            EtapaCola('embeber', self._etapa_embeber, WORKERS_EMBEDDING),
+            EtapaCola('escribir', self._etapa_escribir, WORKERS_ESCRITURA),
+        ], capacidad_cola=CAPACIDAD_COLA)
+        
         resultados = []
+        trabajos = ({'doc': doc} for doc in documentos)
         
-        for idx, doc in enumerate(documentos, 1):
-            print(f"\n[{idx}/{len(documentos)}] {doc['titulo'][:60]}...")
+        for idx, trabajo in enumerate(pipeline.ejecutar(trabajos), 1):
+            doc = trabajo['doc']
+            print(f"\n[{idx}] {doc['titulo'][:60]}...")
             
-            try:
-                # EXTRACT
-                inicio_extract = time.time()
-                pdf_data = self._extraer_pdf(doc['url_original'])
-                if not pdf_data:
-                    raise Exception("Descarga falló")
-                
-                # TRANSFORM
-                texto = self._transformar_pdf_a_texto(pdf_data)
-                if not texto or len(texto.strip()) < 50:
-                    raise Exception("Extracción de texto falló")
-                
-                tiempo_extraccion = int((time.time() - inicio_extract) * 1000)
-                self.metricas.tiempo_extraccion_ms += tiempo_extraccion
-                
-                # EMBEDDING
-                inicio_embed = time.time()
-                embedding, tokens = self._generar_embedding_optimizado(texto)
-                tiempo_embedding = int((time.time() - inicio_embed) * 1000)
-                self.metricas.tiempo_embedding_ms += tiempo_embedding
-                self.metricas.tokens_usados += tokens
-                
-                # LOAD
-                self._cargar_a_bd(doc['id'], texto, embedding)
-                
-                self.metricas.documentos_procesados += 1
-                resultados.append({
-                    'id': doc['id'],
-                    'titulo': doc['titulo'],
-                    'status': 'success',
-                    'texto_length': len(texto),
-                    'tokens': tokens,
-                    'tiempo_ms': tiempo_extraccion + tiempo_embedding
-                })
-                
-                print(f"   ✅ Procesado ({tiempo_extraccion + tiempo_embedding}ms)")
-                
-            except Exception as e:
+            if trabajo.get('error'):
                 self.metricas.documentos_fallidos += 1
                 resultados.append({
                     'id': doc['id'],
                     'titulo': doc['titulo'],
                     'status': 'error',
-                    'error': str(e)
+                    'error': trabajo['error']
                 })
-                print(f"   ❌ Error: {e}")
+                print(f"   ❌ Error ({trabajo['etapa_error']}): {trabajo['error']}")
+                continue
+            
+            inicio_validacion = time.time()
+            calidad = self._validar_calidad_texto(trabajo['texto'])
+            self.metricas.tiempo_validacion_ms += int((time.time() - inicio_validacion) * 1000)
+            
+            tiempo_ms = trabajo['tiempo_extraccion_ms'] + trabajo['tiempo_embedding_ms']
+            self.metricas.documentos_procesados += 1
+            resultados.append({
+                'id': doc['id'],
+                'titulo': doc['titulo'],
+                'status': 'success',
+                'texto_length': len(trabajo['texto']),
+                'tokens': trabajo['tokens'],
+                'calidad': calidad,
+                'tiempo_ms': tiempo_ms
+            })
+            
+            print(f"   ✅ Procesado ({tiempo_ms}ms)")
+        
+        self.metricas.etapas = pipeline.resumen()
+        self.metricas.concurrencia = pipeline.workers_totales()
+        self.metricas.tiempo_extraccion_ms = sum(
+            self.metricas.etapas[nombre]['ocupado_ms'] for nombre in ('descargar', 'extraer')
+        )
+        self.metricas.tiempo_embedding_ms = self.metricas.etapas['embeber']['ocupado_ms']
         
         return resultados
     
+    # ============================================
+    # ETAPAS DEL ETL (se ejecutan en hilos)
+    # ============================================
+    
+    def _etapa_descargar(self, trabajo: Dict):
+        inicio = time.time()
+        with span('descarga', documento_id=trabajo['doc']['id']):
+            trabajo['pdf_data'] = self._extraer_pdf(trabajo['doc']['url_original'])
+        trabajo['tiempo_extraccion_ms'] = int((time.time() - inicio) * 1000)
+        if not trabajo['pdf_data']:
+            raise Exception("Descarga falló")
+    
+    def _etapa_extraer(self, trabajo: Dict):
+        inicio = time.time()
+        with span('extraccion', documento_id=trabajo['doc']['id']):
+            texto = self._transformar_pdf_a_texto(trabajo.pop('pdf_data'))
+        trabajo['tiempo_extraccion_ms'] += int((time.time() - inicio) * 1000)
+        if not texto or len(texto.strip()) < 50:
+            raise Exception("Extracción de texto falló")
+        trabajo['texto'] = texto
+    
+    def _etapa_embeber(self, trabajo: Dict):
+        inicio = time.time()
+        with span('embedding', documento_id=trabajo['doc']['id']):
+            trabajo['embedding'], trabajo['tokens'] = self._generar_embedding_optimizado(trabajo['texto'])
+        trabajo['tiempo_embedding_ms'] = int((time.time() - inicio) * 1000)
+        with self._lock_metricas:
+            self.metricas.tokens_usados += trabajo['tokens']
+    
+    def _etapa_escribir(self, trabajo: Dict):
+        with span('escritura', documento_id=trabajo['doc']['id']):
+            self._cargar_a_bd(trabajo['doc']['id'], trabajo['texto'], trabajo.pop('embedding'))
+    
     def _fase_validacion(self, resultados: List[Dict]):
-        """FASE 3: Validación de calidad"""
+        """FASE 3: Validación de calidad (scores calculados en memoria durante el ETL)"""
         
         print(f"\n✓ FASE 3: VALIDACIÓN DE CALIDAD")
         print("-" * 60)
         
-        inicio = time.time()
-        
         for resultado in resultados:
             if resultado['status'] == 'success':
-                # Validar calidad del texto
-                calidad = self._validar_calidad_texto(resultado['id'])
+                calidad = resultado['calidad']
                 if calidad > 0.7:
                     self.metricas.chunks_validados += 1
                     self.metricas.calidad_promedio += calidad
@@ -200,8 +262,6 @@ class MLOpsPipeline:
         if self.metricas.chunks_validados > 0:
             self.metricas.calidad_promedio /= self.metricas.chunks_validados
         
-        self.metricas.tiempo_validacion_ms = int((time.time() - inicio) * 1000)
-        
         print(f"   ✅ Chunks validados: {self.metricas.chunks_validados}")
         print(f"   📊 Calidad promedio: {self.metricas.calidad_promedio:.2%}")
     
@@ -264,19 +324,23 @@ class MLOpsPipeline:
         """Genera embedding optimizado con conteo de tokens"""
         
         texto_limpio = texto.replace("\n", " ").strip()[:8000]
+        content_hash = hashlib.sha256(texto_limpio.encode()).hexdigest()
         
-        response = self.openai.embeddings.create(
-            model="text-embedding-3-small",
-            input=texto_limpio
-        )
+        cached = self.cache_embeddings.buscar(content_hash, EMBEDDING_DIMENSIONS)
+        if cached is not None:
+            return cached
         
-        embedding = response.data[0].embedding
-        tokens = response.usage.total_tokens
+        resultado = self.proveedor.embeber([texto_limpio])
         
-        # Calcular costo (text-embedding-3-small: $0.02 / 1M tokens)
-        self.metricas.costo_estimado_usd += (tokens / 1_000_000) * 0.02
+        embedding_completo = resultado.vectores[0]
+        tokens = resultado.tokens[0]
+        self.cache_embeddings.guardar(content_hash, embedding_completo, tokens)
         
-        return embedding, tokens
+        # Costo según proveedor (text-embedding-3-small: $0.02 / 1M tokens; onnx: 0)
+        with self._lock_metricas:
+            self.metricas.costo_estimado_usd += resultado.costo_usd
+        
+        return derivar(embedding_completo, EMBEDDING_DIMENSIONS), tokens
     
     def _cargar_a_bd(self, doc_id: str, texto: str, embedding: List[float]):
         """Carga datos procesados a BD"""
@@ -286,39 +350,26 @@ class MLOpsPipeline:
             'embedding': embedding,
             'procesado': True,
             'fecha_procesamiento': datetime.now().isoformat(),
-            'embedding_model': 'text-embedding-3-small',
+            'embedding_model': self.proveedor.modelo,
             'embedding_version': 'v1.0'
         }).eq('id', doc_id).execute()
     
-    def _validar_calidad_texto(self, doc_id: str) -> float:
-        """Valida calidad del texto extraído"""
+    def _validar_calidad_texto(self, texto: str) -> float:
+        """Valida calidad del texto extraído (sin releerlo de la BD)"""
         
-        try:
-            response = self.supabase.table('documentos_oficiales')\
-                .select('contenido_texto')\
-                .eq('id', doc_id)\
-                .single()\
-                .execute()
-            
-            texto = response.data.get('contenido_texto', '')
-            
-            if not texto:
-                return 0.0
-            
-            # Métricas de calidad
-            import re
-            palabras = re.findall(r'\b[a-zA-ZÀ-ſ]{3,}\b', texto)
-            
-            if len(palabras) < 20:
-                return 0.0
-            
-            # Ratio de palabras legibles vs caracteres totales
-            calidad = min(len(palabras) / (len(texto) / 5), 1.0)
-            
-            return calidad
-            
-        except Exception:
+        if not texto:
             return 0.0
+        
+        # Métricas de calidad
+        palabras = re.findall(r'\b[a-zA-ZÀ-ſ]{3,}\b', texto)
+        
+        if len(palabras) < 20:
+            return 0.0
+        
+        # Ratio de palabras legibles vs caracteres totales
+        calidad = min(len(palabras) / (len(texto) / 5), 1.0)
+        
+        return calidad
     
     def _registrar_metricas_procesamiento(self):
         """Registra métricas en tabla metricas_procesamiento"""
@@ -329,7 +380,7 @@ class MLOpsPipeline:
                 'documentos_procesados': self.metricas.documentos_procesados,
                 'documentos_fallidos': self.metricas.documentos_fallidos,
                 'tiempo_total_ms': self.metricas.tiempo_total_ms,
-                'concurrencia_usada': 1,
+                'concurrencia_usada': self.metricas.concurrencia,
                 'metadata': {
                     'tiempo_extraccion_ms': self.metricas.tiempo_extraccion_ms,
                     'tiempo_embedding_ms': self.metricas.tiempo_embedding_ms,
@@ -337,7 +388,10 @@ class MLOpsPipeline:
                     'tokens_usados': self.metricas.tokens_usados,
                     'costo_estimado_usd': round(self.metricas.costo_estimado_usd, 4),
                     'calidad_promedio': round(self.metricas.calidad_promedio, 3),
-                    'chunks_validados': self.metricas.chunks_validados
+                    'chunks_validados': self.metricas.chunks_validados,
+                    'etapas': self.metricas.etapas,
+                    'run_id': obtener_trazador().run_id,
+                    'trazas': obtener_trazador().resumen()
                 }
             }).execute()
             
@@ -385,13 +439,17 @@ class MLOpsPipeline:
         print(f"   Tiempo total:      {self.metricas.tiempo_total_ms:,}ms")
         print(f"   Tokens usados:     {self.metricas.tokens_usados:,}")
         print(f"   Costo estimado:    ${self.metricas.costo_estimado_usd:.4f}")
+        for nombre, etapa in self.metricas.etapas.items():
+            print(f"   Etapa {nombre:<10}  ocupado {etapa['ocupado_ms']:,}ms · "
+                  f"sin entrada {etapa['espera_entrada_ms']:,}ms · bloqueada {etapa['espera_salida_ms']:,}ms")
         print("=" * 60)
 
 
 if __name__ == '__main__':
     try:
-        pipeline = MLOpsPipeline()
-        resultado = pipeline.ejecutar()
+        with perfilar():
+            pipeline = MLOpsPipeline()
+            resultado = pipeline.ejecutar()
         
         sys.exit(0 if resultado['status'] == 'success' else 1)
         
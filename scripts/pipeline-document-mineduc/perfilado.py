@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Perfilado opcional de CPU y memoria para los scripts de fase
+
+Cuando fase2 o fase3 estaban lentas solo había prints y, desde trazas.py,
+tiempos por etapa, sin perfil de CPU ni de memoria. Con
+PIPELINE_PERFILADO activo el punto de entrada de cada script corre dentro
+de perfilar() y al terminar (también con sys.exit o excepción) se escribe
+en PIPELINE_PERFILADO_DIR, junto al *_metrics.json:
+
+- cpu: cProfile del hilo principal → <base>.pstats (snakeviz, pstats) y
+  <base>.cpu.txt con las funciones de mayor tiempo acumulado
+- muestreo: muestreador de pilas de todos los hilos (los workers de fase2
+  no aparecen en cProfile) → <base>.collapsed, pilas colapsadas para
+  flamegraph.pl / speedscope. Es tiempo de pared: hilos esperando I/O
+  también cuentan
+- memoria: tracemalloc con snapshot al inicio y al final → <base>.memoria.txt
+  con los mayores asignadores (diferencia por línea) y el pico
+
+más <base>.perfil.json con el resumen. <base> es <servicio>-<run>-<pid>,
+igual que las trazas. Desactivado, perfilar() es un nullcontext: ningún
+hook de perfilado, muestreo ni tracemalloc queda instalado.
+
+Uso:
+    from perfilado import perfilar
+    with perfilar():
+        main()
+
+Variables de entorno:
+- PIPELINE_PERFILADO: vacío/false (default), true/todo, o lista de modos
+  separada por comas (cpu, muestreo, memoria)
+- PIPELINE_PERFILADO_DIR=perfiles
+- PIPELINE_PERFILADO_INTERVALO_MS=10 (muestreo)
+- PIPELINE_PERFILADO_TOP=30 (filas de los reportes de texto)
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+from typing import Dict, FrozenSet, List, Optional
+
+from trazas import id_ejecucion
+
+MODOS = ('cpu', 'muestreo', 'memoria')
+PERFILADO_DIR = os.getenv('PIPELINE_PERFILADO_DIR', 'perfiles')
+INTERVALO_MS = float(os.getenv('PIPELINE_PERFILADO_INTERVALO_MS', '10'))
+TOP = int(os.getenv('PIPELINE_PERFILADO_TOP', '30'))
+PROFUNDIDAD_MAXIMA = 128
+FRAMES_TRACEMALLOC = 5
+
+
+def modos_activos(valor: Optional[str] = None) -> FrozenSet[str]:
+    """Modos pedidos en PIPELINE_PERFILADO (conjunto vacío = desactivado)"""
+    valor = (os.getenv('PIPELINE_PERFILADO', '') if valor is None else valor).strip().lower()
+    if valor in ('', '0', 'false', 'no', 'none'):
+        return frozenset()
+    if valor in ('1', 'true', 'si', 'todo'):
+        return frozenset(MODOS)
+    modos = {m.strip() for m in valor.split(',') if m.strip()}
+    desconocidos = modos - set(MODOS)
+    if desconocidos:
+        print(f"⚠️ PIPELINE_PERFILADO: modos desconocidos {sorted(desconocidos)} (válidos: {', '.join(MODOS)})")
+    return frozenset(modos & set(MODOS))
+
+
+# ============================================
+# MUESTREO DE PILAS
+# ============================================
+
+def _etiqueta(frame) -> str:
+    codigo = frame.f_code
+    # ';' separa marcos en el formato colapsado
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})".replace(';', ',')
+
+
+def pila_colapsada(frame, hilo: str) -> str:
+    """'hilo;raíz;...;hoja' para flamegraph.pl"""
+    marcos = []
+    while frame is not None and len(marcos) < PROFUNDIDAD_MAXIMA:
+        marcos.append(_etiqueta(frame))
+        frame = frame.f_back
+    return ';'.join([hilo.replace(';', ',')] + marcos[::-1])
+
+
+class MuestreadorPilas:
+    """Toma la pila de cada hilo cada `intervalo_s` desde un hilo aparte"""
+
+    def __init__(self, intervalo_s: float = INTERVALO_MS / 1000.0):
+        self.intervalo_s = intervalo_s
+        self.pilas: Counter = Counter()
+        self.muestras = 0
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._ciclo, name='perfilado-muestreo', daemon=True)
+
+    def _ciclo(self):
+        propio = threading.get_ident()
+        while not self._detener.wait(self.intervalo_s):
+            nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != propio:
+                    self.pilas[pila_colapsada(frame, nombres.get(ident, str(ident)))] += 1
+            self.muestras += 1
+
+    def iniciar(self) -> 'MuestreadorPilas':
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._detener.set()
+        self._hilo.join()
+
+    def a_colapsado(self) -> str:
+        return ''.join(f"{pila} {n}\n" for pila, n in self.pilas.most_common())
+
+
+# ============================================
+# PERFILADOR
+# ============================================
+
+class Perfilador:
+    """Context manager que perfila el bloque y exporta los artefactos al salir"""
+
+    def __init__(self, servicio: str, modos: FrozenSet[str], directorio: str = PERFILADO_DIR,
+                 run_id: Optional[str] = None, top: int = TOP):
+        self.servicio = servicio
+        self.modos = modos
+        self.directorio = directorio
+        self.run_id = run_id or id_ejecucion()
+        self.top = top
+        self.perfil: Optional[cProfile.Profile] = None
+        self.muestreador: Optional[MuestreadorPilas] = None
+        self.snapshot_inicial = None
+        self.snapshot_final = None
+        self.pico_bytes = 0
+        self.duracion_s = 0.0
+        self.archivos: List[str] = []
+        self._asignaciones: Optional[List[Dict]] = None
+        self._inicio = 0.0
+        self._tracemalloc_propio = False
+
+    def __enter__(self) -> 'Perfilador':
+        print(f"🔬 Perfilado activo ({', '.join(sorted(self.modos))}) → {self.directorio}/")
+        if 'memoria' in self.modos:
+            self._tracemalloc_propio = not tracemalloc.is_tracing()
+            if self._tracemalloc_propio:
+                tracemalloc.start(FRAMES_TRACEMALLOC)
+            tracemalloc.reset_peak()
+            self.snapshot_inicial = tracemalloc.take_snapshot()
+        if 'muestreo' in self.modos:
+            self.muestreador = MuestreadorPilas().iniciar()
+        self._inicio = time.perf_counter()
+        if 'cpu' in self.modos:
+            self.perfil = cProfile.Profile()
+            self.perfil.enable()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        if self.perfil is not None:
+            self.perfil.disable()
+        self.duracion_s = time.perf_counter() - self._inicio
+        if self.muestreador is not None:
+            self.muestreador.detener()
+        if self.snapshot_inicial is not None:
+            # Sin las asignaciones del propio tracemalloc ni de este módulo
+            filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            self.snapshot_inicial = self.snapshot_inicial.filter_traces(filtros)
+            self.snapshot_final = tracemalloc.take_snapshot().filter_traces(filtros)
+            self.pico_bytes = tracemalloc.get_traced_memory()[1]
+            if self._tracemalloc_propio:
+                tracemalloc.stop()
+        self.exportar()
+        return False
+
+    def top_cpu(self) -> List[Dict]:
+        if self.perfil is None:
+            return []
+        estadisticas = pstats.Stats(self.perfil).stats
+        filas = sorted(estadisticas.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+        return [{
+            'funcion': f"{funcion} ({os.path.basename(archivo)}:{linea})",
+            'llamadas': llamadas,
+            'propio_s': round(propio, 4),
+            'acumulado_s': round(acumulado, 4)
+        } for (archivo, linea, funcion), (_, llamadas, propio, acumulado, _) in filas]
+
+    def top_asignaciones(self) -> List[Dict]:
+        if self.snapshot_final is None:
+            return []
+        if self._asignaciones is None:
+            self._asignaciones = self._calcular_asignaciones()
+        return self._asignaciones
+
+    def _calcular_asignaciones(self) -> List[Dict]:
+        diferencias = self.snapshot_final.compare_to(self.snapshot_inicial, 'lineno')
+        return [{
+            'ubicacion': f"{os.path.basename(d.traceback[0].filename)}:{d.traceback[0].lineno}",
+            'archivo': d.traceback[0].filename,
+            'kb': round(d.size / 1024, 1),
+            'kb_diferencia': round(d.size_diff / 1024, 1),
+            'bloques': d.count
+        } for d in diferencias[:self.top]]
+
+    def resumen(self) -> Dict:
+        return {
+            'servicio': self.servicio,
+            'run_id': self.run_id,
+            'pid': os.getpid(),
+            'modos': sorted(self.modos),
+            'duracion_s': round(self.duracion_s, 3),
+            'muestras': self.muestreador.muestras if self.muestreador else 0,
+            'intervalo_ms': INTERVALO_MS if self.muestreador else None,
+            'pico_memoria_mb': round(self.pico_bytes / 1024 / 1024, 1) if self.snapshot_final else None,
+            'top_cpu': self.top_cpu(),
+            'top_asignaciones': self.top_asignaciones(),
+            'archivos': self.archivos
+        }
+
+    def _escribir(self, ruta: str, contenido: str):
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.write(contenido)
+        self.archivos.append(os.path.basename(ruta))
+
+    def exportar(self) -> Optional[str]:
+        """Escribe los artefactos de los modos activos; retorna la ruta del .perfil.json"""
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            base = os.path.join(self.directorio, f"{self.servicio}-{self.run_id}-{os.getpid()}")
+
+            if self.perfil is not None:
+                self.perfil.dump_stats(base + '.pstats')
+                self.archivos.append(os.path.basename(base + '.pstats'))
+                texto = io.StringIO()
+                pstats.Stats(self.perfil, stream=texto).sort_stats('cumulative').print_stats(self.top)
+                self._escribir(base + '.cpu.txt', texto.getvalue())
+
+            if self.muestreador is not None:
+                self._escribir(base + '.collapsed', self.muestreador.a_colapsado())
+
+            if self.snapshot_final is not None:
+                lineas = [f"Pico de memoria trazada: {self.pico_bytes / 1024 / 1024:.1f} MB", '',
+                          f"Top {self.top} asignadores (memoria viva al final vs inicio):"]
+                lineas += [f"  {a['ubicacion']:<50} {a['kb']:>10,.1f} KB  ({a['kb_diferencia']:+,.1f} KB, "
+                           f"{a['bloques']:,} bloques)" for a in self.top_asignaciones()]
+                estadisticas = self.snapshot_final.statistics('traceback')[:3]
+                for i, estadistica in enumerate(estadisticas, 1):
+                    lineas += ['', f"#{i}: {estadistica.size / 1024:,.1f} KB en {estadistica.count:,} bloques"]
+                    lineas += [f"  {linea}" for linea in estadistica.traceback.format()]
+                self._escribir(base + '.memoria.txt', '\n'.join(lineas) + '\n')
+
+            with open(base + '.perfil.json', 'w', encoding='utf-8') as f:
+                json.dump(self.resumen(), f, ensure_ascii=False, indent=2)
+            print(f"\n🔬 Perfil exportado: {base}.perfil.json ({', '.join(self.archivos)})")
+            return base + '.perfil.json'
+        except Exception as e:
+            print(f"\n⚠️ Error exportando perfil: {e}")
+            return None
+
+
+def perfilar(servicio: Optional[str] = None, modos: Optional[FrozenSet[str]] = None,
+             directorio: str = PERFILADO_DIR):
+    """
+    Context manager para el punto de entrada de un script. Sin modos
+    activos retorna nullcontext() (costo nulo).
+    """
+    modos = modos_activos() if modos is None else frozenset(modos)
+    if not modos:
+        return nullcontext()
+    nombre = servicio or os.path.splitext(os.path.basename(sys.argv[0] or 'pipeline'))[0]
+    return Perfilador(nombre, modos, directorio)
@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+Runner del pipeline de documentos en un solo proceso (DAG de fases)
+
+El workflow ejecuta cada fase como un job: reinstala dependencias, crea
+clientes y vuelve a consultar documentos_oficiales; fase6 recibe sus
+entradas vía jq y flags. Este runner ejecuta las fases como un DAG dentro
+de un proceso:
+
+    verificar_storage ─→ transformar ─→ cargar ─→ validar ─→ optimizar
+                         (por documento, solapadas)   └──────────┴─→ metricas
+
+- transformar + cargar corren por documento y solapadas: mientras un
+  documento se embebe, el siguiente ya se está extrayendo. Los artefactos
+  pasan en memoria (PDF → Markdown → chunks → score de calidad) sin
+  releer la BD; un documento queda completado segundos después de su
+  descarga. Antes se carga el backlog que ya estaba en 'transformado'
+  (fallos previos de fase3, ejecuciones del workflow por jobs)
+- Las demás fases son globales y corren una vez, en orden topológico; si
+  una falla, sus dependientes se omiten (metricas corre siempre)
+- fase6 recibe los contadores en memoria (sin jq ni flags)
+- Una sola fase (--solo) o un tramo (--desde / --hasta) siguen disponibles;
+  una fase por documento sola se ejecuta como su script
+
+Uso:
+    python scripts/pipeline-document-mineduc/pipeline_runner.py
+    python scripts/pipeline-document-mineduc/pipeline_runner.py --solo cargar
+    python scripts/pipeline-document-mineduc/pipeline_runner.py --hasta cargar
+    PIPELINE_PRESUPUESTO_SEGUNDOS=3600 \\
+        python scripts/pipeline-document-mineduc/pipeline_runner.py --seguir 30
+
+Variables de entorno:
+- RUNNER_WORKERS_TRANSFORMAR=4
+- RUNNER_WORKERS_CARGAR=2
+- PIPELINE_PRESUPUESTO_SEGUNDOS (obligatoria con --seguir)
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cola_pendientes import procesar_en_pool
+from perfilado import perfilar
+from trazas import obtener_trazador, resumen_ejecucion, span
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+WORKERS_TRANSFORMAR = int(os.getenv('RUNNER_WORKERS_TRANSFORMAR', '4'))
+WORKERS_CARGAR = int(os.getenv('RUNNER_WORKERS_CARGAR', '2'))
+COLUMNAS_DESCARGADOS = 'id, storage_path, url_original, titulo, tipo_documento, metadata'
+COLUMNAS_TRANSFORMADOS = 'id, contenido_markdown, contenido_texto, titulo, tipo_documento, metadata'
+
+
+@dataclass(frozen=True)
+class Etapa:
+    nombre: str
+    archivo: str
+    depende_de: Tuple[str, ...] = ()
+    por_documento: bool = False
+    siempre: bool = False  # Corre aunque falle una dependencia
+
+
+ETAPAS: Dict[str, Etapa] = {e.nombre: e for e in (
+    Etapa('verificar_storage', 'fase1.5_verify_storage.py'),
+    Etapa('transformar', 'fase2_transform_multiproveedor.py', ('verificar_storage',), por_documento=True),
+    Etapa('cargar', 'fase3_load.py', ('transformar',), por_documento=True),
+    Etapa('validar', 'fase4_validacion_calidad.py', ('cargar',)),
+    Etapa('optimizar', 'fase5_optimize.py', ('validar',)),
+    Etapa('metricas', 'fase6_metrics.py', ('validar', 'optimizar'), siempre=True),
+)}
+
+
+# ============================================
+# DAG
+# ============================================
+
+def _cierre(nombre: str, vecinos) -> Set[str]:
+    visitados, pendientes = set(), [nombre]
+    while pendientes:
+        actual = pendientes.pop()
+        if actual not in visitados:
+            visitados.add(actual)
+            pendientes.extend(vecinos(actual))
+    return visitados
+
+
+def seleccionar(etapas: Dict[str, Etapa], solo: Optional[str] = None,
+                desde: Optional[str] = None, hasta: Optional[str] = None) -> Set[str]:
+    """Etapas a ejecutar: una sola, o las descendientes de `desde` ∩ ancestros de `hasta`"""
+    for nombre in (solo, desde, hasta):
+        if nombre is not None and nombre not in etapas:
+            raise ValueError(f"Etapa desconocida: {nombre} (disponibles: {', '.join(etapas)})")
+    if solo:
+        return {solo}
+
+    seleccion = set(etapas)
+    if desde:
+        hijos = lambda n: [e.nombre for e in etapas.values() if n in e.depende_de]
+        seleccion &= _cierre(desde, hijos)
+    if hasta:
+        seleccion &= _cierre(hasta, lambda n: etapas[n].depende_de)
+    return seleccion
+
+
+def orden_topologico(etapas: Dict[str, Etapa], seleccion: Set[str]) -> List[str]:
+    """Orden de ejecución (Kahn, estable según la declaración); dependencias fuera de la selección se ignoran"""
+    grados = {n: sum(1 for d in etapas[n].depende_de if d in seleccion) for n in seleccion}
+    orden = []
+    listos = [n for n in etapas if n in seleccion and grados[n] == 0]
+    while listos:
+        actual = listos.pop(0)
+        orden.append(actual)
+        for nombre in etapas:
+            if nombre in seleccion and actual in etapas[nombre].depende_de:
+                grados[nombre] -= 1
+                if grados[nombre] == 0:
+                    listos.append(nombre)
+    if len(orden) != len(seleccion):
+        raise ValueError(f"Ciclo en el DAG de etapas: {sorted(seleccion - set(orden))}")
+    return orden
+
+
+_FASES: Dict[str, object] = {}
+_LOCK_FASES = threading.Lock()
+
+
+def cargar_fase(archivo: str):
+    """Importa un script de fase una sola vez por proceso (clientes y cachés incluidos)"""
+    with _LOCK_FASES:
+        if archivo not in _FASES:
+            nombre = os.path.splitext(archivo)[0].replace('.', '_')
+            spec = importlib.util.spec_from_file_location(nombre, os.path.join(DIRECTORIO, archivo))
+            modulo = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(modulo)
+            _FASES[archivo] = modulo
+        return _FASES[archivo]
+
+
+# ============================================
+# FLUJO POR DOCUMENTO
+# ============================================
+
+@dataclass
+class ArtefactosDocumento:
+    """Lo que cada paso entrega al siguiente, en memoria"""
+    doc: Dict
+    inicio: float = field(default_factory=time.monotonic)
+    pdf_bytes: Optional[bytes] = None
+    transformacion: Optional[Dict] = None
+    chunks: Optional[List[Dict]] = None
+    carga: Optional[Tuple[int, int, float]] = None
+    calidad: Optional[float] = None
+    latencia_segundos: Optional[float] = None
+
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))]
+
+
+class RunnerPipeline:
+    """Ejecuta las etapas seleccionadas del DAG en este proceso"""
+
+    def __init__(self, seleccion: Set[str], workers_transformar: int = WORKERS_TRANSFORMAR,
+                 workers_cargar: int = WORKERS_CARGAR, seguir: Optional[float] = None,
+                 descargados: int = 0, workflow_id: Optional[str] = None):
+        self.orden = orden_topologico(ETAPAS, seleccion)
+        self.workers_transformar = workers_transformar
+        self.workers_cargar = workers_cargar
+        self.seguir = seguir
+        self.workflow_id = workflow_id or os.getenv('GITHUB_RUN_ID') or f"local_{datetime.now():%Y%m%d_%H%M%S}"
+
+        self.estados: Dict[str, str] = {}
+        self.duraciones: Dict[str, float] = {}
+        self.contadores = {
+            # tomados: reclamados de las colas; transformados_previos: backlog ya en 'transformado'
+            'descargados': descargados, 'tomados': 0, 'transformados': 0, 'transformados_previos': 0,
+            'cargados': 0, 'fallidos': 0,
+            'chunks': 0, 'tokens': 0, 'costo_transformacion': 0.0, 'costo_carga': 0.0
+        }
+        self.calidades: List[float] = []
+        self.latencias: List[float] = []
+        self.validacion: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    # ============================================
+    # ORQUESTACIÓN
+    # ============================================
+
+    def ejecutar(self) -> int:
+        print(f"🧭 DAG: {' → '.join(self.orden)}")
+        flujo_hecho = False
+        for nombre in self.orden:
+            etapa = ETAPAS[nombre]
+            solapada = etapa.por_documento and self._flujo_solapado()
+            if solapada and flujo_hecho:
+                continue  # Ya ejecutada junto con la otra etapa por documento
+
+            bloqueantes = [d for d in etapa.depende_de if self.estados.get(d) in ('fallida', 'omitida')]
+            if bloqueantes and not etapa.siempre:
+                print(f"\n⏭️  {nombre}: omitida (falló {', '.join(bloqueantes)})")
+                self.estados[nombre] = 'omitida'
+                continue
+
+            if solapada:
+                flujo_hecho = True
+                nombres = [n for n in self.orden if ETAPAS[n].por_documento]
+            else:
+                nombres = [nombre]
+
+            print(f"\n{'=' * 60}\n▶️  {' + '.join(nombres)}\n{'=' * 60}")
+            inicio = time.monotonic()
+            try:
+                with span(f"etapa_{nombre}"):
+                    exito = self._ejecutar_etapa(nombre)
+            except Exception as e:
+                print(f"\n❌ {nombre}: {e}")
+                exito = False
+            for n in nombres:
+                self.estados[n] = 'ok' if exito else 'fallida'
+                self.duraciones[n] = round(time.monotonic() - inicio, 2)
+
+        self._reporte()
+        return 0 if all(e == 'ok' for e in self.estados.values()) else 1
+
+    def _flujo_solapado(self) -> bool:
+        return 'transformar' in self.orden and 'cargar' in self.orden
+
+    def _ejecutar_etapa(self, nombre: str) -> bool:
+        if nombre in ('transformar', 'cargar'):
+            if self._flujo_solapado():
+                return self._flujo_documentos()
+            # Fase por documento sola: equivale a su script
+            return self._main_de_fase(ETAPAS[nombre].archivo)
+        return getattr(self, f'_etapa_{nombre}')()
+
+    @staticmethod
+    def _main_de_fase(archivo: str) -> bool:
+        try:
+            codigo = cargar_fase(archivo).main()
+        except SystemExit as salida:
+            codigo = salida.code
+        return codigo in (None, 0)
+
+    # ============================================
+    # ETAPAS GLOBALES
+    # ============================================
+
+    def _etapa_verificar_storage(self) -> bool:
+        return self._main_de_fase(ETAPAS['verificar_storage'].archivo)
+
+    def _etapa_validar(self) -> bool:
+        fase4 = cargar_fase(ETAPAS['validar'].archivo)
+        self.validacion = fase4.ValidadorCalidad().validar_todos()
+        return self.validacion['calidad_promedio'] >= 0.5
+
+    def _etapa_optimizar(self) -> bool:
+        return self._main_de_fase(ETAPAS['optimizar'].archivo)
+
+    def _etapa_metricas(self) -> bool:
+        fase6 = cargar_fase(ETAPAS['metricas'].archivo)
+        c = self.contadores
+        validacion = self.validacion or {}
+        calidad = validacion.get('calidad_promedio')
+        if calidad is None and self.calidades:
+            calidad = sum(self.calidades) / len(self.calidades)
+        return fase6.registrar_metricas(Namespace(
+            # Como colector_metricas: nuevos de fase1 o backlog reclamado, lo que sea mayor
+            downloaded=max(c['descargados'], c['tomados']),
+            transformed=c['transformados'] + c['transformados_previos'],
+            loaded=c['cargados'],
+            validated=validacion.get('total_chunks', c['chunks']),
+            quality=round(calidad or 0.0, 4),
+            tokens=c['tokens'],
+            chunks=c['chunks'],
+            cost=round(c['costo_transformacion'] + c['costo_carga'], 4),
+            workflow_id=self.workflow_id,
+            export_json=True,
+            trazas=resumen_ejecucion(obtener_trazador().a_chrome()['traceEvents'])
+        )) == 0
+
+    # ============================================
+    # TRANSFORMAR + CARGAR SOLAPADOS
+    # ============================================
+
+    def _flujo_documentos(self) -> bool:
+        from leases import ColaConLeases
+
+        fase2 = cargar_fase(ETAPAS['transformar'].archivo)
+        fase3 = cargar_fase(ETAPAS['cargar'].archivo)
+        self._fase2, self._fase3 = fase2, fase3
+        self._fase4 = cargar_fase(ETAPAS['validar'].archivo)
+
+        # Un solo buffer de transiciones: el 'transformado' de fase2 siempre se
+        # aplica antes del cierre de fase3 (que hace flush antes de finalizar)
+        fase3.transiciones = fase2.transiciones
+
+        self._cargar_transformados(fase3)
+
+        cola = ColaConLeases(
+            fase2.supabase, 'descargado', COLUMNAS_DESCARGADOS,
+            lambda q: q.eq('etapa_actual', 'descargado')
+        )
+        if self.seguir and cola.presupuesto_segundos is None:
+            raise ValueError("--seguir requiere PIPELINE_PRESUPUESTO_SEGUNDOS")
+
+        # Cargas en vuelo acotadas: si embeber es más lento, la extracción espera
+        cupos = threading.BoundedSemaphore(2 * self.workers_cargar)
+        cargas = {}
+        with ThreadPoolExecutor(max_workers=self.workers_cargar) as pool_carga:
+            for doc, futuro in procesar_en_pool(self._documentos(cola), self._transformar, self.workers_transformar):
+                try:
+                    artefactos = futuro.result()
+                except Exception as e:
+                    print(f"  ❌ Error transformando {doc.get('titulo', doc['id'])}: {e}")
+                    artefactos = None
+
+                if artefactos is None or artefactos.transformacion is None:
+                    self._fallo(cola, doc)
+                    continue
+
+                fase2.registrar_transformacion(artefactos.transformacion)
+                with self._lock:
+                    self.contadores['transformados'] += 1
+                    self.contadores['costo_transformacion'] += artefactos.transformacion['costo']
+
+                cupos.acquire()
+                carga = pool_carga.submit(self._cargar, artefactos)
+                carga.add_done_callback(lambda _: cupos.release())
+                cargas[carga] = artefactos
+
+            for carga in as_completed(cargas):
+                doc = cargas[carga].doc
+                try:
+                    carga.result()
+                except Exception as e:
+                    print(f"  ❌ Error cargando {doc.get('titulo', doc['id'])}: {e}")
+                    self._fallo(cola, doc)
+
+        # Aplicar transiciones antes de liberar leases
+        fase2.transiciones.flush()
+        cola.cerrar()
+        with self._lock:
+            self.contadores['tomados'] += cola.entregados
+        return self.contadores['fallidos'] == 0 or self.contadores['cargados'] > 0
+
+    def _cargar_transformados(self, fase3):
+        """
+        Backlog que ya estaba en 'transformado' sin procesar (el flujo solapado
+        solo reclama 'descargado'): se carga como en fase3, con su misma cola
+        """
+        from leases import ColaConLeases
+
+        cola = ColaConLeases(
+            fase3.supabase, 'transformado', COLUMNAS_TRANSFORMADOS,
+            lambda q: q.eq('etapa_actual', 'transformado').eq('procesado', False),
+            solo_no_procesados=True
+        )
+        for doc, futuro in procesar_en_pool(cola, fase3.procesar_documento, self.workers_cargar):
+            try:
+                chunks_guardados, tokens, costo = futuro.result()
+            except Exception as e:
+                print(f"  ❌ Error cargando {doc.get('titulo', doc['id'])}: {e}")
+                self._fallo(cola, doc)
+                continue
+            with self._lock:
+                self.contadores['cargados'] += 1
+                self.contadores['chunks'] += chunks_guardados
+                self.contadores['tokens'] += tokens
+                self.contadores['costo_carga'] += costo
+
+        fase3.transiciones.flush()
+        cola.cerrar()
+        with self._lock:
+            self.contadores['tomados'] += cola.entregados
+            self.contadores['transformados_previos'] += cola.entregados
+        if cola.entregados:
+            print(f"📦 Backlog 'transformado' cargado: {cola.entregados} documentos")
+
+    def _documentos(self, cola) -> Iterator[Dict]:
+        """Backlog de 'descargado'; con --seguir vuelve a reclamar hasta agotar el presupuesto"""
+        while True:
+            entregados = cola.entregados
+            yield from cola
+            if not self.seguir or cola.agotado_por_presupuesto:
+                return
+            restante = cola.segundos_restantes() or 0.0
+            if restante <= self.seguir:
+                return
+            if cola.entregados == entregados:
+                time.sleep(self.seguir)
+
+    def _fallo(self, cola, doc: Dict):
+        cola.liberar(doc['id'])
+        with self._lock:
+            self.contadores['fallidos'] += 1
+
+    def _transformar(self, doc: Dict) -> Optional[ArtefactosDocumento]:
+        fase2 = self._fase2
+        artefactos = ArtefactosDocumento(doc)
+
+        with span('descarga', documento_id=doc['id']):
+            exito, artefactos.pdf_bytes = fase2.descargar_pdf_con_verificacion(doc)
+        if not exito or artefactos.pdf_bytes is None:
+            fase2.marcar_sin_archivo(doc['id'])
+            return None
+
+        artefactos.transformacion = fase2.procesar_documento_individual(doc, pdf_bytes=artefactos.pdf_bytes)
+        artefactos.pdf_bytes = None  # Ya no se necesita: libera memoria mientras espera la carga
+        return artefactos
+
+    def _cargar(self, artefactos: ArtefactosDocumento):
+        fase3, fase4 = self._fase3, self._fase4
+        transformacion = artefactos.transformacion
+        doc = {
+            **artefactos.doc,
+            'contenido_markdown': transformacion['contenido_final'],
+            'contenido_texto': None,
+            'metadata': {**(artefactos.doc.get('metadata') or {}), **transformacion.get('metadata_documento', {})}
+        }
+
+        print(f"\n🔢 {doc['titulo']}")
+        with span('chunking', documento_id=doc['id']):
+            artefactos.chunks = fase3.fragmentar_documento(doc)
+        artefactos.carga = fase3.procesar_documento_batch(doc, artefactos.chunks)
+        chunks_guardados, tokens, costo = artefactos.carga
+
+        # Calidad del documento desde los artefactos (mismo score que fase4, sin consultar la BD)
+        if chunks_guardados:
+            artefactos.calidad = self.puntuar(fase4, transformacion['contenido_final'], artefactos.chunks)
+        artefactos.latencia_segundos = time.monotonic() - artefactos.inicio
+        artefactos.chunks = None
+
+        with self._lock:
+            self.contadores['cargados'] += 1
+            self.contadores['chunks'] += chunks_guardados
+            self.contadores['tokens'] += tokens
+            self.contadores['costo_carga'] += costo
+            self.latencias.append(artefactos.latencia_segundos)
+            if artefactos.calidad is not None:
+                self.calidades.append(artefactos.calidad)
+        print(f"  ⏱️  Descargado → completado en {artefactos.latencia_segundos:.1f}s")
+
+    @staticmethod
+    def puntuar(fase4, markdown: str, chunks: List[Dict]) -> float:
+        import numpy as np
+
+        stats = fase4.estadisticas_texto(markdown)
+        return float(fase4.puntuar_calidad(
+            longitud_texto=np.array([stats['longitud_texto']]),
+            palabras_legibles=np.array([stats['palabras_legibles']]),
+            tiene_metadata_pdf=np.array([stats['tiene_metadata_pdf']]),
+            total_chunks=np.array([len(chunks)]),
+            sin_embedding=np.array([0]),
+            chunks_validos=np.array([sum(len(c['contenido']) > 100 for c in chunks)])
+        )[0])
+
+    # ============================================
+    # REPORTE
+    # ============================================
+
+    def resumen(self) -> Dict:
+        c = self.contadores
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'fase': 'pipeline_runner',
+            'workflow_id': self.workflow_id,
+            'etapas': {n: {'estado': self.estados.get(n, 'pendiente'), 'segundos': self.duraciones.get(n)}
+                       for n in self.orden},
+            **c,
+            'costo_transformacion': round(c['costo_transformacion'], 4),
+            'costo_carga': round(c['costo_carga'], 4),
+            'cost_usd': round(c['costo_transformacion'] + c['costo_carga'], 4),
+            'calidad_promedio_cargados': round(sum(self.calidades) / len(self.calidades), 4) if self.calidades else None,
+            'latencia_documento_segundos': {
+                'p50': round(percentil(self.latencias, 0.5), 2),
+                'p95': round(percentil(self.latencias, 0.95), 2),
+                'max': round(max(self.latencias), 2) if self.latencias else 0.0
+            },
+            'run_id': obtener_trazador().run_id,
+            'trazas': obtener_trazador().resumen()
+        }
+
+    def _reporte(self):
+        resumen = self.resumen()
+        print("\n" + "=" * 60)
+        print("🧭 PIPELINE EN UN PROCESO")
+        print("=" * 60)
+        for nombre, info in resumen['etapas'].items():
+            icono = {'ok': '✅', 'fallida': '❌', 'omitida': '⏭️'}.get(info['estado'], '•')
+            print(f"   {icono} {nombre:18s} {info['segundos'] or 0:>8.1f}s")
+        if resumen['transformados'] or resumen['cargados']:
+            latencia = resumen['latencia_documento_segundos']
+            print(f"   📄 Transformados: {resumen['transformados']} | Cargados: {resumen['cargados']} | "
+                  f"Fallidos: {resumen['fallidos']}")
+            print(f"   ⏱️  Latencia por documento: p50 {latencia['p50']}s, p95 {latencia['p95']}s")
+            print(f"   💰 Costo: ${resumen['cost_usd']:.4f} USD")
+        export_metrics_json(resumen, 'pipeline_runner_metrics.json')
+        obtener_trazador().exportar()
+
+
+def export_metrics_json(metrics: dict, filepath: str):
+    """Exporta métricas en formato JSON para GitHub Actions"""
+    try:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2, ensure_ascii=False)
+        print(f"\n📄 Métricas exportadas: {filepath}")
+    except Exception as e:
+        print(f"\n⚠️ Error exportando métricas: {e}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Pipeline de documentos como DAG en un solo proceso')
+    parser.add_argument('--solo', choices=list(ETAPAS), help='Ejecutar una sola etapa')
+    parser.add_argument('--desde', choices=list(ETAPAS), help='Etapa inicial (incluye sus dependientes)')
+    parser.add_argument('--hasta', choices=list(ETAPAS), help='Etapa final (incluye sus dependencias)')
+    parser.add_argument('--seguir', type=float, metavar='SEGUNDOS',
+                        help='Seguir reclamando documentos nuevos cada N segundos hasta agotar el presupuesto')
+    parser.add_argument('--descargados', type=int, default=0, help='Documentos nuevos reportados por fase1')
+    parser.add_argument('--workflow-id', help='ID de ejecución para fase6 (por defecto GITHUB_RUN_ID)')
+    args = parser.parse_args()
+
+    if args.solo and (args.desde or args.hasta):
+        parser.error('--solo no se combina con --desde/--hasta')
+
+    seleccion = seleccionar(ETAPAS, args.solo, args.desde, args.hasta)
+    runner = RunnerPipeline(seleccion, seguir=args.seguir, descargados=args.descargados,
+                            workflow_id=args.workflow_id)
+    return runner.ejecutar()
+
+
+if __name__ == '__main__':
+    try:
+        with perfilar():
+            sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Interrupción manual")
+        sys.exit(1)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Planificador de requests de embeddings según límites por minuto (TPM/RPM)
+
+Los límites de OpenAI son tokens y requests por minuto. Antes, fase3
+disparaba requests hasta recibir un 429 y el documento completo quedaba
+'fallido'. El planificador:
+
+- Cuenta los tokens de cada texto antes de enviarlo (tokenizer de fase3)
+- Arma lotes que caben en una request (≤ MAX_TOKENS_REQUEST y ≤ TPM)
+- Reserva tokens y requests en dos cubos que se recargan de forma continua
+  (capacidad = presupuesto por minuto); si no alcanza, el hilo espera
+- Ante un 429 pausa a todos los hilos hasta el reset que informa el
+  servidor (retry-after, x-ratelimit-reset-tokens/-requests) y reintenta:
+  el throttling nunca marca un documento como fallido. Solo
+  'insufficient_quota' (sin saldo) se propaga como error
+
+Es compartido por todos los workers de fase3 (una instancia por proveedor).
+
+Variables de entorno:
+- EMBEDDING_TPM=1000000
+- EMBEDDING_RPM=3000
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+EMBEDDING_TPM = int(os.getenv('EMBEDDING_TPM', '1000000'))
+EMBEDDING_RPM = int(os.getenv('EMBEDDING_RPM', '3000'))
+MAX_TOKENS_REQUEST = 300_000  # Límite de tokens por request de /embeddings
+ESPERA_MAXIMA_SEGUNDOS = 60.0
+
+HEADERS_RESET = ('x-ratelimit-reset-tokens', 'x-ratelimit-reset-requests')
+
+
+# ============================================
+# CUBO DE TOKENS
+# ============================================
+
+class CuboTokens:
+    """Presupuesto por minuto con recarga continua (no es thread-safe por sí solo)"""
+
+    def __init__(self, capacidad_por_minuto: int, reloj: Callable[[], float] = time.monotonic):
+        self.capacidad = float(capacidad_por_minuto)
+        self.tasa = self.capacidad / 60.0
+        self.disponible = self.capacidad
+        self.reloj = reloj
+        self.actualizado = reloj()
+
+    def _recargar(self):
+        ahora = self.reloj()
+        self.disponible = min(self.capacidad, self.disponible + (ahora - self.actualizado) * self.tasa)
+        self.actualizado = ahora
+
+    def espera(self, cantidad: float) -> float:
+        """Segundos hasta que haya `cantidad` disponible (0 si ya alcanza)"""
+        self._recargar()
+        falta = min(cantidad, self.capacidad) - self.disponible
+        return max(0.0, falta / self.tasa)
+
+    def consumir(self, cantidad: float):
+        self._recargar()
+        self.disponible -= min(cantidad, self.capacidad)
+
+    def vaciar(self):
+        self._recargar()
+        self.disponible = min(self.disponible, 0.0)
+
+
+# ============================================
+# RESPUESTAS 429
+# ============================================
+
+def parsear_duracion(valor: str) -> Optional[float]:
+    """'6m0s', '1.5s', '120ms', '2' → segundos (formato de x-ratelimit-reset-*)"""
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    partes = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', valor)
+    if not partes:
+        return None
+    factores = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+    return sum(float(numero) * factores[unidad] for numero, unidad in partes)
+
+
+def espera_por_limite(error: Exception) -> Optional[float]:
+    """
+    Segundos a esperar si `error` es un 429 por throttling; None si es otro
+    error (incluido 429 por cuota agotada, que no se resuelve esperando).
+    El valor 0.0 indica 429 sin headers de reset (backoff exponencial).
+    """
+    if getattr(error, 'status_code', None) != 429 and type(error).__name__ != 'RateLimitError':
+        return None
+    cuerpo = getattr(error, 'body', None)
+    codigo = getattr(error, 'code', None) or (cuerpo.get('code') if isinstance(cuerpo, dict) else None)
+    if codigo == 'insufficient_quota':
+        return None
+
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    esperas = []
+    if headers.get('retry-after-ms') is not None:
+        esperas.append(parsear_duracion(headers['retry-after-ms']) / 1000.0)
+    for nombre in ('retry-after',) + HEADERS_RESET:
+        segundos = parsear_duracion(headers.get(nombre))
+        if segundos is not None:
+            esperas.append(segundos)
+    return max(esperas) if esperas else 0.0
+
+
+# ============================================
+# PLANIFICADOR
+# ============================================
+
+class PlanificadorEmbeddings:
+    """Reserva TPM/RPM antes de cada request y absorbe los 429"""
+
+    def __init__(self, tpm: int = EMBEDDING_TPM, rpm: int = EMBEDDING_RPM,
+                 contar_tokens: Optional[Callable[[str], int]] = None,
+                 max_tokens_request: int = MAX_TOKENS_REQUEST,
+                 reloj: Callable[[], float] = time.monotonic,
+                 dormir: Callable[[float], None] = time.sleep):
+        self.cubo_tokens = CuboTokens(tpm, reloj)
+        self.cubo_requests = CuboTokens(rpm, reloj)
+        self.contar_tokens = contar_tokens
+        self.max_tokens_lote = min(max_tokens_request, tpm)
+        self.reloj = reloj
+        self.dormir = dormir
+        self.pausa_hasta = 0.0
+        self._lock = threading.Lock()
+        self.estadisticas = {'requests': 0, 'tokens': 0, 'throttles': 0, 'espera_segundos': 0.0}
+
+    def contar(self, texto: str) -> int:
+        if self.contar_tokens is None:
+            return max(1, len(texto) // 4)
+        return max(1, self.contar_tokens(texto))
+
+    def particionar(self, conteos: Sequence[int], max_textos: int) -> List[Tuple[int, int]]:
+        """Rangos [inicio, fin) contiguos con ≤ max_textos textos y ≤ max_tokens_lote tokens"""
+        rangos = []
+        inicio, acumulado = 0, 0
+        for i, tokens in enumerate(conteos):
+            lleno = i - inicio >= max_textos or acumulado + tokens > self.max_tokens_lote
+            if i > inicio and lleno:
+                rangos.append((inicio, i))
+                inicio, acumulado = i, 0
+            acumulado += tokens
+        if inicio < len(conteos):
+            rangos.append((inicio, len(conteos)))
+        return rangos
+
+    def reservar(self, tokens: int):
+        """Bloquea hasta que ambos cubos (y la pausa por 429) permiten la request"""
+        while True:
+            with self._lock:
+                espera = max(
+                    self.pausa_hasta - self.reloj(),
+                    self.cubo_tokens.espera(tokens),
+                    self.cubo_requests.espera(1)
+                )
+                if espera <= 0:
+                    self.cubo_tokens.consumir(tokens)
+                    self.cubo_requests.consumir(1)
+                    self.estadisticas['requests'] += 1
+                    self.estadisticas['tokens'] += tokens
+                    return
+                self.estadisticas['espera_segundos'] += espera
+            self.dormir(espera)
+
+    def ejecutar(self, llamada: Callable[[], object], tokens: int):
+        """llamada() respetando el presupuesto; reintenta indefinidamente ante throttling"""
+        throttles = 0
+        while True:
+            self.reservar(tokens)
+            try:
+                return llamada()
+            except Exception as e:
+                espera = espera_por_limite(e)
+                if espera is None:
+                    raise
+                throttles += 1
+                if espera <= 0:
+                    espera = min(2.0 ** throttles, ESPERA_MAXIMA_SEGUNDOS)
+                # Jitter para que los workers no vuelvan todos en el mismo instante
+                espera = min(espera, ESPERA_MAXIMA_SEGUNDOS) * (1 + random.random() * 0.1)
+                with self._lock:
+                    self.pausa_hasta = max(self.pausa_hasta, self.reloj() + espera)
+                    self.cubo_tokens.vaciar()
+                    self.estadisticas['throttles'] += 1
+                print(f"  ⏳ 429 de la API: pausa de {espera:.1f}s (reintento {throttles})")
+
+    def resumen(self) -> Dict:
+        with self._lock:
+            return {**self.estadisticas, 'espera_segundos': round(self.estadisticas['espera_segundos'], 1)}
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Política de reindexado HNSW condicionada a deriva
+
+Recrear el índice HNSW de chunks_documentos en cada ejecución de fase5
+bloquea escrituras y consume CPU aunque casi nada haya cambiado. La
+política decide con dos señales:
+
+1. Cambios desde la última construcción: filas insertadas, actualizadas y
+   eliminadas (contadores de pg_stat_user_tables menos el snapshot guardado
+   en estado_indices_vectoriales), relativas a las filas al construir
+2. Recall@k muestreado del índice contra búsqueda exacta: el top-k exacto
+   de pocas consultas se calcula en la BD (vecinos_exactos_muestra_chunks,
+   scan secuencial) y se compara con buscar_chunks_similares; no se
+   descarga el corpus
+
+Solo si se cruza un umbral (o FORCE_REINDEX=true) se reconstruye; con un
+DSN (DATABASE_URL) la reconstrucción es REINDEX INDEX CONCURRENTLY, sin
+bloquear escrituras. Si no, se usa la RPC recrear_indice_hnsw. En el resto
+de los casos fase5 solo ejecuta ANALYZE.
+
+Variables de entorno:
+- REINDEX_UMBRAL_CAMBIOS=0.2 (fracción de filas cambiadas)
+- REINDEX_UMBRAL_RECALL=0.9 (recall@10 mínimo aceptable)
+- REINDEX_CONSULTAS_RECALL=30 (0 desactiva la medición)
+- DATABASE_URL (opcional, habilita REINDEX CONCURRENTLY)
+- FORCE_REINDEX=true (fuerza la reconstrucción)
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119006_estado_indices_vectoriales.sql
+    supabase/migrations/20260119013_vecinos_exactos_muestra.sql (recall)
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+UMBRAL_CAMBIOS = float(os.getenv('REINDEX_UMBRAL_CAMBIOS', '0.2'))
+UMBRAL_RECALL = float(os.getenv('REINDEX_UMBRAL_RECALL', '0.9'))
+CONSULTAS_RECALL = int(os.getenv('REINDEX_CONSULTAS_RECALL', '30'))
+K_RECALL = 10
+
+ACCION_RECONSTRUIR = 'reconstruir'
+ACCION_ANALYZE = 'analyze'
+
+
+@dataclass
+class DecisionReindexado:
+    """Resultado de la política con las entradas que la justifican"""
+    accion: str
+    motivos: List[str] = field(default_factory=list)
+    entradas: Dict = field(default_factory=dict)
+
+    def como_dict(self) -> Dict:
+        return {'accion': self.accion, 'motivos': self.motivos, 'entradas': self.entradas}
+
+
+def cambios_desde_construccion(snapshot: Optional[Dict], estadisticas: Dict) -> Optional[int]:
+    """
+    Filas insertadas + actualizadas + eliminadas desde el snapshot.
+    None si no hay snapshot; si los contadores se reiniciaron (reset de
+    estadísticas) se toman los actuales completos.
+    """
+    if snapshot is None:
+        return None
+    cambios = 0
+    for campo in ('insertados', 'actualizados', 'eliminados'):
+        actual = estadisticas.get(campo) or 0
+        previo = snapshot.get(f'{campo}_al_construir') or 0
+        cambios += actual - previo if actual >= previo else actual
+    return cambios
+
+
+def decidir(snapshot: Optional[Dict], estadisticas: Dict, recall: Optional[float],
+            forzar: bool = False, umbral_cambios: float = UMBRAL_CAMBIOS,
+            umbral_recall: float = UMBRAL_RECALL) -> DecisionReindexado:
+    """Aplica los umbrales (función pura, sin acceso a BD)"""
+
+    cambios = cambios_desde_construccion(snapshot, estadisticas)
+    base = (snapshot or {}).get('filas_al_construir') or estadisticas.get('filas_vivas') or 0
+    fraccion = (cambios / max(base, 1)) if cambios is not None else None
+
+    entradas = {
+        'filas_vivas': estadisticas.get('filas_vivas'),
+        'filas_al_construir': (snapshot or {}).get('filas_al_construir'),
+        'construido_at': (snapshot or {}).get('construido_at'),
+        'cambios_desde_construccion': cambios,
+        'fraccion_cambios': round(fraccion, 4) if fraccion is not None else None,
+        'recall_muestreado': recall,
+        'umbral_cambios': umbral_cambios,
+        'umbral_recall': umbral_recall
+    }
+
+    motivos = []
+    if forzar:
+        motivos.append('forzado (FORCE_REINDEX)')
+    if fraccion is not None and fraccion >= umbral_cambios:
+        motivos.append(f'cambios {fraccion:.1%} >= {umbral_cambios:.0%}')
+    if recall is not None and recall < umbral_recall:
+        motivos.append(f'recall@{K_RECALL} {recall:.1%} < {umbral_recall:.0%}')
+
+    if motivos:
+        return DecisionReindexado(ACCION_RECONSTRUIR, motivos, entradas)
+
+    if snapshot is None:
+        motivos.append('sin snapshot previo: se registra la línea base')
+    else:
+        motivos.append('cambios y recall dentro de umbrales')
+    return DecisionReindexado(ACCION_ANALYZE, motivos, entradas)
+
+
+def recall_contra_exactos(backend, filas: List[Dict], k: int = K_RECALL,
+                          concurrencia: int = 4) -> Optional[float]:
+    """
+    Recall@k medio del backend (búsqueda con índice) frente a los vecinos
+    exactos de vecinos_exactos_muestra_chunks. None si el corpus tiene k
+    filas o menos (el recall sería trivialmente 1).
+    """
+    from vectores import decodificar_vector
+
+    filas = [f for f in filas if len(f.get('vecinos') or []) >= k]
+    if not filas:
+        return None
+
+    def consultar(fila: Dict) -> float:
+        esperados = set(fila['vecinos'][:k])
+        vecinos = backend.buscar(decodificar_vector(fila['embedding']), k)
+        return len(esperados & set(vecinos[:k])) / len(esperados)
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        recalls = list(executor.map(consultar, filas))
+    return round(sum(recalls) / len(recalls), 4)
+
+
+def _rpc_no_desplegada(error: Exception) -> bool:
+    mensaje = str(error)
+    return 'PGRST202' in mensaje or 'Could not find the function' in mensaje
+
+
+class PoliticaReindexado:
+    """Evalúa la política y ejecuta la reconstrucción cuando corresponde"""
+
+    def __init__(self, supabase_client, tabla: str = 'chunks_documentos',
+                 indice: str = 'hnsw_chunks_documentos', dsn: Optional[str] = None):
+        self.supabase = supabase_client
+        self.tabla = tabla
+        self.indice = indice
+        self.dsn = dsn if dsn is not None else os.getenv('DATABASE_URL')
+
+    # ============================================
+    # ENTRADAS
+    # ============================================
+
+    def estadisticas_tabla(self) -> Dict:
+        result = self.supabase.rpc('estadisticas_cambios_tabla', {'p_tabla': self.tabla}).execute()
+        filas = result.data or []
+        return filas[0] if filas else {}
+
+    def snapshot(self) -> Optional[Dict]:
+        result = self.supabase.table('estado_indices_vectoriales')\
+            .select('*')\
+            .eq('indice', self.indice)\
+            .limit(1)\
+            .execute()
+        return result.data[0] if result.data else None
+
+    def recall_muestreado(self, consultas: int = CONSULTAS_RECALL) -> Optional[float]:
+        if consultas <= 0:
+            return None
+        from benchmark_retrieval import BackendRPC
+
+        try:
+            result = self.supabase.rpc('vecinos_exactos_muestra_chunks', {
+                'p_consultas': consultas,
+                'p_k': K_RECALL
+            }).execute()
+        except Exception as e:
+            if _rpc_no_desplegada(e):
+                print("   ⚠️ RPC vecinos_exactos_muestra_chunks no desplegada: recall no medido")
+                return None
+            raise
+        return recall_contra_exactos(BackendRPC(self.supabase), result.data or [])
+
+    def evaluar(self, forzar: bool = False) -> DecisionReindexado:
+        print("\n🧭 POLÍTICA DE REINDEXADO")
+        print("=" * 60)
+
+        try:
+            estadisticas = self.estadisticas_tabla()
+            snapshot = self.snapshot()
+        except Exception as e:
+            print(f"   ⚠️ Sin estadísticas de cambios ({str(e)[:80]}) - se asume sin deriva")
+            estadisticas, snapshot = {}, None
+
+        try:
+            recall = self.recall_muestreado()
+        except Exception as e:
+            print(f"   ⚠️ No se pudo medir recall: {str(e)[:80]}")
+            recall = None
+
+        decision = decidir(snapshot, estadisticas, recall, forzar=forzar)
+
+        entradas = decision.entradas
+        if entradas['fraccion_cambios'] is not None:
+            print(f"   Cambios desde construcción: {entradas['cambios_desde_construccion']:,} "
+                  f"({entradas['fraccion_cambios']:.1%})")
+        if recall is not None:
+            print(f"   Recall@{K_RECALL} muestreado: {recall:.1%}")
+        icono = "🔧" if decision.accion == ACCION_RECONSTRUIR else "📊"
+        print(f"   {icono} Decisión: {decision.accion} ({'; '.join(decision.motivos)})")
+
+        # Primera ejecución: la línea base es el estado actual
+        if snapshot is None and decision.accion == ACCION_ANALYZE and estadisticas:
+            try:
+                self.registrar_construccion(estadisticas, recall, {'linea_base': True})
+            except Exception as e:
+                print(f"   ⚠️ No se pudo registrar línea base: {str(e)[:80]}")
+
+        return decision
+
+    # ============================================
+    # ACCIONES
+    # ============================================
+
+    def reconstruir(self, respaldo_rpc: Callable[[], Dict]) -> Dict:
+        """REINDEX CONCURRENTLY vía DSN o, sin DSN, la RPC bloqueante"""
+        if self.dsn:
+            resultado = self._reindexar_concurrente()
+        else:
+            print("   💡 Sin DATABASE_URL: reconstrucción vía RPC (bloquea escrituras)")
+            resultado = respaldo_rpc()
+            resultado['modo'] = 'rpc'
+
+        if resultado.get('success'):
+            try:
+                self.registrar_construccion(self.estadisticas_tabla(), None, {'modo': resultado.get('modo')})
+            except Exception as e:
+                print(f"   ⚠️ No se pudo registrar snapshot del índice: {e}")
+        return resultado
+
+    def _reindexar_concurrente(self) -> Dict:
+        from benchmark_retrieval import conectar_postgres
+
+        print("   🔧 REINDEX INDEX CONCURRENTLY (sin bloquear escrituras)...")
+        inicio = datetime.now()
+        try:
+            conexion = conectar_postgres(self.dsn)
+            with conexion.cursor() as cursor:
+                cursor.execute(
+                    "select indexname from pg_indexes "
+                    "where schemaname = 'public' and tablename = %s and indexdef ilike %s",
+                    (self.tabla, '%using hnsw%')
+                )
+                indices = [fila[0] for fila in cursor.fetchall()]
+                for nombre in indices:
+                    cursor.execute(f'reindex index concurrently public."{nombre}"')
+                    print(f"   ✅ {nombre} reconstruido")
+            conexion.close()
+        except Exception as e:
+            print(f"   ⚠️ Error en REINDEX CONCURRENTLY: {e}")
+            return {'success': False, 'modo': 'concurrente', 'error': str(e)}
+
+        if not indices:
+            print(f"   ⚠️ No hay índices HNSW en {self.tabla}")
+        return {
+            'success': bool(indices),
+            'modo': 'concurrente',
+            'indices': indices,
+            'segundos': round((datetime.now() - inicio).total_seconds(), 1)
+        }
+
+    def registrar_construccion(self, estadisticas: Dict, recall: Optional[float], metadata: Dict):
+        self.supabase.table('estado_indices_vectoriales').upsert({
+            'indice': self.indice,
+            'tabla': self.tabla,
+            'filas_al_construir': estadisticas.get('filas_vivas') or 0,
+            'insertados_al_construir': estadisticas.get('insertados') or 0,
+            'actualizados_al_construir': estadisticas.get('actualizados') or 0,
+            'eliminados_al_construir': estadisticas.get('eliminados') or 0,
+            'recall_al_construir': recall,
+            'construido_at': datetime.now().isoformat(),
+            'metadata': metadata
+        }, on_conflict='indice').execute()
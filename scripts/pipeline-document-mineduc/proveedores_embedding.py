@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Proveedores de embeddings intercambiables: OpenAI o modelo local ONNX (CPU)
+
+generar_embedding_con_cache (fase3) y MLOpsPipeline estaban atados a
+OpenAI. Este módulo define una interfaz mínima (`embeber(textos)` en lotes)
+con dos backends:
+
+- 'openai': API de embeddings (text-embedding-3-*), lotes de
+  EMBEDDING_LOTE textos por request
+- 'onnx': modelo sentence-embedding exportado a ONNX (p. ej.
+  multilingual-e5-small) ejecutado con onnxruntime en CPU: lotes ordenados
+  por largo (menos padding), mean pooling con máscara y normalización L2,
+  hilos configurables. Sin red ni cuota: útil para benchmarks offline,
+  experimentos de re-embebido y contenido masivo de bajo valor (anexos)
+
+obtener_proveedor() mantiene una instancia por (proveedor, modelo): el
+modelo ONNX se carga una sola vez por proceso y queda caliente para todos
+los hilos. La clave del caché de embeddings incluye proveedor y modelo.
+
+Variables de entorno:
+- EMBEDDING_PROVEEDOR=openai|onnx
+- EMBEDDING_LOTE=64 (textos por request a OpenAI)
+- ONNX_MODELO_DIR (directorio con model.onnx y tokenizer.json)
+- ONNX_MODELO_NOMBRE (nombre para el caché; por defecto el del directorio)
+- ONNX_HILOS=4 (intra_op_num_threads)
+- ONNX_LOTE=32
+- ONNX_MAX_TOKENS=512
+- ONNX_PREFIJO (p. ej. 'passage: ' para modelos e5)
+
+Dependencias opcionales (backend onnx): pip install onnxruntime tokenizers
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from matryoshka import DIMENSIONES_MODELO
+from planificador_embeddings import PlanificadorEmbeddings
+
+PROVEEDOR = os.getenv('EMBEDDING_PROVEEDOR', 'openai')
+EMBEDDING_LOTE = int(os.getenv('EMBEDDING_LOTE', '64'))
+ONNX_MODELO_DIR = os.getenv('ONNX_MODELO_DIR')
+ONNX_HILOS = int(os.getenv('ONNX_HILOS', '4'))
+ONNX_LOTE = int(os.getenv('ONNX_LOTE', '32'))
+ONNX_MAX_TOKENS = int(os.getenv('ONNX_MAX_TOKENS', '512'))
+ONNX_PREFIJO = os.getenv('ONNX_PREFIJO', '')
+
+# USD por millón de tokens
+COSTOS_OPENAI = {
+    'text-embedding-3-large': 0.13,
+    'text-embedding-3-small': 0.02
+}
+
+
+@dataclass
+class ResultadoEmbedding:
+    """Vectores en el orden de los textos, tokens por texto y costo total"""
+    vectores: List[List[float]] = field(default_factory=list)
+    tokens: List[int] = field(default_factory=list)
+    costo_usd: float = 0.0
+
+
+class ProveedorEmbedding(ABC):
+    """Interfaz común: subclases implementan _embeber_lote"""
+
+    nombre = 'base'
+
+    def __init__(self, modelo: str, dimensiones: int, lote: int):
+        self.modelo = modelo
+        self.dimensiones = dimensiones
+        self.lote = lote
+
+    def embeber(self, textos: List[str]) -> ResultadoEmbedding:
+        resultado = ResultadoEmbedding()
+        for inicio in range(0, len(textos), self.lote):
+            vectores, tokens, costo = self._embeber_lote(textos[inicio:inicio + self.lote])
+            resultado.vectores.extend(vectores)
+            resultado.tokens.extend(tokens)
+            resultado.costo_usd += costo
+        return resultado
+
+    @abstractmethod
+    def _embeber_lote(self, textos: List[str]) -> Tuple[List[List[float]], List[int], float]:
+        """(vectores, tokens por texto, costo USD) de un lote de hasta self.lote textos"""
+
+
+# ============================================
+# OPENAI
+# ============================================
+
+class ProveedorOpenAI(ProveedorEmbedding):
+    """API de OpenAI al tamaño nativo del modelo (Matryoshka deriva el resto)"""
+
+    nombre = 'openai'
+
+    def __init__(self, modelo: str = 'text-embedding-3-large', cliente=None, lote: int = EMBEDDING_LOTE,
+                 planificador: Optional[PlanificadorEmbeddings] = None):
+        super().__init__(modelo, DIMENSIONES_MODELO.get(modelo, 1536), lote)
+        if cliente is None:
+            from openai import OpenAI
+            cliente = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self._cliente_base = cliente
+        self.cliente = cliente
+        self.costo_por_millon = COSTOS_OPENAI.get(modelo, 0.13)
+        # Con planificador: lotes por tokens contados antes de enviar y ritmo TPM/RPM
+        self.planificador = planificador
+
+    @property
+    def planificador(self) -> Optional[PlanificadorEmbeddings]:
+        return self._planificador
+
+    @planificador.setter
+    def planificador(self, planificador: Optional[PlanificadorEmbeddings]):
+        # El planificador ya reintenta los 429 según los headers de reset: sin
+        # los reintentos del SDK, que duplicarían la espera y las requests
+        self._planificador = planificador
+        self.cliente = (self._cliente_base.with_options(max_retries=0)
+                        if planificador is not None else self._cliente_base)
+
+    def embeber(self, textos: List[str]) -> ResultadoEmbedding:
+        if self.planificador is None:
+            return super().embeber(textos)
+
+        conteos = [self.planificador.contar(t) for t in textos]
+        resultado = ResultadoEmbedding(tokens=conteos)
+        for inicio, fin in self.planificador.particionar(conteos, self.lote):
+            lote = textos[inicio:fin]
+            resp = self.planificador.ejecutar(
+                lambda: self.cliente.embeddings.create(model=self.modelo, input=lote),
+                sum(conteos[inicio:fin])
+            )
+            resultado.vectores.extend(d.embedding for d in sorted(resp.data, key=lambda d: d.index))
+            resultado.costo_usd += (resp.usage.total_tokens / 1_000_000) * self.costo_por_millon
+        return resultado
+
+    def _embeber_lote(self, textos: List[str]) -> Tuple[List[List[float]], List[int], float]:
+        resp = self.cliente.embeddings.create(model=self.modelo, input=textos)
+        datos = sorted(resp.data, key=lambda d: d.index)
+        total = resp.usage.total_tokens
+
+        # La API solo informa el total del lote: se reparte por largo de texto
+        largos = [max(len(t), 1) for t in textos]
+        tokens = [round(total * largo / sum(largos)) for largo in largos]
+        return [d.embedding for d in datos], tokens, (total / 1_000_000) * self.costo_por_millon
+
+
+# ============================================
+# ONNX LOCAL (CPU)
+# ============================================
+
+class ProveedorONNX(ProveedorEmbedding):
+    """Modelo sentence-embedding ONNX con onnxruntime (sin red, costo cero)"""
+
+    nombre = 'onnx'
+
+    def __init__(self, directorio: str, modelo: Optional[str] = None, hilos: int = ONNX_HILOS,
+                 lote: int = ONNX_LOTE, max_tokens: int = ONNX_MAX_TOKENS, prefijo: str = ONNX_PREFIJO):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError("Backend onnx requiere: pip install onnxruntime tokenizers")
+
+        opciones = onnxruntime.SessionOptions()
+        opciones.intra_op_num_threads = hilos
+        opciones.inter_op_num_threads = 1
+        self.sesion = onnxruntime.InferenceSession(
+            os.path.join(directorio, 'model.onnx'), opciones, providers=['CPUExecutionProvider']
+        )
+        self.entradas = {e.name for e in self.sesion.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(directorio, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.enable_padding()
+        self.prefijo = prefijo
+        # La sesión de onnxruntime admite run() concurrente; el tokenizer no
+        self._lock_tokenizer = threading.Lock()
+
+        modelo = modelo or os.getenv('ONNX_MODELO_NOMBRE') or os.path.basename(os.path.normpath(directorio))
+        super().__init__(modelo, 0, lote)
+        self.dimensiones = len(self._embeber_lote(['calentamiento'])[0][0])
+
+    @staticmethod
+    def agrupar(salida: np.ndarray, mascara: np.ndarray) -> np.ndarray:
+        """Mean pooling con máscara + L2 (salidas ya agrupadas solo se normalizan)"""
+        if salida.ndim == 3:
+            pesos = mascara[..., None].astype(np.float32)
+            salida = (salida * pesos).sum(axis=1) / np.maximum(pesos.sum(axis=1), 1e-9)
+        normas = np.linalg.norm(salida, axis=1, keepdims=True)
+        return salida / np.maximum(normas, 1e-12)
+
+    def embeber(self, textos: List[str]) -> ResultadoEmbedding:
+        # Lotes de largo similar: menos padding por lote
+        orden = sorted(range(len(textos)), key=lambda i: len(textos[i]))
+        ordenado = super().embeber([textos[i] for i in orden])
+
+        resultado = ResultadoEmbedding(vectores=[None] * len(textos), tokens=[0] * len(textos))
+        for posicion, i in enumerate(orden):
+            resultado.vectores[i] = ordenado.vectores[posicion]
+            resultado.tokens[i] = ordenado.tokens[posicion]
+        return resultado
+
+    def _embeber_lote(self, textos: List[str]) -> Tuple[List[List[float]], List[int], float]:
+        with self._lock_tokenizer:
+            codificados = self.tokenizer.encode_batch([self.prefijo + t for t in textos])
+        ids = np.array([c.ids for c in codificados], dtype=np.int64)
+        mascara = np.array([c.attention_mask for c in codificados], dtype=np.int64)
+
+        feed = {'input_ids': ids, 'attention_mask': mascara}
+        if 'token_type_ids' in self.entradas:
+            feed['token_type_ids'] = np.zeros_like(ids)
+        salida = self.sesion.run(None, {k: v for k, v in feed.items() if k in self.entradas})[0]
+
+        vectores = self.agrupar(np.asarray(salida, dtype=np.float32), mascara)
+        return vectores.tolist(), mascara.sum(axis=1).astype(int).tolist(), 0.0
+
+
+# ============================================
+# INSTANCIAS COMPARTIDAS
+# ============================================
+
+_INSTANCIAS: Dict[Tuple[str, Optional[str]], ProveedorEmbedding] = {}
+_LOCK_INSTANCIAS = threading.Lock()
+
+
+def obtener_proveedor(nombre: Optional[str] = None, modelo: Optional[str] = None) -> ProveedorEmbedding:
+    """Instancia única por (proveedor, modelo): el modelo ONNX se carga una vez"""
+    nombre = nombre or PROVEEDOR
+    clave = (nombre, modelo)
+    with _LOCK_INSTANCIAS:
+        if clave not in _INSTANCIAS:
+            if nombre == 'openai':
+                _INSTANCIAS[clave] = ProveedorOpenAI(modelo or 'text-embedding-3-large')
+            elif nombre == 'onnx':
+                if not ONNX_MODELO_DIR:
+                    raise ValueError("EMBEDDING_PROVEEDOR=onnx requiere ONNX_MODELO_DIR")
+                _INSTANCIAS[clave] = ProveedorONNX(ONNX_MODELO_DIR, modelo)
+            else:
+                raise ValueError(f"Proveedor de embeddings desconocido: {nombre} (usar 'openai' u 'onnx')")
+        return _INSTANCIAS[clave]
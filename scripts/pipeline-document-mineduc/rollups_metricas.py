@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Rollups incrementales por hora y día de las métricas del pipeline
+
+fase6 releía todas las filas de metricas_pipeline_rag de los últimos 30
+días en cada ejecución (promedio histórico y líneas base de regresiones).
+Con este módulo:
+
+1. RollupsMetricas.acumular(): fase6 suma la ejecución recién insertada a
+   metricas_pipeline_rollups (una fila por hora y otra por día) vía la RPC
+   acumular_rollup_metricas, idempotente por id de la fila
+2. SketchCuantiles: histograma logarítmico con error relativo acotado
+   (ERROR_RELATIVO) que se fusiona sumando buckets; guarda las métricas por
+   ejecución (s/doc, tokens/doc, costo/doc, latencias) y las duraciones de
+   los spans de trazas.py
+3. consultar() / promedio_historico() / lineas_base(): leen solo los
+   rollups diarios, así las comparaciones históricas son O(días) y no
+   O(ejecuciones)
+
+Mientras los rollups no cubran todas las ejecuciones de la ventana
+(migración no aplicada o historial previo sin backfill) fase6 vuelve a
+leer las filas crudas. deploy-and-migrate.yml corre el backfill tras las
+migraciones.
+
+Uso (backfill de filas existentes):
+    python scripts/pipeline-document-mineduc/rollups_metricas.py [--dias 90]
+
+Variables de entorno:
+    METRICAS_ROLLUPS: usar rollups en fase6 (default: true)
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119012_rollups_metricas_pipeline.sql
+"""
+
+import argparse
+import math
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from anomalias_metricas import MIN_EJECUCIONES, LineaBase, ewma, extraer_metricas
+
+ROLLUPS_HABILITADOS = os.getenv('METRICAS_ROLLUPS', 'true').lower() == 'true'
+
+ERROR_RELATIVO = 0.01
+GAMMA = (1 + ERROR_RELATIVO) / (1 - ERROR_RELATIVO)
+_LOG_GAMMA = math.log(GAMMA)
+
+COLUMNAS_ROLLUP = (
+    'periodo, ejecuciones, documentos_monitoreados, documentos_procesados, chunks_validados, '
+    'errores_criticos, tokens, costo_usd, duracion_total_s, metricas_ejecucion, latencias'
+)
+
+
+# ============================================
+# SKETCH DE CUANTILES
+# ============================================
+
+def _extremo(funcion, a: Optional[float], b: Optional[float]) -> Optional[float]:
+    valores = [v for v in (a, b) if v is not None]
+    return funcion(valores) if valores else None
+
+
+class SketchCuantiles:
+    """Histograma de buckets logarítmicos: cuantiles con error relativo ≤ ERROR_RELATIVO"""
+
+    def __init__(self, n: int = 0, suma: float = 0.0, minimo: Optional[float] = None,
+                 maximo: Optional[float] = None, ceros: int = 0, buckets: Optional[Dict[int, int]] = None):
+        self.n = n
+        self.suma = suma
+        self.minimo = minimo
+        self.maximo = maximo
+        self.ceros = ceros
+        self.buckets: Dict[int, int] = dict(buckets or {})
+
+    @staticmethod
+    def indice(valor: float) -> int:
+        return math.ceil(math.log(valor) / _LOG_GAMMA)
+
+    @staticmethod
+    def representante(indice: int) -> float:
+        return 2 * GAMMA ** indice / (GAMMA + 1)
+
+    def agregar(self, valor: float, veces: int = 1) -> 'SketchCuantiles':
+        self.n += veces
+        self.suma += valor * veces
+        self.minimo = valor if self.minimo is None else min(self.minimo, valor)
+        self.maximo = valor if self.maximo is None else max(self.maximo, valor)
+        if valor <= 0:
+            self.ceros += veces
+        else:
+            i = self.indice(valor)
+            self.buckets[i] = self.buckets.get(i, 0) + veces
+        return self
+
+    def fusionar(self, otro: 'SketchCuantiles') -> 'SketchCuantiles':
+        """Misma operación que fusionar_sketch() en SQL"""
+        self.n += otro.n
+        self.suma += otro.suma
+        self.minimo = _extremo(min, self.minimo, otro.minimo)
+        self.maximo = _extremo(max, self.maximo, otro.maximo)
+        self.ceros += otro.ceros
+        for i, cantidad in otro.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + cantidad
+        return self
+
+    def _valores(self) -> List[tuple]:
+        """[(valor representativo, cantidad)] en orden creciente"""
+        valores = [(0.0, self.ceros)] if self.ceros else []
+        return valores + [(self.representante(i), self.buckets[i]) for i in sorted(self.buckets)]
+
+    @staticmethod
+    def _cuantil_ponderado(pares: List[tuple], q: float) -> float:
+        total = sum(c for _, c in pares)
+        rango = q * (total - 1)
+        acumulado = 0
+        for valor, cantidad in pares:
+            acumulado += cantidad
+            if acumulado > rango:
+                return valor
+        return pares[-1][0]
+
+    def cuantil(self, q: float) -> float:
+        if self.n == 0:
+            return 0.0
+        valor = self._cuantil_ponderado(self._valores(), q)
+        return min(max(valor, self.minimo), self.maximo)
+
+    def mad(self, centro: Optional[float] = None) -> float:
+        """Desviación absoluta mediana aproximada desde los buckets"""
+        if self.n == 0:
+            return 0.0
+        centro = self.cuantil(0.5) if centro is None else centro
+        desvios = sorted((abs(valor - centro), cantidad) for valor, cantidad in self._valores())
+        return self._cuantil_ponderado(desvios, 0.5)
+
+    @property
+    def media(self) -> float:
+        return self.suma / self.n if self.n else 0.0
+
+    def a_dict(self) -> Dict:
+        return {'n': self.n, 'suma': self.suma, 'min': self.minimo, 'max': self.maximo,
+                'ceros': self.ceros, 'buckets': {str(i): c for i, c in self.buckets.items()}}
+
+    @classmethod
+    def desde_dict(cls, datos: Optional[Dict]) -> 'SketchCuantiles':
+        datos = datos or {}
+        return cls(n=int(datos.get('n') or 0), suma=float(datos.get('suma') or 0.0),
+                   minimo=datos.get('min'), maximo=datos.get('max'), ceros=int(datos.get('ceros') or 0),
+                   buckets={int(i): int(c) for i, c in (datos.get('buckets') or {}).items()})
+
+
+def sketches(valores: Dict[str, float]) -> Dict[str, Dict]:
+    """{métrica: valor} de una ejecución → {métrica: sketch de un elemento}"""
+    return {metrica: SketchCuantiles().agregar(valor).a_dict() for metrica, valor in valores.items()}
+
+
+def fusionar_sketches(sketches_por_periodo: Iterable[Dict[str, Dict]]) -> Dict[str, SketchCuantiles]:
+    fusionados: Dict[str, SketchCuantiles] = {}
+    for por_clave in sketches_por_periodo:
+        for clave, datos in (por_clave or {}).items():
+            fusionados.setdefault(clave, SketchCuantiles()).fusionar(SketchCuantiles.desde_dict(datos))
+    return fusionados
+
+
+def sketches_desde_eventos(eventos: List[Dict], fases: Optional[Dict[str, str]] = None) -> Dict[str, Dict]:
+    """
+    Duraciones (ms) de los spans de trazas.py: `documento.<fase>` para el span
+    raíz de cada documento y `etapa.<nombre>` para el resto
+    """
+    fases = fases or {}
+    por_clave: Dict[str, SketchCuantiles] = {}
+    for evento in eventos:
+        if evento.get('ph') != 'X':
+            continue
+        if evento['name'] == 'documento':
+            clave = f"documento.{fases.get(evento.get('cat'), evento.get('cat'))}"
+        else:
+            clave = f"etapa.{evento['name']}"
+        por_clave.setdefault(clave, SketchCuantiles()).agregar(evento.get('dur', 0) / 1000.0)
+    return {clave: sketch.a_dict() for clave, sketch in por_clave.items()}
+
+
+# ============================================
+# ROLLUPS EN SUPABASE
+# ============================================
+
+def _rpc_no_desplegada(error: Exception) -> bool:
+    mensaje = str(error)
+    return 'PGRST202' in mensaje or 'Could not find the function' in mensaje
+
+
+def contadores_desde_fila(fila: Dict) -> Dict:
+    """Sumas de una fila de metricas_pipeline_rag para el rollup"""
+    metadata = fila.get('metadata') or {}
+    return {
+        'documentos_monitoreados': int(fila.get('documentos_monitoreados') or 0),
+        'documentos_procesados': int(fila.get('documentos_procesados') or 0),
+        'chunks_validados': int(fila.get('chunks_validados') or 0),
+        'errores_criticos': int(fila.get('errores_criticos') or 0),
+        'tokens': int(metadata.get('total_tokens') or 0),
+        'costo_usd': metadata.get('total_cost_usd') or 0.0,
+        'duracion_total_s': (metadata.get('rendimiento') or {}).get('duracion_total_s') or 0.0,
+    }
+
+
+class RollupsMetricas:
+    """Escritura incremental y consulta de metricas_pipeline_rollups"""
+
+    def __init__(self, supabase_client):
+        self.supabase = supabase_client
+        self._rpc_disponible = ROLLUPS_HABILITADOS
+
+    def acumular(self, fila: Dict, latencias: Optional[Dict[str, Dict]] = None,
+                 momento: Optional[str] = None) -> bool:
+        """
+        Suma una fila ya insertada en metricas_pipeline_rag (necesita su id).
+        False si la fila ya estaba acumulada o la RPC no está desplegada.
+        """
+        if not self._rpc_disponible or not fila.get('id'):
+            return False
+        try:
+            result = self.supabase.rpc('acumular_rollup_metricas', {
+                'p_metrica_id': fila['id'],
+                'p_momento': momento or fila.get('created_at') or datetime.now(timezone.utc).isoformat(),
+                'p_contadores': contadores_desde_fila(fila),
+                'p_metricas_ejecucion': sketches(extraer_metricas(fila)),
+                'p_latencias': latencias or {}
+            }).execute()
+            return bool(result.data)
+        except Exception as e:
+            if not _rpc_no_desplegada(e):
+                raise
+            print("   ⚠️ RPC acumular_rollup_metricas no desplegada - sin rollups")
+            self._rpc_disponible = False
+            return False
+
+    def consultar(self, desde: datetime, granularidad: str = 'dia',
+                  hasta: Optional[datetime] = None) -> List[Dict]:
+        """Rollups de [desde, hasta) en orden cronológico; [] si la tabla no existe"""
+        if not ROLLUPS_HABILITADOS:
+            return []
+        query = self.supabase.table('metricas_pipeline_rollups')\
+            .select(COLUMNAS_ROLLUP)\
+            .eq('granularidad', granularidad)\
+            .gte('periodo', desde.isoformat())
+        if hasta is not None:
+            query = query.lt('periodo', hasta.isoformat())
+        try:
+            return query.order('periodo').execute().data or []
+        except Exception as e:
+            print(f"   ⚠️ No se pudieron leer rollups: {e}")
+            return []
+
+    def consultar_dias(self, dias: int) -> List[Dict]:
+        return self.consultar(inicio_ventana(dias), 'dia')
+
+    def contar_ejecuciones(self, desde: datetime) -> Optional[int]:
+        """Filas de metricas_pipeline_rag desde `desde`; None si no se pudieron contar"""
+        try:
+            result = self.supabase.table('metricas_pipeline_rag')\
+                .select('id', count='exact')\
+                .gte('created_at', desde.isoformat())\
+                .limit(1)\
+                .execute()
+            return result.count
+        except Exception as e:
+            print(f"   ⚠️ No se pudieron contar ejecuciones: {e}")
+            return None
+
+    def consultar_ventana(self, dias: int) -> List[Dict]:
+        """
+        Rollups diarios de los últimos N días solo si cubren todas las
+        ejecuciones de la ventana; [] (filas crudas) mientras falte backfill
+        """
+        desde = inicio_ventana(dias)
+        rollups = self.consultar(desde, 'dia')
+        if rollups and not cubre_ventana(rollups, desde, self.contar_ejecuciones(desde)):
+            print("   ⚠️ Rollups incompletos para la ventana (¿falta backfill?) - usando filas crudas")
+            return []
+        return rollups
+
+
+def inicio_ventana(dias: int) -> datetime:
+    """Medianoche UTC de hace N días (inicio de la ventana de rollups diarios)"""
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=dias)
+
+
+def cubre_ventana(rollups: List[Dict], desde: datetime, ejecuciones_crudas: Optional[int] = None) -> bool:
+    """
+    True si los rollups representan la ventana completa: al menos
+    MIN_EJECUCIONES y tantas ejecuciones como filas crudas. Sin conteo de
+    filas crudas, el rollup más antiguo debe ser el del inicio de la ventana.
+    """
+    ejecuciones = sum(r['ejecuciones'] for r in rollups)
+    if ejecuciones < MIN_EJECUCIONES:
+        return False
+    if ejecuciones_crudas is not None:
+        return ejecuciones >= ejecuciones_crudas
+    return min(datetime.fromisoformat(r['periodo']) for r in rollups) <= desde
+
+
+def promedio_historico(rollups: List[Dict]) -> Optional[Dict]:
+    """Mismo formato que HistoricalAnalyzer.obtener_promedio_historico"""
+    ejecuciones = sum(r['ejecuciones'] for r in rollups)
+    if not ejecuciones:
+        return None
+    return {
+        'runs_totales': ejecuciones,
+        'docs_procesados_promedio': sum(r['documentos_procesados'] for r in rollups) / ejecuciones,
+        'chunks_promedio': sum(r['chunks_validados'] for r in rollups) / ejecuciones,
+        'errores_promedio': sum(r['errores_criticos'] for r in rollups) / ejecuciones
+    }
+
+
+def lineas_base(rollups: List[Dict]) -> Dict[str, LineaBase]:
+    """
+    Línea base por métrica desde rollups en orden cronológico: mediana y MAD
+    del sketch fusionado, EWMA sobre la media de cada periodo
+    """
+    fusionados = fusionar_sketches(r.get('metricas_ejecucion') for r in rollups)
+    bases = {}
+    for metrica, sketch in fusionados.items():
+        if sketch.n < MIN_EJECUCIONES:
+            continue
+        centro = sketch.cuantil(0.5)
+        periodos = [SketchCuantiles.desde_dict((r.get('metricas_ejecucion') or {}).get(metrica)) for r in rollups]
+        tendencia = ewma(p.media for p in periodos if p.n)
+        bases[metrica] = LineaBase(metrica, sketch.n, centro, sketch.mad(centro), tendencia)
+    return bases
+
+
+# ============================================
+# BACKFILL
+# ============================================
+
+def backfill(supabase_client, dias: int, lote: int = 500) -> Dict:
+    """Acumula las filas de metricas_pipeline_rag de los últimos N días (idempotente)"""
+    rollups = RollupsMetricas(supabase_client)
+    desde = (datetime.now(timezone.utc) - timedelta(days=dias)).isoformat()
+    leidas = acumuladas = 0
+    ultimo = None
+    while True:
+        query = supabase_client.table('metricas_pipeline_rag')\
+            .select('id, created_at, documentos_monitoreados, documentos_procesados, '
+                    'chunks_validados, errores_criticos, metadata')\
+            .gte('created_at', desde)
+        if ultimo is not None:
+            # Cursor (created_at, id): filas con el mismo created_at en el borde de página no se saltan
+            creado, fila_id = ultimo
+            query = query.or_(f'created_at.gt."{creado}",and(created_at.eq."{creado}",id.gt.{fila_id})')
+        pagina = query.order('created_at').order('id').limit(lote).execute().data or []
+        for fila in pagina:
+            acumuladas += rollups.acumular(fila)
+        leidas += len(pagina)
+        if not rollups._rpc_disponible or len(pagina) < lote:
+            break
+        ultimo = (pagina[-1]['created_at'], pagina[-1]['id'])
+    return {'timestamp': datetime.now().isoformat(), 'filas_leidas': leidas, 'filas_acumuladas': acumuladas}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill de rollups de metricas_pipeline_rag')
+    parser.add_argument('--dias', type=int, default=90)
+    parser.add_argument('--lote', type=int, default=500)
+    args = parser.parse_args()
+
+    try:
+        from dotenv import load_dotenv
+        from supabase import create_client
+    except ImportError:
+        print("❌ Instalar: pip install supabase python-dotenv")
+        sys.exit(1)
+
+    load_dotenv('.env.local')
+    supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+
+    print("\n" + "=" * 60)
+    print("🧮 BACKFILL DE ROLLUPS (metricas_pipeline_rag)")
+    print("=" * 60)
+
+    resumen = backfill(supabase, args.dias, args.lote)
+    print(f"\n✅ {resumen['filas_acumuladas']:,} de {resumen['filas_leidas']:,} filas acumuladas")
+
+
+if __name__ == '__main__':
+    main()
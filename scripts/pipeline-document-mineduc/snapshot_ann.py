@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Snapshot local de embeddings + índice ANN (IVF en NumPy) sin red
+
+Las evaluaciones y trabajos batch llaman a buscar_chunks_similares una vez
+por consulta. Este módulo exporta los chunks buscables a un directorio
+compacto y permite consultarlos localmente con la misma forma de respuesta
+que la RPC, a miles de consultas por segundo:
+
+    snapshot/
+      manifest.json     dimensiones, formato, filas, parámetros IVF
+      vectores.npy      float16 o int8 (memory-mapped al abrir)
+      escalas.npy       escala por fila (solo int8)
+      filas.jsonl       chunk_id, documento_id, titulo_documento, seccion,
+                        metadata, columnas filtrables y (opcional) contenido
+      ivf_centroides.npy / ivf_orden.npy / ivf_offsets.npy
+
+El índice IVF agrupa los vectores con k-means esférico; una consulta
+recorre solo las nprobe listas más cercanas y reordena los candidatos con
+el producto punto exacto sobre los vectores decodificados.
+
+Uso:
+    python scripts/pipeline-document-mineduc/snapshot_ann.py \\
+        --salida snapshot_chunks [--formato float16|int8] [--lists N] [--sin-contenido]
+
+    from snapshot_ann import SnapshotANN
+    snapshot = SnapshotANN.abrir('snapshot_chunks')
+    snapshot.buscar(query_embedding, match_threshold=0.7, match_count=10)
+
+Variables de entorno:
+- SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY (exportación)
+- EMBEDDING_DIMENSIONS=1536
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    print("❌ Instalar: pip install numpy")
+    sys.exit(1)
+
+from vectores import cuantizar_int8, decodificar_vector, decuantizar_int8, normalizar_filas
+
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))
+TAMANO_PAGINA = 500
+FORMATOS = ('float16', 'int8')
+NPROBE_DEFECTO = 8
+ITERACIONES_KMEANS = 10
+MUESTRA_KMEANS = 50_000
+LOTE_CONSULTAS = 256
+
+VERSION_FORMATO = 1
+
+
+# ============================================
+# ÍNDICE IVF
+# ============================================
+
+def lists_por_defecto(filas: int) -> int:
+    """~sqrt(n) listas: equilibra costo de centroides y de candidatos"""
+    return max(1, min(filas, int(round(np.sqrt(filas)))))
+
+
+def kmeans_esferico(matriz: np.ndarray, lists: int, iteraciones: int = ITERACIONES_KMEANS,
+                    semilla: int = 42) -> np.ndarray:
+    """Centroides normalizados (coseno) entrenados sobre una muestra"""
+    rng = np.random.default_rng(semilla)
+    muestra = matriz
+    if len(matriz) > MUESTRA_KMEANS:
+        muestra = matriz[rng.choice(len(matriz), MUESTRA_KMEANS, replace=False)]
+    muestra = np.asarray(muestra, dtype=np.float32)
+
+    centroides = muestra[rng.choice(len(muestra), lists, replace=False)].copy()
+    for _ in range(iteraciones):
+        asignacion = asignar_listas(muestra, centroides)
+        sumas = np.zeros_like(centroides)
+        np.add.at(sumas, asignacion, muestra)
+        vacios = ~sumas.any(axis=1)
+        # Listas vacías: se re-siembran con puntos al azar
+        sumas[vacios] = muestra[rng.choice(len(muestra), int(vacios.sum()))]
+        centroides = normalizar_filas(sumas)
+    return centroides
+
+
+def asignar_listas(matriz: np.ndarray, centroides: np.ndarray) -> np.ndarray:
+    asignacion = np.empty(len(matriz), dtype=np.int32)
+    for inicio in range(0, len(matriz), LOTE_CONSULTAS * 16):
+        bloque = np.asarray(matriz[inicio:inicio + LOTE_CONSULTAS * 16], dtype=np.float32)
+        asignacion[inicio:inicio + len(bloque)] = (bloque @ centroides.T).argmax(axis=1)
+    return asignacion
+
+
+class IndiceIVF:
+    """Listas invertidas: filas ordenadas por lista + offsets de cada lista"""
+
+    def __init__(self, centroides: np.ndarray, orden: np.ndarray, offsets: np.ndarray):
+        self.centroides = centroides
+        self.orden = orden
+        self.offsets = offsets
+
+    @property
+    def lists(self) -> int:
+        return len(self.centroides)
+
+    @classmethod
+    def construir(cls, matriz: np.ndarray, lists: int, semilla: int = 42) -> 'IndiceIVF':
+        lists = max(1, min(lists, len(matriz)))
+        centroides = kmeans_esferico(matriz, lists, semilla=semilla)
+        asignacion = asignar_listas(matriz, centroides)
+        orden = np.argsort(asignacion, kind='stable').astype(np.int64)
+        offsets = np.zeros(lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(asignacion, minlength=lists), out=offsets[1:])
+        return cls(centroides, orden, offsets)
+
+    def candidatos(self, consulta: np.ndarray, nprobe: int) -> np.ndarray:
+        """Filas de las nprobe listas más cercanas a la consulta"""
+        nprobe = min(nprobe, self.lists)
+        similitudes = self.centroides @ consulta
+        listas = np.argpartition(-similitudes, nprobe - 1)[:nprobe]
+        return np.concatenate([self.orden[self.offsets[l]:self.offsets[l + 1]] for l in listas])
+
+    def guardar(self, directorio: str):
+        np.save(os.path.join(directorio, 'ivf_centroides.npy'), self.centroides)
+        np.save(os.path.join(directorio, 'ivf_orden.npy'), self.orden)
+        np.save(os.path.join(directorio, 'ivf_offsets.npy'), self.offsets)
+
+    @classmethod
+    def cargar(cls, directorio: str) -> 'IndiceIVF':
+        return cls(
+            np.load(os.path.join(directorio, 'ivf_centroides.npy')),
+            np.load(os.path.join(directorio, 'ivf_orden.npy'), mmap_mode='r'),
+            np.load(os.path.join(directorio, 'ivf_offsets.npy'))
+        )
+
+
+# ============================================
+# SNAPSHOT
+# ============================================
+
+class SnapshotANN:
+    """Vectores cuantizados + filas + índice IVF, consultables sin red"""
+
+    def __init__(self, vectores: np.ndarray, escalas: Optional[np.ndarray], filas: List[Dict],
+                 indice: IndiceIVF, manifest: Dict):
+        self.vectores = vectores
+        self.escalas = escalas
+        self.filas = filas
+        self.indice = indice
+        self.manifest = manifest
+
+    def __len__(self) -> int:
+        return len(self.filas)
+
+    @property
+    def ids(self) -> List[str]:
+        return [fila['chunk_id'] for fila in self.filas]
+
+    # --------------------------------------------
+    # Construcción / persistencia
+    # --------------------------------------------
+
+    @classmethod
+    def construir(cls, matriz: np.ndarray, filas: List[Dict], formato: str = 'float16',
+                  lists: Optional[int] = None, semilla: int = 42) -> 'SnapshotANN':
+        """matriz (n, d) float32 normalizada, alineada con filas"""
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato desconocido: {formato} (usar {', '.join(FORMATOS)})")
+        if len(matriz) != len(filas):
+            raise ValueError("matriz y filas deben tener el mismo largo")
+
+        if formato == 'int8':
+            vectores, escalas = cuantizar_int8(matriz)
+        else:
+            vectores, escalas = matriz.astype(np.float16), None
+
+        lists = lists or lists_por_defecto(len(matriz))
+        indice = IndiceIVF.construir(matriz, lists, semilla=semilla)
+        manifest = {
+            'version': VERSION_FORMATO,
+            'creado_at': datetime.now().isoformat(),
+            'filas': len(filas),
+            'dimensiones': int(matriz.shape[1]),
+            'formato': formato,
+            'lists': indice.lists
+        }
+        return cls(vectores, escalas, filas, indice, manifest)
+
+    def guardar(self, directorio: str):
+        os.makedirs(directorio, exist_ok=True)
+        np.save(os.path.join(directorio, 'vectores.npy'), self.vectores)
+        if self.escalas is not None:
+            np.save(os.path.join(directorio, 'escalas.npy'), self.escalas)
+        with open(os.path.join(directorio, 'filas.jsonl'), 'w', encoding='utf-8') as f:
+            for fila in self.filas:
+                f.write(json.dumps(fila, ensure_ascii=False) + '\n')
+        self.indice.guardar(directorio)
+        with open(os.path.join(directorio, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def abrir(cls, directorio: str) -> 'SnapshotANN':
+        """Abre un snapshot con los vectores memory-mapped (no se cargan a RAM)"""
+        with open(os.path.join(directorio, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        vectores = np.load(os.path.join(directorio, 'vectores.npy'), mmap_mode='r')
+        escalas = None
+        if manifest['formato'] == 'int8':
+            escalas = np.load(os.path.join(directorio, 'escalas.npy'))
+        with open(os.path.join(directorio, 'filas.jsonl'), encoding='utf-8') as f:
+            filas = [json.loads(linea) for linea in f]
+        return cls(vectores, escalas, filas, IndiceIVF.cargar(directorio), manifest)
+
+    # --------------------------------------------
+    # Consulta
+    # --------------------------------------------
+
+    def decodificar(self, indices: np.ndarray) -> np.ndarray:
+        """Vectores float32 de las filas indicadas"""
+        if self.escalas is not None:
+            return decuantizar_int8(self.vectores[indices], self.escalas[indices])
+        return self.vectores[indices].astype(np.float32)
+
+    def matriz(self) -> np.ndarray:
+        """Corpus completo decodificado (para fuerza bruta / detección de duplicados)"""
+        return self.decodificar(np.arange(len(self)))
+
+    def buscar_indices(self, consulta: np.ndarray, k: int, nprobe: int = NPROBE_DEFECTO,
+                       permitidas: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k aproximado: (índices de fila, similitudes) ordenados"""
+        consulta = np.asarray(consulta, dtype=np.float32)
+        norma = np.linalg.norm(consulta)
+        if norma > 0:
+            consulta = consulta / norma
+
+        candidatos = self.indice.candidatos(consulta, nprobe)
+        if permitidas is not None:
+            candidatos = candidatos[permitidas[candidatos]]
+        if len(candidatos) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Orden ascendente: lecturas secuenciales sobre el memmap
+        candidatos = np.sort(candidatos)
+        similitudes = self.decodificar(candidatos) @ consulta
+        k = min(k, len(candidatos))
+        top = np.argpartition(-similitudes, k - 1)[:k]
+        top = top[np.argsort(-similitudes[top])]
+        return candidatos[top], similitudes[top]
+
+    def _permitidas(self, p_dominio_mbe: Optional[str], p_tipo_contenido: Optional[str]) -> Optional[np.ndarray]:
+        if p_dominio_mbe is None and p_tipo_contenido is None:
+            return None
+        return np.array([
+            (p_dominio_mbe is None or p_dominio_mbe.lower() in (fila.get('dominios_mbe') or []))
+            and (p_tipo_contenido is None or fila.get('tipo_contenido') == p_tipo_contenido)
+            for fila in self.filas
+        ], dtype=bool)
+
+    def buscar(self, query_embedding, match_threshold: float = 0.7, match_count: int = 10,
+               p_dominio_mbe: Optional[str] = None, p_tipo_contenido: Optional[str] = None,
+               nprobe: int = NPROBE_DEFECTO) -> List[Dict]:
+        """Misma forma de respuesta que la RPC buscar_chunks_similares"""
+        indices, similitudes = self.buscar_indices(
+            np.asarray(query_embedding, dtype=np.float32), match_count, nprobe,
+            self._permitidas(p_dominio_mbe, p_tipo_contenido)
+        )
+        resultados = []
+        for i, similitud in zip(indices, similitudes):
+            if similitud <= match_threshold:
+                continue
+            fila = self.filas[i]
+            resultados.append({
+                'chunk_id': fila['chunk_id'],
+                'documento_id': fila['documento_id'],
+                'titulo_documento': fila.get('titulo_documento'),
+                'contenido': fila.get('contenido'),
+                'seccion': fila.get('seccion'),
+                'similarity': float(similitud),
+                'metadata': fila.get('metadata') or {}
+            })
+        return resultados
+
+
+class BackendLocal:
+    """Backend de benchmark_retrieval sobre un snapshot local"""
+
+    nombre = 'local'
+
+    def __init__(self, snapshot: SnapshotANN, nprobe: int = NPROBE_DEFECTO):
+        self.snapshot = snapshot
+        self.nprobe = nprobe
+        self._ids = snapshot.ids
+
+    def buscar(self, vector: np.ndarray, k: int) -> List[str]:
+        indices, _ = self.snapshot.buscar_indices(vector, k, self.nprobe)
+        return [self._ids[i] for i in indices]
+
+
+# ============================================
+# EXPORTACIÓN DESDE SUPABASE
+# ============================================
+
+def exportar_desde_supabase(supabase, formato: str = 'float16', lists: Optional[int] = None,
+                            incluir_contenido: bool = True,
+                            dimensiones: int = EMBEDDING_DIMENSIONS) -> SnapshotANN:
+    """Chunks buscables (es_version_actual) leídos por keyset sobre id"""
+    columnas = ['id', 'documento_id', 'seccion', 'metadata', 'embedding',
+                'tipo_contenido', 'dominios_mbe',
+                'documentos_oficiales!inner(titulo, es_version_actual)']
+    if incluir_contenido:
+        columnas.insert(2, 'contenido')
+
+    filas, paginas = [], []
+    ultimo = None
+    while True:
+        query = supabase.table('chunks_documentos')\
+            .select(', '.join(columnas))\
+            .eq('documentos_oficiales.es_version_actual', True)\
+            .not_.is_('embedding', 'null')
+        if ultimo is not None:
+            query = query.gt('id', ultimo)
+        pagina = query.order('id').limit(TAMANO_PAGINA).execute().data or []
+
+        bloque = np.zeros((len(pagina), dimensiones), dtype=np.float32)
+        usadas = 0
+        for chunk in pagina:
+            vector = decodificar_vector(chunk.get('embedding'))
+            if vector is None or vector.shape[0] != dimensiones:
+                continue
+            bloque[usadas] = vector
+            usadas += 1
+            filas.append({
+                'chunk_id': chunk['id'],
+                'documento_id': chunk['documento_id'],
+                'titulo_documento': (chunk.get('documentos_oficiales') or {}).get('titulo'),
+                'contenido': chunk.get('contenido'),
+                'seccion': chunk.get('seccion'),
+                'tipo_contenido': chunk.get('tipo_contenido'),
+                'dominios_mbe': chunk.get('dominios_mbe') or [],
+                'metadata': chunk.get('metadata') or {}
+            })
+        paginas.append(normalizar_filas(bloque[:usadas]))
+        print(f"   📥 {len(filas):,} chunks leídos")
+
+        if len(pagina) < TAMANO_PAGINA:
+            break
+        ultimo = pagina[-1]['id']
+
+    matriz = np.concatenate(paginas) if paginas else np.zeros((0, dimensiones), dtype=np.float32)
+    return SnapshotANN.construir(matriz, filas, formato=formato, lists=lists)
+
+
+def evaluar_snapshot(snapshot: SnapshotANN, consultas: int = 200, k: int = 10,
+                     nprobe: int = NPROBE_DEFECTO, semilla: int = 42) -> Dict:
+    """Recall@k del IVF contra fuerza bruta sobre los mismos vectores y QPS local"""
+    from benchmark_retrieval import top_k_exacto
+
+    matriz = snapshot.matriz()
+    rng = np.random.default_rng(semilla)
+    muestra = rng.choice(len(matriz), size=min(consultas, len(matriz)), replace=False)
+    exactos = top_k_exacto(matriz, matriz[muestra], k)
+
+    inicio = time.perf_counter()
+    aproximados = [snapshot.buscar_indices(matriz[i], k, nprobe)[0] for i in muestra]
+    duracion = time.perf_counter() - inicio
+
+    recalls = [len(set(a.tolist()) & set(e.tolist())) / len(e) for a, e in zip(aproximados, exactos)]
+    return {
+        'consultas': len(muestra),
+        'k': k,
+        'nprobe': nprobe,
+        'recall_at_k': round(float(np.mean(recalls)), 4),
+        'consultas_por_segundo': round(len(muestra) / duracion, 1) if duracion > 0 else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snapshot local de embeddings + índice IVF')
+    parser.add_argument('--salida', default='snapshot_chunks')
+    parser.add_argument('--formato', choices=FORMATOS, default='float16')
+    parser.add_argument('--lists', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, default=NPROBE_DEFECTO)
+    parser.add_argument('--sin-contenido', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        from dotenv import load_dotenv
+        from supabase import create_client
+    except ImportError:
+        print("❌ Instalar: pip install supabase python-dotenv")
+        sys.exit(1)
+
+    load_dotenv('.env.local')
+    supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+
+    print("\n" + "=" * 60)
+    print("💾 SNAPSHOT LOCAL DE EMBEDDINGS (IVF NumPy)")
+    print("=" * 60)
+
+    inicio = time.perf_counter()
+    snapshot = exportar_desde_supabase(supabase, formato=args.formato, lists=args.lists,
+                                       incluir_contenido=not args.sin_contenido)
+    if not len(snapshot):
+        print("   ⚠️ Sin embeddings que exportar")
+        sys.exit(1)
+    snapshot.guardar(args.salida)
+
+    print(f"\n   ✅ {len(snapshot):,} chunks → {args.salida}/ ({args.formato}, "
+          f"{snapshot.vectores.nbytes / 1e6:.1f} MB, {snapshot.indice.lists} listas) "
+          f"en {time.perf_counter() - inicio:.1f}s")
+
+    evaluacion = evaluar_snapshot(snapshot, nprobe=args.nprobe)
+    print(f"   🎯 Recall@{evaluacion['k']} local (nprobe={args.nprobe}): {evaluacion['recall_at_k']:.2%} | "
+          f"{evaluacion['consultas_por_segundo']} consultas/s")
+
+
+if __name__ == '__main__':
+    main()
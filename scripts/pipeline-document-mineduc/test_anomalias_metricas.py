@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Tests para la detección de regresiones con líneas base robustas"""
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from anomalias_metricas import (
+    calcular_linea_base, detectar_regresiones, extraer_metricas, mad, mediana
+)
+
+
+def fila(documentos, duracion_s=None, tokens_por_doc=None, costo_por_doc=None, vision_p50=None):
+    rendimiento = {'duracion_total_s': duracion_s,
+                   'latencia_documento_ms': {'transformacion': {'n': documentos, 'p50_ms': 4000.0}}}
+    if vision_p50 is not None:
+        rendimiento['latencia_etapa_ms'] = {'vision': {'n': 3 * documentos, 'p50_ms': vision_p50}}
+    return {'documentos_procesados': documentos,
+            'metadata': {'rendimiento': rendimiento,
+                         'kpis': {'tokens_por_doc': tokens_por_doc, 'costo_por_doc': costo_por_doc}}}
+
+
+HISTORIAL_TOKENS = [5000, 5200, 4900, 5100, 5050, 4950, 5150]
+
+
+class TestAnomaliasMetricas(unittest.TestCase):
+
+    def test_estadisticos_robustos(self):
+        valores = [10, 11, 12, 13, 1000]
+        self.assertEqual(mediana(valores), 12)
+        self.assertEqual(mad(valores), 1)
+        self.assertEqual(mediana([1, 2, 3, 4]), 2.5)
+        self.assertIsNone(calcular_linea_base('x', [1, 2, 3, 4]))
+
+    def test_extraer_metricas(self):
+        m = extraer_metricas(fila(10, duracion_s=300, tokens_por_doc=5000, costo_por_doc=0.02, vision_p50=900.0))
+        self.assertEqual(m, {
+            's_por_doc': 4.0, 'latencia_doc_transformacion_ms': 4000.0, 'latencia_vision_ms': 900.0,
+            'tokens_por_doc': 5000, 'costo_por_doc_usd': 0.02
+        })
+        # Sin documentos no hay métricas por documento
+        self.assertEqual(extraer_metricas(fila(0, duracion_s=300, tokens_por_doc=5000)), {})
+        # Filas anteriores sin kpis.tokens_por_doc usan metadata.total_tokens
+        self.assertEqual(extraer_metricas({'documentos_procesados': 4, 'metadata': {'total_tokens': 800}}),
+                         {'tokens_por_doc': 200.0})
+
+    def test_pocos_documentos_sin_metricas_de_tiempo(self):
+        # Una ejecución tranquila (2 documentos, 20 min de costo fijo) no es una regresión
+        historial = [extraer_metricas(fila(40, duracion_s=1800)) for _ in range(6)]
+        tranquila = extraer_metricas(fila(2, duracion_s=1200, tokens_por_doc=5000, vision_p50=900.0))
+        self.assertEqual(tranquila, {'tokens_por_doc': 5000, 'latencia_vision_ms': 900.0})
+        self.assertEqual(detectar_regresiones(tranquila, historial), [])
+        # El tiempo por documento no depende de la duración total de la ejecución
+        self.assertEqual(extraer_metricas(fila(40, duracion_s=9000))['s_por_doc'], 4.0)
+
+    def test_tokens_duplicados_es_critico(self):
+        historial = [{'tokens_por_doc': t} for t in HISTORIAL_TOKENS]
+        alertas = detectar_regresiones({'tokens_por_doc': 10400}, historial)
+        self.assertEqual(len(alertas), 1)
+        self.assertEqual(alertas[0]['tipo'], 'regresion_tokens_por_doc')
+        self.assertEqual(alertas[0]['severidad'], 'critical')
+        self.assertEqual(alertas[0]['mediana'], 5050)
+
+    def test_ruido_y_mejoras_no_alertan(self):
+        historial = [{'tokens_por_doc': t} for t in HISTORIAL_TOKENS]
+        self.assertEqual(detectar_regresiones({'tokens_por_doc': 5300}, historial), [])
+        self.assertEqual(detectar_regresiones({'tokens_por_doc': 2000}, historial), [])
+        # Historial insuficiente
+        self.assertEqual(detectar_regresiones({'tokens_por_doc': 99999}, historial[:4]), [])
+
+    def test_mad_cero_y_variacion_minima(self):
+        historial = [{'costo_por_doc_usd': 0.010} for _ in range(6)]
+        # +20% supera el piso de escala (5% de la mediana) pero no la variación mínima del costo
+        self.assertEqual(detectar_regresiones({'costo_por_doc_usd': 0.012}, historial), [])
+        alertas = detectar_regresiones({'costo_por_doc_usd': 0.012}, historial,
+                                       variaciones={'costo_por_doc_usd': 0.10})
+        self.assertEqual([a['severidad'] for a in alertas], ['warning'])
+
+    def test_latencia_de_vision_con_tendencia(self):
+        # La EWMA sigue un aumento gradual: el último valor no es regresión respecto de ella
+        historial = [{'latencia_vision_ms': v} for v in (800, 820, 790, 810, 1500, 1600, 1700)]
+        self.assertEqual(detectar_regresiones({'latencia_vision_ms': 1550}, historial), [])
+        alertas = detectar_regresiones({'latencia_vision_ms': 3000},
+                                       [{'latencia_vision_ms': v} for v in (800, 820, 790, 810, 805)])
+        self.assertEqual(alertas[0]['tipo'], 'regresion_latencia_vision_ms')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Tests para el benchmark de recuperación"""
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmark_retrieval import ejecutar_benchmark, percentiles_ms, top_k_exacto
+from vectores import normalizar_filas
+
+
+class BackendFalso:
+    """Búsqueda exacta, opcionalmente perdiendo el último vecino"""
+
+    nombre = 'falso'
+
+    def __init__(self, ids, matriz, perder_ultimo=False):
+        self.ids = ids
+        self.matriz = matriz
+        self.perder_ultimo = perder_ultimo
+
+    def buscar(self, vector, k):
+        orden = np.argsort(-(self.matriz @ vector))[:k]
+        vecinos = [self.ids[i] for i in orden]
+        return vecinos[:-1] if self.perder_ultimo else vecinos
+
+
+class TestBenchmarkRetrieval(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.matriz = normalizar_filas(rng.standard_normal((500, 32)).astype(np.float32))
+        self.ids = [f'c{i}' for i in range(500)]
+
+    def test_top_k_exacto_ordenado(self):
+        consultas = self.matriz[:300]
+        top = top_k_exacto(self.matriz, consultas, 5)
+        self.assertEqual(top.shape, (300, 5))
+        # Cada consulta es su propio vecino más cercano
+        self.assertEqual(top[:, 0].tolist(), list(range(300)))
+        similitudes = np.take_along_axis(consultas @ self.matriz.T, top, axis=1)
+        self.assertTrue((np.diff(similitudes, axis=1) <= 1e-6).all())
+
+    def test_recall_perfecto_y_parcial(self):
+        exacto = ejecutar_benchmark(BackendFalso(self.ids, self.matriz), self.ids, self.matriz,
+                                    consultas=20, k=10, concurrencia=3)
+        self.assertEqual(exacto['recall_at_k'], 1.0)
+        self.assertEqual(exacto['consultas'], 20)
+
+        parcial = ejecutar_benchmark(BackendFalso(self.ids, self.matriz, perder_ultimo=True),
+                                     self.ids, self.matriz, consultas=20, k=10)
+        self.assertAlmostEqual(parcial['recall_at_k'], 0.9)
+
+    def test_percentiles(self):
+        latencias = percentiles_ms([i / 1000 for i in range(1, 101)])
+        self.assertAlmostEqual(latencias['p50'], 50.5)
+        self.assertGreater(latencias['p99'], latencias['p95'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Tests para detección de casi duplicados (MinHash + LSH)"""
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from casi_duplicados import IndiceLSH, firma_minhash, similitud_estimada
+
+MANUAL = "\n\n".join(
+    f"## Sección {i}\n\nEl docente planifica la enseñanza del módulo {i} considerando "
+    f"los objetivos de aprendizaje, la evaluación formativa y la reflexión pedagógica "
+    f"sobre la práctica número {i} en el aula."
+    for i in range(60)
+)
+
+
+class TestMinHash(unittest.TestCase):
+
+    def test_firma_determinista(self):
+        self.assertTrue((firma_minhash(MANUAL) == firma_minhash(MANUAL)).all())
+
+    def test_reedicion_casi_identica(self):
+        edicion_2025 = "# Manual Portafolio 2025\n\n" + MANUAL
+        edicion_2026 = "# Manual Portafolio 2026\n\n" + MANUAL
+        sim = similitud_estimada(firma_minhash(edicion_2025), firma_minhash(edicion_2026))
+        self.assertGreater(sim, 0.85)
+
+    def test_documentos_distintos(self):
+        otro = "Rúbrica de evaluación con niveles insatisfactorio básico competente destacado " * 20
+        sim = similitud_estimada(firma_minhash(MANUAL), firma_minhash(otro))
+        self.assertLess(sim, 0.2)
+
+    def test_indice_lsh(self):
+        indice = IndiceLSH()
+        indice.agregar('base', firma_minhash("# Manual 2025\n\n" + MANUAL))
+        indice.agregar('otro', firma_minhash("texto completamente diferente " * 50))
+
+        clave, sim = indice.mas_similar(firma_minhash("# Manual 2026\n\n" + MANUAL))
+        self.assertEqual(clave, 'base')
+        self.assertGreater(sim, 0.85)
+
+
+if __name__ == '__main__':
+    unittest.main()
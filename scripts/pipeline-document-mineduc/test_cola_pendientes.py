@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Tests para la cola de pendientes con paginación keyset"""
+import unittest
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from cola_pendientes import ColaPendientes, procesar_en_pool
+
+
+class QueryFalsa:
+    """Imita el builder de postgrest sobre una lista ordenada de filas"""
+
+    def __init__(self, filas, consultas):
+        self.filas = filas
+        self.consultas = consultas
+        self.cursor = None
+        self.limite = None
+
+    def select(self, columnas):
+        self.columnas = columnas
+        return self
+
+    def eq(self, columna, valor):
+        self.filas = [f for f in self.filas if f.get(columna) == valor]
+        return self
+
+    def or_(self, filtro):
+        self.cursor = filtro
+        return self
+
+    def order(self, columna):
+        return self
+
+    def limit(self, n):
+        self.limite = n
+        return self
+
+    def execute(self):
+        self.consultas.append(self.cursor)
+        filas = self.filas
+        if self.cursor:
+            creado = self.cursor.split('"')[1]
+            doc_id = self.cursor.rsplit('id.gt.', 1)[1].rstrip(')')
+            filas = [f for f in filas if (f['created_at'], f['id']) > (creado, doc_id)]
+        resultado = type('R', (), {})()
+        resultado.data = filas[:self.limite]
+        return resultado
+
+
+class SupabaseFalso:
+    def __init__(self, filas):
+        self.filas = filas
+        self.consultas = []
+
+    def table(self, nombre):
+        return QueryFalsa(list(self.filas), self.consultas)
+
+
+def _filas(n):
+    # Varias filas comparten created_at para ejercitar el desempate por id
+    return [
+        {'id': f'doc-{i:03d}', 'created_at': f'2025-01-{1 + i // 3:02d}T00:00:00', 'etapa_actual': 'descargado'}
+        for i in range(n)
+    ]
+
+
+class TestColaPendientes(unittest.TestCase):
+
+    def test_drena_backlog_completo(self):
+        supabase = SupabaseFalso(_filas(23))
+        cola = ColaPendientes(supabase, 'id', lambda q: q.eq('etapa_actual', 'descargado'),
+                              tamano_pagina=5, presupuesto_segundos=None, max_documentos=None)
+
+        ids = [doc['id'] for doc in cola]
+        self.assertEqual(ids, [f'doc-{i:03d}' for i in range(23)])
+        self.assertEqual(cola.paginas, 5)
+        self.assertIsNone(supabase.consultas[0])
+
+    def test_respeta_max_documentos(self):
+        cola = ColaPendientes(SupabaseFalso(_filas(23)), 'id', lambda q: q,
+                              tamano_pagina=5, presupuesto_segundos=None, max_documentos=7)
+        self.assertEqual(len(list(cola)), 7)
+
+    def test_presupuesto_agotado(self):
+        cola = ColaPendientes(SupabaseFalso(_filas(23)), 'id', lambda q: q,
+                              tamano_pagina=5, presupuesto_segundos=0, max_documentos=None)
+        self.assertEqual(list(cola), [])
+        self.assertTrue(cola.agotado_por_presupuesto)
+
+    def test_presupuesto_agotado_a_mitad_de_pagina(self):
+        cola = ColaPendientes(SupabaseFalso(_filas(23)), 'id', lambda q: q,
+                              tamano_pagina=5, presupuesto_segundos=60, max_documentos=None)
+        entregados = []
+        for doc in cola:
+            entregados.append(doc['id'])
+            if len(entregados) == 2:
+                cola.inicio -= 61  # el tiempo se agota durante el segundo documento
+        self.assertEqual(entregados, ['doc-000', 'doc-001'])
+        self.assertEqual(cola.entregados, 2)
+        self.assertTrue(cola.agotado_por_presupuesto)
+
+
+class TestProcesarEnPool(unittest.TestCase):
+
+    def test_acota_tareas_en_vuelo(self):
+        consumidos = []
+        en_vuelo = []
+        lock = threading.Lock()
+
+        def items():
+            for i in range(20):
+                consumidos.append(i)
+                yield i
+
+        def trabajo(i):
+            with lock:
+                en_vuelo.append(len(consumidos) - len(resultados))
+            time.sleep(0.005)
+            return i * 2
+
+        resultados = []
+        for item, futuro in procesar_en_pool(items(), trabajo, max_workers=2, max_en_vuelo=3):
+            resultados.append(futuro.result())
+
+        self.assertEqual(sorted(resultados), [i * 2 for i in range(20)])
+        self.assertLessEqual(max(en_vuelo), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Tests para el colector de métricas desde artefactos"""
+import unittest
+import json
+import os
+import sys
+import tempfile
+from argparse import Namespace
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from colector_metricas import calcular_rendimiento, recolectar
+
+
+def escribir(directorio, ruta, contenido):
+    ruta = os.path.join(directorio, ruta)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(contenido, f)
+
+
+def traza(servicio, run_id, spans):
+    """spans: [(nombre, inicio_s, duracion_s)]"""
+    return {
+        'traceEvents': [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': servicio}}] + [
+            {'name': nombre, 'cat': servicio, 'ph': 'X', 'ts': inicio * 1e6, 'dur': duracion * 1e6,
+             'pid': 1, 'tid': 1, 'args': {}}
+            for nombre, inicio, duracion in spans
+        ],
+        'otherData': {'run_id': run_id}
+    }
+
+
+class TestColectorMetricas(unittest.TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        # Estructura de download-artifact: un subdirectorio por artefacto
+        escribir(self.directorio, 'extract-response/monitor_response.json', {'reporte': {'documentos_nuevos': 3}})
+        escribir(self.directorio, 'transform-metrics/transform_metrics.json',
+                 {'total': 10, 'transformed': 8, 'cost_usd': 0.2, 'tiempo_total_segundos': 120})
+        escribir(self.directorio, 'load-metrics/load_metrics.json',
+                 {'loaded': 6, 'tokens': 30000, 'cost_usd': 0.1, 'chunks': {'total_generados': 60}})
+        escribir(self.directorio, 'validation-report/validation_metrics.json',
+                 {'total_chunks': 58, 'calidad_promedio': 0.82})
+        escribir(self.directorio, 'load-metrics/trazas/fase3_load-77-1.trace.json', traza('fase3_load', '77', [
+            ('documento', 200, 10), ('documento', 210, 20), ('embedding', 212, 5), ('documento', 230, 30)
+        ]))
+        escribir(self.directorio, 'transform-metrics/trazas/fase2_transform_multiproveedor-77-1.trace.json',
+                 traza('fase2_transform_multiproveedor', '77', [('documento', 0, 60), ('documento', 60, 60)]))
+        # Otra ejecución: se ignora
+        escribir(self.directorio, 'viejo/fase3_load-76-1.trace.json', traza('fase3_load', '76', [('documento', 0, 999)]))
+
+    def test_contadores_y_rendimiento_desde_artefactos(self):
+        m = recolectar(self.directorio, run_id='77')
+
+        self.assertEqual((m.downloaded, m.transformed, m.loaded), (10, 8, 6))
+        self.assertEqual((m.validated, m.quality, m.tokens, m.chunks), (58, 0.82, 30000, 60))
+        self.assertAlmostEqual(m.cost, 0.3)
+
+        r = m.rendimiento
+        self.assertEqual(r['duracion_total_s'], 260.0)
+        self.assertEqual(r['duracion_por_fase_s'], {'carga': 60.0, 'transformacion': 120.0})
+        self.assertEqual(r['documentos_por_minuto'], round(6 / 260 * 60, 3))
+        self.assertEqual(r['transformacion_documentos_por_minuto'], 4.0)
+        self.assertEqual(r['carga_chunks_por_segundo'], 1.0)
+        self.assertEqual(r['carga_tokens_por_segundo'], 500.0)
+        self.assertEqual(r['costo_por_documento_usd'], 0.05)
+        self.assertEqual(r['latencia_documento_ms']['carga']['p50_ms'], 20000.0)
+        self.assertEqual(r['latencia_documento_ms']['transformacion']['n'], 2)
+        self.assertEqual(r['latencia_etapa_ms'], {'embedding': {'n': 1, 'p50_ms': 5000.0, 'p90_ms': 5000.0, 'p99_ms': 5000.0}})
+
+        args = m.aplicar(Namespace(downloaded=0, workflow_id='77'))
+        self.assertEqual(args.loaded, 6)
+        self.assertIs(args.rendimiento, r)
+
+    def test_runner_reemplaza_fases_separadas(self):
+        escribir(self.directorio, 'runner/pipeline_runner_metrics.json', {
+            'descargados': 0, 'transformados': 4, 'cargados': 4, 'chunks': 40, 'tokens': 900, 'cost_usd': 0.05
+        })
+        m = recolectar(self.directorio, run_id='sin-trazas')
+        self.assertEqual((m.downloaded, m.transformed, m.loaded, m.chunks), (3, 4, 4, 40))
+        self.assertEqual(m.validated, 58)
+
+    def test_sin_datos_queda_en_none(self):
+        r = calcular_rendimiento(Namespace(loaded=0, transformed=0, validated=0, tokens=0, cost=0.0))
+        self.assertIsNone(r['documentos_por_minuto'])
+        self.assertIsNone(r['carga_tokens_por_segundo'])
+        self.assertIsNone(r['costo_por_documento_usd'])
+        self.assertEqual(r['latencia_documento_ms'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
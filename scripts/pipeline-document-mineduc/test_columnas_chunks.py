@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Tests para las columnas tipadas de chunks"""
+import unittest
+import os
+import sys
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from columnas_chunks import BackfillColumnasChunks, columnas_tipadas
+
+
+class TestColumnasTipadas(unittest.TestCase):
+
+    def test_rubrica_con_nivel(self):
+        metadata = {
+            'tipo_documento': 'rubricas_portafolio',
+            'categoria': 'rubrica_evaluacion',
+            'indicador_nombre': 'Indicador 1: Planificación',
+            'nivel_desempeno': 'básico',
+            'nivel_educativo': 'basica_1_6',
+            'dominios_mbe': ['a', 'c']
+        }
+        columnas = columnas_tipadas("Este indicador evalúa el Dominio A del MBE", metadata)
+        self.assertEqual(columnas['dominio_mbe'], 'a')
+        self.assertEqual(columnas['dominios_mbe'], ['a'])
+        self.assertEqual(columnas['tipo_contenido'], 'rubrica_evaluacion')
+        self.assertEqual(columnas['seccion'], 'Indicador 1: Planificación')
+        self.assertEqual(columnas['nivel_desempeno'], 'basico')
+        self.assertEqual(columnas['nivel_educativo'], 'basica_1_6')
+
+    def test_hereda_dominios_del_documento(self):
+        metadata = {'tipo_documento': 'manual', 'categoria': 'manual_portafolio', 'modulo': '2',
+                    'seccion': 'x' * 300, 'dominios_mbe': ['b', 'a']}
+        columnas = columnas_tipadas("Texto sin referencias", metadata)
+        self.assertIsNone(columnas['dominio_mbe'])
+        self.assertEqual(columnas['dominios_mbe'], ['a', 'b'])
+        self.assertEqual(columnas['modulo'], 2)
+        self.assertEqual(len(columnas['seccion']), 200)
+
+    def test_metadata_vacia(self):
+        columnas = columnas_tipadas('', None)
+        self.assertEqual(columnas['tipo_contenido'], 'desconocido')
+        self.assertEqual(columnas['dominios_mbe'], [])
+        self.assertIsNone(columnas['nivel_desempeno'])
+        self.assertIsNone(columnas['pagina_numero'])
+
+
+class TestBackfillColumnasChunks(unittest.TestCase):
+
+    def _supabase(self, paginas, error_rpc=None):
+        supabase = Mock()
+        query = supabase.table.return_value.select.return_value.is_.return_value
+        query.gt.return_value = query
+        query.order.return_value.limit.return_value.execute.side_effect = [Mock(data=p) for p in paginas]
+        if error_rpc:
+            supabase.rpc.return_value.execute.side_effect = error_rpc
+        else:
+            supabase.rpc.return_value.execute.side_effect = lambda: Mock(data=2)
+        return supabase
+
+    def test_actualiza_en_bloque_por_keyset(self):
+        paginas = [
+            [{'id': '1', 'contenido': 'dominio b', 'metadata': {}}, {'id': '2', 'contenido': '', 'metadata': {}}],
+            [{'id': '3', 'contenido': '', 'metadata': {'categoria': 'x'}}]
+        ]
+        supabase = self._supabase(paginas)
+        resumen = BackfillColumnasChunks(supabase, lote=2).ejecutar()
+
+        self.assertEqual(resumen['chunks_leidos'], 3)
+        self.assertTrue(resumen['via_rpc'])
+        primera = supabase.rpc.call_args_list[0][0][1]['p_filas']
+        self.assertEqual(primera[0]['id'], '1')
+        self.assertEqual(primera[0]['dominio_mbe'], 'b')
+        supabase.table.return_value.select.return_value.is_.return_value.gt.assert_called_with('id', '2')
+
+    def test_fila_a_fila_sin_rpc(self):
+        paginas = [[{'id': '1', 'contenido': '', 'metadata': {}}]]
+        supabase = self._supabase(paginas, error_rpc=Exception("PGRST202 Could not find the function"))
+        resumen = BackfillColumnasChunks(supabase, lote=10).ejecutar()
+
+        self.assertFalse(resumen['via_rpc'])
+        self.assertEqual(resumen['chunks_actualizados'], 1)
+        supabase.table.return_value.update.return_value.eq.assert_called_with('id', '1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Tests para la detección vectorizada de chunks duplicados"""
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from duplicados_chunks import DetectorChunksDuplicados, claves_lsh, clusters_duplicados, pares_similares
+from snapshot_ann import SnapshotANN
+from vectores import decodificar_vector, matriz_float32, normalizar_filas
+
+
+def _corpus(n=300, dim=64, semilla=0):
+    """n vectores aleatorios más dos duplicados ruidosos de los vectores 0 y 1"""
+    rng = np.random.default_rng(semilla)
+    base = rng.standard_normal((n, dim)).astype(np.float32)
+    duplicados = base[[0, 0, 1]] + 0.01 * rng.standard_normal((3, dim)).astype(np.float32)
+    matriz = normalizar_filas(np.vstack([base, duplicados]))
+    ids = [f'c{i}' for i in range(len(matriz))]
+    return ids, matriz
+
+
+class TestVectores(unittest.TestCase):
+
+    def test_decodificar_formatos(self):
+        np.testing.assert_allclose(decodificar_vector('[0.5,-1,2e-3]'), [0.5, -1, 0.002], rtol=1e-6)
+        np.testing.assert_allclose(decodificar_vector([1, 2]), [1, 2])
+        self.assertIsNone(decodificar_vector(None))
+
+    def test_matriz_descarta_dimension_incorrecta(self):
+        matriz, validos = matriz_float32(['[1,2,3]', '[1,2]', None], 3)
+        self.assertEqual(matriz.dtype, np.float32)
+        self.assertEqual(validos.tolist(), [True, False, False])
+
+
+class TestDuplicadosChunks(unittest.TestCase):
+
+    def test_pares_por_lotes(self):
+        _, matriz = _corpus()
+        pares = {(i, j) for i, j, _ in pares_similares(matriz, 0.95, lote=64)}
+        self.assertEqual(pares, {(0, 300), (0, 301), (300, 301), (1, 302)})
+
+    def test_clusters_con_bloqueo_lsh(self):
+        ids, matriz = _corpus()
+        bloques = {}
+        for i, fila in enumerate(claves_lsh(matriz)):
+            for tabla, clave in enumerate(fila):
+                bloques.setdefault(f'{tabla}:{clave}', []).append(i)
+        bloques = {k: np.asarray(v) for k, v in bloques.items()}
+
+        clusters, evaluados = clusters_duplicados(ids, matriz, bloques, 0.95)
+        self.assertIn(['c0', 'c300', 'c301'], clusters)
+        self.assertIn(['c1', 'c302'], clusters)
+        self.assertLess(evaluados, len(ids) * (len(ids) - 1) // 2)
+
+    def test_detector_desde_snapshot_sin_supabase(self):
+        ids, matriz = _corpus()
+        filas = [{'chunk_id': c, 'documento_id': f'd{i % 7}', 'metadata': {'tipo_documento': 'guia'}}
+                 for i, c in enumerate(ids)]
+        directorio = tempfile.mkdtemp()
+        SnapshotANN.construir(matriz, filas, formato='float16', lists=4).guardar(directorio)
+
+        detector = DetectorChunksDuplicados(None, umbral=0.95, dimensiones=64, snapshot=directorio)
+        self.assertEqual(detector.bloqueo, 'lsh')
+        reporte = detector.detectar()
+        self.assertEqual(reporte['chunks_analizados'], len(ids))
+        self.assertEqual(reporte['clusters'], 2)
+        self.assertEqual(reporte['chunks_redundantes'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Tests para embeddings en precisión reducida"""
+import unittest
+import os
+import sys
+from unittest.mock import Mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from embeddings_reducidos import (MigradorEmbeddings, codificar_int8, columnas_cache, comparar_precision,
+                                  decodificar_int8, embedding_de_cache, sentencias_activacion_halfvec,
+                                  serializar_embedding)
+from vectores import normalizar_filas
+
+
+class TestEmbeddingsReducidos(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.matriz = normalizar_filas(rng.standard_normal((400, 64)).astype(np.float32))
+
+    def test_int8_ida_y_vuelta(self):
+        vector = self.matriz[0]
+        columnas = codificar_int8(vector)
+        self.assertTrue(columnas['embedding_int8'].startswith('\\x'))
+        self.assertEqual(len(columnas['embedding_int8']), 2 + 2 * 64)
+        decodificado = decodificar_int8(columnas['embedding_int8'], columnas['embedding_escala'])
+        self.assertLess(np.abs(decodificado - vector).max(), columnas['embedding_escala'])
+
+    def test_columnas_y_lectura_de_cache(self):
+        vector = self.matriz[1].tolist()
+        self.assertEqual(columnas_cache(vector, 'float32'), {'embedding': vector})
+        fila_int8 = {'embedding': None, **columnas_cache(vector, 'int8')}
+        self.assertAlmostEqual(float(np.dot(embedding_de_cache(fila_int8), vector)), 1.0, places=3)
+        self.assertEqual(len(embedding_de_cache({'embedding': '[0.5,0.25]'})), 2)
+        self.assertIsNone(embedding_de_cache({'embedding': None, 'embedding_int8': None}))
+        with self.assertRaises(ValueError):
+            columnas_cache(vector, 'bfloat16')
+
+    def test_serializacion_halfvec(self):
+        vector = self.matriz[2].tolist()
+        self.assertIs(serializar_embedding(vector, 'float32'), vector)
+        texto = serializar_embedding(vector, 'halfvec')
+        valores = np.array(texto[1:-1].split(','), dtype=np.float32)
+        np.testing.assert_allclose(valores.astype(np.float16), np.float16(vector), rtol=1e-3)
+        self.assertLess(len(texto), len(str(vector)) * 0.6)
+        # Embedding reutilizado tal como lo devuelve PostgREST (texto pgvector)
+        self.assertEqual(serializar_embedding('[0.1,0.2]', 'halfvec'), '[0.1,0.2]')
+        self.assertEqual(serializar_embedding(str(vector).replace(' ', ''), 'halfvec'), texto)
+
+    def test_activacion_halfvec_concurrente_y_en_orden(self):
+        sentencias = sentencias_activacion_halfvec(['idx_chunks_embedding'])
+        self.assertEqual(len(sentencias), 3)
+        self.assertTrue(sentencias[0].startswith('create index concurrently if not exists idx_chunks_embedding_half'))
+        self.assertIn("set app.embedding_busqueda = 'halfvec'", sentencias[1])
+        self.assertEqual(sentencias[2], 'drop index concurrently if exists public."idx_chunks_embedding"')
+        # Sin índice float32 que retirar solo se crea el halfvec y se cambia la búsqueda
+        self.assertEqual(len(sentencias_activacion_halfvec([])), 2)
+
+    def test_comparar_precision(self):
+        resultado = comparar_precision(self.matriz, consultas=50, k=10)
+        variantes = resultado['variantes']
+        self.assertEqual(variantes['float32']['recall_at_k'], 1.0)
+        self.assertGreaterEqual(variantes['halfvec']['recall_at_k'], 0.98)
+        self.assertGreaterEqual(variantes['int8']['recall_at_k'], 0.9)
+        self.assertEqual(variantes['halfvec']['bytes_por_vector'] * 2, variantes['float32']['bytes_por_vector'])
+
+    def test_backfill_halfvec_hasta_agotar(self):
+        supabase = Mock()
+        supabase.rpc.return_value.execute.side_effect = [Mock(data=5000), Mock(data=120)]
+        self.assertEqual(MigradorEmbeddings(supabase).backfill_chunks_half(), 5120)
+        self.assertEqual(supabase.rpc.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Tests para las etapas concurrentes del ETL de mlops_pipeline"""
+import unittest
+import os
+import sys
+import threading
+import time
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from etapas_concurrentes import EtapaCola, PipelineEtapas
+
+
+class TestPipelineEtapas(unittest.TestCase):
+
+    def test_errores_saltan_etapas_siguientes(self):
+        vistos = []
+
+        def primera(trabajo):
+            if trabajo['n'] == 2:
+                raise ValueError('falla en primera')
+            trabajo['doble'] = trabajo['n'] * 2
+
+        def segunda(trabajo):
+            vistos.append(trabajo['n'])
+
+        pipeline = PipelineEtapas([EtapaCola('primera', primera, 3), EtapaCola('segunda', segunda, 2)],
+                                  capacidad_cola=1)
+        salida = list(pipeline.ejecutar({'n': n} for n in range(6)))
+
+        self.assertEqual(sorted(t['n'] for t in salida), list(range(6)))
+        fallido = next(t for t in salida if t['n'] == 2)
+        self.assertEqual((fallido['error'], fallido['etapa_error']), ('falla en primera', 'primera'))
+        self.assertNotIn(2, vistos)
+        resumen = pipeline.resumen()
+        self.assertEqual(resumen['primera']['errores'], 1)
+        self.assertEqual(resumen['segunda']['trabajos'], 6)
+        self.assertEqual(pipeline.workers_totales(), 5)
+
+    def test_etapas_se_solapan(self):
+        # Con 4 documentos y dos etapas de 50ms, en serie serían ≥ 400ms
+        pipeline = PipelineEtapas([
+            EtapaCola('red', lambda t: time.sleep(0.05), 2),
+            EtapaCola('cpu', lambda t: time.sleep(0.05), 1),
+        ])
+        inicio = time.monotonic()
+        self.assertEqual(len(list(pipeline.ejecutar({'n': n} for n in range(4)))), 4)
+        self.assertLess(time.monotonic() - inicio, 0.35)
+        self.assertGreaterEqual(pipeline.resumen()['cpu']['ocupado_ms'], 190)
+
+    def test_error_del_origen_se_propaga(self):
+        def origen():
+            yield {'n': 1}
+            raise RuntimeError('paginación falló')
+
+        pipeline = PipelineEtapas([EtapaCola('unica', lambda t: None)])
+        with self.assertRaises(RuntimeError):
+            list(pipeline.ejecutar(origen()))
+
+
+class TestMLOpsETL(unittest.TestCase):
+
+    def test_etl_puntua_texto_en_memoria(self):
+        import mlops_pipeline
+        from mlops_pipeline import MetricasETL, MLOpsPipeline
+
+        pipeline = MLOpsPipeline.__new__(MLOpsPipeline)
+        pipeline.supabase = Mock()
+        pipeline.metricas = MetricasETL()
+        pipeline._lock_metricas = threading.Lock()
+        pipeline._extraer_pdf = lambda url: None if url == 'roto' else b'%PDF'
+        pipeline._transformar_pdf_a_texto = lambda pdf: 'texto legible del documento ' * 40
+        pipeline._generar_embedding_optimizado = lambda texto: ([0.1, 0.2], 50)
+        pipeline._cargar_a_bd = Mock()
+
+        docs = [{'id': f'd{i}', 'titulo': f'Doc {i}', 'url_original': 'roto' if i == 1 else 'ok'}
+                for i in range(3)]
+        with patch.object(mlops_pipeline, 'WORKERS_DESCARGA', 2):
+            resultados = pipeline._fase_etl(docs)
+        pipeline._fase_validacion(resultados)
+
+        self.assertEqual(pipeline.metricas.documentos_procesados, 2)
+        self.assertEqual(pipeline.metricas.documentos_fallidos, 1)
+        self.assertEqual(pipeline.metricas.tokens_usados, 100)
+        self.assertEqual(pipeline._cargar_a_bd.call_count, 2)
+        self.assertEqual(pipeline.metricas.chunks_validados, 2)
+        self.assertGreater(pipeline.metricas.calidad_promedio, 0.7)
+        # La validación ya no relee contenido_texto desde la BD
+        pipeline.supabase.table.assert_not_called()
+        self.assertEqual(set(pipeline.metricas.etapas), {'descargar', 'extraer', 'embeber', 'escribir'})
+        self.assertEqual(pipeline.metricas.etapas['descargar']['errores'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
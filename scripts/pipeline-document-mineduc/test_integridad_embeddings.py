@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Tests para el escáner de integridad de embeddings"""
+import unittest
+from unittest.mock import Mock
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from integridad_embeddings import EscanerIntegridad, analizar_vectores, hashes_invalidos
+
+
+def _unitario(dim, eje=0):
+    v = np.zeros(dim, dtype=np.float32)
+    v[eje] = 1.0
+    return v
+
+
+class TestIntegridadEmbeddings(unittest.TestCase):
+
+    def test_chequeos_vectorizados(self):
+        dim = 4
+        valores = [
+            '[1,0,0,0]',                    # correcto (texto pgvector)
+            [0.5, 0.5, 0.5, 0.5],           # correcto (lista JSON)
+            [1, 0, 0],                      # dimensión incorrecta
+            [float('nan'), 0, 0, 0],        # NaN
+            [0, 0, 0, 0],                   # norma nula
+            [2, 0, 0, 0],                   # deriva de norma
+            None                            # sin embedding
+        ]
+        m = analizar_vectores(valores, dim, tolerancia=0.01)
+        self.assertEqual(np.flatnonzero(m['dimension_incorrecta']).tolist(), [2])
+        self.assertEqual(np.flatnonzero(m['no_finito']).tolist(), [3])
+        self.assertEqual(np.flatnonzero(m['norma_nula']).tolist(), [4])
+        self.assertEqual(np.flatnonzero(m['deriva_norma']).tolist(), [5])
+        self.assertEqual(np.flatnonzero(m['sin_embedding']).tolist(), [6])
+
+    def test_hash_de_contenido(self):
+        contenido = 'El docente reflexiona sobre su práctica'
+        correcto = hashlib.sha256(contenido.encode()).hexdigest()
+        self.assertEqual(hashes_invalidos([contenido, contenido, contenido],
+                                          [correcto, 'otro', None]).tolist(), [False, True, True])
+
+    def test_escaneo_paginado(self):
+        contenido = 'texto'
+        filas = [
+            {'id': f'c{i}', 'contenido': contenido,
+             'chunk_hash': hashlib.sha256(contenido.encode()).hexdigest(),
+             'embedding': _unitario(8, i % 8).tolist()}
+            for i in range(5)
+        ]
+        filas[3]['embedding'] = [0.0] * 8
+
+        supabase = Mock()
+        query = supabase.table.return_value.select.return_value
+        query.order.return_value.limit.return_value.execute.return_value.data = filas[:2]
+        query.gt.return_value.order.return_value.limit.return_value.execute.side_effect = [
+            Mock(data=filas[2:4]), Mock(data=filas[4:])
+        ]
+
+        reporte = EscanerIntegridad(supabase, dimensiones=8, tamano_pagina=2).escanear_chunks()
+        self.assertEqual(reporte['filas'], 5)
+        self.assertEqual(reporte['problemas'], 1)
+        self.assertEqual(reporte['ejemplos'], {'norma_nula': ['c3']})
+
+
+if __name__ == '__main__':
+    unittest.main()
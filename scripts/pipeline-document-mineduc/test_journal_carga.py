@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Tests para el journal de carga reanudable de fase3"""
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from journal_carga import JournalCarga, ProgresoDocumento, grupos, huella_chunks
+
+
+class TestJournalCarga(unittest.TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.supabase = Mock()
+        self.remoto = self.supabase.table.return_value.select.return_value.eq.return_value.limit.return_value
+        self.remoto.execute.return_value = Mock(data=[])
+        self.journal = JournalCarga(self.supabase, self.directorio)
+        self.huella = huella_chunks(['h1', 'h2', 'h3'], 'openai', 'text-embedding-3-large')
+
+    def test_grupos_y_huella(self):
+        self.assertEqual([list(g) for g in grupos(7, 2, 3)], [[2, 3, 4], [5, 6]])
+        self.assertEqual(grupos(4, 4, 3), [])
+        self.assertNotEqual(self.huella, huella_chunks(['h1', 'h2', 'h3'], 'onnx', 'text-embedding-3-large'))
+        self.assertNotEqual(self.huella, huella_chunks(['h1', 'h3', 'h2'], 'openai', 'text-embedding-3-large'))
+
+    def test_reanuda_desde_checkpoint_local(self):
+        self.assertFalse(self.journal.cargar('d1', self.huella, 3).reanudado)
+
+        self.journal.registrar(ProgresoDocumento('d1', self.huella, 3, chunks_escritos=2, tokens=40, costo_usd=0.01))
+        upsert = self.supabase.table.return_value.upsert
+        self.assertEqual(upsert.call_args[1]['on_conflict'], 'documento_id')
+
+        progreso = JournalCarga(self.supabase, self.directorio).cargar('d1', self.huella, 3)
+        self.assertEqual(progreso.chunks_escritos, 2)
+        self.assertEqual(progreso.tokens, 40)
+        # Otro chunking: se empieza de cero
+        self.assertEqual(self.journal.cargar('d1', 'otra', 3).chunks_escritos, 0)
+
+    def test_reanuda_desde_bd_en_otro_runner(self):
+        self.remoto.execute.return_value = Mock(data=[{
+            'huella': self.huella, 'total_chunks': 3, 'chunks_escritos': 1,
+            'chunks_reutilizados': 0, 'tokens': 20, 'costo_usd': '0.005'
+        }])
+        progreso = self.journal.cargar('d2', self.huella, 3)
+        self.assertEqual(progreso.chunks_escritos, 1)
+        self.assertAlmostEqual(progreso.costo_usd, 0.005)
+
+    def test_finalizar_atomico_y_fallback(self):
+        progreso = ProgresoDocumento('d1', self.huella, 3, chunks_escritos=3)
+        self.journal.registrar(progreso)
+        self.assertTrue(self.journal.finalizar(progreso, {'chunks_generados': 3}, 'modelo'))
+        parametros = self.supabase.rpc.call_args[0][1]
+        self.assertEqual(parametros['p_total_chunks'], 3)
+        self.assertFalse(os.path.exists(os.path.join(self.directorio, 'd1.json')))
+
+        self.supabase.rpc.return_value.execute.side_effect = Exception('PGRST202 Could not find the function')
+        self.assertFalse(self.journal.finalizar(progreso, {}, 'modelo'))
+        recorte = self.supabase.table.return_value.delete.return_value.eq.return_value.gte
+        recorte.assert_called_with('chunk_index', 3)
+
+    def test_tabla_no_desplegada_usa_solo_journal_local(self):
+        self.remoto.execute.side_effect = Exception("PGRST205 Could not find the table 'progreso_carga_documentos'")
+        self.assertEqual(self.journal.cargar('d1', self.huella, 3).chunks_escritos, 0)
+        self.journal.registrar(ProgresoDocumento('d1', self.huella, 3, chunks_escritos=2))
+        self.supabase.table.return_value.upsert.assert_not_called()
+        self.assertEqual(self.journal.cargar('d1', self.huella, 3).chunks_escritos, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
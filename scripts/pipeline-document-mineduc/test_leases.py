@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Tests para el reclamo de documentos con leases"""
+import unittest
+from unittest.mock import Mock
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from leases import ColaConLeases
+
+
+def _supabase_con_lotes(lotes):
+    """Mock cuyo rpc('reclamar_documentos') entrega los lotes en orden"""
+    supabase = Mock()
+    restantes = list(lotes)
+    llamadas = []
+
+    def rpc(nombre, params):
+        llamadas.append((nombre, params))
+        respuesta = Mock()
+        if nombre == 'reclamar_documentos':
+            respuesta.execute.return_value.data = restantes.pop(0) if restantes else []
+        else:
+            respuesta.execute.return_value.data = 1
+        return respuesta
+
+    supabase.rpc.side_effect = rpc
+    return supabase, llamadas
+
+
+class TestColaConLeases(unittest.TestCase):
+
+    def _cola(self, supabase, **kwargs):
+        return ColaConLeases(supabase, 'descargado', 'id, titulo', lambda q: q,
+                             owner='runner-a', lote=2, presupuesto_segundos=None,
+                             max_documentos=None, **kwargs)
+
+    def test_reclama_hasta_vaciar(self):
+        supabase, llamadas = _supabase_con_lotes([
+            [{'id': 'd1', 'titulo': 'A', 'storage_path': 'x'}, {'id': 'd2', 'titulo': 'B'}],
+            [{'id': 'd3', 'titulo': 'C'}],
+        ])
+        cola = self._cola(supabase)
+
+        docs = list(cola)
+        self.assertEqual([d['id'] for d in docs], ['d1', 'd2', 'd3'])
+        # Solo las columnas pedidas (más las claves del cursor)
+        self.assertNotIn('storage_path', docs[0])
+        self.assertEqual(cola.entregados, 3)
+
+        reclamos = [p for n, p in llamadas if n == 'reclamar_documentos']
+        self.assertEqual(len(reclamos), 3)
+        self.assertEqual(reclamos[0]['p_owner'], 'runner-a')
+        self.assertEqual(reclamos[0]['p_etapa'], 'descargado')
+        cola.cerrar()
+
+    def test_liberar_y_cerrar(self):
+        supabase, llamadas = _supabase_con_lotes([[{'id': 'd1', 'titulo': 'A'}]])
+        cola = self._cola(supabase)
+        for doc in cola:
+            cola.liberar(doc['id'], reintentar_en=60)
+        cola.cerrar()
+
+        liberaciones = [p for n, p in llamadas if n == 'liberar_documentos']
+        self.assertEqual(liberaciones[0], {'p_owner': 'runner-a', 'p_ids': ['d1'], 'p_reintentar_en_segundos': 60})
+        self.assertEqual(liberaciones[-1]['p_ids'], None)
+        self.assertEqual(cola.liberados_por_fallo, 1)
+
+    def test_presupuesto_agotado_devuelve_lo_no_entregado(self):
+        supabase, llamadas = _supabase_con_lotes([
+            [{'id': 'd1', 'titulo': 'A'}, {'id': 'd2', 'titulo': 'B'}, {'id': 'd3', 'titulo': 'C'}]
+        ])
+        cola = ColaConLeases(supabase, 'descargado', 'id, titulo', lambda q: q, owner='runner-a',
+                             lote=3, presupuesto_segundos=60, max_documentos=None)
+        entregados = []
+        for doc in cola:
+            entregados.append(doc['id'])
+            cola._respaldo.inicio -= 61
+
+        self.assertEqual(entregados, ['d1'])
+        self.assertEqual(cola.entregados, 1)
+        self.assertTrue(cola.agotado_por_presupuesto)
+        devoluciones = [p for n, p in llamadas if n == 'liberar_documentos']
+        self.assertEqual(devoluciones, [{'p_owner': 'runner-a', 'p_ids': ['d2', 'd3'], 'p_reintentar_en_segundos': 0}])
+        self.assertEqual(cola.liberados_por_fallo, 0)
+        cola.cerrar()
+
+    def test_fallback_sin_rpc(self):
+        supabase = Mock()
+        supabase.rpc.return_value.execute.side_effect = Exception("PGRST202 Could not find the function")
+        query = supabase.table.return_value.select.return_value
+        query.order.return_value.order.return_value.limit.return_value.execute.return_value.data = [
+            {'id': 'd1', 'created_at': '2025-01-01', 'titulo': 'A'}
+        ]
+        cola = self._cola(supabase)
+
+        self.assertEqual([d['id'] for d in cola], ['d1'])
+        self.assertFalse(cola.usa_leases)
+        cola.liberar('d1')
+        cola.cerrar()
+        supabase.rpc.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
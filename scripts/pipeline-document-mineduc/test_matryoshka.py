@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Tests para las dimensiones Matryoshka"""
+import unittest
+import os
+import sys
+from unittest.mock import Mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from integridad_embeddings import analizar_vectores
+from matryoshka import CacheMatryoshka, PobladorColumnaDerivada, derivar, error_dimensiones, truncar
+
+
+class TestMatryoshka(unittest.TestCase):
+
+    def setUp(self):
+        self.completos = np.random.default_rng(5).standard_normal((20, 3072)).astype(np.float32)
+
+    def test_truncar_vectorizado(self):
+        derivados = truncar(self.completos, 768)
+        self.assertEqual(derivados.shape, (20, 768))
+        np.testing.assert_allclose(np.linalg.norm(derivados, axis=1), 1.0, rtol=1e-5)
+        # Mismo resultado fila a fila que en bloque
+        np.testing.assert_allclose(derivar(self.completos[3], 768), derivados[3], rtol=1e-6)
+        # La dirección de los primeros componentes se conserva
+        self.assertAlmostEqual(float(derivados[0, 0] / derivados[0, 1]),
+                               float(self.completos[0, 0] / self.completos[0, 1]), places=4)
+        self.assertFalse(truncar(np.zeros(10), 4).any())
+        with self.assertRaises(ValueError):
+            truncar(self.completos[0, :512], 768)
+
+    def test_cache_deriva_de_la_mayor_dimension(self):
+        supabase = Mock()
+        query = supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.eq.return_value
+        query.gte.return_value.order.return_value.limit.return_value.execute.return_value = Mock(data=[
+            {'embedding': self.completos[0].tolist(), 'dimensions': 3072, 'tokens_usados': 42}
+        ])
+        embedding, tokens = CacheMatryoshka(supabase, 'text-embedding-3-large').buscar('h', 1536)
+        self.assertEqual(len(embedding), 1536)
+        self.assertEqual(tokens, 42)
+        query.gte.assert_called_with('dimensions', 1536)
+
+        CacheMatryoshka(supabase).guardar('h', self.completos[1].tolist(), 10)
+        insertado = supabase.table.return_value.insert.call_args[0][0]
+        self.assertEqual(insertado['dimensions'], 3072)
+        self.assertEqual(insertado['provider'], 'openai')
+
+    def test_poblar_columna_derivada(self):
+        supabase = Mock()
+        paginas = supabase.table.return_value.select.return_value.is_.return_value
+        paginas.order.return_value.limit.return_value.execute.return_value = Mock(data=[
+            {'id': 'c1', 'chunk_hash': 'h1'}, {'id': 'c2', 'chunk_hash': 'h2'}
+        ])
+        cache = supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.in_.return_value
+        cache.execute.return_value = Mock(data=[
+            {'content_hash': 'h1', 'embedding': self.completos[0, :1536].tolist(), 'dimensions': 1536},
+            {'content_hash': 'h1', 'embedding': self.completos[0].tolist(), 'dimensions': 3072}
+        ])
+
+        resumen = PobladorColumnaDerivada(supabase, 'embedding_768', 768).ejecutar()
+        self.assertEqual(resumen['actualizados'], 1)
+        self.assertEqual(resumen['sin_cache'], 1)
+        filas = supabase.rpc.call_args[0][1]['p_filas']
+        np.testing.assert_allclose(filas[0]['embedding'], truncar(self.completos[0], 768), rtol=1e-6)
+        with self.assertRaises(ValueError):
+            PobladorColumnaDerivada(supabase, 'contenido', 768)
+        with self.assertRaises(ValueError):
+            PobladorColumnaDerivada(supabase, 'embedding_384', 384, modelo='multilingual-e5-small', proveedor='onnx')
+
+    def test_truncado_solo_para_modelos_matryoshka(self):
+        self.assertIsNone(error_dimensiones('text-embedding-3-large', 3072, 1536))
+        self.assertIsNone(error_dimensiones('text-embedding-3-small', 1536, 1536))
+        self.assertIn('no se pueden derivar', error_dimensiones('text-embedding-3-small', 1536, 3072))
+        # Un modelo local de 768D no se trunca a 384D ni llena una columna de 1536
+        self.assertIsNone(error_dimensiones('multilingual-e5-base', 768, 768))
+        self.assertIn('no admite truncado', error_dimensiones('multilingual-e5-base', 768, 384))
+        self.assertIn('vector(768)', error_dimensiones('multilingual-e5-base', 768, 1536))
+
+    def test_integridad_con_dimensiones_por_fila(self):
+        valores = [truncar(self.completos[0], 3072).tolist(), truncar(self.completos[1], 1536).tolist()]
+        mascaras = analizar_vectores(valores, 1536, 0.01, esperadas=[3072, 1536])
+        self.assertFalse(mascaras['dimension_incorrecta'].any())
+        self.assertFalse(mascaras['deriva_norma'].any())
+        mascaras = analizar_vectores(valores, 1536, 0.01, esperadas=[1536, None])
+        self.assertEqual(mascaras['dimension_incorrecta'].tolist(), [True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Tests para el perfilado opcional de los scripts de fase"""
+import unittest
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from perfilado import Perfilador, modos_activos, perfilar, pila_colapsada
+
+
+def trabajo_cpu(segundos=0.15):
+    fin = time.perf_counter() + segundos
+    total = 0
+    while time.perf_counter() < fin:
+        total += sum(i * i for i in range(500))
+    return total
+
+
+class TestPerfilado(unittest.TestCase):
+
+    def test_modos_y_desactivado_sin_costo(self):
+        self.assertEqual(modos_activos(''), frozenset())
+        self.assertEqual(modos_activos('false'), frozenset())
+        self.assertEqual(modos_activos('todo'), frozenset({'cpu', 'muestreo', 'memoria'}))
+        self.assertEqual(modos_activos('cpu, memoria,otro'), frozenset({'cpu', 'memoria'}))
+        self.assertIsInstance(perfilar(modos=frozenset()), nullcontext)
+
+    def test_pila_colapsada(self):
+        pila = pila_colapsada(sys._getframe(), 'Main;Thread')
+        partes = pila.split(';')
+        self.assertEqual(partes[0], 'Main,Thread')
+        self.assertTrue(partes[-1].startswith('test_pila_colapsada (test_perfilado.py:'))
+
+    def test_exporta_artefactos_de_todos_los_modos(self):
+        directorio = tempfile.mkdtemp()
+        with Perfilador('fase_prueba', frozenset({'cpu', 'muestreo', 'memoria'}), directorio, run_id='9') as perfil:
+            hilo = threading.Thread(target=trabajo_cpu, name='worker-0')
+            hilo.start()
+            retenido = [bytearray(1024) for _ in range(2000)]
+            trabajo_cpu()
+            hilo.join()
+
+        base = os.path.join(directorio, f'fase_prueba-9-{os.getpid()}')
+        for extension in ('.pstats', '.cpu.txt', '.collapsed', '.memoria.txt', '.perfil.json'):
+            self.assertTrue(os.path.exists(base + extension), extension)
+
+        with open(base + '.collapsed', encoding='utf-8') as f:
+            pilas = f.read().splitlines()
+        self.assertTrue(any(p.startswith('worker-0;') and 'trabajo_cpu' in p for p in pilas))
+        self.assertTrue(all(p.rsplit(' ', 1)[1].isdigit() for p in pilas))
+
+        with open(base + '.perfil.json', encoding='utf-8') as f:
+            resumen = json.load(f)
+        self.assertEqual(resumen['modos'], ['cpu', 'memoria', 'muestreo'])
+        self.assertGreater(resumen['muestras'], 0)
+        self.assertGreaterEqual(resumen['pico_memoria_mb'], 2.0)
+        self.assertTrue(any('trabajo_cpu' in f['funcion'] for f in resumen['top_cpu']))
+        self.assertIn('test_perfilado.py', resumen['top_asignaciones'][0]['ubicacion'])
+        self.assertEqual(len(retenido), 2000)
+        self.assertEqual(perfil.archivos, [os.path.basename(base) + e for e in
+                                           ('.pstats', '.cpu.txt', '.collapsed', '.memoria.txt')])
+
+    def test_exporta_aunque_el_script_termine_con_sys_exit(self):
+        directorio = tempfile.mkdtemp()
+        with self.assertRaises(SystemExit):
+            with perfilar('fase_exit', modos={'cpu'}, directorio=directorio):
+                trabajo_cpu(0.01)
+                sys.exit(1)
+        self.assertTrue(any(a.endswith('.perfil.json') for a in os.listdir(directorio)))
+
+
+if __name__ == '__main__':
+    unittest.main()
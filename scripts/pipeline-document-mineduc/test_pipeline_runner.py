@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Tests para el runner del pipeline en un solo proceso"""
+import unittest
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pipeline_runner
+from pipeline_runner import ETAPAS, Etapa, RunnerPipeline, orden_topologico, seleccionar
+
+
+class ColaFalsa:
+    """Lista de documentos con la interfaz de ColaConLeases usada por el runner"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.entregados = 0
+        self.presupuesto_segundos = None
+        self.agotado_por_presupuesto = False
+        self.liberados = []
+        self.cerrada = False
+
+    def __iter__(self):
+        for doc in self.docs:
+            self.entregados += 1
+            yield doc
+
+    def liberar(self, doc_id):
+        self.liberados.append(doc_id)
+
+    def cerrar(self):
+        self.cerrada = True
+
+
+class TestPipelineRunner(unittest.TestCase):
+
+    def test_seleccion_y_orden(self):
+        self.assertEqual(orden_topologico(ETAPAS, set(ETAPAS)),
+                         ['verificar_storage', 'transformar', 'cargar', 'validar', 'optimizar', 'metricas'])
+        self.assertEqual(seleccionar(ETAPAS, solo='cargar'), {'cargar'})
+        self.assertEqual(seleccionar(ETAPAS, hasta='cargar'), {'verificar_storage', 'transformar', 'cargar'})
+        self.assertEqual(seleccionar(ETAPAS, desde='validar'), {'validar', 'optimizar', 'metricas'})
+        self.assertEqual(seleccionar(ETAPAS, desde='transformar', hasta='validar'),
+                         {'transformar', 'cargar', 'validar'})
+        with self.assertRaises(ValueError):
+            seleccionar(ETAPAS, solo='fase9')
+
+        ciclo = {'a': Etapa('a', 'a.py', ('b',)), 'b': Etapa('b', 'b.py', ('a',))}
+        with self.assertRaises(ValueError):
+            orden_topologico(ciclo, {'a', 'b'})
+
+    def test_falla_omite_dependientes_salvo_metricas(self):
+        runner = RunnerPipeline({'validar', 'optimizar', 'metricas'})
+        ejecutadas = []
+
+        def ejecutar_etapa(nombre):
+            ejecutadas.append(nombre)
+            return nombre != 'validar'
+
+        with patch.object(runner, '_ejecutar_etapa', side_effect=ejecutar_etapa), \
+                patch.object(pipeline_runner, 'export_metrics_json'), \
+                patch('trazas.Trazador.exportar'):
+            self.assertEqual(runner.ejecutar(), 1)
+        self.assertEqual(ejecutadas, ['validar', 'metricas'])
+        self.assertEqual(runner.estados, {'validar': 'fallida', 'optimizar': 'omitida', 'metricas': 'ok'})
+
+    def test_flujo_documentos_en_memoria(self):
+        docs = [{'id': f'd{i}', 'titulo': f'Doc {i}', 'metadata': {'origen': 'monitor'}} for i in range(3)]
+        cola = ColaFalsa(docs)
+
+        fase2 = SimpleNamespace(supabase=Mock(), transiciones=Mock(), registrar_transformacion=Mock(),
+                                marcar_sin_archivo=Mock())
+        fase2.descargar_pdf_con_verificacion = lambda doc: (doc['id'] != 'd2', b'%PDF' if doc['id'] != 'd2' else None)
+        fase2.procesar_documento_individual = lambda doc, pdf_bytes: {
+            'doc_id': doc['id'], 'contenido_final': f"# {doc['titulo']}\n" + 'texto legible ' * 80,
+            'costo': 0.01, 'metadata_documento': {'candidato_delta': {'documento_base_id': 'base'}}
+        }
+        recibidos = []
+        fase3 = SimpleNamespace(supabase=Mock(), transiciones=Mock())
+        # Backlog ya transformado de una ejecución anterior: se carga antes del flujo solapado
+        previos = ColaFalsa([{'id': 't0', 'titulo': 'Previo'}, {'id': 't1', 'titulo': 'Previo roto'}])
+        fase3.procesar_documento = lambda doc: (5, 50, 0.001) if doc['id'] == 't0' else 1 / 0
+        fase3.fragmentar_documento = lambda doc: [{'contenido': doc['contenido_markdown']}]
+
+        def procesar(doc, chunks):
+            recibidos.append((doc, chunks))
+            return len(chunks), 100, 0.002
+
+        fase3.procesar_documento_batch = procesar
+        fase4 = pipeline_runner.cargar_fase('fase4_validacion_calidad.py')
+
+        fases = {ETAPAS['transformar'].archivo: fase2, ETAPAS['cargar'].archivo: fase3,
+                 ETAPAS['validar'].archivo: fase4}
+        runner = RunnerPipeline({'transformar', 'cargar'}, workers_transformar=2, workers_cargar=1)
+        with patch.object(pipeline_runner, 'cargar_fase', side_effect=fases.__getitem__), \
+                patch('leases.ColaConLeases', side_effect=[previos, cola]):
+            self.assertTrue(runner._flujo_documentos())
+
+        # Un solo buffer de transiciones compartido entre fases
+        self.assertIs(fase3.transiciones, fase2.transiciones)
+        fase2.transiciones.flush.assert_called()
+        self.assertTrue(cola.cerrada)
+        self.assertTrue(previos.cerrada)
+        fase3.transiciones.flush.assert_called()
+
+        self.assertEqual(runner.contadores['tomados'], 5)
+        self.assertEqual(runner.contadores['transformados_previos'], 2)
+        self.assertEqual(runner.contadores['transformados'], 2)
+        self.assertEqual(runner.contadores['cargados'], 3)
+        self.assertEqual(runner.contadores['tokens'], 250)
+        self.assertEqual(runner.contadores['fallidos'], 2)
+        self.assertEqual(previos.liberados, ['t1'])
+        self.assertEqual(cola.liberados, ['d2'])
+        fase2.marcar_sin_archivo.assert_called_once_with('d2')
+
+        # fase3 recibe el Markdown y la metadata de fase2 sin releer la BD
+        doc, chunks = recibidos[0]
+        self.assertIn('texto legible', doc['contenido_markdown'])
+        self.assertEqual(doc['metadata'], {'origen': 'monitor', 'candidato_delta': {'documento_base_id': 'base'}})
+        self.assertEqual(len(runner.calidades), 2)
+        self.assertGreater(runner.calidades[0], 0.7)
+        self.assertEqual(len(runner.latencias), 2)
+
+    def test_metricas_con_argumentos_por_defecto(self):
+        # Sin --descargados, los documentos reclamados cuentan como descargados
+        registrados = []
+        fase6 = SimpleNamespace(registrar_metricas=lambda args: registrados.append(args) or 0)
+        runner = RunnerPipeline({'metricas'})
+        runner.contadores.update(tomados=4, transformados=2, transformados_previos=1, cargados=3, chunks=30)
+        with patch.object(pipeline_runner, 'cargar_fase', return_value=fase6):
+            self.assertTrue(runner._etapa_metricas())
+            runner.contadores['descargados'] = 7
+            runner._etapa_metricas()
+
+        args = registrados[0]
+        self.assertEqual((args.downloaded, args.transformed, args.loaded), (4, 3, 3))
+        self.assertGreaterEqual(args.downloaded, args.transformed)
+        self.assertGreaterEqual(args.transformed, args.loaded)
+        self.assertEqual(args.validated, 30)
+        self.assertEqual(registrados[1].downloaded, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Tests para el planificador de embeddings por TPM/RPM"""
+import unittest
+import os
+import sys
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from planificador_embeddings import PlanificadorEmbeddings, espera_por_limite, parsear_duracion
+from proveedores_embedding import ProveedorOpenAI
+
+
+class RelojFalso:
+    def __init__(self):
+        self.ahora = 0.0
+        self.esperas = []
+
+    def __call__(self):
+        return self.ahora
+
+    def dormir(self, segundos):
+        self.esperas.append(segundos)
+        self.ahora += segundos
+
+
+class ErrorLimite(Exception):
+    def __init__(self, headers=None, code=None):
+        super().__init__('rate limit')
+        self.status_code = 429
+        self.code = code
+        self.response = Mock(headers=headers or {})
+
+
+class TestPlanificadorEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+        self.reloj = RelojFalso()
+
+    def planificador(self, tpm=600, rpm=60):
+        return PlanificadorEmbeddings(tpm, rpm, contar_tokens=len, reloj=self.reloj, dormir=self.reloj.dormir)
+
+    def test_parsear_headers_de_reset(self):
+        self.assertEqual(parsear_duracion('6m0s'), 360.0)
+        self.assertAlmostEqual(parsear_duracion('1.5s'), 1.5)
+        self.assertAlmostEqual(parsear_duracion('120ms'), 0.12)
+        self.assertEqual(parsear_duracion('2'), 2.0)
+        self.assertIsNone(parsear_duracion('pronto'))
+
+        self.assertEqual(espera_por_limite(ErrorLimite({'x-ratelimit-reset-tokens': '6s', 'retry-after': '2'})), 6.0)
+        self.assertEqual(espera_por_limite(ErrorLimite()), 0.0)
+        self.assertIsNone(espera_por_limite(ErrorLimite(code='insufficient_quota')))
+        self.assertIsNone(espera_por_limite(ValueError('otro')))
+
+    def test_ritmo_por_tpm(self):
+        planificador = self.planificador(tpm=600)
+        for _ in range(3):
+            planificador.reservar(300)
+        # Cubo lleno (600) alcanza para dos; la tercera espera 300 tokens a 10/s
+        self.assertAlmostEqual(sum(self.reloj.esperas), 30.0)
+        self.assertEqual(planificador.resumen()['requests'], 3)
+
+    def test_particionar_por_textos_y_tokens(self):
+        planificador = self.planificador(tpm=100)
+        self.assertEqual(planificador.particionar([40, 40, 40, 10, 10, 10], 3), [(0, 2), (2, 5), (5, 6)])
+        # Un texto más grande que el lote va solo
+        self.assertEqual(planificador.particionar([150, 10], 5), [(0, 1), (1, 2)])
+
+    def test_429_pausa_y_reintenta_sin_fallar(self):
+        planificador = self.planificador()
+        llamada = Mock(side_effect=[ErrorLimite({'x-ratelimit-reset-requests': '5s'}), ErrorLimite(), 'ok'])
+        self.assertEqual(planificador.ejecutar(llamada, 10), 'ok')
+        self.assertEqual(llamada.call_count, 3)
+        self.assertEqual(planificador.resumen()['throttles'], 2)
+        self.assertGreaterEqual(self.reloj.ahora, 5.0 + 2.0)
+
+        with self.assertRaises(ErrorLimite):
+            planificador.ejecutar(Mock(side_effect=ErrorLimite(code='insufficient_quota')), 10)
+
+    def test_proveedor_openai_con_planificador(self):
+        cliente = Mock()
+        cliente.embeddings.create.side_effect = lambda model, input: Mock(
+            data=[Mock(index=i, embedding=[float(len(t))]) for i, t in enumerate(input)],
+            usage=Mock(total_tokens=sum(map(len, input)))
+        )
+        cliente.with_options.return_value = cliente
+        proveedor = ProveedorOpenAI('text-embedding-3-small', cliente=cliente, lote=10,
+                                    planificador=self.planificador(tpm=6))
+        # Los 429 los reintenta el planificador, no el SDK
+        cliente.with_options.assert_called_once_with(max_retries=0)
+        resultado = proveedor.embeber(['aaa', 'bb', 'cccc'])
+        self.assertEqual(cliente.embeddings.create.call_count, 2)
+        self.assertEqual(resultado.vectores, [[3.0], [2.0], [4.0]])
+        self.assertEqual(resultado.tokens, [3, 2, 4])
+        self.assertAlmostEqual(resultado.costo_usd, 9 / 1_000_000 * 0.02)
+
+        # Adjuntado después de construir (como en fase3) y luego retirado
+        sin_planificador = ProveedorOpenAI('text-embedding-3-small', cliente=Mock())
+        sin_planificador._cliente_base.with_options.assert_not_called()
+        sin_planificador.planificador = self.planificador(tpm=6)
+        self.assertIs(sin_planificador.cliente, sin_planificador._cliente_base.with_options.return_value)
+        sin_planificador.planificador = None
+        self.assertIs(sin_planificador.cliente, sin_planificador._cliente_base)
+
+
+if __name__ == '__main__':
+    unittest.main()
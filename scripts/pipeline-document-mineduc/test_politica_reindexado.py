@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Tests para la política de reindexado HNSW"""
+import unittest
+import os
+import sys
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from politica_reindexado import (ACCION_ANALYZE, ACCION_RECONSTRUIR, PoliticaReindexado,
+                                 cambios_desde_construccion, decidir, recall_contra_exactos)
+
+SNAPSHOT = {
+    'filas_al_construir': 10_000,
+    'insertados_al_construir': 50_000,
+    'actualizados_al_construir': 1_000,
+    'eliminados_al_construir': 40_000
+}
+
+
+def _estadisticas(insertados=0, actualizados=0, eliminados=0):
+    return {
+        'filas_vivas': 10_000 + insertados - eliminados,
+        'insertados': SNAPSHOT['insertados_al_construir'] + insertados,
+        'actualizados': SNAPSHOT['actualizados_al_construir'] + actualizados,
+        'eliminados': SNAPSHOT['eliminados_al_construir'] + eliminados
+    }
+
+
+class TestPoliticaReindexado(unittest.TestCase):
+
+    def test_pocos_cambios_solo_analyze(self):
+        decision = decidir(SNAPSHOT, _estadisticas(insertados=500), recall=0.98,
+                           umbral_cambios=0.2, umbral_recall=0.9)
+        self.assertEqual(decision.accion, ACCION_ANALYZE)
+        self.assertEqual(decision.entradas['cambios_desde_construccion'], 500)
+
+    def test_cambios_sobre_umbral(self):
+        decision = decidir(SNAPSHOT, _estadisticas(insertados=1_500, eliminados=600), recall=0.98,
+                           umbral_cambios=0.2, umbral_recall=0.9)
+        self.assertEqual(decision.accion, ACCION_RECONSTRUIR)
+        self.assertAlmostEqual(decision.entradas['fraccion_cambios'], 0.21)
+
+    def test_recall_bajo_o_forzado(self):
+        self.assertEqual(decidir(SNAPSHOT, _estadisticas(), recall=0.8).accion, ACCION_RECONSTRUIR)
+        self.assertEqual(decidir(SNAPSHOT, _estadisticas(), recall=None, forzar=True).accion, ACCION_RECONSTRUIR)
+
+    def test_sin_snapshot_registra_linea_base(self):
+        decision = decidir(None, _estadisticas(), recall=None)
+        self.assertEqual(decision.accion, ACCION_ANALYZE)
+        self.assertIsNone(decision.entradas['cambios_desde_construccion'])
+
+    def test_reset_de_contadores(self):
+        reiniciado = {'insertados': 300, 'actualizados': 0, 'eliminados': 0}
+        self.assertEqual(cambios_desde_construccion(SNAPSHOT, reiniciado), 300)
+
+    def test_recall_contra_vecinos_exactos_de_la_bd(self):
+        class BackendFalso:
+            def buscar(self, vector, k):
+                # El índice pierde un vecino de la segunda consulta
+                return ['a', 'b'] if vector[0] > 0 else ['c', 'x']
+
+        filas = [{'consulta_id': 'a', 'embedding': '[1,0]', 'vecinos': ['a', 'b']},
+                 {'consulta_id': 'c', 'embedding': '[-1,0]', 'vecinos': ['c', 'd']}]
+        self.assertEqual(recall_contra_exactos(BackendFalso(), filas, k=2), 0.75)
+        self.assertIsNone(recall_contra_exactos(BackendFalso(), [{'embedding': '[1,0]', 'vecinos': ['a']}], k=2))
+
+    def test_recall_sin_rpc_no_descarga_el_corpus(self):
+        supabase = Mock()
+        supabase.rpc.return_value.execute.side_effect = Exception('PGRST202 Could not find the function')
+        self.assertIsNone(PoliticaReindexado(supabase).recall_muestreado(consultas=5))
+        supabase.rpc.assert_called_once_with('vecinos_exactos_muestra_chunks', {'p_consultas': 5, 'p_k': 10})
+        supabase.table.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Tests para los proveedores de embeddings intercambiables"""
+import unittest
+import os
+import sys
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import proveedores_embedding
+from proveedores_embedding import ProveedorEmbedding, ProveedorONNX, ProveedorOpenAI, obtener_proveedor
+
+
+def cliente_falso():
+    """Cliente OpenAI que devuelve los datos desordenados, como permite la API"""
+    cliente = Mock()
+
+    def create(model, input):
+        datos = [Mock(index=i, embedding=[float(len(t))] * 3072) for i, t in enumerate(input)]
+        return Mock(data=list(reversed(datos)), usage=Mock(total_tokens=10 * len(input)))
+
+    cliente.embeddings.create.side_effect = create
+    return cliente
+
+
+class TestProveedoresEmbedding(unittest.TestCase):
+
+    def test_openai_lotes_orden_y_costo(self):
+        cliente = cliente_falso()
+        proveedor = ProveedorOpenAI('text-embedding-3-large', cliente=cliente, lote=2)
+        textos = ['a', 'bbb', 'cc', 'dddd', 'e']
+
+        resultado = proveedor.embeber(textos)
+        self.assertEqual(cliente.embeddings.create.call_count, 3)
+        self.assertEqual([v[0] for v in resultado.vectores], [1.0, 3.0, 2.0, 4.0, 1.0])
+        self.assertEqual(proveedor.dimensiones, 3072)
+        # Tokens del lote repartidos por largo
+        self.assertEqual(resultado.tokens[:2], [5, 15])
+        self.assertAlmostEqual(resultado.costo_usd, 50 / 1_000_000 * 0.13)
+
+    def test_agrupar_mean_pooling_con_mascara(self):
+        salida = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]], dtype=np.float32)
+        mascara = np.array([[1, 1, 0]])
+        np.testing.assert_allclose(ProveedorONNX.agrupar(salida, mascara), [[1.0, 0.0]])
+        # Salidas ya agrupadas (sentence_embedding): solo normalización
+        ya_agrupada = np.array([[3.0, 4.0]], dtype=np.float32)
+        np.testing.assert_allclose(ProveedorONNX.agrupar(ya_agrupada, mascara), [[0.6, 0.8]])
+
+    def test_onnx_restaura_orden_original(self):
+        proveedor = ProveedorONNX.__new__(ProveedorONNX)
+        proveedor.lote = 2
+        lotes = []
+
+        def embeber_lote(textos):
+            lotes.append(list(textos))
+            return [[float(len(t))] for t in textos], [len(t) for t in textos], 0.0
+
+        proveedor._embeber_lote = embeber_lote
+        resultado = proveedor.embeber(['ccc', 'a', 'dddd', 'bb'])
+        self.assertEqual(lotes, [['a', 'bb'], ['ccc', 'dddd']])
+        self.assertEqual(resultado.vectores, [[3.0], [1.0], [4.0], [2.0]])
+        self.assertEqual(resultado.tokens, [3, 1, 4, 2])
+
+    def test_instancia_unica_por_proveedor_y_modelo(self):
+        with patch.dict(proveedores_embedding._INSTANCIAS, clear=True), \
+                patch.object(proveedores_embedding, 'ProveedorOpenAI') as fabrica:
+            fabrica.side_effect = lambda modelo: Mock(modelo=modelo)
+            primero = obtener_proveedor('openai', 'text-embedding-3-small')
+            self.assertIs(obtener_proveedor('openai', 'text-embedding-3-small'), primero)
+            self.assertIsNot(obtener_proveedor('openai', 'text-embedding-3-large'), primero)
+            self.assertEqual(fabrica.call_count, 2)
+
+            with self.assertRaises(ValueError):
+                obtener_proveedor('desconocido')
+            with patch.object(proveedores_embedding, 'ONNX_MODELO_DIR', None), self.assertRaises(ValueError):
+                obtener_proveedor('onnx')
+
+    def test_interfaz_abstracta(self):
+        with self.assertRaises(TypeError):
+            ProveedorEmbedding('modelo', 3, 2)
+
+        class SinLote(ProveedorEmbedding):
+            pass
+
+        with self.assertRaises(TypeError):
+            SinLote('modelo', 3, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Tests para los rollups incrementales de métricas del pipeline"""
+import unittest
+import json
+import os
+import random
+import sys
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from anomalias_metricas import evaluar_regresiones, extraer_metricas, mad, mediana
+from rollups_metricas import (
+    ERROR_RELATIVO, RollupsMetricas, SketchCuantiles, backfill, cubre_ventana, fusionar_sketches,
+    lineas_base, promedio_historico, sketches, sketches_desde_eventos
+)
+
+
+def fila(metrica_id, documentos, tokens):
+    return {'id': metrica_id, 'created_at': '2026-01-19T10:15:00+00:00', 'documentos_monitoreados': documentos,
+            'documentos_procesados': documentos, 'chunks_validados': documentos * 10, 'errores_criticos': 0,
+            'metadata': {'total_tokens': tokens, 'total_cost_usd': 0.01 * documentos,
+                         'kpis': {'tokens_por_doc': tokens / documentos}}}
+
+
+def rollup_diario(filas):
+    """Lo que acumular_rollup_metricas deja en la fila del día"""
+    return {
+        'ejecuciones': len(filas),
+        'documentos_procesados': sum(f['documentos_procesados'] for f in filas),
+        'chunks_validados': sum(f['chunks_validados'] for f in filas),
+        'errores_criticos': 0,
+        'metricas_ejecucion': {clave: s.a_dict() for clave, s in
+                               fusionar_sketches(sketches(extraer_metricas(f)) for f in filas).items()}
+    }
+
+
+class TestSketchCuantiles(unittest.TestCase):
+
+    def test_cuantiles_con_error_relativo_acotado(self):
+        generador = random.Random(7)
+        valores = sorted(generador.lognormvariate(7, 1) for _ in range(5000))
+        sketch = SketchCuantiles()
+        for valor in valores:
+            sketch.agregar(valor)
+
+        for q in (0.5, 0.9, 0.99):
+            exacto = valores[int(q * (len(valores) - 1))]
+            self.assertLessEqual(abs(sketch.cuantil(q) - exacto) / exacto, ERROR_RELATIVO * 1.01)
+        self.assertEqual(sketch.cuantil(1.0), valores[-1])
+        self.assertAlmostEqual(sketch.media, sum(valores) / len(valores))
+        self.assertLess(len(sketch.buckets), 600)
+
+    def test_fusion_equivale_a_un_solo_sketch_y_serializa(self):
+        a, b, todo = SketchCuantiles(), SketchCuantiles(), SketchCuantiles()
+        for i, valor in enumerate([0, 3.5, 120, 120, 9000, 0.02, 47]):
+            (a if i % 2 else b).agregar(valor)
+            todo.agregar(valor)
+
+        fusion = SketchCuantiles.desde_dict(json.loads(json.dumps(a.a_dict()))).fusionar(b)
+        self.assertEqual(fusion.a_dict(), todo.a_dict())
+        self.assertEqual((fusion.ceros, fusion.minimo, fusion.maximo), (1, 0, 9000))
+        self.assertEqual(SketchCuantiles().cuantil(0.5), 0.0)
+
+    def test_sketches_desde_eventos(self):
+        eventos = [
+            {'name': 'documento', 'cat': 'fase3_load', 'ph': 'X', 'dur': 2_000_000},
+            {'name': 'embedding', 'cat': 'fase3_load', 'ph': 'X', 'dur': 500_000},
+            {'name': 'process_name', 'ph': 'M'},
+        ]
+        latencias = sketches_desde_eventos(eventos, {'fase3_load': 'carga'})
+        self.assertEqual(set(latencias), {'documento.carga', 'etapa.embedding'})
+        self.assertEqual(latencias['documento.carga']['max'], 2000.0)
+
+
+class TestRollupsMetricas(unittest.TestCase):
+
+    def test_linea_base_desde_rollups_aproxima_la_exacta(self):
+        generador = random.Random(3)
+        dias = [[fila(f'{d}-{i}', 10, generador.gauss(5000, 150) * 10) for i in range(3)] for d in range(10)]
+        rollups = [rollup_diario(filas) for filas in dias]
+
+        exactos = [f['metadata']['kpis']['tokens_por_doc'] for filas in dias for f in filas]
+        base = lineas_base(rollups)['tokens_por_doc']
+        self.assertEqual(base.n, 30)
+        self.assertLessEqual(abs(base.mediana - mediana(exactos)) / mediana(exactos), ERROR_RELATIVO)
+        self.assertLess(abs(base.mad - mad(exactos)), 0.03 * mediana(exactos))
+
+        alertas = evaluar_regresiones({'tokens_por_doc': 10_500}, {'tokens_por_doc': base})
+        self.assertEqual([a['severidad'] for a in alertas], ['critical'])
+        self.assertEqual(evaluar_regresiones({'tokens_por_doc': 5100}, {'tokens_por_doc': base}), [])
+
+        promedio = promedio_historico(rollups)
+        self.assertEqual(promedio['runs_totales'], 30)
+        self.assertEqual(promedio['docs_procesados_promedio'], 10)
+        self.assertIsNone(promedio_historico([]))
+
+    def test_acumular_llama_rpc_y_se_desactiva_si_no_existe(self):
+        supabase = Mock()
+        supabase.rpc.return_value.execute.return_value = Mock(data=True)
+        rollups = RollupsMetricas(supabase)
+
+        self.assertTrue(rollups.acumular(fila('m1', 4, 800), {'etapa.vision': {'n': 1}}))
+        nombre, parametros = supabase.rpc.call_args[0]
+        self.assertEqual(nombre, 'acumular_rollup_metricas')
+        self.assertEqual(parametros['p_metrica_id'], 'm1')
+        self.assertEqual(parametros['p_momento'], '2026-01-19T10:15:00+00:00')
+        self.assertEqual(parametros['p_contadores']['tokens'], 800)
+        self.assertEqual(parametros['p_metricas_ejecucion']['tokens_por_doc']['n'], 1)
+        # Sin id (insert falló) no se acumula
+        self.assertFalse(rollups.acumular({'documentos_procesados': 4}))
+
+        supabase.rpc.return_value.execute.side_effect = Exception('PGRST202 Could not find the function')
+        self.assertFalse(rollups.acumular(fila('m2', 4, 800)))
+        self.assertFalse(rollups.acumular(fila('m3', 4, 800)))
+        self.assertEqual(supabase.rpc.call_count, 2)
+
+    def test_cubre_ventana(self):
+        desde = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        rollups = [{'periodo': '2026-01-10T00:00:00+00:00', 'ejecuciones': 3},
+                   {'periodo': '2026-01-11T00:00:00+00:00', 'ejecuciones': 4}]
+        # Un solo rollup reciente no representa 30 días de filas crudas
+        self.assertFalse(cubre_ventana(rollups[:1], desde, 3))
+        self.assertFalse(cubre_ventana(rollups, desde, 40))
+        self.assertTrue(cubre_ventana(rollups, desde, 7))
+        # Sin conteo de filas crudas: el rollup más antiguo debe llegar al inicio
+        self.assertFalse(cubre_ventana(rollups, desde))
+        self.assertTrue(cubre_ventana([{'periodo': '2026-01-01T00:00:00+00:00', 'ejecuciones': 5}], desde))
+
+    def test_consultar_ventana_sin_backfill_usa_filas_crudas(self):
+        supabase = Mock()
+        tabla = supabase.table.return_value
+        consulta = tabla.select.return_value.eq.return_value.gte.return_value.order.return_value.execute
+        consulta.return_value = Mock(data=[{'periodo': '2026-01-19T00:00:00+00:00', 'ejecuciones': 6}])
+        conteo = tabla.select.return_value.gte.return_value.limit.return_value.execute
+
+        with patch('rollups_metricas.ROLLUPS_HABILITADOS', True):
+            conteo.return_value = Mock(count=90)
+            self.assertEqual(RollupsMetricas(supabase).consultar_ventana(30), [])
+            conteo.return_value = Mock(count=6)
+            self.assertEqual(len(RollupsMetricas(supabase).consultar_ventana(30)), 1)
+
+    def test_backfill_no_salta_filas_con_el_mismo_created_at(self):
+        filas = [dict(fila(f'm{i:02d}', 2, 100), created_at=f'2026-01-{10 + i // 4:02d}T00:00:00+00:00')
+                 for i in range(10)]
+        cursores = []
+
+        class Query:
+            def __init__(self):
+                self.cursor = None
+                self.limite = None
+
+            def select(self, columnas):
+                return self
+
+            def gte(self, columna, valor):
+                return self
+
+            def or_(self, filtro):
+                self.cursor = filtro
+                return self
+
+            def order(self, columna):
+                return self
+
+            def limit(self, n):
+                self.limite = n
+                return self
+
+            def execute(self):
+                cursores.append(self.cursor)
+                pendientes = filas
+                if self.cursor:
+                    creado = self.cursor.split('"')[1]
+                    fila_id = self.cursor.rsplit('id.gt.', 1)[1].rstrip(')')
+                    pendientes = [f for f in filas if (f['created_at'], f['id']) > (creado, fila_id)]
+                return SimpleNamespace(data=pendientes[:self.limite])
+
+        supabase = Mock()
+        supabase.table.side_effect = lambda nombre: Query()
+        supabase.rpc.return_value.execute.return_value = Mock(data=True)
+
+        with patch('rollups_metricas.ROLLUPS_HABILITADOS', True):
+            resumen = backfill(supabase, 30, lote=3)
+
+        self.assertEqual((resumen['filas_leidas'], resumen['filas_acumuladas']), (10, 10))
+        acumuladas = [c[0][1]['p_metrica_id'] for c in supabase.rpc.call_args_list]
+        self.assertEqual(acumuladas, [f['id'] for f in filas])
+        self.assertIn('id.gt.m02', cursores[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
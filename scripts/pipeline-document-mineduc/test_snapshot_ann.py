@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Tests para el snapshot local con índice IVF"""
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from snapshot_ann import SnapshotANN, evaluar_snapshot
+from vectores import cuantizar_int8, decuantizar_int8, normalizar_filas
+
+
+def _corpus(n=2000, dim=32, semilla=3):
+    """Vectores agrupados en 40 clusters (estructura que el IVF aprovecha)"""
+    rng = np.random.default_rng(semilla)
+    centros = rng.standard_normal((40, dim))
+    matriz = centros[rng.integers(0, 40, n)] + 0.3 * rng.standard_normal((n, dim))
+    filas = [{
+        'chunk_id': f'c{i}',
+        'documento_id': f'd{i // 10}',
+        'titulo_documento': f'Documento {i // 10}',
+        'contenido': f'texto {i}',
+        'seccion': None,
+        'tipo_contenido': 'rubrica_evaluacion' if i % 2 else 'manual_portafolio',
+        'dominios_mbe': ['a'] if i % 3 == 0 else [],
+        'metadata': {}
+    } for i in range(n)]
+    return normalizar_filas(matriz.astype(np.float32)), filas
+
+
+class TestSnapshotANN(unittest.TestCase):
+
+    def test_cuantizacion_int8(self):
+        matriz, _ = _corpus(100)
+        codigos, escalas = cuantizar_int8(matriz)
+        self.assertEqual(codigos.dtype, np.int8)
+        self.assertLess(np.abs(decuantizar_int8(codigos, escalas) - matriz).max(), 0.01)
+
+    def test_recall_y_forma_de_respuesta(self):
+        matriz, filas = _corpus()
+        for formato in ('float16', 'int8'):
+            snapshot = SnapshotANN.construir(matriz, filas, formato=formato)
+            evaluacion = evaluar_snapshot(snapshot, consultas=100, k=10, nprobe=8)
+            self.assertGreaterEqual(evaluacion['recall_at_k'], 0.9, formato)
+
+        resultados = snapshot.buscar(matriz[5], match_threshold=0.0, match_count=5)
+        self.assertEqual(resultados[0]['chunk_id'], 'c5')
+        self.assertEqual(set(resultados[0]), {'chunk_id', 'documento_id', 'titulo_documento', 'contenido',
+                                              'seccion', 'similarity', 'metadata'})
+        similitudes = [r['similarity'] for r in resultados]
+        self.assertEqual(similitudes, sorted(similitudes, reverse=True))
+
+    def test_filtros_y_umbral(self):
+        matriz, filas = _corpus()
+        snapshot = SnapshotANN.construir(matriz, filas)
+        resultados = snapshot.buscar(matriz[4], match_threshold=0.0, match_count=10,
+                                     p_dominio_mbe='A', p_tipo_contenido='manual_portafolio')
+        self.assertTrue(resultados)
+        for r in resultados:
+            indice = int(r['chunk_id'][1:])
+            self.assertTrue(indice % 2 == 0 and indice % 3 == 0)
+        self.assertEqual(snapshot.buscar(matriz[4], match_threshold=0.9999, match_count=10,
+                                         p_dominio_mbe='a')[:1], [])
+
+    def test_guardar_y_abrir_memmap(self):
+        matriz, filas = _corpus(300)
+        snapshot = SnapshotANN.construir(matriz, filas, formato='int8', lists=10)
+        with tempfile.TemporaryDirectory() as directorio:
+            snapshot.guardar(directorio)
+            abierto = SnapshotANN.abrir(directorio)
+            self.assertIsInstance(abierto.vectores, np.memmap)
+            self.assertEqual(abierto.manifest['lists'], 10)
+            self.assertEqual(abierto.ids, snapshot.ids)
+            self.assertEqual(abierto.buscar(matriz[7], 0.0, 3), snapshot.buscar(matriz[7], 0.0, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Tests para el buffer de transiciones de estado"""
+import unittest
+from unittest.mock import Mock
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from transiciones_estado import BufferTransiciones
+
+
+class TestBufferTransiciones(unittest.TestCase):
+
+    def _buffer(self, **kwargs):
+        supabase = Mock()
+        supabase.rpc.return_value.execute.return_value.data = 1
+        buffer = BufferTransiciones(supabase, auto_flush=False, **kwargs)
+        return buffer, supabase
+
+    def test_coalesce_por_documento(self):
+        buffer, supabase = self._buffer(max_filas=10)
+        buffer.agregar('doc-1', estado_procesamiento='procesando')
+        buffer.agregar('doc-1', 'completado', {'chunks_generados': 3}, procesado=True)
+        buffer.agregar('doc-1', metadata={'tokens_embeddings': 100})
+        self.assertEqual(buffer.pendientes(), 1)
+
+        buffer.flush()
+        payload = supabase.rpc.call_args[0][1]['p_transiciones']
+        self.assertEqual(len(payload), 1)
+        self.assertEqual(payload[0]['etapa'], 'completado')
+        self.assertEqual(payload[0]['metadata'], {'chunks_generados': 3, 'tokens_embeddings': 100})
+        self.assertEqual(payload[0]['campos'], {'estado_procesamiento': 'procesando', 'procesado': True})
+
+    def test_flush_al_llenar(self):
+        buffer, supabase = self._buffer(max_filas=2)
+        buffer.agregar('doc-1', 'transformado')
+        supabase.rpc.assert_not_called()
+        buffer.agregar('doc-2', 'transformado')
+        supabase.rpc.assert_called_once()
+        self.assertEqual(buffer.pendientes(), 0)
+
+    def test_flush_de_un_documento(self):
+        buffer, supabase = self._buffer(max_filas=10)
+        buffer.agregar('doc-1', progreso_procesamiento=40)
+        buffer.agregar('doc-2', progreso_procesamiento=80)
+
+        self.assertEqual(buffer.flush('doc-1'), 1)
+        payload = supabase.rpc.call_args[0][1]['p_transiciones']
+        self.assertEqual([f['id'] for f in payload], ['doc-1'])
+        self.assertEqual(buffer.pendientes(), 1)
+        self.assertEqual(buffer.flush('doc-1'), 0)
+        self.assertEqual(supabase.rpc.call_count, 1)
+
+        buffer.flush()
+        self.assertEqual([f['id'] for f in supabase.rpc.call_args[0][1]['p_transiciones']], ['doc-2'])
+
+    def test_campo_desconocido(self):
+        buffer, _ = self._buffer()
+        with self.assertRaises(ValueError):
+            buffer.agregar('doc-1', columna_inexistente=1)
+
+    def test_fallback_sin_rpc(self):
+        buffer, supabase = self._buffer()
+        supabase.rpc.return_value.execute.side_effect = Exception("PGRST202 Could not find the function")
+        supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {'metadata': {'previo': True}}
+        ]
+        buffer.agregar('doc-1', 'storage_validado', {'storage_verificado': True})
+        self.assertEqual(buffer.flush(), 1)
+
+        update = supabase.table.return_value.update.call_args[0][0]
+        self.assertEqual(update['etapa_actual'], 'storage_validado')
+        self.assertEqual(update['metadata'], {'previo': True, 'storage_verificado': True})
+
+        # La RPC no se vuelve a intentar en el mismo proceso
+        buffer.agregar('doc-2', 'storage_validado')
+        buffer.flush()
+        self.assertEqual(supabase.rpc.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Tests para las trazas por fase"""
+import unittest
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from trazas import Trazador, cargar_eventos, percentil, resumen_ejecucion
+
+
+class TestTrazas(unittest.TestCase):
+
+    def test_spans_anidados_por_hilo(self):
+        trazador = Trazador('fase2', run_id='123')
+
+        def documento(doc_id):
+            with trazador.span('documento', documento_id=doc_id) as atributos:
+                with trazador.span('descarga'):
+                    pass
+                atributos['metodo'] = 'pymupdf'
+
+        hilos = [threading.Thread(target=documento, args=(f'd{i}',)) for i in range(3)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        documentos = {s['span_id']: s for s in trazador.spans if s['nombre'] == 'documento'}
+        descargas = [s for s in trazador.spans if s['nombre'] == 'descarga']
+        self.assertEqual(len(documentos), 3)
+        for descarga in descargas:
+            padre = documentos[descarga['padre_id']]
+            self.assertEqual(padre['hilo'], descarga['hilo'])
+        self.assertTrue(all(s['padre_id'] is None for s in documentos.values()))
+        self.assertEqual({s['atributos']['metodo'] for s in documentos.values()}, {'pymupdf'})
+
+        resumen = trazador.resumen()
+        self.assertEqual(resumen['documento']['n'], 3)
+        self.assertGreaterEqual(resumen['documento']['p90_ms'], resumen['documento']['p50_ms'])
+
+    def test_error_y_formatos(self):
+        trazador = Trazador('fase3', run_id='123')
+        with self.assertRaises(ValueError):
+            with trazador.span('embedding', textos=4):
+                raise ValueError('api caída')
+
+        evento = [e for e in trazador.a_chrome()['traceEvents'] if e['ph'] == 'X'][0]
+        self.assertEqual((evento['name'], evento['cat']), ('embedding', 'fase3'))
+        self.assertEqual(evento['args']['error'], 'ValueError')
+
+        span = trazador.a_otlp()['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+        self.assertEqual(len(span['traceId']), 32)
+        self.assertEqual(span['status']['code'], 2)
+        self.assertEqual(span['attributes'], [{'key': 'textos', 'value': {'intValue': '4'}}])
+        self.assertGreaterEqual(int(span['endTimeUnixNano']), int(span['startTimeUnixNano']))
+
+    def test_combina_fases_de_la_misma_ejecucion(self):
+        directorio = tempfile.mkdtemp()
+        for servicio, run_id in (('fase2', '123'), ('fase3', '123'), ('fase3', '999')):
+            trazador = Trazador(servicio, run_id=run_id)
+            with trazador.span('documento'):
+                pass
+            trazador.exportar(directorio)
+        self.assertEqual(len([a for a in os.listdir(directorio) if a.endswith('.otlp.json')]), 3)
+
+        eventos = cargar_eventos(directorio, '123')
+        self.assertEqual({e['cat'] for e in eventos}, {'fase2', 'fase3'})
+        resumen = resumen_ejecucion(eventos)
+        self.assertEqual(resumen['spans'], 2)
+        self.assertEqual(set(resumen['fases']), {'fase2', 'fase3'})
+        self.assertEqual(resumen['etapas']['documento']['n'], 2)
+
+        # Eventos de metadata (ph 'M') se ignoran; sin eventos el total es 0
+        self.assertEqual(resumen_ejecucion([{'ph': 'M'}])['tiempo_total_ms'], 0)
+
+    def test_percentil_y_deshabilitado(self):
+        self.assertEqual(percentil([10.0, 20.0, 30.0, 40.0], 50), 25.0)
+        self.assertEqual(percentil([], 90), 0.0)
+
+        trazador = Trazador('fase2', run_id='1', habilitado=False)
+        with trazador.span('documento') as atributos:
+            atributos['x'] = 1
+        self.assertEqual(trazador.spans, [])
+        self.assertIsNone(trazador.exportar(tempfile.mkdtemp()))
+
+    def test_limite_de_spans_conserva_duraciones(self):
+        trazador = Trazador('fase3', run_id='1', max_spans=2)
+        for _ in range(5):
+            with trazador.span('escritura'):
+                pass
+        self.assertEqual(len(trazador.spans), 2)
+        self.assertEqual(trazador.descartados, 3)
+        self.assertEqual(trazador.resumen()['escritura']['n'], 5)
+        self.assertEqual(json.loads(json.dumps(trazador.a_chrome()))['otherData']['spans_descartados'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
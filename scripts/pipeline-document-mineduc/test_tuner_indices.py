@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Tests para el auto-tuner de índices vectoriales"""
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from tuner_indices import candidatos_lists, configuraciones_hnsw, generar_sql, probes_validos, recomendar
+
+
+def _medicion(construccion, busqueda, recall, p95, tipo='hnsw', tamano=1_000_000, segundos=10.0):
+    return {
+        'tipo': tipo,
+        'construccion': construccion,
+        'busqueda': busqueda,
+        'segundos_construccion': segundos,
+        'tamano_indice_bytes': tamano,
+        'corpus': 5000,
+        'k': 10,
+        'recall_at_k': recall,
+        'latencia_ms': {'p50': p95 / 2, 'p95': p95, 'p99': p95 * 2}
+    }
+
+
+class TestTunerIndices(unittest.TestCase):
+
+    def test_espacio_de_busqueda(self):
+        configuraciones = configuraciones_hnsw([8, 16, 32], [32, 64])
+        self.assertIn({'m': 16, 'ef_construction': 32}, configuraciones)
+        self.assertNotIn({'m': 32, 'ef_construction': 32}, configuraciones)
+        self.assertIn({'m': 32, 'ef_construction': 64}, configuraciones)
+
+        self.assertEqual(candidatos_lists(100_000), [50, 100, 200])
+        self.assertEqual(candidatos_lists(4_000_000), [1000, 2000, 4000])
+        self.assertEqual(candidatos_lists(300), [1, 2])
+        self.assertEqual(probes_validos([1, 4, 16, 64], 10), [1, 4, 10])
+
+    def test_recomienda_menor_latencia_que_cumple(self):
+        mediciones = [
+            _medicion({'m': 16, 'ef_construction': 64}, {'ef_search': 20}, 0.90, 2.0),
+            _medicion({'m': 16, 'ef_construction': 64}, {'ef_search': 80}, 0.97, 5.0),
+            _medicion({'m': 32, 'ef_construction': 128}, {'ef_search': 40}, 0.96, 4.0),
+            _medicion({'m': 32, 'ef_construction': 128}, {'ef_search': 160}, 0.99, 9.0),
+        ]
+        recomendacion = recomendar(mediciones, 0.95)
+        self.assertTrue(recomendacion['cumple_objetivo'])
+        self.assertEqual(recomendacion['candidatas_que_cumplen'], 3)
+        self.assertEqual(recomendacion['medicion']['busqueda'], {'ef_search': 40})
+
+        sin_objetivo = recomendar(mediciones, 0.995)
+        self.assertFalse(sin_objetivo['cumple_objetivo'])
+        self.assertEqual(sin_objetivo['medicion']['recall_at_k'], 0.99)
+        self.assertIsNone(recomendar([], 0.95))
+
+    def test_sql_generado(self):
+        hnsw = recomendar([_medicion({'m': 16, 'ef_construction': 64}, {'ef_search': 40}, 0.96, 3.0)], 0.95)
+        sql = generar_sql('chunks_documentos', hnsw, 'idx_chunks_embedding')
+        self.assertIn('using hnsw (embedding vector_cosine_ops)', sql)
+        self.assertIn('with (m = 16, ef_construction = 64)', sql)
+        self.assertIn('drop index concurrently if exists idx_chunks_embedding;', sql)
+        self.assertIn('alter index idx_chunks_embedding_nuevo rename to idx_chunks_embedding;', sql)
+        self.assertIn('alter function buscar_chunks_similares set hnsw.ef_search = 40;', sql)
+
+        # Sin índice previo: solo se crea, nada que reemplazar
+        sql = generar_sql('chunks_documentos', hnsw)
+        self.assertIn('create index concurrently if not exists idx_chunks_embedding\n', sql)
+        self.assertNotIn('drop index', sql)
+
+        ivf = recomendar([_medicion({'lists': 50}, {'probes': 8}, 0.9, 1.0, tipo='ivfflat')], 0.95)
+        sql = generar_sql('rubricas_mbe', ivf)
+        self.assertIn('with (lists = 50)', sql)
+        self.assertIn('alter function buscar_rubricas_similares set ivfflat.probes = 8;', sql)
+        self.assertIn('Ninguna configuración alcanzó', sql)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Tests para el scoring vectorizado de fase4"""
+import unittest
+import os
+import sys
+from unittest.mock import Mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fase4_validacion_calidad import ValidadorCalidad, estadisticas_texto, puntuar_calidad
+
+
+def _puntuar(docs):
+    columnas = {
+        campo: np.array([d[campo] for d in docs], dtype=np.int64)
+        for campo in ('longitud_texto', 'palabras_legibles', 'tiene_metadata_pdf',
+                      'total_chunks', 'sin_embedding', 'chunks_validos')
+    }
+    return puntuar_calidad(**columnas)
+
+
+class TestPuntuarCalidad(unittest.TestCase):
+
+    def test_documento_completo(self):
+        texto = "El docente planifica la enseñanza con evaluación formativa. " * 40
+        doc = dict(estadisticas_texto(texto), total_chunks=4, sin_embedding=0, chunks_validos=4)
+        self.assertAlmostEqual(_puntuar([doc])[0], 1.0)
+
+    def test_criterios_parciales(self):
+        texto = "palabra " * 60 + "endobj"
+        doc = dict(estadisticas_texto(texto), total_chunks=4, sin_embedding=2, chunks_validos=1)
+        # 0.08 (longitud) + 0.12 (palabras) + 0 (metadata) + 0.125 + 0.05
+        self.assertAlmostEqual(_puntuar([doc])[0], 0.375)
+
+    def test_sin_texto_ni_chunks(self):
+        vacio = dict(estadisticas_texto(''), total_chunks=3, sin_embedding=0, chunks_validos=3)
+        corto = dict(estadisticas_texto('hola'), total_chunks=0, sin_embedding=0, chunks_validos=0)
+        calidades = _puntuar([vacio, corto])
+        self.assertEqual(calidades[0], 0.0)
+        self.assertAlmostEqual(calidades[1], 0.15)
+
+    def test_rpc_paginada_por_cursor(self):
+        ids = [f'{i:08d}-0000-0000-0000-000000000000' for i in range(5)]
+        llamadas = []
+
+        def rpc(funcion, parametros):
+            llamadas.append(parametros)
+            posteriores = [i for i in ids if parametros['p_despues_de'] is None or i > parametros['p_despues_de']]
+            return Mock(execute=Mock(return_value=Mock(data=[{'id': i} for i in posteriores[:parametros['p_limite']]])))
+
+        validador = ValidadorCalidad.__new__(ValidadorCalidad)
+        validador.supabase = Mock(rpc=rpc)
+        filas = list(validador._paginar_rpc('validacion_calidad_documentos', tamano=2))
+        self.assertEqual([f['id'] for f in filas], ids)
+        self.assertEqual([p['p_despues_de'] for p in llamadas], [None, ids[1], ids[3]])
+
+    def test_duplicados_por_contenido_no_se_puntuan(self):
+        texto = "El docente planifica la enseñanza con evaluación formativa. " * 40
+        tablas = {
+            'documentos_oficiales': [
+                {'id': 'canonico', 'titulo': 'Guía', 'contenido_texto': texto, 'procesado': True, 'metadata': {}},
+                {'id': 'copia', 'titulo': 'Guía (copia)', 'contenido_texto': texto, 'procesado': True,
+                 'metadata': {'documento_canonico_id': 'canonico', 'chunks_compartidos_con': 'canonico'}}
+            ],
+            'chunks_documentos': [{'id': f'c{i}', 'documento_id': 'canonico', 'contenido': 'x' * 200,
+                                   'embedding': [0.1]} for i in range(4)]
+        }
+
+        class Query:
+            def __init__(self, filas):
+                self.filas = filas
+
+            def select(self, columnas):
+                return self
+
+            def order(self, columna):
+                return self
+
+            def eq(self, columna, valor):
+                return Query([f for f in self.filas if f[columna] == valor])
+
+            def is_(self, columna, valor):
+                if columna.startswith('metadata->>'):
+                    clave = columna.split('->>')[1]
+                    return Query([f for f in self.filas if (f['metadata'] or {}).get(clave) is None])
+                return Query([f for f in self.filas if f[columna] is None])
+
+            def range(self, desde, hasta):
+                return Mock(execute=Mock(return_value=Mock(data=[dict(f) for f in self.filas[desde:hasta + 1]])))
+
+        def rpc(funcion, parametros):
+            raise Exception('PGRST202 Could not find the function')
+
+        validador = ValidadorCalidad.__new__(ValidadorCalidad)
+        validador.supabase = Mock(rpc=rpc, table=lambda nombre: Query(tablas[nombre]))
+        validador._mostrar_reporte = Mock()
+        resultados = validador.validar_todos()
+
+        self.assertEqual([d['id'] for d in resultados['detalles']], ['canonico'])
+        self.assertEqual(resultados['rechazados'], 0)
+        self.assertAlmostEqual(resultados['calidad_promedio'], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
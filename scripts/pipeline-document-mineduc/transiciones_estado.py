@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Buffer compartido de transiciones de estado para documentos_oficiales
+
+Todas las fases actualizaban documentos_oficiales fila por fila (un
+round-trip PostgREST por documento, más otro para leer la metadata antes
+de mezclarla). Este módulo acumula transiciones (id, etapa, parche de
+metadata, columnas extra) y las aplica en bloque con una sola llamada RPC
+cada N filas o cada T milisegundos.
+
+GARANTÍAS:
+- Coalescencia: varias transiciones del mismo documento se fusionan
+  (última etapa gana, parches de metadata se mezclan)
+- Merge de metadata en el servidor (no requiere SELECT previo)
+- Crash-safe: flush automático en atexit y en SIGTERM
+- Fallback fila a fila si la RPC no está desplegada
+
+Variables de entorno:
+- TRANSICIONES_MAX_FILAS=50 (filas por llamada RPC)
+- TRANSICIONES_MAX_ESPERA_MS=2000 (antigüedad máxima de una transición pendiente)
+
+ESQUEMA BD REQUERIDO:
+    supabase/migrations/20260119001_transiciones_documentos_bulk.sql
+"""
+
+import os
+import atexit
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+MAX_FILAS = int(os.getenv('TRANSICIONES_MAX_FILAS', '50'))
+MAX_ESPERA_MS = int(os.getenv('TRANSICIONES_MAX_ESPERA_MS', '2000'))
+
+# Columnas de documentos_oficiales que la RPC sabe aplicar además de etapa/metadata
+CAMPOS_PERMITIDOS = {
+    'contenido_markdown',
+    'estado_procesamiento',
+    'procesado',
+    'fecha_procesamiento',
+    'fecha_actualizacion',
+    'embedding_model',
+    'progreso_procesamiento',
+    'error_procesamiento',
+    'etapa_fallida',
+    'rubrica_extraida',
+    'storage_path',
+}
+
+
+class BufferTransiciones:
+    """
+    Acumula transiciones de documentos_oficiales y las aplica en bloque.
+
+    Uso:
+        transiciones = BufferTransiciones(supabase)
+        transiciones.agregar(doc_id, 'transformado', {'tipo_pdf': 'texto_nativo'},
+                             contenido_markdown=markdown)
+        ...
+        transiciones.flush()  # opcional: también ocurre al salir del proceso
+    """
+
+    def __init__(self, supabase_client, max_filas: Optional[int] = None,
+                 max_espera_ms: Optional[int] = None, auto_flush: bool = True):
+        self.supabase = supabase_client
+        self.max_filas = max_filas or MAX_FILAS
+        self.max_espera_ms = max_espera_ms if max_espera_ms is not None else MAX_ESPERA_MS
+
+        self._pendientes: Dict[str, Dict] = {}
+        self._primera_pendiente: Optional[float] = None
+        self._lock = threading.Lock()
+        self._lock_envio = threading.Lock()
+        self._rpc_disponible = True
+        self._cerrado = False
+
+        self.filas_aplicadas = 0
+        self.llamadas_rpc = 0
+
+        atexit.register(self.flush)
+        _instalar_manejador_sigterm()
+
+        self._detener = threading.Event()
+        self._hilo = None
+        if auto_flush and self.max_espera_ms > 0:
+            self._hilo = threading.Thread(target=self._vigilar, daemon=True)
+            self._hilo.start()
+
+    # ============================================
+    # API PÚBLICA
+    # ============================================
+
+    def agregar(self, doc_id: str, etapa: Optional[str] = None,
+                metadata: Optional[Dict] = None, **campos) -> None:
+        """Encola una transición; se fusiona con otra pendiente del mismo documento"""
+
+        desconocidos = set(campos) - CAMPOS_PERMITIDOS
+        if desconocidos:
+            raise ValueError(f"Campos no soportados por la transición: {sorted(desconocidos)}")
+
+        lleno = False
+        with self._lock:
+            actual = self._pendientes.get(doc_id)
+            if actual is None:
+                actual = {'id': doc_id, 'etapa': None, 'metadata': None, 'campos': {}}
+                self._pendientes[doc_id] = actual
+                if self._primera_pendiente is None:
+                    self._primera_pendiente = time.monotonic()
+
+            if etapa is not None:
+                actual['etapa'] = etapa
+            if metadata:
+                actual['metadata'] = {**(actual['metadata'] or {}), **metadata}
+            actual['campos'].update(campos)
+
+            lleno = len(self._pendientes) >= self.max_filas
+
+        if lleno:
+            self.flush()
+
+    def pendientes(self) -> int:
+        with self._lock:
+            return len(self._pendientes)
+
+    def flush(self, doc_id: Optional[str] = None) -> int:
+        """
+        Aplica las transiciones pendientes (solo las de doc_id si se indica;
+        el resto sigue acumulándose). Retorna filas aplicadas.
+        """
+
+        with self._lock_envio:
+            with self._lock:
+                if doc_id is not None:
+                    fila = self._pendientes.pop(doc_id, None)
+                    if fila is None:
+                        return 0
+                    filas = [fila]
+                    if not self._pendientes:
+                        self._primera_pendiente = None
+                else:
+                    if not self._pendientes:
+                        return 0
+                    filas = list(self._pendientes.values())
+                    self._pendientes = {}
+                    self._primera_pendiente = None
+
+            aplicadas = 0
+            for inicio in range(0, len(filas), self.max_filas):
+                aplicadas += self._enviar(filas[inicio:inicio + self.max_filas])
+
+            self.filas_aplicadas += aplicadas
+            return aplicadas
+
+    def cerrar(self) -> None:
+        """Detiene el flush periódico y vacía el buffer"""
+        if self._cerrado:
+            return
+        self._cerrado = True
+        self._detener.set()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cerrar()
+        return False
+
+    # ============================================
+    # INTERNOS
+    # ============================================
+
+    def _vigilar(self):
+        """Hilo de fondo: flush cuando la transición más antigua supera max_espera_ms"""
+        intervalo = self.max_espera_ms / 1000
+        while not self._detener.wait(intervalo / 2):
+            with self._lock:
+                inicio = self._primera_pendiente
+            if inicio is not None and (time.monotonic() - inicio) * 1000 >= self.max_espera_ms:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"  ⚠️  Error en flush periódico de transiciones: {e}")
+
+    def _enviar(self, filas: List[Dict]) -> int:
+        if self._rpc_disponible:
+            try:
+                result = self.supabase.rpc('aplicar_transiciones_documentos', {
+                    'p_transiciones': [_serializar(f) for f in filas]
+                }).execute()
+                self.llamadas_rpc += 1
+                return result.data if isinstance(result.data, int) else len(filas)
+
+            except Exception as e:
+                mensaje = str(e)
+                if 'PGRST202' in mensaje or 'Could not find the function' in mensaje:
+                    print("  ⚠️  RPC aplicar_transiciones_documentos no desplegada - usando fallback fila a fila")
+                    self._rpc_disponible = False
+                else:
+                    print(f"  ⚠️  Error aplicando transiciones en bloque ({len(filas)} filas): {mensaje[:100]}")
+
+        return self._enviar_fila_a_fila(filas)
+
+    def _enviar_fila_a_fila(self, filas: List[Dict]) -> int:
+        """Fallback: equivalente al comportamiento previo (SELECT metadata + UPDATE)"""
+        aplicadas = 0
+        for fila in filas:
+            try:
+                update = dict(fila['campos'])
+                if fila['etapa'] is not None:
+                    update['etapa_actual'] = fila['etapa']
+
+                if fila['metadata']:
+                    result = self.supabase.table('documentos_oficiales')\
+                        .select('metadata')\
+                        .eq('id', fila['id'])\
+                        .execute()
+                    actual = (result.data[0].get('metadata') if result.data else None) or {}
+                    update['metadata'] = {**actual, **fila['metadata']}
+
+                if update:
+                    self.supabase.table('documentos_oficiales')\
+                        .update(update)\
+                        .eq('id', fila['id'])\
+                        .execute()
+                aplicadas += 1
+
+            except Exception as e:
+                print(f"  ⚠️  Error actualizando documento {fila['id']}: {e}")
+
+        return aplicadas
+
+
+def _serializar(fila: Dict) -> Dict:
+    campos = {
+        k: (v.isoformat() if isinstance(v, datetime) else v)
+        for k, v in fila['campos'].items()
+    }
+    return {
+        'id': fila['id'],
+        'etapa': fila['etapa'],
+        'metadata': fila['metadata'],
+        'campos': campos or None
+    }
+
+
+_SIGTERM_INSTALADO = False
+
+
+def _instalar_manejador_sigterm():
+    """Convierte SIGTERM en SystemExit para que atexit vacíe los buffers"""
+    global _SIGTERM_INSTALADO
+
+    if _SIGTERM_INSTALADO or threading.current_thread() is not threading.main_thread():
+        return
+
+    try:
+        if signal.getsignal(signal.SIGTERM) not in (signal.SIG_DFL, None):
+            return
+
+        def _salir(signum, frame):
+            print("\n⚠️  SIGTERM recibido - aplicando transiciones pendientes...")
+            raise SystemExit(128 + signum)
+
+        signal.signal(signal.SIGTERM, _salir)
+        _SIGTERM_INSTALADO = True
+    except (ValueError, AttributeError):
+        # Plataformas sin SIGTERM o intérprete embebido
+        pass
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Trazas por fase: spans anidados por documento y etapa bajo un run id común
+
+Los tiempos estaban dispersos (deltas de time.time() impresos en fase1.5 y
+fase2, tiempo_total_ms: 0 fijo en fase6, buckets gruesos en MetricasETL).
+Cada script registra spans (descarga, clasificación, OCR, llamada de
+visión, chunking, embedding, escritura) y al terminar exporta:
+
+- <servicio>-<run>-<pid>.trace.json: formato Chrome trace (chrome://tracing,
+  ui.perfetto.dev); los ids de span/padre y el run id van en 'args'
+- <servicio>-<run>-<pid>.otlp.json: OTLP/JSON (resourceSpans), importable
+  en cualquier backend OpenTelemetry
+- resumen por etapa (n, total, p50/p90/p99, máx) para los *_metrics.json
+
+Todos los jobs de un workflow comparten GITHUB_RUN_ID, por lo que sus
+trazas se combinan (resumen_ejecucion) en fase6 para obtener el tiempo de
+pared real de la ejecución.
+
+Uso:
+    from trazas import span
+    with span('documento', documento_id=doc['id']):
+        with span('descarga'):
+            ...
+
+Variables de entorno:
+- PIPELINE_RUN_ID (por defecto GITHUB_RUN_ID[-GITHUB_RUN_ATTEMPT] o local_<fecha>)
+- PIPELINE_TRAZAS=true
+- PIPELINE_TRAZAS_DIR=trazas
+- PIPELINE_TRAZAS_MAX_SPANS=200000 (sobre el límite solo se acumulan duraciones)
+"""
+
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+TRAZAS_HABILITADAS = os.getenv('PIPELINE_TRAZAS', 'true').lower() == 'true'
+TRAZAS_DIR = os.getenv('PIPELINE_TRAZAS_DIR', 'trazas')
+MAX_SPANS = int(os.getenv('PIPELINE_TRAZAS_MAX_SPANS', '200000'))
+
+
+def id_ejecucion() -> str:
+    """Run id compartido por todas las fases de una ejecución"""
+    if os.getenv('PIPELINE_RUN_ID'):
+        return os.getenv('PIPELINE_RUN_ID')
+    if os.getenv('GITHUB_RUN_ID'):
+        intento = os.getenv('GITHUB_RUN_ATTEMPT', '1')
+        return os.getenv('GITHUB_RUN_ID') + ('' if intento == '1' else f"-{intento}")
+    return f"local_{datetime.now():%Y%m%d_%H%M%S}"
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por interpolación lineal (valores ya ordenados)"""
+    if not valores:
+        return 0.0
+    posicion = (len(valores) - 1) * p / 100.0
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicion - inferior)
+
+
+def resumir_duraciones(duraciones: Dict[str, List[float]]) -> Dict[str, Dict]:
+    """{etapa: [ms, ...]} → {etapa: {n, total_ms, p50_ms, p90_ms, p99_ms, max_ms}}"""
+    resumen = {}
+    for nombre, valores in sorted(duraciones.items()):
+        ordenados = sorted(valores)
+        resumen[nombre] = {
+            'n': len(ordenados),
+            'total_ms': round(sum(ordenados), 1),
+            'p50_ms': round(percentil(ordenados, 50), 1),
+            'p90_ms': round(percentil(ordenados, 90), 1),
+            'p99_ms': round(percentil(ordenados, 99), 1),
+            'max_ms': round(ordenados[-1], 1) if ordenados else 0.0
+        }
+    return resumen
+
+
+def _valor_otlp(valor) -> Dict:
+    if isinstance(valor, bool):
+        return {'boolValue': valor}
+    if isinstance(valor, int):
+        return {'intValue': str(valor)}
+    if isinstance(valor, float):
+        return {'doubleValue': valor}
+    return {'stringValue': str(valor)}
+
+
+# ============================================
+# TRAZADOR
+# ============================================
+
+class Trazador:
+    """Spans de un proceso; el anidamiento se sigue por hilo"""
+
+    def __init__(self, servicio: str, run_id: Optional[str] = None,
+                 habilitado: bool = TRAZAS_HABILITADAS, max_spans: int = MAX_SPANS):
+        self.servicio = servicio
+        self.run_id = run_id or id_ejecucion()
+        self.trace_id = hashlib.sha256(self.run_id.encode()).hexdigest()[:32]
+        self.habilitado = habilitado
+        self.max_spans = max_spans
+        self.spans: List[Dict] = []
+        self.duraciones: Dict[str, List[float]] = {}
+        self.descartados = 0
+        self._pila = threading.local()
+        self._lock = threading.Lock()
+
+    def _activos(self) -> List[str]:
+        if not hasattr(self._pila, 'ids'):
+            self._pila.ids = []
+        return self._pila.ids
+
+    @contextmanager
+    def span(self, nombre: str, **atributos):
+        """Registra un span; el dict entregado admite atributos conocidos al final"""
+        if not self.habilitado:
+            yield atributos
+            return
+
+        activos = self._activos()
+        span_id = os.urandom(8).hex()
+        padre = activos[-1] if activos else None
+        activos.append(span_id)
+        inicio_ns = time.time_ns()
+        inicio_perf = time.perf_counter_ns()
+        error = None
+        try:
+            yield atributos
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            activos.pop()
+            duracion_ns = time.perf_counter_ns() - inicio_perf
+            self._registrar({
+                'nombre': nombre,
+                'span_id': span_id,
+                'padre_id': padre,
+                'inicio_ns': inicio_ns,
+                'duracion_ns': duracion_ns,
+                'hilo': threading.get_ident(),
+                'atributos': atributos,
+                'error': error
+            })
+
+    def _registrar(self, registro: Dict):
+        with self._lock:
+            self.duraciones.setdefault(registro['nombre'], []).append(registro['duracion_ns'] / 1e6)
+            if len(self.spans) < self.max_spans:
+                self.spans.append(registro)
+            else:
+                self.descartados += 1
+
+    def resumen(self) -> Dict[str, Dict]:
+        with self._lock:
+            return resumir_duraciones(self.duraciones)
+
+    # ============================================
+    # EXPORTACIÓN
+    # ============================================
+
+    def a_chrome(self) -> Dict:
+        pid = os.getpid()
+        eventos = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': self.servicio}}]
+        for s in self.spans:
+            eventos.append({
+                'name': s['nombre'],
+                'cat': self.servicio,
+                'ph': 'X',
+                'ts': s['inicio_ns'] / 1000.0,
+                'dur': s['duracion_ns'] / 1000.0,
+                'pid': pid,
+                'tid': s['hilo'],
+                'args': {
+                    **s['atributos'],
+                    'span_id': s['span_id'],
+                    'padre_id': s['padre_id'],
+                    **({'error': s['error']} if s['error'] else {})
+                }
+            })
+        return {
+            'traceEvents': eventos,
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'run_id': self.run_id,
+                'trace_id': self.trace_id,
+                'servicio': self.servicio,
+                'spans_descartados': self.descartados
+            }
+        }
+
+    def a_otlp(self) -> Dict:
+        spans = []
+        for s in self.spans:
+            span = {
+                'traceId': self.trace_id,
+                'spanId': s['span_id'],
+                'name': s['nombre'],
+                'kind': 1,
+                'startTimeUnixNano': str(s['inicio_ns']),
+                'endTimeUnixNano': str(s['inicio_ns'] + s['duracion_ns']),
+                'attributes': [{'key': k, 'value': _valor_otlp(v)} for k, v in s['atributos'].items()]
+            }
+            if s['padre_id']:
+                span['parentSpanId'] = s['padre_id']
+            if s['error']:
+                span['status'] = {'code': 2, 'message': s['error']}
+            spans.append(span)
+        return {'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': self.servicio}},
+                {'key': 'pipeline.run_id', 'value': {'stringValue': self.run_id}}
+            ]},
+            'scopeSpans': [{'scope': {'name': 'trazas'}, 'spans': spans}]
+        }]}
+
+    def exportar(self, directorio: str = TRAZAS_DIR) -> Optional[str]:
+        """Escribe .trace.json y .otlp.json; retorna la ruta del Chrome trace"""
+        if not self.habilitado or not self.spans:
+            return None
+        try:
+            os.makedirs(directorio, exist_ok=True)
+            base = os.path.join(directorio, f"{self.servicio}-{self.run_id}-{os.getpid()}")
+            with self._lock:
+                chrome, otlp = self.a_chrome(), self.a_otlp()
+            with open(base + '.trace.json', 'w', encoding='utf-8') as f:
+                json.dump(chrome, f, ensure_ascii=False)
+            with open(base + '.otlp.json', 'w', encoding='utf-8') as f:
+                json.dump(otlp, f, ensure_ascii=False)
+            print(f"\n🧭 Trazas exportadas: {base}.trace.json ({len(self.spans):,} spans)")
+            return base + '.trace.json'
+        except Exception as e:
+            print(f"\n⚠️ Error exportando trazas: {e}")
+            return None
+
+
+# ============================================
+# TRAZADOR DEL PROCESO
+# ============================================
+
+_trazador: Optional[Trazador] = None
+_lock_global = threading.Lock()
+
+
+def obtener_trazador(servicio: Optional[str] = None) -> Trazador:
+    """Trazador único del proceso (el servicio por defecto es el nombre del script)"""
+    global _trazador
+    with _lock_global:
+        if _trazador is None:
+            nombre = servicio or os.path.splitext(os.path.basename(sys.argv[0] or 'pipeline'))[0]
+            _trazador = Trazador(nombre)
+        return _trazador
+
+
+def span(nombre: str, **atributos):
+    """Span en el trazador del proceso"""
+    return obtener_trazador().span(nombre, **atributos)
+
+
+# ============================================
+# COMBINACIÓN ENTRE FASES
+# ============================================
+
+def cargar_eventos(directorio: str = TRAZAS_DIR, run_id: Optional[str] = None) -> List[Dict]:
+    """Eventos 'X' de todos los Chrome traces del directorio con ese run id"""
+    run_id = run_id or id_ejecucion()
+    eventos = []
+    for ruta in sorted(glob.glob(os.path.join(directorio, '**', '*.trace.json'), recursive=True)):
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                traza = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if (traza.get('otherData') or {}).get('run_id') != run_id:
+            continue
+        eventos.extend(e for e in traza.get('traceEvents', []) if e.get('ph') == 'X')
+    return eventos
+
+
+def resumen_ejecucion(eventos: Iterable[Dict]) -> Dict:
+    """Tiempo de pared de la ejecución, por fase, y percentiles por etapa"""
+    eventos = [e for e in eventos if e.get('ph') == 'X']
+    if not eventos:
+        return {'spans': 0, 'tiempo_total_ms': 0, 'fases': {}, 'etapas': {}, 'documentos_por_fase': {}}
+
+    limites: Dict[str, List[float]] = {}
+    duraciones: Dict[str, List[float]] = {}
+    documentos: Dict[str, List[float]] = {}
+    for e in eventos:
+        fin = e['ts'] + e['dur']
+        inicio_fase, fin_fase = limites.get(e['cat'], (e['ts'], fin))
+        limites[e['cat']] = (min(inicio_fase, e['ts']), max(fin_fase, fin))
+        duraciones.setdefault(e['name'], []).append(e['dur'] / 1000.0)
+        if e['name'] == 'documento':
+            documentos.setdefault(e['cat'], []).append(e['dur'] / 1000.0)
+
+    inicio = min(i for i, _ in limites.values())
+    fin = max(f for _, f in limites.values())
+    return {
+        'spans': len(eventos),
+        'tiempo_total_ms': int((fin - inicio) / 1000),
+        'fases': {fase: int((f - i) / 1000) for fase, (i, f) in sorted(limites.items())},
+        'etapas': resumir_duraciones(duraciones),
+        # Latencia por documento dentro de cada fase (spans 'documento')
+        'documentos_por_fase': resumir_duraciones(documentos)
+    }
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Auto-tuner de parámetros de índices vectoriales (HNSW / IVFFlat)
+
+Los parámetros de los índices están fijos en el esquema y migraciones
+(ivfflat de chunks_documentos con los valores por defecto, ivfflat de
+rubricas_mbe con lists = 100), sin relación con el tamaño real del corpus.
+Este script:
+
+1. Copia una muestra de los embeddings a una tabla snapshot UNLOGGED
+   (tuning_<tabla>) para no tocar los índices de producción
+2. Para cada configuración de construcción (m / ef_construction en HNSW,
+   lists en IVFFlat) crea el índice y mide tiempo de construcción y tamaño
+3. Para cada parámetro de búsqueda (ef_search / probes) mide recall@k contra
+   el top-k exacto (NumPy) y latencias p50/p95/p99
+4. Recomienda la configuración que cumple el recall objetivo con la menor
+   latencia p95 y emite el SQL para aplicarla, reemplazando el índice que
+   exista hoy sobre <tabla>(embedding) según pg_indexes
+
+Requiere un DSN: CREATE INDEX y los SET de sesión no son posibles vía RPC.
+
+Uso:
+    python scripts/pipeline-document-mineduc/tuner_indices.py \\
+        [--tabla chunks_documentos|rubricas_mbe] [--dsn postgresql://...] \\
+        [--muestra 50000] [--consultas 100] [--recall-objetivo 0.95] \\
+        [--m 8,16,32] [--ef-construction 64,128] [--ef-search 20,40,80,160] \\
+        [--lists 50,100,200] [--probes 1,2,4,8,16]
+
+Salidas: tuning_indices.json (todas las mediciones + recomendación) y
+tuning_indices.sql (SQL a revisar y aplicar).
+
+Variables de entorno:
+- DATABASE_URL (si no se pasa --dsn)
+- EMBEDDING_DIMENSIONS=1536
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+    from dotenv import load_dotenv
+except ImportError:
+    print("❌ Instalar: pip install python-dotenv numpy")
+    sys.exit(1)
+
+from benchmark_retrieval import (BackendPostgres, _apilar, conectar_postgres,
+                                 ejecutar_benchmark, export_metrics_json)
+
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))
+
+TIPO_HNSW = 'hnsw'
+TIPO_IVFFLAT = 'ivfflat'
+
+# Tipo a evaluar, nombre del índice si la tabla aún no tiene uno sobre
+# embedding, y función de búsqueda (parámetros de búsqueda se fijan a nivel
+# de función con ALTER FUNCTION ... SET)
+TABLAS = {
+    'chunks_documentos': {
+        'tipo': TIPO_HNSW,
+        'indice': 'idx_chunks_embedding',
+        'funcion': 'buscar_chunks_similares'
+    },
+    'rubricas_mbe': {
+        'tipo': TIPO_IVFFLAT,
+        'indice': 'idx_rubricas_embedding',
+        'funcion': 'buscar_rubricas_similares'
+    }
+}
+
+M_DEFECTO = [8, 16, 32]
+EF_CONSTRUCTION_DEFECTO = [64, 128]
+EF_SEARCH_DEFECTO = [20, 40, 80, 160]
+PROBES_DEFECTO = [1, 2, 4, 8, 16, 32]
+
+
+# ============================================
+# ESPACIO DE BÚSQUEDA
+# ============================================
+
+def configuraciones_hnsw(ms: List[int], efs_construccion: List[int]) -> List[Dict]:
+    """Combinaciones válidas (pgvector exige ef_construction >= 2 * m)"""
+    return [
+        {'m': m, 'ef_construction': ef}
+        for m in ms
+        for ef in efs_construccion
+        if ef >= 2 * m
+    ]
+
+
+def candidatos_lists(filas: int) -> List[int]:
+    """
+    Candidatos de lists alrededor de la guía de pgvector:
+    filas / 1000 hasta 1M de filas, sqrt(filas) por encima
+    """
+    base = filas / 1000 if filas <= 1_000_000 else math.sqrt(filas)
+    base = max(1, int(round(base)))
+    return sorted({max(1, base // 2), base, base * 2})
+
+
+def probes_validos(probes: List[int], lists: int) -> List[int]:
+    """probes > lists equivale a búsqueda exhaustiva: se recorta a lists"""
+    return sorted({min(p, lists) for p in probes if p > 0})
+
+
+# ============================================
+# RECOMENDACIÓN
+# ============================================
+
+def recomendar(mediciones: List[Dict], recall_objetivo: float) -> Optional[Dict]:
+    """
+    Entre las mediciones que cumplen el recall objetivo, la de menor latencia
+    p95 (desempate: índice más pequeño, construcción más rápida). Si ninguna
+    lo cumple, la de mayor recall.
+    """
+    medidas = [m for m in mediciones if m.get('recall_at_k') is not None]
+    if not medidas:
+        return None
+
+    cumplen = [m for m in medidas if m['recall_at_k'] >= recall_objetivo]
+    if cumplen:
+        elegida = min(cumplen, key=lambda m: (
+            m['latencia_ms']['p95'],
+            m['tamano_indice_bytes'],
+            m['segundos_construccion']
+        ))
+    else:
+        elegida = max(medidas, key=lambda m: (m['recall_at_k'], -m['latencia_ms']['p95']))
+
+    return {
+        'medicion': elegida,
+        'recall_objetivo': recall_objetivo,
+        'cumple_objetivo': bool(cumplen),
+        'candidatas_que_cumplen': len(cumplen)
+    }
+
+
+def generar_sql(tabla: str, recomendacion: Dict, indice_actual: Optional[str] = None) -> str:
+    """
+    SQL para aplicar la recomendación sin dejar la tabla sin índice.
+    indice_actual es el índice ANN que hoy existe sobre embedding (ver
+    indice_existente); sin él se crea el índice con el nombre de TABLAS.
+    """
+    config = TABLAS[tabla]
+    medicion = recomendacion['medicion']
+    construccion = medicion['construccion']
+    busqueda = medicion['busqueda']
+    indice = indice_actual or config['indice']
+
+    if medicion['tipo'] == TIPO_HNSW:
+        opciones = f"m = {construccion['m']}, ef_construction = {construccion['ef_construction']}"
+        ajuste = f"hnsw.ef_search = {busqueda['ef_search']}"
+    else:
+        opciones = f"lists = {construccion['lists']}"
+        ajuste = f"ivfflat.probes = {busqueda['probes']}"
+
+    lineas = [
+        f"-- Recomendación tuner_indices.py ({datetime.now().date().isoformat()})",
+        f"-- recall@{medicion['k']} {medicion['recall_at_k']:.4f} | "
+        f"p95 {medicion['latencia_ms']['p95']} ms | "
+        f"muestra {medicion['corpus']:,} filas",
+    ]
+    if not recomendacion['cumple_objetivo']:
+        lineas.append(f"-- ⚠️ Ninguna configuración alcanzó recall {recomendacion['recall_objetivo']}: "
+                      "se recomienda la de mayor recall")
+    if indice_actual:
+        lineas += [
+            "",
+            f"-- Construir el nuevo índice junto al actual ({indice_actual}) y reemplazarlo",
+            f"create index concurrently if not exists {indice}_nuevo",
+            f"  on {tabla} using {medicion['tipo']} (embedding vector_cosine_ops)",
+            f"  with ({opciones});",
+            f"drop index concurrently if exists {indice};",
+            f"alter index {indice}_nuevo rename to {indice};",
+        ]
+    else:
+        lineas += [
+            "",
+            f"-- {tabla} no tiene índice ANN sobre embedding",
+            f"create index concurrently if not exists {indice}",
+            f"  on {tabla} using {medicion['tipo']} (embedding vector_cosine_ops)",
+            f"  with ({opciones});",
+        ]
+    lineas += [
+        "",
+        "-- Parámetro de búsqueda solo para la función RAG",
+        f"alter function {config['funcion']} set {ajuste};",
+        ""
+    ]
+    return "\n".join(lineas)
+
+
+# ============================================
+# MEDICIÓN SOBRE SNAPSHOT
+# ============================================
+
+class BackendSnapshot(BackendPostgres):
+    """Búsqueda SQL sobre la tabla snapshot, forzando el uso del índice"""
+
+    nombre = 'snapshot'
+
+    def __init__(self, dsn: str, tabla: str, ef_search: Optional[int] = None,
+                 probes: Optional[int] = None):
+        super().__init__(dsn, ef_search=ef_search, probes=probes)
+        self.sql = (f"select id::text from {tabla} "
+                    f"order by embedding <=> %s::vector limit %s")
+
+    def conexion(self):
+        nueva = getattr(self._local, 'conexion', None) is None
+        conexion = super().conexion()
+        if nueva:
+            # En muestras pequeñas el planner prefiere seq scan (recall 100%)
+            with conexion.cursor() as cursor:
+                cursor.execute("set enable_seqscan = off")
+        return conexion
+
+    def buscar(self, vector: np.ndarray, k: int) -> List[str]:
+        texto = '[' + ','.join(f'{x:.7g}' for x in vector) + ']'
+        with self.conexion().cursor() as cursor:
+            cursor.execute(self.sql, (texto, k))
+            return [fila[0] for fila in cursor.fetchall()]
+
+
+class TunerIndices:
+    """Construye cada configuración sobre el snapshot y mide"""
+
+    def __init__(self, dsn: str, tabla: str, muestra: int, consultas: int = 100,
+                 k: int = 10, concurrencia: int = 4, maintenance_work_mem: Optional[str] = None):
+        self.dsn = dsn
+        self.tabla = tabla
+        self.snapshot = f'tuning_{tabla}'
+        self.muestra = muestra
+        self.consultas = consultas
+        self.k = k
+        self.concurrencia = concurrencia
+        self.conexion = conectar_postgres(dsn)
+        if maintenance_work_mem:
+            self._ejecutar(f"set maintenance_work_mem = '{maintenance_work_mem}'")
+        self.ids: List[str] = []
+        self.matriz = None
+
+    def _ejecutar(self, sql: str, parametros=None):
+        with self.conexion.cursor() as cursor:
+            cursor.execute(sql, parametros)
+            return cursor.fetchall() if cursor.description else None
+
+    def crear_snapshot(self):
+        print(f"\n📸 Snapshot {self.snapshot} ({self.muestra:,} filas máx.)")
+        self._ejecutar(f"drop table if exists {self.snapshot}")
+        self._ejecutar(
+            f"create unlogged table {self.snapshot} as "
+            f"select id, embedding from {self.tabla} "
+            f"where embedding is not null order by random() limit %s",
+            (self.muestra,)
+        )
+        filas = self._ejecutar(f"select id::text, embedding::text from {self.snapshot}")
+        self.ids, self.matriz = _apilar(filas, EMBEDDING_DIMENSIONS)
+        print(f"   ✅ {len(self.ids):,} vectores ({self.matriz.nbytes / 1e6:.1f} MB)")
+
+    def eliminar_snapshot(self):
+        self._ejecutar(f"drop table if exists {self.snapshot}")
+
+    def indice_existente(self) -> Optional[str]:
+        """
+        Índice HNSW/IVFFlat que hoy existe sobre <tabla>(embedding), leído de
+        pg_indexes como en politica_reindexado (el de embedding_half no cuenta)
+        """
+        filas = self._ejecutar(
+            "select indexname from pg_indexes "
+            "where schemaname = 'public' and tablename = %s "
+            "and indexdef ~* 'using (hnsw|ivfflat) \\(embedding ' "
+            "order by indexname",
+            (self.tabla,)
+        )
+        return filas[0][0] if filas else None
+
+    def _construir(self, tipo: str, opciones: Dict) -> Dict:
+        indice = f'{self.snapshot}_idx'
+        with_sql = ', '.join(f'{clave} = {int(valor)}' for clave, valor in opciones.items())
+        self._ejecutar(f"drop index if exists {indice}")
+        inicio = time.perf_counter()
+        self._ejecutar(
+            f"create index {indice} on {self.snapshot} "
+            f"using {tipo} (embedding vector_cosine_ops) with ({with_sql})"
+        )
+        segundos = time.perf_counter() - inicio
+        tamano = self._ejecutar("select pg_relation_size(%s::regclass)", (indice,))[0][0]
+        return {'segundos_construccion': round(segundos, 2), 'tamano_indice_bytes': int(tamano)}
+
+    def _medir(self, tipo: str, construccion: Dict, estructura: Dict, busqueda: Dict) -> Dict:
+        backend = BackendSnapshot(self.dsn, self.snapshot, **busqueda)
+        resultado = ejecutar_benchmark(backend, self.ids, self.matriz, self.consultas,
+                                       self.k, self.concurrencia)
+        medicion = {'tipo': tipo, 'construccion': construccion, 'busqueda': busqueda}
+        medicion.update(estructura)
+        medicion.update({clave: resultado[clave] for clave in
+                         ('corpus', 'k', 'recall_at_k', 'recall_min', 'latencia_ms', 'consultas_por_segundo')})
+
+        parametros = ', '.join(f'{c}={v}' for c, v in {**construccion, **busqueda}.items())
+        print(f"   {parametros:<45} recall {medicion['recall_at_k']:.2%} | "
+              f"p95 {medicion['latencia_ms']['p95']}ms")
+        return medicion
+
+    def barrer_hnsw(self, configuraciones: List[Dict], efs_search: List[int]) -> List[Dict]:
+        mediciones = []
+        for construccion in configuraciones:
+            estructura = self._construir(TIPO_HNSW, construccion)
+            print(f"\n🏗️  HNSW {construccion}: {estructura['segundos_construccion']}s, "
+                  f"{estructura['tamano_indice_bytes'] / 1e6:.1f} MB")
+            for ef in efs_search:
+                mediciones.append(self._medir(TIPO_HNSW, construccion, estructura, {'ef_search': ef}))
+        return mediciones
+
+    def barrer_ivfflat(self, lists: List[int], probes: List[int]) -> List[Dict]:
+        mediciones = []
+        for n_lists in lists:
+            construccion = {'lists': n_lists}
+            estructura = self._construir(TIPO_IVFFLAT, construccion)
+            print(f"\n🏗️  IVFFlat {construccion}: {estructura['segundos_construccion']}s, "
+                  f"{estructura['tamano_indice_bytes'] / 1e6:.1f} MB")
+            for p in probes_validos(probes, n_lists):
+                mediciones.append(self._medir(TIPO_IVFFLAT, construccion, estructura, {'probes': p}))
+        return mediciones
+
+
+def _enteros(valor: Optional[str]) -> Optional[List[int]]:
+    return [int(v) for v in valor.split(',') if v.strip()] if valor else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Auto-tuner de índices vectoriales')
+    parser.add_argument('--tabla', choices=sorted(TABLAS), default='chunks_documentos')
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--muestra', type=int, default=50_000)
+    parser.add_argument('--consultas', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--concurrencia', type=int, default=4)
+    parser.add_argument('--recall-objetivo', type=float, default=0.95)
+    parser.add_argument('--m', help='Lista de m (HNSW), ej: 8,16,32')
+    parser.add_argument('--ef-construction', help='Lista de ef_construction (HNSW)')
+    parser.add_argument('--ef-search', help='Lista de ef_search (HNSW)')
+    parser.add_argument('--lists', help='Lista de lists (IVFFlat); por defecto según tamaño')
+    parser.add_argument('--probes', help='Lista de probes (IVFFlat)')
+    parser.add_argument('--maintenance-work-mem', default=None, help="Ej: '1GB'")
+    parser.add_argument('--conservar-snapshot', action='store_true')
+    parser.add_argument('--output', default='tuning_indices.json')
+    parser.add_argument('--sql-output', default='tuning_indices.sql')
+    args = parser.parse_args()
+
+    load_dotenv('.env.local')
+
+    print("\n" + "=" * 60)
+    print("🎛️  TUNER DE ÍNDICES VECTORIALES")
+    print("=" * 60)
+
+    if not args.dsn:
+        print("❌ Requiere --dsn o DATABASE_URL (CREATE INDEX no es posible vía RPC)")
+        sys.exit(1)
+
+    tipo = TABLAS[args.tabla]['tipo']
+    tuner = TunerIndices(args.dsn, args.tabla, args.muestra, args.consultas, args.k,
+                         args.concurrencia, args.maintenance_work_mem)
+    tuner.crear_snapshot()
+    if len(tuner.ids) <= args.k:
+        print("   ⚠️ Muy pocos vectores para medir recall")
+        tuner.eliminar_snapshot()
+        sys.exit(1)
+
+    try:
+        if tipo == TIPO_HNSW:
+            configuraciones = configuraciones_hnsw(_enteros(args.m) or M_DEFECTO,
+                                                   _enteros(args.ef_construction) or EF_CONSTRUCTION_DEFECTO)
+            mediciones = tuner.barrer_hnsw(configuraciones, _enteros(args.ef_search) or EF_SEARCH_DEFECTO)
+        else:
+            lists = _enteros(args.lists) or candidatos_lists(len(tuner.ids))
+            mediciones = tuner.barrer_ivfflat(lists, _enteros(args.probes) or PROBES_DEFECTO)
+    finally:
+        if not args.conservar_snapshot:
+            tuner.eliminar_snapshot()
+
+    recomendacion = recomendar(mediciones, args.recall_objetivo)
+    resultado = {
+        'timestamp': datetime.now().isoformat(),
+        'tabla': args.tabla,
+        'tipo': tipo,
+        'muestra': len(tuner.ids),
+        'recall_objetivo': args.recall_objetivo,
+        'mediciones': mediciones,
+        'recomendacion': recomendacion
+    }
+
+    if recomendacion:
+        elegida = recomendacion['medicion']
+        icono = "✅" if recomendacion['cumple_objetivo'] else "⚠️"
+        print(f"\n{icono} Recomendación: {elegida['construccion']} {elegida['busqueda']}")
+        print(f"   Recall@{args.k}: {elegida['recall_at_k']:.2%} | p95 {elegida['latencia_ms']['p95']}ms | "
+              f"construcción {elegida['segundos_construccion']}s | "
+              f"{elegida['tamano_indice_bytes'] / 1e6:.1f} MB")
+
+        indice_actual = tuner.indice_existente()
+        if indice_actual is None:
+            print(f"   ⚠️ {args.tabla} no tiene índice ANN sobre embedding: se creará {TABLAS[args.tabla]['indice']}")
+        sql = generar_sql(args.tabla, recomendacion, indice_actual)
+        with open(args.sql_output, 'w', encoding='utf-8') as f:
+            f.write(sql)
+        print(f"\n📝 SQL para aplicar: {args.sql_output}")
+        print(sql)
+
+    export_metrics_json(resultado, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Decodificación de embeddings pgvector a arreglos NumPy
+
+PostgREST devuelve las columnas vector como texto "[0.1,0.2,...]" y el
+caché de embeddings las guarda como listas JSON. Estas utilidades los
+convierten a float32 contiguo sin pasar por json.loads fila a fila.
+"""
+
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+
+def decodificar_vector(valor) -> Optional[np.ndarray]:
+    """Texto pgvector, lista o arreglo → vector float32 (None si no hay valor)"""
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        texto = valor.strip()
+        if texto.startswith('[') and texto.endswith(']'):
+            texto = texto[1:-1]
+        if not texto:
+            return np.empty(0, dtype=np.float32)
+        return np.fromstring(texto, sep=',', dtype=np.float32)
+    return np.asarray(valor, dtype=np.float32).ravel()
+
+
+def matriz_float32(valores: Iterable, dimensiones: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Apila vectores en una matriz (n, dimensiones) float32.
+
+    Returns:
+        (matriz, validos): las filas sin valor o con otra dimensión quedan en
+        cero y validos[i] = False.
+    """
+    valores = list(valores)
+    matriz = np.zeros((len(valores), dimensiones), dtype=np.float32)
+    validos = np.zeros(len(valores), dtype=bool)
+
+    for i, valor in enumerate(valores):
+        vector = decodificar_vector(valor)
+        if vector is not None and vector.shape[0] == dimensiones:
+            matriz[i] = vector
+            validos[i] = True
+
+    return matriz, validos
+
+
+def normalizar_filas(matriz: np.ndarray) -> np.ndarray:
+    """Normaliza L2 cada fila en sitio (las filas nulas quedan en cero)"""
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    np.divide(matriz, normas, out=matriz, where=normas > 0)
+    return matriz
+
+
+def cuantizar_int8(matriz: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cuantización int8 simétrica por fila.
+
+    Returns:
+        (codigos int8, escalas float32) con matriz ≈ codigos * escalas[:, None]
+    """
+    matriz = np.asarray(matriz, dtype=np.float32)
+    maximos = np.abs(matriz).max(axis=1) if matriz.size else np.zeros(len(matriz), dtype=np.float32)
+    escalas = (maximos / 127.0).astype(np.float32)
+    divisor = np.where(escalas > 0, escalas, 1.0)[:, None]
+    codigos = np.clip(np.rint(matriz / divisor), -127, 127).astype(np.int8)
+    return codigos, escalas
+
+
+def decuantizar_int8(codigos: np.ndarray, escalas: np.ndarray) -> np.ndarray:
+    """Inversa de cuantizar_int8 (float32)"""
+    return codigos.astype(np.float32) * np.asarray(escalas, dtype=np.float32)[:, None]
@@ -5,18 +5,25 @@ from dotenv import load_dotenv
 from supabase import create_client
 from openai import OpenAI
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pipeline-document-mineduc'))
+from transiciones_estado import BufferTransiciones
+from cola_pendientes import ColaPendientes
+
 load_dotenv('.env.local')
 supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
 openai = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+transiciones = BufferTransiciones(supabase)
 
-docs = supabase.table('documentos_oficiales')\
-    .select('id, contenido_texto')\
-    .eq('tipo_documento', 'rubricas')\
-    .eq('procesado', True)\
-    .limit(10)\
-    .execute().data or []
+# Backlog completo de rúbricas sin extraer (páginas keyset pedidas a demanda)
+docs = ColaPendientes(
+    supabase,
+    'id, contenido_texto',
+    lambda q: q.eq('tipo_documento', 'rubricas')
+               .eq('procesado', True)
+               .not_.is_('rubrica_extraida', 'true')
+)
 
-print(f"🤖 Extrayendo rúbricas de {len(docs)} documentos...")
+print(f"🤖 Extrayendo rúbricas pendientes (páginas de {docs.tamano_pagina})...")
 
 extracted = 0
 for doc in docs:
@@ -29,11 +36,12 @@ for doc in docs:
         )
         
         rubricas = json.loads(resp.choices[0].message.content)
-        supabase.table('documentos_oficiales').update({'rubrica_extraida': True}).eq('id', doc['id']).execute()
+        transiciones.agregar(doc['id'], rubrica_extraida=True)
         extracted += 1
         print(f"✅ {doc['id']}")
     except Exception as e:
         print(f"❌ {doc['id']}: {e}")
 
-print(f"\nExtraídas: {extracted}")
+transiciones.flush()
+print(f"\nExtraídas: {extracted}/{docs.entregados}")
 sys.exit(0 if extracted > 0 else 1)
@@ -0,0 +1,58 @@
+-- Transiciones de estado en bloque para documentos_oficiales
+-- Usada por scripts/pipeline-document-mineduc/transiciones_estado.py
+--
+-- p_transiciones: arreglo JSON de objetos
+--   { "id": uuid, "etapa": text|null, "metadata": jsonb|null, "campos": jsonb|null }
+-- La metadata se mezcla (||) con la existente; "campos" solo aplica columnas conocidas.
+
+create or replace function aplicar_transiciones_documentos(p_transiciones jsonb)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  filas integer;
+begin
+  update documentos_oficiales d
+  set
+    etapa_actual = coalesce(t.etapa, d.etapa_actual),
+    metadata = case
+      when t.metadata is null then d.metadata
+      else coalesce(d.metadata, '{}'::jsonb) || t.metadata
+    end,
+    contenido_markdown = case when t.campos ? 'contenido_markdown'
+      then t.campos->>'contenido_markdown' else d.contenido_markdown end,
+    estado_procesamiento = case when t.campos ? 'estado_procesamiento'
+      then t.campos->>'estado_procesamiento' else d.estado_procesamiento end,
+    procesado = case when t.campos ? 'procesado'
+      then (t.campos->>'procesado')::boolean else d.procesado end,
+    fecha_procesamiento = case when t.campos ? 'fecha_procesamiento'
+      then (t.campos->>'fecha_procesamiento')::timestamptz else d.fecha_procesamiento end,
+    fecha_actualizacion = case when t.campos ? 'fecha_actualizacion'
+      then (t.campos->>'fecha_actualizacion')::timestamptz else d.fecha_actualizacion end,
+    embedding_model = case when t.campos ? 'embedding_model'
+      then t.campos->>'embedding_model' else d.embedding_model end,
+    progreso_procesamiento = case when t.campos ? 'progreso_procesamiento'
+      then (t.campos->>'progreso_procesamiento')::integer else d.progreso_procesamiento end,
+    error_procesamiento = case when t.campos ? 'error_procesamiento'
+      then t.campos->>'error_procesamiento' else d.error_procesamiento end,
+    etapa_fallida = case when t.campos ? 'etapa_fallida'
+      then t.campos->>'etapa_fallida' else d.etapa_fallida end,
+    rubrica_extraida = case when t.campos ? 'rubrica_extraida'
+      then (t.campos->>'rubrica_extraida')::boolean else d.rubrica_extraida end,
+    storage_path = case when t.campos ? 'storage_path'
+      then t.campos->>'storage_path' else d.storage_path end
+  from jsonb_to_recordset(p_transiciones) as t(id uuid, etapa text, metadata jsonb, campos jsonb)
+  where d.id = t.id;
+
+  get diagnostics filas = row_count;
+  return filas;
+end;
+$$;
+
+comment on function aplicar_transiciones_documentos(jsonb) is
+'Aplica en un solo UPDATE un lote de transiciones de etapa/metadata de documentos_oficiales';
+
+revoke all on function aplicar_transiciones_documentos(jsonb) from public, anon, authenticated;
+grant execute on function aplicar_transiciones_documentos(jsonb) to service_role;
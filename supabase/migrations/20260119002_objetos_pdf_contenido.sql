@@ -0,0 +1,25 @@
+-- Almacén direccionado por contenido: SHA-256 del PDF → objeto canónico en Storage
+-- Usado por scripts/pipeline-document-mineduc/almacen_contenido.py
+
+create table if not exists objetos_pdf (
+  sha256 text primary key,
+  storage_path text not null,
+  documento_canonico_id uuid references documentos_oficiales(id) on delete set null,
+  tamano_bytes bigint,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists objetos_pdf_documento_idx on objetos_pdf (documento_canonico_id);
+
+-- Documentos que apuntan a un canónico (para reportes y para fase3)
+create index if not exists documentos_oficiales_canonico_idx
+  on documentos_oficiales ((metadata->>'documento_canonico_id'))
+  where metadata ? 'documento_canonico_id';
+
+comment on table objetos_pdf is
+'Registro SHA-256 → objeto canónico: evita subir, transformar y embeber varias veces el mismo PDF';
+
+alter table objetos_pdf enable row level security;
+
+create policy "Service role access" on objetos_pdf
+  for all using (auth.role() = 'service_role');
@@ -0,0 +1,20 @@
+-- Firmas MinHash del Markdown extraído para detección de casi duplicados
+-- Usado por scripts/pipeline-document-mineduc/casi_duplicados.py
+
+create table if not exists firmas_minhash_documentos (
+  documento_id uuid primary key references documentos_oficiales(id) on delete cascade,
+  num_perm integer not null,
+  firma bigint[] not null,
+  tipo_documento text,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists firmas_minhash_num_perm_idx on firmas_minhash_documentos (num_perm);
+
+comment on table firmas_minhash_documentos is
+'Firmas MinHash (shingles de palabras) para detectar re-ediciones casi idénticas de documentos MINEDUC';
+
+alter table firmas_minhash_documentos enable row level security;
+
+create policy "Service role access" on firmas_minhash_documentos
+  for all using (auth.role() = 'service_role');
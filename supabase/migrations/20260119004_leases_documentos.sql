@@ -0,0 +1,105 @@
+-- Leases sobre documentos_oficiales para repartir una fase entre varios runners
+-- Usado por scripts/pipeline-document-mineduc/leases.py
+--
+-- Un documento está libre si lease_expira es null o ya venció. reclamar_documentos
+-- toma N documentos libres con FOR UPDATE SKIP LOCKED, así dos runners concurrentes
+-- nunca reciben la misma fila.
+
+alter table documentos_oficiales
+  add column if not exists lease_owner text,
+  add column if not exists lease_expira timestamptz;
+
+create index if not exists documentos_oficiales_lease_idx
+  on documentos_oficiales (etapa_actual, lease_expira, created_at, id);
+
+-- Reclama hasta p_cantidad documentos de la etapa indicada
+create or replace function reclamar_documentos(
+  p_etapa text,
+  p_owner text,
+  p_cantidad integer default 5,
+  p_lease_segundos integer default 900,
+  p_solo_no_procesados boolean default false
+)
+returns setof documentos_oficiales
+language sql
+security definer
+set search_path = public
+as $$
+  with candidatos as (
+    select id
+    from documentos_oficiales
+    where etapa_actual = p_etapa
+      and (not p_solo_no_procesados or procesado = false)
+      and (lease_expira is null or lease_expira < now())
+    order by created_at, id
+    limit p_cantidad
+    for update skip locked
+  )
+  update documentos_oficiales d
+  set lease_owner = p_owner,
+      lease_expira = now() + make_interval(secs => p_lease_segundos)
+  from candidatos c
+  where d.id = c.id
+  returning d.*;
+$$;
+
+-- Extiende todos los leases vigentes de un runner (heartbeat)
+create or replace function renovar_leases_documentos(
+  p_owner text,
+  p_lease_segundos integer default 900
+)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  filas integer;
+begin
+  update documentos_oficiales
+  set lease_expira = now() + make_interval(secs => p_lease_segundos)
+  where lease_owner = p_owner;
+
+  get diagnostics filas = row_count;
+  return filas;
+end;
+$$;
+
+-- Libera leases de un runner. p_reintentar_en_segundos > 0 deja el documento
+-- bloqueado ese tiempo (backoff tras un fallo) sin dueño que lo renueve.
+create or replace function liberar_documentos(
+  p_owner text,
+  p_ids uuid[] default null,
+  p_reintentar_en_segundos integer default 0
+)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  filas integer;
+begin
+  update documentos_oficiales
+  set lease_owner = null,
+      lease_expira = case
+        when p_reintentar_en_segundos > 0 then now() + make_interval(secs => p_reintentar_en_segundos)
+        else null
+      end
+  where lease_owner = p_owner
+    and (p_ids is null or id = any(p_ids));
+
+  get diagnostics filas = row_count;
+  return filas;
+end;
+$$;
+
+comment on function reclamar_documentos(text, text, integer, integer, boolean) is
+'Reclama documentos libres de una etapa con FOR UPDATE SKIP LOCKED y les asigna un lease';
+
+revoke all on function reclamar_documentos(text, text, integer, integer, boolean) from public, anon, authenticated;
+revoke all on function renovar_leases_documentos(text, integer) from public, anon, authenticated;
+revoke all on function liberar_documentos(text, uuid[], integer) from public, anon, authenticated;
+grant execute on function reclamar_documentos(text, text, integer, integer, boolean) to service_role;
+grant execute on function renovar_leases_documentos(text, integer) to service_role;
+grant execute on function liberar_documentos(text, uuid[], integer) to service_role;
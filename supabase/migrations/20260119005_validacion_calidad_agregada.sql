@@ -0,0 +1,52 @@
+-- Estadísticas de calidad por documento en una sola consulta agregada
+-- Usada por scripts/pipeline-document-mineduc/fase4_validacion_calidad.py
+--
+-- Reemplaza el patrón N+1 (una consulta a chunks_documentos por documento
+-- trayendo embedding y contenido completos) por un GROUP BY que solo
+-- devuelve contadores. Paginable con offset/limit desde PostgREST.
+
+create or replace function validacion_calidad_documentos()
+returns table (
+  id uuid,
+  titulo text,
+  longitud_texto integer,
+  palabras_legibles integer,
+  tiene_metadata_pdf boolean,
+  total_chunks integer,
+  sin_embedding integer,
+  chunks_validos integer
+)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  with chunks as (
+    select
+      c.documento_id,
+      count(*)::integer as total_chunks,
+      count(*) filter (where c.embedding is null)::integer as sin_embedding,
+      count(*) filter (where length(c.contenido) > 100)::integer as chunks_validos
+    from chunks_documentos c
+    group by c.documento_id
+  )
+  select
+    d.id,
+    d.titulo::text,
+    coalesce(length(d.contenido_texto), 0),
+    coalesce(regexp_count(d.contenido_texto, '\m[a-zA-ZÀ-ſ]{3,}\M'), 0),
+    coalesce(d.contenido_texto ~* '(endobj|endstream|flatedecode)', false),
+    coalesce(ch.total_chunks, 0),
+    coalesce(ch.sin_embedding, 0),
+    coalesce(ch.chunks_validos, 0)
+  from documentos_oficiales d
+  left join chunks ch on ch.documento_id = d.id
+  where d.procesado = true
+  order by d.id;
+$$;
+
+comment on function validacion_calidad_documentos() is
+'Contadores de texto y chunks por documento procesado para el scoring vectorizado de fase4';
+
+revoke all on function validacion_calidad_documentos() from public, anon, authenticated;
+grant execute on function validacion_calidad_documentos() to service_role;
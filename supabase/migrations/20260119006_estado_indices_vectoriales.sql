@@ -0,0 +1,54 @@
+-- Estado de construcción de índices vectoriales para la política de reindexado
+-- Usado por scripts/pipeline-document-mineduc/politica_reindexado.py
+--
+-- Guarda los contadores acumulados de pg_stat_user_tables al momento de la
+-- última reconstrucción; la diferencia con los actuales da las filas
+-- insertadas/actualizadas/eliminadas desde entonces.
+
+create table if not exists estado_indices_vectoriales (
+  indice text primary key,
+  tabla text not null,
+  filas_al_construir bigint not null default 0,
+  insertados_al_construir bigint not null default 0,
+  actualizados_al_construir bigint not null default 0,
+  eliminados_al_construir bigint not null default 0,
+  recall_al_construir numeric,
+  construido_at timestamptz not null default now(),
+  metadata jsonb not null default '{}'::jsonb
+);
+
+comment on table estado_indices_vectoriales is
+'Snapshot de contadores de la tabla en la última reconstrucción de cada índice vectorial';
+
+alter table estado_indices_vectoriales enable row level security;
+
+create policy "Service role access" on estado_indices_vectoriales
+  for all using (auth.role() = 'service_role');
+
+-- Contadores acumulados de cambios de una tabla (pg_stat_user_tables)
+create or replace function estadisticas_cambios_tabla(p_tabla text)
+returns table (
+  filas_vivas bigint,
+  insertados bigint,
+  actualizados bigint,
+  eliminados bigint,
+  ultimo_analyze timestamptz
+)
+language sql
+stable
+security definer
+set search_path = public, pg_catalog
+as $$
+  select
+    s.n_live_tup,
+    s.n_tup_ins,
+    s.n_tup_upd,
+    s.n_tup_del,
+    greatest(s.last_analyze, s.last_autoanalyze)
+  from pg_stat_user_tables s
+  where s.schemaname = 'public'
+    and s.relname = p_tabla;
+$$;
+
+revoke all on function estadisticas_cambios_tabla(text) from public, anon, authenticated;
+grant execute on function estadisticas_cambios_tabla(text) to service_role;
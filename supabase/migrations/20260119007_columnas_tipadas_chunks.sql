@@ -0,0 +1,135 @@
+-- Columnas tipadas de chunks_documentos para búsqueda vectorial pre-filtrada
+-- Usado por scripts/pipeline-document-mineduc/columnas_chunks.py y fase3_load.py
+--
+-- Los atributos filtrables vivían solo en metadata (JSONB). Se promueven a
+-- columnas con índices B-tree/GIN para que los filtros de
+-- buscar_chunks_similares se resuelvan antes de ordenar por distancia.
+
+alter table chunks_documentos
+  add column if not exists dominios_mbe text[] not null default '{}',
+  add column if not exists nivel_educativo varchar(50),
+  add column if not exists modulo smallint,
+  add column if not exists nivel_desempeno varchar(20);
+
+create index if not exists idx_chunks_dominios_mbe on chunks_documentos using gin (dominios_mbe);
+create index if not exists idx_chunks_nivel_educativo on chunks_documentos (nivel_educativo);
+create index if not exists idx_chunks_modulo on chunks_documentos (modulo) where modulo is not null;
+create index if not exists idx_chunks_nivel_desempeno on chunks_documentos (nivel_desempeno) where nivel_desempeno is not null;
+-- Backfill: chunks pendientes de poblar
+create index if not exists idx_chunks_sin_tipo on chunks_documentos (id) where tipo_contenido is null;
+
+-- Actualización en bloque de columnas tipadas (backfill)
+-- p_filas: [{"id": ..., "seccion": ..., "dominios_mbe": [...], ...}, ...]
+create or replace function actualizar_columnas_chunks(p_filas jsonb)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_actualizados integer;
+begin
+  update chunks_documentos c
+  set
+    seccion = f.seccion,
+    dominio_mbe = f.dominio_mbe,
+    dominios_mbe = coalesce(f.dominios_mbe, '{}'),
+    tipo_contenido = f.tipo_contenido,
+    nivel_educativo = f.nivel_educativo,
+    modulo = f.modulo,
+    nivel_desempeno = f.nivel_desempeno,
+    pagina_numero = f.pagina_numero
+  from jsonb_to_recordset(p_filas) as f(
+    id uuid,
+    seccion varchar,
+    dominio_mbe varchar,
+    dominios_mbe text[],
+    tipo_contenido varchar,
+    nivel_educativo varchar,
+    modulo smallint,
+    nivel_desempeno varchar,
+    pagina_numero integer
+  )
+  where c.id = f.id;
+
+  get diagnostics v_actualizados = row_count;
+  return v_actualizados;
+end;
+$$;
+
+revoke all on function actualizar_columnas_chunks(jsonb) from public, anon, authenticated;
+grant execute on function actualizar_columnas_chunks(jsonb) to service_role;
+
+-- Búsqueda RAG con filtros sobre columnas tipadas.
+-- SQL dinámico: solo los filtros activos llegan al planner, que puede elegir
+-- el índice B-tree/GIN y ordenar por distancia solo las filas que califican
+-- (con "(p is null or col = p)" el plan genérico no usa esos índices).
+drop function if exists buscar_chunks_similares(vector, float, int, int, varchar, varchar);
+
+create or replace function buscar_chunks_similares(
+  query_embedding vector(1536),
+  match_threshold float default 0.7,
+  match_count int default 10,
+  p_año_vigencia int default null,
+  p_dominio_mbe varchar default null,
+  p_tipo_contenido varchar default null,
+  p_nivel_educativo varchar default null,
+  p_modulo int default null,
+  p_nivel_desempeno varchar default null
+)
+returns table (
+  chunk_id uuid,
+  documento_id uuid,
+  titulo_documento varchar,
+  contenido text,
+  seccion varchar,
+  similarity float,
+  metadata jsonb
+)
+language plpgsql
+stable
+as $$
+declare
+  v_filtros text := '';
+begin
+  if p_año_vigencia is not null then
+    v_filtros := v_filtros || ' and d.año_vigencia = $4';
+  end if;
+  if p_dominio_mbe is not null then
+    v_filtros := v_filtros || ' and c.dominios_mbe @> array[lower($5)]::text[]';
+  end if;
+  if p_tipo_contenido is not null then
+    v_filtros := v_filtros || ' and c.tipo_contenido = $6';
+  end if;
+  if p_nivel_educativo is not null then
+    v_filtros := v_filtros || ' and c.nivel_educativo = $7';
+  end if;
+  if p_modulo is not null then
+    v_filtros := v_filtros || ' and c.modulo = $8';
+  end if;
+  if p_nivel_desempeno is not null then
+    v_filtros := v_filtros || ' and c.nivel_desempeno = $9';
+  end if;
+
+  return query execute format($q$
+    select
+      c.id,
+      c.documento_id,
+      d.titulo,
+      c.contenido,
+      c.seccion,
+      1 - (c.embedding <=> $1) as similarity,
+      c.metadata
+    from chunks_documentos c
+    join documentos_oficiales d on d.id = c.documento_id
+    where d.es_version_actual = true
+      and c.embedding is not null
+      %s
+      and (1 - (c.embedding <=> $1)) > $2
+    order by c.embedding <=> $1
+    limit $3
+  $q$, v_filtros)
+  using query_embedding, match_threshold, match_count, p_año_vigencia, p_dominio_mbe,
+        p_tipo_contenido, p_nivel_educativo, p_modulo, p_nivel_desempeno;
+end;
+$$;
@@ -0,0 +1,190 @@
+-- Almacenamiento de embeddings en precisión reducida
+-- Usado por scripts/pipeline-document-mineduc/embeddings_reducidos.py y fase3_load.py
+--
+-- chunks_documentos: columna halfvec (2 bytes por dimensión) mantenida por
+-- trigger desde embedding. Esta migración solo agrega la columna (más
+-- almacenamiento, no menos); la memoria del índice se reduce a la mitad en
+-- el cambio de índice, fuera de la transacción de la migración:
+--   1. embeddings_reducidos.py backfill --solo chunks
+--   2. embeddings_reducidos.py activar-halfvec (DATABASE_URL): crea
+--      idx_chunks_embedding_half con CONCURRENTLY, fija
+--      app.embedding_busqueda = 'halfvec' en buscar_chunks_similares y
+--      elimina el índice ANN float32 de embedding
+--
+-- embeddings_cache: int8 con escala por vector (1 byte por dimensión); el
+-- float32 pasa a ser opcional para liberar espacio tras el backfill.
+
+-- ============================================
+-- chunks_documentos: halfvec
+-- ============================================
+
+alter table chunks_documentos
+  add column if not exists embedding_half halfvec(1536);
+
+create or replace function sincronizar_embedding_half()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.embedding_half := new.embedding::halfvec(1536);
+  return new;
+end;
+$$;
+
+drop trigger if exists trigger_embedding_half on chunks_documentos;
+create trigger trigger_embedding_half
+  before insert or update of embedding on chunks_documentos
+  for each row
+  execute function sincronizar_embedding_half();
+
+-- idx_chunks_embedding_half no se crea aquí: un CREATE INDEX sin
+-- CONCURRENTLY bloquea las escrituras de chunks_documentos durante toda la
+-- construcción. Lo crea activar-halfvec tras el backfill.
+
+-- Backfill por lotes de filas existentes (devuelve filas actualizadas; 0 = terminado)
+create or replace function backfill_embedding_half(p_limite int default 5000)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_actualizados integer;
+begin
+  update chunks_documentos c
+  set embedding_half = c.embedding::halfvec(1536)
+  where c.id in (
+    select id from chunks_documentos
+    where embedding is not null and embedding_half is null
+    limit p_limite
+    for update skip locked
+  );
+
+  get diagnostics v_actualizados = row_count;
+  return v_actualizados;
+end;
+$$;
+
+revoke all on function backfill_embedding_half(int) from public, anon, authenticated;
+grant execute on function backfill_embedding_half(int) to service_role;
+
+-- ============================================
+-- embeddings_cache: int8 + escala
+-- ============================================
+
+alter table embeddings_cache
+  add column if not exists embedding_int8 bytea,
+  add column if not exists embedding_escala real;
+
+alter table embeddings_cache alter column embedding drop not null;
+
+-- p_filas: [{"content_hash": ..., "model": ..., "embedding_int8": "\\x...", "embedding_escala": ...}]
+create or replace function actualizar_cache_int8(p_filas jsonb, p_liberar_float32 boolean default false)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_actualizados integer;
+begin
+  update embeddings_cache e
+  set
+    embedding_int8 = f.embedding_int8,
+    embedding_escala = f.embedding_escala,
+    embedding = case when p_liberar_float32 then null else e.embedding end
+  from jsonb_to_recordset(p_filas) as f(
+    content_hash text,
+    model text,
+    embedding_int8 bytea,
+    embedding_escala real
+  )
+  where e.content_hash = f.content_hash
+    and e.model = f.model;
+
+  get diagnostics v_actualizados = row_count;
+  return v_actualizados;
+end;
+$$;
+
+revoke all on function actualizar_cache_int8(jsonb, boolean) from public, anon, authenticated;
+grant execute on function actualizar_cache_int8(jsonb, boolean) to service_role;
+
+-- ============================================
+-- Búsqueda RAG: columna configurable por función
+-- ============================================
+
+create or replace function buscar_chunks_similares(
+  query_embedding vector(1536),
+  match_threshold float default 0.7,
+  match_count int default 10,
+  p_año_vigencia int default null,
+  p_dominio_mbe varchar default null,
+  p_tipo_contenido varchar default null,
+  p_nivel_educativo varchar default null,
+  p_modulo int default null,
+  p_nivel_desempeno varchar default null
+)
+returns table (
+  chunk_id uuid,
+  documento_id uuid,
+  titulo_documento varchar,
+  contenido text,
+  seccion varchar,
+  similarity float,
+  metadata jsonb
+)
+language plpgsql
+stable
+as $$
+declare
+  v_filtros text := '';
+  v_columna text := 'c.embedding';
+  v_distancia text := 'c.embedding <=> $1';
+begin
+  if current_setting('app.embedding_busqueda', true) = 'halfvec' then
+    v_columna := 'c.embedding_half';
+    v_distancia := 'c.embedding_half <=> $1::halfvec(1536)';
+  end if;
+
+  if p_año_vigencia is not null then
+    v_filtros := v_filtros || ' and d.año_vigencia = $4';
+  end if;
+  if p_dominio_mbe is not null then
+    v_filtros := v_filtros || ' and c.dominios_mbe @> array[lower($5)]::text[]';
+  end if;
+  if p_tipo_contenido is not null then
+    v_filtros := v_filtros || ' and c.tipo_contenido = $6';
+  end if;
+  if p_nivel_educativo is not null then
+    v_filtros := v_filtros || ' and c.nivel_educativo = $7';
+  end if;
+  if p_modulo is not null then
+    v_filtros := v_filtros || ' and c.modulo = $8';
+  end if;
+  if p_nivel_desempeno is not null then
+    v_filtros := v_filtros || ' and c.nivel_desempeno = $9';
+  end if;
+
+  return query execute format($q$
+    select
+      c.id,
+      c.documento_id,
+      d.titulo,
+      c.contenido,
+      c.seccion,
+      1 - (%1$s) as similarity,
+      c.metadata
+    from chunks_documentos c
+    join documentos_oficiales d on d.id = c.documento_id
+    where d.es_version_actual = true
+      and %3$s is not null
+      %2$s
+      and (1 - (%1$s)) > $2
+    order by %1$s
+    limit $3
+  $q$, v_distancia, v_filtros, v_columna)
+  using query_embedding, match_threshold, match_count, p_año_vigencia, p_dominio_mbe,
+        p_tipo_contenido, p_nivel_educativo, p_modulo, p_nivel_desempeno;
+end;
+$$;
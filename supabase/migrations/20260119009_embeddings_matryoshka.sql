@@ -0,0 +1,60 @@
+-- Caché de embeddings a tamaño completo (Matryoshka)
+-- Usado por scripts/pipeline-document-mineduc/matryoshka.py y fase3_load.py
+--
+-- embeddings_cache guarda el vector nativo del modelo (3072 para
+-- text-embedding-3-large); las columnas destino reciben dimensiones menores
+-- por truncado + renormalización en el pipeline.
+
+-- La columna del caché deja de fijar la dimensión (si era vector(n))
+do $$
+begin
+  if exists (
+    select 1 from information_schema.columns
+    where table_schema = 'public'
+      and table_name = 'embeddings_cache'
+      and column_name = 'embedding'
+      and udt_name = 'vector'
+  ) then
+    alter table embeddings_cache alter column embedding type vector using embedding::vector;
+  end if;
+end $$;
+
+-- Búsqueda por (hash, modelo) eligiendo la mayor dimensión disponible
+create index if not exists idx_embeddings_cache_hash_modelo_dim
+  on embeddings_cache (content_hash, model, dimensions desc);
+
+-- Escribe vectores derivados en una columna embedding_<sufijo> de chunks_documentos
+-- p_filas: [{"id": ..., "embedding": [...]}, ...]
+create or replace function actualizar_embedding_derivado(p_columna text, p_filas jsonb)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_actualizados integer;
+begin
+  if p_columna !~ '^embedding_[a-z0-9_]+$' or not exists (
+    select 1 from information_schema.columns
+    where table_schema = 'public'
+      and table_name = 'chunks_documentos'
+      and column_name = p_columna
+  ) then
+    raise exception 'Columna destino inválida: %', p_columna;
+  end if;
+
+  execute format(
+    'update chunks_documentos c
+     set %1$I = (f.embedding::text)::vector
+     from jsonb_to_recordset($1) as f(id uuid, embedding jsonb)
+     where c.id = f.id',
+    p_columna
+  ) using p_filas;
+
+  get diagnostics v_actualizados = row_count;
+  return v_actualizados;
+end;
+$$;
+
+revoke all on function actualizar_embedding_derivado(text, jsonb) from public, anon, authenticated;
+grant execute on function actualizar_embedding_derivado(text, jsonb) to service_role;
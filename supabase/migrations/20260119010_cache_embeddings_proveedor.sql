@@ -0,0 +1,15 @@
+-- Proveedor de embeddings como parte de la clave del caché
+-- Usado por scripts/pipeline-document-mineduc/proveedores_embedding.py,
+-- matryoshka.py y fase3_load.py
+--
+-- Un mismo texto embebido con OpenAI y con un modelo local ONNX produce
+-- vectores de espacios distintos: el caché se indexa por
+-- (content_hash, provider, model). Las filas existentes son de OpenAI.
+
+alter table embeddings_cache
+  add column if not exists provider text not null default 'openai';
+
+drop index if exists idx_embeddings_cache_hash_modelo_dim;
+
+create index if not exists idx_embeddings_cache_hash_proveedor_modelo_dim
+  on embeddings_cache (content_hash, provider, model, dimensions desc);
@@ -0,0 +1,74 @@
+-- Carga reanudable de chunks (fase3)
+-- Usado por scripts/pipeline-document-mineduc/journal_carga.py y fase3_load.py
+--
+-- progreso_carga_documentos es el journal por documento: cuántos chunks ya
+-- quedaron escritos (upsert por documento_id, chunk_index) para la huella
+-- actual del chunking. Si el runner muere, la siguiente ejecución retoma
+-- desde ese punto. finalizar_carga_documento cierra el documento en una
+-- sola transacción: recorta chunks sobrantes de un intento anterior,
+-- verifica el total, marca el documento completado y borra el journal.
+
+create table if not exists progreso_carga_documentos (
+  documento_id uuid primary key references documentos_oficiales(id) on delete cascade,
+  huella text not null,
+  total_chunks integer not null,
+  chunks_escritos integer not null default 0,
+  chunks_reutilizados integer not null default 0,
+  tokens integer not null default 0,
+  costo_usd numeric(12, 6) not null default 0,
+  worker text,
+  actualizado_en timestamptz not null default now()
+);
+
+alter table progreso_carga_documentos enable row level security;
+
+-- Upsert del documento reanudado: el conflicto (documento_id, chunk_index)
+-- ya está cubierto por la restricción unique de chunks_documentos.
+
+create or replace function finalizar_carga_documento(
+  p_documento_id uuid,
+  p_total_chunks integer,
+  p_metadata jsonb,
+  p_embedding_model text
+)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_chunks integer;
+begin
+  -- Cola de un intento anterior con otro chunking
+  delete from chunks_documentos
+  where documento_id = p_documento_id
+    and chunk_index >= p_total_chunks;
+
+  select count(*) into v_chunks
+  from chunks_documentos
+  where documento_id = p_documento_id;
+
+  if v_chunks <> p_total_chunks then
+    raise exception 'Documento % incompleto: % de % chunks', p_documento_id, v_chunks, p_total_chunks;
+  end if;
+
+  update documentos_oficiales
+  set
+    etapa_actual = 'completado',
+    metadata = coalesce(metadata, '{}'::jsonb) || coalesce(p_metadata, '{}'::jsonb),
+    procesado = true,
+    fecha_procesamiento = now(),
+    embedding_model = p_embedding_model,
+    progreso_procesamiento = 100,
+    estado_procesamiento = 'exitoso',
+    error_procesamiento = null
+  where id = p_documento_id;
+
+  delete from progreso_carga_documentos where documento_id = p_documento_id;
+
+  return v_chunks;
+end;
+$$;
+
+revoke all on function finalizar_carga_documento(uuid, integer, jsonb, text) from public, anon, authenticated;
+grant execute on function finalizar_carga_documento(uuid, integer, jsonb, text) to service_role;
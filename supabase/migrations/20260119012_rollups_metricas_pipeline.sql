@@ -0,0 +1,162 @@
+-- Rollups incrementales por hora y por día de metricas_pipeline_rag
+-- Usado por scripts/pipeline-document-mineduc/rollups_metricas.py y fase6_metrics.py
+--
+-- fase6 releía 30 días de filas crudas en cada ejecución para el promedio
+-- histórico y las líneas base de regresiones. Cada ejecución ahora se
+-- acumula al insertarse en una fila por hora y otra por día: contadores,
+-- sumas y sketches de cuantiles (histogramas logarítmicos con error
+-- relativo acotado) que se fusionan sumando buckets. Las comparaciones
+-- históricas leen a lo más una fila por día.
+--
+-- Formato de un sketch (jsonb):
+--   {"n": 12, "suma": 3400.5, "min": 120.0, "max": 910.0, "ceros": 0,
+--    "buckets": {"236": 3, "241": 9}}
+-- metricas_ejecucion: un valor por ejecución (s_por_doc, tokens_por_doc, ...)
+-- latencias: duraciones de spans (documento.<fase>, etapa.<nombre>) en ms
+
+alter table metricas_pipeline_rag add column if not exists metadata jsonb;
+
+create index if not exists idx_metricas_pipeline_rag_created_at
+  on metricas_pipeline_rag(created_at);
+
+create table if not exists metricas_pipeline_rollups (
+  granularidad text not null check (granularidad in ('hora', 'dia')),
+  periodo timestamptz not null,
+  ejecuciones integer not null default 0,
+  documentos_monitoreados bigint not null default 0,
+  documentos_procesados bigint not null default 0,
+  chunks_validados bigint not null default 0,
+  errores_criticos bigint not null default 0,
+  tokens bigint not null default 0,
+  costo_usd numeric(14, 6) not null default 0,
+  duracion_total_s double precision not null default 0,
+  metricas_ejecucion jsonb not null default '{}'::jsonb,
+  latencias jsonb not null default '{}'::jsonb,
+  actualizado_en timestamptz not null default now(),
+  primary key (granularidad, periodo)
+);
+
+-- Ejecuciones ya acumuladas: reintentos de fase6 o del backfill no duplican
+create table if not exists metricas_pipeline_rollups_aplicadas (
+  metrica_id uuid primary key references metricas_pipeline_rag(id) on delete cascade,
+  aplicado_en timestamptz not null default now()
+);
+
+alter table metricas_pipeline_rollups enable row level security;
+alter table metricas_pipeline_rollups_aplicadas enable row level security;
+
+create or replace function fusionar_sketch(a jsonb, b jsonb)
+returns jsonb
+language sql
+immutable
+set search_path = public
+as $$
+  select case
+    when a is null then b
+    when b is null then a
+    else jsonb_build_object(
+      'n', coalesce((a->>'n')::bigint, 0) + coalesce((b->>'n')::bigint, 0),
+      'suma', coalesce((a->>'suma')::double precision, 0) + coalesce((b->>'suma')::double precision, 0),
+      'min', least((a->>'min')::double precision, (b->>'min')::double precision),
+      'max', greatest((a->>'max')::double precision, (b->>'max')::double precision),
+      'ceros', coalesce((a->>'ceros')::bigint, 0) + coalesce((b->>'ceros')::bigint, 0),
+      'buckets', coalesce((
+        select jsonb_object_agg(indice, total)
+        from (
+          select key as indice, sum(value::bigint) as total
+          from (
+            select key, value from jsonb_each_text(coalesce(a->'buckets', '{}'::jsonb))
+            union all
+            select key, value from jsonb_each_text(coalesce(b->'buckets', '{}'::jsonb))
+          ) x
+          group by key
+        ) y
+      ), '{}'::jsonb)
+    )
+  end;
+$$;
+
+-- {clave: sketch} ⊕ {clave: sketch}
+create or replace function fusionar_sketches(a jsonb, b jsonb)
+returns jsonb
+language sql
+immutable
+set search_path = public
+as $$
+  select coalesce(jsonb_object_agg(clave, fusionar_sketch(a->clave, b->clave)), '{}'::jsonb)
+  from (
+    select jsonb_object_keys(coalesce(a, '{}'::jsonb)) as clave
+    union
+    select jsonb_object_keys(coalesce(b, '{}'::jsonb))
+  ) claves;
+$$;
+
+create or replace function acumular_rollup_metricas(
+  p_metrica_id uuid,
+  p_momento timestamptz,
+  p_contadores jsonb,
+  p_metricas_ejecucion jsonb,
+  p_latencias jsonb
+)
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_aplicadas integer;
+begin
+  insert into metricas_pipeline_rollups_aplicadas (metrica_id)
+  values (p_metrica_id)
+  on conflict (metrica_id) do nothing;
+
+  get diagnostics v_aplicadas = row_count;
+  if v_aplicadas = 0 then
+    return false;
+  end if;
+
+  insert into metricas_pipeline_rollups as r (
+    granularidad, periodo, ejecuciones, documentos_monitoreados, documentos_procesados,
+    chunks_validados, errores_criticos, tokens, costo_usd, duracion_total_s,
+    metricas_ejecucion, latencias
+  )
+  select
+    g.granularidad,
+    date_trunc(g.unidad, p_momento),
+    1,
+    coalesce((p_contadores->>'documentos_monitoreados')::bigint, 0),
+    coalesce((p_contadores->>'documentos_procesados')::bigint, 0),
+    coalesce((p_contadores->>'chunks_validados')::bigint, 0),
+    coalesce((p_contadores->>'errores_criticos')::bigint, 0),
+    coalesce((p_contadores->>'tokens')::bigint, 0),
+    coalesce((p_contadores->>'costo_usd')::numeric, 0),
+    coalesce((p_contadores->>'duracion_total_s')::double precision, 0),
+    coalesce(p_metricas_ejecucion, '{}'::jsonb),
+    coalesce(p_latencias, '{}'::jsonb)
+  from (values ('hora', 'hour'), ('dia', 'day')) as g(granularidad, unidad)
+  on conflict (granularidad, periodo) do update set
+    ejecuciones = r.ejecuciones + excluded.ejecuciones,
+    documentos_monitoreados = r.documentos_monitoreados + excluded.documentos_monitoreados,
+    documentos_procesados = r.documentos_procesados + excluded.documentos_procesados,
+    chunks_validados = r.chunks_validados + excluded.chunks_validados,
+    errores_criticos = r.errores_criticos + excluded.errores_criticos,
+    tokens = r.tokens + excluded.tokens,
+    costo_usd = r.costo_usd + excluded.costo_usd,
+    duracion_total_s = r.duracion_total_s + excluded.duracion_total_s,
+    metricas_ejecucion = fusionar_sketches(r.metricas_ejecucion, excluded.metricas_ejecucion),
+    latencias = fusionar_sketches(r.latencias, excluded.latencias),
+    actualizado_en = now();
+
+  return true;
+end;
+$$;
+
+comment on function acumular_rollup_metricas(uuid, timestamptz, jsonb, jsonb, jsonb) is
+'Suma una fila de metricas_pipeline_rag a sus rollups por hora y día (idempotente por metrica_id)';
+
+revoke all on function fusionar_sketch(jsonb, jsonb) from public, anon, authenticated;
+revoke all on function fusionar_sketches(jsonb, jsonb) from public, anon, authenticated;
+revoke all on function acumular_rollup_metricas(uuid, timestamptz, jsonb, jsonb, jsonb) from public, anon, authenticated;
+grant execute on function fusionar_sketch(jsonb, jsonb) to service_role;
+grant execute on function fusionar_sketches(jsonb, jsonb) to service_role;
+grant execute on function acumular_rollup_metricas(uuid, timestamptz, jsonb, jsonb, jsonb) to service_role;
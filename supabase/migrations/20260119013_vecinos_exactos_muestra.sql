@@ -0,0 +1,50 @@
+-- Top-k exacto de una muestra de chunks para medir recall del índice
+-- Usado por scripts/pipeline-document-mineduc/politica_reindexado.py
+--
+-- recall_muestreado descargaba todo el corpus de embeddings en cada
+-- ejecución de fase5 para calcular el top-k exacto en NumPy. Esta función
+-- lo resuelve en la BD: toma p_consultas chunks vigentes al azar y, para
+-- cada uno, sus p_k vecinos por coseno con índices deshabilitados (scan
+-- secuencial, resultado exacto). Solo viajan los vectores de la muestra;
+-- el lado aproximado sigue siendo buscar_chunks_similares.
+
+create or replace function vecinos_exactos_muestra_chunks(
+  p_consultas integer default 30,
+  p_k integer default 10
+)
+returns table (
+  consulta_id text,
+  embedding text,
+  vecinos text[]
+)
+language sql
+stable
+security definer
+set search_path = public
+set enable_indexscan = off
+set enable_bitmapscan = off
+as $$
+  with muestra as (
+    select c.id, c.embedding
+    from chunks_documentos c
+    join documentos_oficiales d on d.id = c.documento_id
+    where d.es_version_actual = true and c.embedding is not null
+    order by random()
+    limit p_consultas
+  )
+  select
+    m.id::text,
+    m.embedding::text,
+    array(
+      select c.id::text
+      from chunks_documentos c
+      join documentos_oficiales d on d.id = c.documento_id
+      where d.es_version_actual = true and c.embedding is not null
+      order by c.embedding <=> m.embedding
+      limit p_k
+    )
+  from muestra m;
+$$;
+
+revoke all on function vecinos_exactos_muestra_chunks(integer, integer) from public, anon, authenticated;
+grant execute on function vecinos_exactos_muestra_chunks(integer, integer) to service_role;
@@ -0,0 +1,71 @@
+-- validacion_calidad_documentos sin duplicados por contenido
+-- Usada por scripts/pipeline-document-mineduc/fase4_validacion_calidad.py
+--
+-- fase3 marca un PDF duplicado por contenido (mismo sha256 que un documento
+-- canónico) como procesado/completado sin chunks propios: reutiliza los del
+-- canónico y registra metadata.chunks_compartidos_con. Puntuado por sus
+-- propios chunks cada duplicado quedaba con calidad ~0, rechazado, y bajaba
+-- calidad_promedio (que decide el exit code de fase4). Se excluyen: sus
+-- chunks ya se evalúan con el documento canónico.
+--
+-- Se filtra por chunks_compartidos_con y no por documento_canonico_id:
+-- un duplicado cuyo canónico aún no tenía chunks se carga con chunks propios
+-- y sí debe puntuarse.
+
+create or replace function validacion_calidad_documentos(
+  p_despues_de uuid default null,
+  p_limite integer default 1000
+)
+returns table (
+  id uuid,
+  titulo text,
+  longitud_texto integer,
+  palabras_legibles integer,
+  tiene_metadata_pdf boolean,
+  total_chunks integer,
+  sin_embedding integer,
+  chunks_validos integer
+)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  with pagina as (
+    select d.id, d.titulo, d.contenido_texto
+    from documentos_oficiales d
+    where d.procesado = true
+      and not coalesce(d.metadata ? 'chunks_compartidos_con', false)
+      and (p_despues_de is null or d.id > p_despues_de)
+    order by d.id
+    limit p_limite
+  ),
+  chunks as (
+    select
+      c.documento_id,
+      count(*)::integer as total_chunks,
+      count(*) filter (where c.embedding is null)::integer as sin_embedding,
+      count(*) filter (where length(c.contenido) > 100)::integer as chunks_validos
+    from chunks_documentos c
+    where c.documento_id in (select p.id from pagina p)
+    group by c.documento_id
+  )
+  select
+    d.id,
+    d.titulo::text,
+    coalesce(length(d.contenido_texto), 0),
+    coalesce(regexp_count(d.contenido_texto, '\m[a-zA-ZÀ-ſ]{3,}\M'), 0),
+    coalesce(d.contenido_texto ~* '(endobj|endstream|flatedecode)', false),
+    coalesce(ch.total_chunks, 0),
+    coalesce(ch.sin_embedding, 0),
+    coalesce(ch.chunks_validos, 0)
+  from pagina d
+  left join chunks ch on ch.documento_id = d.id
+  order by d.id;
+$$;
+
+comment on function validacion_calidad_documentos(uuid, integer) is
+'Contadores de texto y chunks por documento procesado para el scoring vectorizado de fase4 (keyset sobre id, sin duplicados por contenido)';
+
+revoke all on function validacion_calidad_documentos(uuid, integer) from public, anon, authenticated;
+grant execute on function validacion_calidad_documentos(uuid, integer) to service_role;